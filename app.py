@@ -75,7 +75,8 @@ def main():
         )
         auto_download_manager = AutoDownloadManager(
             uploader=uploader,
-            notifier_config=notifier_config
+            notifier_config=notifier_config,
+            worker_processes=download_config.get('worker_processes', 0)
         )
         logging.info("AutoDownloadManager 初始化完成")
 
@@ -104,9 +105,10 @@ def main():
         # 13. 注册信号处理，确保程序退出时停止下载监控和登出微信
         def signal_handler(sig, frame):
             logging.info('接收到退出信号，正在停止程序...')
-            itchat_handler.logout()
             uploader.stop()  # 停止 Uploader 的上传线程
             auto_download_manager.stop()  # 停止下载管理器
+            notifier.stop()  # 发出剩余的通知后再保存会话或登出微信
+            itchat_handler.shutdown()
             sys.exit(0)
 
         signal.signal(signal.SIGINT, signal_handler)
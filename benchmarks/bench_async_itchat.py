@@ -0,0 +1,171 @@
+# benchmarks/bench_async_itchat.py
+"""
+在一个事件循环上同时运行异步 itchat 的消息接收、文本通知发送和文件上传，测量事件循环的延迟和消息接收延迟。
+
+模拟的网页微信接口（benchmarks/e2e/webwx_server.py）在当前进程的线程中运行：synccheck 长轮询、webwxsync、
+webwxsendmsg、webwxuploadmedia 和 webwxsendappmsg 都按设定的延迟响应。一个线程按固定间隔向接口放入发给本账号的消息，
+事件循环上同时进行：
+- start_receiving 的长轮询和 webwxsync，收到的消息由 run 的回复循环交给处理函数，记录从放入到处理的延迟；
+- --notifications 条并发的 send_msg；
+- --files 个文件的 upload_file 和 send_file；
+- 每 5 毫秒醒来一次的探测任务，记录实际醒来时间比预期晚多少（事件循环延迟）。
+
+对照组“阻塞请求”在协程中调用基于 requests 的同步组件发送和上传（原异步组件的做法），接收仍使用异步会话，
+用来说明阻塞请求对同一循环上消息接收的影响。
+
+用法:
+    python -m benchmarks.bench_async_itchat [--messages 40] [--notifications 20] [--files 2] [--send-ms 150]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.e2e.clock import ScaledClock
+from benchmarks.e2e.webwx_server import FakeWebWxServer, make_async_core, make_core
+from lib.itchat.content import TEXT
+
+FRIENDS = ['基准好友']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def probe_loop(lags, stopped, interval=0.005):
+    """每 interval 秒醒来一次，记录醒来时间比预期晚的秒数。"""
+    while not stopped.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - expected)
+
+
+def push_messages(server, count, interval):
+    for index in range(count):
+        server.push_message('@friend001', f"基准消息 {index}")
+        time.sleep(interval)
+
+
+async def run_scenario(mode, args, server, files):
+    core = make_async_core(server.url, chatrooms=[], friends=FRIENDS)
+    blocking_core = make_core(server.url, chatrooms=[], friends=FRIENDS) if mode == 'blocking' else None
+    latencies = {}
+    lags = []
+    stopped = asyncio.Event()
+    all_received = asyncio.Event()
+
+    @core.msg_register(TEXT)
+    async def handle_text(msg):
+        latencies[msg['MsgId']] = time.perf_counter() - server.pushed_at[msg['MsgId']]
+        if len(latencies) >= args.messages:
+            all_received.set()
+
+    async def send_notification(index):
+        message = f"[{mode}] 通知 {index}"
+        if blocking_core:
+            return bool(blocking_core.send_msg(message, toUserName='@friend001'))
+        return bool(await core.send_msg(message, toUserName='@friend001'))
+
+    async def send_file(path):
+        if blocking_core:
+            r = blocking_core.upload_file(path)
+            return bool(r) and bool(blocking_core.send_file(path, toUserName='@friend001', mediaId=r['MediaId']))
+        r = await core.upload_file(path)
+        return bool(r) and bool(await core.send_file(path, toUserName='@friend001', mediaId=r['MediaId']))
+
+    probe = asyncio.ensure_future(probe_loop(lags, stopped))
+    await core.start_receiving()
+    reply_task = await core.run(blockThread=False)
+    pusher = threading.Thread(target=push_messages, args=(server, args.messages, args.push_interval / 1000))
+    started = time.perf_counter()
+    pusher.start()
+    await asyncio.sleep(args.push_interval / 1000 * 3)
+    results = await asyncio.gather(*[send_notification(i) for i in range(args.notifications)],
+                                   *[send_file(path) for path in files])
+    send_elapsed = time.perf_counter() - started
+    await asyncio.to_thread(pusher.join)
+    try:
+        await asyncio.wait_for(all_received.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    stopped.set()
+    await probe
+    await core.logout()
+    await asyncio.gather(core.receivingTask, reply_task, return_exceptions=True)
+    return {
+        'mode': mode, 'lags': lags, 'latencies': list(latencies.values()), 'send_elapsed': send_elapsed,
+        'sent_ok': sum(results), 'sent_total': len(results),
+    }
+
+
+def describe(name, result):
+    lags, latencies = result['lags'], result['latencies']
+    print(f"{name:<10}{percentile(lags, 0.5) * 1000:>10.1f}{percentile(lags, 0.99) * 1000:>10.1f}"
+          f"{max(lags or [0]) * 1000:>10.1f}{percentile(latencies, 0.5) * 1000:>12.1f}"
+          f"{percentile(latencies, 0.95) * 1000:>12.1f}{len(latencies):>8}{result['send_elapsed']:>12.2f}"
+          f"{result['sent_ok']:>6}/{result['sent_total']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量异步 itchat 在一个事件循环上并发收发时的循环延迟和消息延迟。')
+    parser.add_argument('--messages', type=int, default=40, help='接口放入的待收消息数')
+    parser.add_argument('--push-interval', type=float, default=50, help='放入消息的间隔（毫秒）')
+    parser.add_argument('--notifications', type=int, default=20, help='并发发送的文本通知数')
+    parser.add_argument('--files', type=int, default=2, help='并发上传并发送的文件数')
+    parser.add_argument('--file-mb', type=int, default=2, help='每个文件的大小（MB）')
+    parser.add_argument('--send-ms', type=float, default=150, help='接口处理每条发送请求的延迟（毫秒）')
+    parser.add_argument('--upload-ms', type=float, default=100, help='接口处理每个上传分块的延迟（毫秒）')
+    parser.add_argument('--timeout', type=float, default=30, help='等待全部消息收到的最长秒数')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('itchat').setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='bench_async_itchat_')
+    files = []
+    for index in range(args.files):
+        path = os.path.join(workdir, f"资料{index}.docx")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(args.file_mb * 1024 * 1024))
+        files.append(path)
+
+    results = []
+    try:
+        for mode in ('blocking', 'async'):
+            server = FakeWebWxServer(ScaledClock(), upload_ms=args.upload_ms, send_ms=args.send_ms,
+                                     poll_seconds=5).start()
+            try:
+                results.append(asyncio.run(run_scenario(mode, args, server, files)))
+                texts = sum(len(texts) for texts in server.text_deliveries.values())
+                files_delivered = sum(len(names) for names in server.deliveries.values())
+            finally:
+                server.stop()
+            results[-1]['delivered'] = (texts, files_delivered)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"待收消息: {args.messages}，文本通知: {args.notifications}，文件: {args.files} × {args.file_mb}MB，"
+          f"单次发送延迟: {args.send_ms:.0f}ms")
+    print(f"{'方式':<10}{'循环p50':>10}{'循环p99':>10}{'循环最大':>10}{'消息p50':>12}{'消息p95':>12}{'收到':>8}"
+          f"{'发送耗时(秒)':>12}{'发送成功':>8}")
+    print("（循环延迟和消息延迟单位为毫秒）")
+    for name, result in zip(('阻塞请求', '异步会话'), results):
+        describe(name, result)
+
+    failed = [result['mode'] for result in results
+              if len(result['latencies']) != args.messages or result['sent_ok'] != result['sent_total']
+              or result['delivered'] != (args.notifications, args.files)]
+    if failed:
+        print(f"\n校验失败：{failed} 未收到全部消息或未发送全部通知和文件（接口记录：{[r['delivered'] for r in results]}）")
+        sys.exit(1)
+    print("\n校验通过：两种方式都收到全部消息，通知和文件全部送达。")
+
+
+if __name__ == '__main__':
+    main()
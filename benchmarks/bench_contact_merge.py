@@ -0,0 +1,212 @@
+# benchmarks/bench_contact_merge.py
+"""
+对比原来按列表线性查找合并联系人与按索引合并时，处理 ModContactList 增量的耗时和内存分配。
+
+先载入 --rooms 个群聊（每个 --members 名成员）和 --friends 个好友，再依次合并 --deltas 个群聊增量和同样数量的好友增量：
+群聊增量带完整成员列表，其中少量成员改名、加入或退出；好友增量为单个好友改备注。
+原来的合并方式按 update_local_chatrooms / update_local_friends 的旧实现逐个在列表中查找群聊和成员，
+退出成员用列表 in 判断；按索引合并使用 itchat 当前的实现。两种方式合并后的联系人应当一致。
+内存分配用 tracemalloc 单独测量一遍，报告分配的内存块数和峰值。
+
+用法:
+    python -m benchmarks.bench_contact_merge [--rooms 300] [--members 500] [--deltas 100] [--friends 2000]
+"""
+
+import argparse
+import copy
+import random
+import sys
+import time
+import tracemalloc
+
+from lib.itchat import utils
+from lib.itchat.components import load_components
+from lib.itchat.components.contact import update_local_chatrooms, update_local_friends
+from lib.itchat.core import Core
+from lib.itchat.utils import update_info_dict
+
+SELF_USER_NAME = '@bench_self'
+
+
+def legacy_update_local_chatrooms(core, l):
+    """原来的实现：群聊和成员都在列表中线性查找，退出成员用列表 in 判断。"""
+    with core.storageClass.updateLock:
+        for chatroom in l:
+            utils.emoji_formatter(chatroom, 'NickName')
+            for member in chatroom['MemberList']:
+                if 'NickName' in member:
+                    utils.emoji_formatter(member, 'NickName')
+                if 'DisplayName' in member:
+                    utils.emoji_formatter(member, 'DisplayName')
+                if 'RemarkName' in member:
+                    utils.emoji_formatter(member, 'RemarkName')
+            oldChatroom = utils.search_dict_list(core.chatroomList, 'UserName', chatroom['UserName'])
+            if oldChatroom:
+                update_info_dict(oldChatroom, chatroom)
+                memberList = chatroom.get('MemberList', [])
+                oldMemberList = oldChatroom['MemberList']
+                if memberList:
+                    for member in memberList:
+                        oldMember = utils.search_dict_list(oldMemberList, 'UserName', member['UserName'])
+                        if oldMember:
+                            update_info_dict(oldMember, member)
+                        else:
+                            oldMemberList.append(member)
+            else:
+                core.chatroomList.append(chatroom)
+                oldChatroom = utils.search_dict_list(core.chatroomList, 'UserName', chatroom['UserName'])
+            if len(chatroom['MemberList']) != len(oldChatroom['MemberList']) and chatroom['MemberList']:
+                existsUserNames = [member['UserName'] for member in chatroom['MemberList']]
+                delList = []
+                for i, member in enumerate(oldChatroom['MemberList']):
+                    if member['UserName'] not in existsUserNames:
+                        delList.append(i)
+                delList.sort(reverse=True)
+                for i in delList:
+                    del oldChatroom['MemberList'][i]
+            if oldChatroom.get('ChatRoomOwner') and oldChatroom.get('MemberList'):
+                owner = utils.search_dict_list(oldChatroom['MemberList'], 'UserName', oldChatroom['ChatRoomOwner'])
+                oldChatroom['OwnerUin'] = (owner or {}).get('Uin', 0)
+            if 'OwnerUin' in oldChatroom and oldChatroom['OwnerUin'] != 0:
+                oldChatroom['IsAdmin'] = oldChatroom['OwnerUin'] == int(core.loginInfo['wxuin'])
+            else:
+                oldChatroom['IsAdmin'] = None
+            newSelf = utils.search_dict_list(oldChatroom['MemberList'], 'UserName', core.storageClass.userName)
+            oldChatroom['Self'] = newSelf or copy.deepcopy(core.loginInfo['User'])
+
+
+def legacy_update_local_friends(core, l):
+    """原来的实现：每次调用拼接 memberList + mpList，在其中线性查找。"""
+    with core.storageClass.updateLock:
+        fullList = core.memberList + core.mpList
+        for friend in l:
+            if 'NickName' in friend:
+                utils.emoji_formatter(friend, 'NickName')
+            if 'RemarkName' in friend:
+                utils.emoji_formatter(friend, 'RemarkName')
+            oldInfoDict = utils.search_dict_list(fullList, 'UserName', friend['UserName'])
+            if oldInfoDict is None:
+                oldInfoDict = copy.deepcopy(friend)
+                if oldInfoDict['VerifyFlag'] & 8 == 0:
+                    core.memberList.append(oldInfoDict)
+                else:
+                    core.mpList.append(oldInfoDict)
+            else:
+                update_info_dict(oldInfoDict, friend)
+
+
+def make_member(room, index, suffix=''):
+    return {'UserName': f"@m{room}x{index}", 'NickName': f"成员{room}-{index}{suffix}", 'DisplayName': '',
+            'Uin': 0, 'AttrStatus': 0}
+
+
+def make_room(room, members):
+    return {'UserName': f"@@room{room}", 'NickName': f"群聊{room}", 'ChatRoomOwner': f"@m{room}x0",
+            'MemberList': [make_member(room, index) for index in members]}
+
+
+def make_friend(index, suffix=''):
+    return {'UserName': f"@friend{index}", 'NickName': f"好友{index}", 'RemarkName': f"备注{index}{suffix}",
+            'VerifyFlag': 0, 'Sex': 1}
+
+
+def make_deltas(args):
+    """生成群聊增量和好友增量。每个群聊增量带完整成员列表，其中 2 人改名、3 人加入、2 人退出。"""
+    rng = random.Random(42)
+    members = {room: list(range(args.members)) for room in range(args.rooms)}
+    next_member = {room: args.members for room in range(args.rooms)}
+    room_deltas = []
+    for _ in range(args.deltas):
+        room = rng.randrange(args.rooms)
+        current = members[room]
+        for _ in range(2):
+            current.remove(rng.choice(current[1:]))
+        for _ in range(3):
+            current.append(next_member[room])
+            next_member[room] += 1
+        renamed = set(rng.sample(current, 2))
+        delta = make_room(room, [])
+        delta['MemberList'] = [make_member(room, index, '改' if index in renamed else '') for index in current]
+        room_deltas.append(delta)
+    friend_deltas = [[make_friend(rng.randrange(args.friends), f"-{n}")] for n in range(args.deltas)]
+    return room_deltas, friend_deltas
+
+
+def make_core(args):
+    load_components(Core)
+    core = Core()
+    core.loginInfo = {'wxuin': '1', 'User': {'UserName': SELF_USER_NAME, 'NickName': '基准账号'}}
+    core.storageClass.userName = SELF_USER_NAME
+    return core
+
+
+def load(core, args, room_merge, friend_merge):
+    room_merge(core, [make_room(room, range(args.members)) for room in range(args.rooms)])
+    friend_merge(core, [make_friend(index) for index in range(args.friends)])
+
+
+def snapshot(core):
+    rooms = {room['UserName']: sorted((m['UserName'], m['NickName']) for m in room['MemberList'])
+             for room in core.chatroomList}
+    friends = sorted((f['UserName'], f['RemarkName']) for f in core.memberList)
+    return rooms, friends
+
+
+def run(name, room_merge, friend_merge, args, room_deltas, friend_deltas):
+    core = make_core(args)
+    load(core, args, room_merge, friend_merge)
+    # 增量在计时外复制好，计时只包括合并
+    room_copies = [copy.deepcopy(d) for d in room_deltas]
+    friend_copies = [copy.deepcopy(d) for d in friend_deltas]
+    started = time.perf_counter()
+    for room_delta, friend_delta in zip(room_copies, friend_copies):
+        room_merge(core, [room_delta])
+        friend_merge(core, friend_delta)
+    elapsed = time.perf_counter() - started
+
+    traced = make_core(args)
+    load(traced, args, room_merge, friend_merge)
+    room_copies = [copy.deepcopy(d) for d in room_deltas]
+    friend_copies = [copy.deepcopy(d) for d in friend_deltas]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for room_delta, friend_delta in zip(room_copies, friend_copies):
+        room_merge(traced, [room_delta])
+        friend_merge(traced, friend_delta)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return {'name': name, 'elapsed': elapsed, 'peak': peak, 'blocks': blocks, 'snapshot': snapshot(core)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比线性查找与按索引合并联系人增量的耗时和内存分配。')
+    parser.add_argument('--rooms', type=int, default=300)
+    parser.add_argument('--members', type=int, default=500, help='每个群聊的成员数')
+    parser.add_argument('--deltas', type=int, default=100, help='群聊增量数（好友增量数相同）')
+    parser.add_argument('--friends', type=int, default=2000)
+    args = parser.parse_args()
+
+    room_deltas, friend_deltas = make_deltas(args)
+    before = run('线性查找', legacy_update_local_chatrooms, legacy_update_local_friends, args,
+                 room_deltas, friend_deltas)
+    after = run('按索引合并', update_local_chatrooms, update_local_friends, args, room_deltas, friend_deltas)
+
+    print(f"群聊: {args.rooms} × {args.members} 名成员，好友: {args.friends}，增量: {args.deltas} 个群聊 + {args.deltas} 个好友")
+    print(f"{'方式':<10}{'总耗时(毫秒)':>14}{'每个增量(毫秒)':>16}{'新增内存块':>12}{'峰值(KB)':>12}")
+    for result in (before, after):
+        print(f"{result['name']:<10}{result['elapsed'] * 1000:>14.1f}{result['elapsed'] * 1000 / args.deltas:>16.2f}"
+              f"{result['blocks']:>12}{result['peak'] / 1024:>12.1f}")
+    print(f"耗时降低: {before['elapsed'] / after['elapsed']:.1f} 倍")
+
+    if before['snapshot'] != after['snapshot']:
+        print("\n校验失败：两种方式合并后的群成员或好友不一致")
+        sys.exit(1)
+    print("\n校验通过：两种方式合并后的群成员和好友一致。")
+
+
+if __name__ == '__main__':
+    main()
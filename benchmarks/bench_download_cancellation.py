@@ -0,0 +1,209 @@
+# benchmarks/bench_download_cancellation.py
+"""
+模拟下载流水线在请求被取消、过期或请求者积分耗尽时，浏览器下载线程和账号额度花在无法交付的任务上的比例。
+
+按虚拟时钟推进，不实际等待。DownloadTaskQueue 每隔 --interval 秒分派 --batch-size 个任务到 --slots 个下载线程，
+每个任务依次经过页面加载（5 秒）、点击下载（消耗一次账号额度）和文件等待，文件等待结束后交给上传：
+- 大群在开始后 20 秒内粘贴 --burst 个链接，管理员在 --cancel-at 秒发送“取消群组下载 大群”；
+- 积分群只有 --points 积分，每交付一份扣 1 分，积分用完后其余请求不再需要；
+- 其它群组陆续发送链接，约 10% 的链接与其它群组请求同一份资料；
+- 约 --stuck 比例的文件一直等不到，占用下载线程直到 1800 秒的等待上限。
+请求的截止时间为 --deadline 秒。对比原来不检查的流水线与在分派、页面加载、点击、文件等待和上传前检查
+RequestContextStore 的流水线：统计交付给仍需要的请求者的文件数、点击和线程时间中花在无法交付任务上的比例。
+
+用法:
+    python -m benchmarks.bench_download_cancellation [--burst 80] [--slots 9] [--deadline 1200] [--cancel-at 90]
+"""
+
+import argparse
+import logging
+import random
+import sys
+from collections import deque
+
+from src.file_upload.request_context import RequestContextStore
+from src.itchat_module.download_scheduler import FairScheduler
+from src.itchat_module.routing import PRIORITY_GROUP
+
+BIG_GROUP = '大群'
+POINTS_GROUP = '积分群'
+MAX_FILE_WAIT = 1800
+PAGE_LOAD = 5
+CANCEL_CHECK_INTERVAL = 10
+
+
+def make_requests(args):
+    """生成 (到达时间, 群组, soft_id, 文件等待秒数)，按到达时间排序；文件等待秒数按 soft_id 固定。"""
+    rng = random.Random(7)
+    requests = []
+    serial = 0
+
+    def add(at, group):
+        nonlocal serial
+        if requests and rng.random() < 0.1:
+            soft_id = rng.choice(requests)[2]
+        else:
+            serial += 1
+            soft_id = str(10000000 + serial)
+        requests.append((at, group, soft_id))
+
+    for _ in range(args.burst):
+        add(rng.uniform(0, 20), BIG_GROUP)
+    for _ in range(40):
+        add(rng.uniform(0, 300), POINTS_GROUP)
+    for group in ('群组B', '群组C', '群组D'):
+        for _ in range(25):
+            add(rng.uniform(0, 900), group)
+    waits = {}
+    for _, _, soft_id in requests:
+        if soft_id not in waits:
+            waits[soft_id] = MAX_FILE_WAIT if rng.random() < args.stuck else rng.uniform(5, 40)
+    requests.sort(key=lambda request: request[0])
+    return [(at, group, soft_id, waits[soft_id]) for at, group, soft_id in requests]
+
+
+def simulate(name, requests, args, checks):
+    now = [0.0]
+    points = {POINTS_GROUP: args.points}
+    store = RequestContextStore(deadline=args.deadline, clock=lambda: now[0])
+
+    def still_wanted(context):
+        return points.get(context.recipient_name, 1) > 0
+
+    def cancelled(soft_id):
+        return checks and store.check(soft_id, still_wanted=still_wanted) is not None
+
+    file_waits = {soft_id: wait for _, _, soft_id, wait in requests}
+    task_queue = FairScheduler(clock=lambda: now[0])
+    instance_queue = deque()  # XKW.task
+    running = []  # [阶段, 阶段结束时间, soft_id, 开始时间, 已点击, 文件等待秒数或结束时间, 下次检查时间]
+    stats = {'clicks': 0, 'wasted_clicks': 0, 'slot_seconds': 0.0, 'wasted_slot_seconds': 0.0,
+             'delivered': 0, 'dropped': 0, 'latencies': []}
+    pending = deque(requests)
+    tick = 0
+    next_dispatch = 0
+    cancel_done = False
+
+    def finish(task, delivered_to):
+        _, _, soft_id, started, clicked, _, _ = task
+        elapsed = now[0] - started
+        stats['slot_seconds'] += elapsed
+        if not delivered_to:
+            stats['wasted_slot_seconds'] += elapsed
+            stats['wasted_clicks'] += clicked
+
+    while pending or task_queue.qsize() or instance_queue or running:
+        now[0] = tick
+        while pending and pending[0][0] <= tick:
+            _, group, soft_id, _ = pending.popleft()
+            # 与 MessageHandler 相同：同一 soft_id 已有请求在等待时不再添加下载任务
+            if points.get(group, 1) > 0 and store.add(soft_id, group)[1]:
+                task_queue.put(soft_id, PRIORITY_GROUP, group)
+        if not cancel_done and tick >= args.cancel_at:
+            store.cancel_recipient(BIG_GROUP)
+            cancel_done = True
+
+        # DownloadTaskQueue：分派前放弃已取消的任务，不占用本批名额
+        if tick >= next_dispatch:
+            batch = 0
+            while batch < args.batch_size and task_queue.qsize():
+                soft_id = task_queue.get_nowait().url
+                if cancelled(soft_id):
+                    stats['dropped'] += 1
+                    continue
+                instance_queue.append(soft_id)
+                batch += 1
+            next_dispatch = tick + args.interval
+
+        # 下载线程推进各阶段
+        for task in list(running):
+            stage, ends_at, soft_id, started, clicked, file_at, next_check = task
+            if stage == 'load' and tick >= ends_at:
+                if cancelled(soft_id):  # 点击前检查
+                    running.remove(task)
+                    finish(task, [])
+                    stats['dropped'] += 1
+                    continue
+                task[0], task[4] = 'wait', 1
+                task[5] = tick + file_at
+                task[6] = tick + CANCEL_CHECK_INTERVAL
+                stats['clicks'] += 1
+            elif stage == 'wait':
+                if file_at < MAX_FILE_WAIT and tick >= task[5]:
+                    # 上传前只交付给仍在截止时间内且有积分的请求者
+                    delivered_to = [context for context in store.pop_for_soft_id(soft_id) if still_wanted(context)]
+                    for context in delivered_to:
+                        if context.recipient_name in points:
+                            points[context.recipient_name] -= 1
+                        stats['latencies'].append(tick - context.created_at)
+                    stats['delivered'] += len(delivered_to)
+                    running.remove(task)
+                    finish(task, delivered_to)
+                elif tick >= started + PAGE_LOAD + MAX_FILE_WAIT:
+                    running.remove(task)
+                    finish(task, [])
+                elif tick >= next_check:
+                    task[6] = tick + CANCEL_CHECK_INTERVAL
+                    if cancelled(soft_id):
+                        running.remove(task)
+                        finish(task, [])
+                        stats['dropped'] += 1
+
+        # 空闲线程从实例队列取任务，分派和页面加载前检查
+        while len(running) < args.slots and instance_queue:
+            soft_id = instance_queue.popleft()
+            if cancelled(soft_id):
+                stats['dropped'] += 1
+                continue
+            running.append(['load', tick + PAGE_LOAD, soft_id, tick, 0, file_waits[soft_id], 0])
+        tick += 1
+    stats['name'] = name
+    stats['finished_at'] = tick
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟下载流水线在请求被取消或过期时，下载线程和账号额度的浪费。')
+    parser.add_argument('--burst', type=int, default=80, help='大群一次粘贴的链接数')
+    parser.add_argument('--points', type=int, default=8, help='积分群的积分')
+    parser.add_argument('--slots', type=int, default=9, help='下载线程数（实例数 × 每个实例的线程数）')
+    parser.add_argument('--interval', type=float, default=30, help='DownloadTaskQueue 的分派间隔（秒）')
+    parser.add_argument('--batch-size', type=int, default=10, help='每次分派的任务数')
+    parser.add_argument('--deadline', type=float, default=1200, help='请求的截止时间（秒）')
+    parser.add_argument('--cancel-at', type=float, default=90, help='管理员取消大群下载的时间（秒）')
+    parser.add_argument('--stuck', type=float, default=0.05, help='一直等不到文件的比例')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    requests = make_requests(args)
+    before = simulate('不检查', requests, args, checks=False)
+    after = simulate('逐阶段检查', requests, args, checks=True)
+    logging.disable(logging.NOTSET)
+
+    print(f"请求: {len(requests)} 个（大群 {args.burst} 个，{args.cancel_at:.0f} 秒时取消），下载线程 {args.slots} 个，"
+          f"截止时间 {args.deadline:.0f} 秒")
+    print(f"{'方式':<10}{'交付':>6}{'点击':>6}{'浪费点击':>10}{'线程时间(秒)':>14}{'浪费比例':>10}"
+          f"{'提前放弃':>10}{'交付p50(秒)':>13}{'完成(秒)':>10}")
+    for result in (before, after):
+        latencies = sorted(result['latencies'])
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        wasted = result['wasted_slot_seconds'] / result['slot_seconds'] if result['slot_seconds'] else 0
+        print(f"{result['name']:<10}{result['delivered']:>6}{result['clicks']:>6}{result['wasted_clicks']:>10}"
+              f"{result['slot_seconds']:>14.0f}{wasted:>10.0%}{result['dropped']:>10}{p50:>13.0f}"
+              f"{result['finished_at']:>10}")
+
+    failures = []
+    if after['delivered'] < before['delivered']:
+        failures.append('逐阶段检查后交付的文件数减少')
+    if after['wasted_clicks'] >= before['wasted_clicks']:
+        failures.append('逐阶段检查没有减少花在无法交付任务上的点击')
+    if after['wasted_slot_seconds'] >= before['wasted_slot_seconds']:
+        failures.append('逐阶段检查没有减少花在无法交付任务上的线程时间')
+    if failures:
+        print("\n校验失败：" + '；'.join(failures))
+        sys.exit(1)
+    print("\n校验通过：交付的文件数不少于原来，花在无法交付任务上的点击和线程时间减少。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# benchmarks/bench_download_fairness.py
+"""
+模拟一个群组一次粘贴大量链接时，其他群组、个人和管理员的下载请求在 DownloadTaskQueue 中的等待时间。
+
+DownloadTaskQueue 每隔 --interval 秒向下载实例分派一批（--batch-size 个）任务，模拟按虚拟时钟推进，不实际等待：
+- 大群在开始后 10 秒内粘贴 --burst 个链接；
+- --small-groups 个小群各自每隔约 --small-period 秒发送一个链接；
+- 一名监控个人不定时发送链接，管理员在大群中发送两次测试链接。
+对比原来的单一 FIFO 队列与 FairScheduler（管理员 > 个人 > 群组的优先级通道，通道内按群组赤字轮转），
+统计各类请求从入队到分派的等待时间。两种方式分派的任务总数和全部分派完的时间应当一致。
+
+用法:
+    python -m benchmarks.bench_download_fairness [--burst 100] [--small-groups 3] [--interval 30] [--batch-size 10]
+"""
+
+import argparse
+import random
+import sys
+from collections import deque
+
+from src.itchat_module.download_scheduler import FairScheduler
+from src.itchat_module.routing import PRIORITY_ADMIN, PRIORITY_GROUP, PRIORITY_INDIVIDUAL
+
+BIG_GROUP = '大群'
+
+
+def make_requests(args):
+    """生成 (到达时间, 请求类别, 通道, 来源, url)，按到达时间排序。"""
+    rng = random.Random(42)
+    requests = []
+    for index in range(args.burst):
+        requests.append((rng.uniform(0, 10), 'burst', PRIORITY_GROUP, BIG_GROUP,
+                         f"https://www.zxxk.com/soft/{10000000 + index}.html"))
+    serial = 0
+    for group in range(args.small_groups):
+        at = rng.uniform(0, args.small_period)
+        while at < args.duration:
+            serial += 1
+            requests.append((at, 'small', PRIORITY_GROUP, f"小群{group + 1}",
+                             f"https://www.zxxk.com/soft/{20000000 + serial}.html"))
+            at += rng.uniform(args.small_period * 0.5, args.small_period * 1.5)
+    for index in range(4):
+        requests.append((rng.uniform(0, args.duration), 'individual', PRIORITY_INDIVIDUAL, '监控个人',
+                         f"https://www.zxxk.com/soft/{30000000 + index}.html"))
+    for index, at in enumerate((30, 90)):
+        requests.append((at, 'admin', PRIORITY_ADMIN, '管理员', f"https://www.zxxk.com/soft/{40000000 + index}.html"))
+    requests.sort(key=lambda request: request[0])
+    return requests
+
+
+class FifoQueue:
+    """原来的方式：所有请求进入一个 FIFO 队列。"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.items = deque()
+
+    def put(self, url, lane, flow):
+        self.items.append((url, self.clock()))
+
+    def pop(self):
+        url, enqueued_at = self.items.popleft()
+        return url, self.clock() - enqueued_at
+
+    def qsize(self):
+        return len(self.items)
+
+
+class FairQueue:
+    """FairScheduler 的模拟适配：时钟为虚拟时钟。"""
+
+    def __init__(self, clock, weights):
+        self.scheduler = FairScheduler(weights=weights, clock=clock)
+        self.clock = clock
+
+    def put(self, url, lane, flow):
+        self.scheduler.put(url, lane, flow)
+
+    def pop(self):
+        task = self.scheduler.get_nowait()
+        return task.url, self.clock() - task.enqueued_at
+
+    def qsize(self):
+        return self.scheduler.qsize()
+
+
+def simulate(name, make_queue, requests, args):
+    now = [0.0]
+    task_queue = make_queue(lambda: now[0])
+    kinds = {url: kind for _, kind, _, _, url in requests}
+    waits = {kind: [] for kind in ('admin', 'individual', 'small', 'burst')}
+    pending = deque(requests)
+    tick = 0.0
+    while pending or task_queue.qsize():
+        # 到下一次分派前到达的请求依次入队
+        while pending and pending[0][0] <= tick:
+            at, kind, lane, flow, url = pending.popleft()
+            now[0] = at
+            task_queue.put(url, lane, flow)
+        now[0] = tick
+        for _ in range(min(args.batch_size, task_queue.qsize())):
+            url, wait = task_queue.pop()
+            waits[kinds[url]].append(wait)
+        tick += args.interval
+    return {'name': name, 'waits': waits, 'finished_at': now[0]}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟一个群组突发大量链接时，FIFO 与优先级通道加公平调度的等待时间。')
+    parser.add_argument('--burst', type=int, default=100, help='大群一次粘贴的链接数')
+    parser.add_argument('--small-groups', type=int, default=3)
+    parser.add_argument('--small-period', type=float, default=60, help='每个小群发送链接的平均间隔（秒）')
+    parser.add_argument('--duration', type=float, default=600, help='小群和个人发送链接的时间范围（秒）')
+    parser.add_argument('--interval', type=float, default=30, help='DownloadTaskQueue 的分派间隔（秒）')
+    parser.add_argument('--batch-size', type=int, default=10, help='每次分派的任务数')
+    parser.add_argument('--big-weight', type=float, default=1, help='大群在配置中的权重')
+    args = parser.parse_args()
+
+    requests = make_requests(args)
+    results = [
+        simulate('FIFO', FifoQueue, requests, args),
+        simulate('优先级+公平', lambda clock: FairQueue(clock, {BIG_GROUP: args.big_weight}), requests, args),
+    ]
+
+    labels = {'admin': '管理员', 'individual': '个人', 'small': '小群', 'burst': '大群'}
+    print(f"请求: {len(requests)} 个（大群突发 {args.burst} 个），每 {args.interval:.0f} 秒分派 {args.batch_size} 个")
+    print(f"{'方式':<12}{'类别':<8}{'数量':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'最长(秒)':>10}")
+    for result in results:
+        for kind, waits in result['waits'].items():
+            print(f"{result['name']:<12}{labels[kind]:<8}{len(waits):>6}{percentile(waits, 0.5):>10.0f}"
+                  f"{percentile(waits, 0.95):>10.0f}{max(waits, default=0):>10.0f}")
+        print(f"{result['name']:<12}全部分派完成于 {result['finished_at']:.0f} 秒")
+    before, after = results
+    small_before = percentile(before['waits']['small'], 0.95)
+    small_after = percentile(after['waits']['small'], 0.95)
+    print(f"小群 p95 等待: {small_before:.0f} 秒 -> {small_after:.0f} 秒")
+
+    failures = []
+    if sum(map(len, before['waits'].values())) != sum(map(len, after['waits'].values())):
+        failures.append('两种方式分派的任务数不一致')
+    if before['finished_at'] != after['finished_at']:
+        failures.append('两种方式全部分派完的时间不一致')
+    if small_after >= small_before:
+        failures.append('公平调度没有缩短小群的 p95 等待时间')
+    if max(after['waits']['admin'], default=0) > args.interval:
+        failures.append('管理员的测试链接等待超过一个分派间隔')
+    if failures:
+        print("\n校验失败：" + '；'.join(failures))
+        sys.exit(1)
+    print("\n校验通过：分派总数和完成时间一致，小群的 p95 等待缩短，管理员链接在一个分派间隔内分派。")
+
+
+if __name__ == '__main__':
+    main()
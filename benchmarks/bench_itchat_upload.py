@@ -0,0 +1,101 @@
+# benchmarks/bench_itchat_upload.py
+"""
+测量 itchat 分块上传大文件时的内存峰值和吞吐量。
+
+模拟的 webwxuploadmedia 接口（benchmarks/e2e/webwx_server.py）在当前进程中运行，接收到的分块写入临时文件并在最后一块校验 MD5；
+每次上传在独立的子进程中调用 Core.upload_file，子进程报告上传前后的最大常驻内存，互不影响。
+--chunk-fail-rate 大于 0 时服务端随机拒绝分块，子进程重复调用 upload_file，从最后确认的分块继续上传。
+
+用法:
+    python -m benchmarks.bench_itchat_upload [--size-mb 64] [--concurrency 1 2 4] [--chunk-fail-rate 0.05]
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.e2e.clock import ScaledClock
+from benchmarks.e2e.webwx_server import FakeWebWxServer, make_core
+
+
+def run_child(args):
+    """子进程：上传一个文件，输出 JSON 结果。"""
+    from lib.itchat import config
+
+    config.UPLOAD_CONCURRENCY = args.child_concurrency
+    core = make_core(args.child_url, chatrooms=[])
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    attempts, r = 0, None
+    while attempts < args.max_attempts:
+        attempts += 1
+        r = core.upload_file(args.child_file)
+        if r:
+            break
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'ok': bool(r), 'media_id': r.get('MediaId', '') if r else '', 'attempts': attempts, 'elapsed': elapsed,
+        'baseline_kb': baseline_kb, 'peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def make_file(path, size_mb):
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量 itchat 分块上传的内存峰值和吞吐量。')
+    parser.add_argument('--size-mb', type=int, default=64, help='上传文件大小（MB）')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4], help='同时上传的分块数')
+    parser.add_argument('--upload-ms', type=float, default=40, help='服务端处理每个分块的延迟（毫秒）')
+    parser.add_argument('--chunk-fail-rate', type=float, default=0.0, help='服务端拒绝分块的概率')
+    parser.add_argument('--max-attempts', type=int, default=20, help='每次上传最多调用 upload_file 的次数')
+    parser.add_argument('--child-url', help=argparse.SUPPRESS)
+    parser.add_argument('--child-file', help=argparse.SUPPRESS)
+    parser.add_argument('--child-concurrency', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_url:
+        run_child(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench_itchat_upload_')
+    file_path = os.path.join(workdir, 'courseware.zip')
+    make_file(file_path, args.size_mb)
+    server = FakeWebWxServer(ScaledClock(1), upload_ms=args.upload_ms, chunk_fail_rate=args.chunk_fail_rate).start()
+
+    print(f"文件大小: {args.size_mb}MB，分块延迟: {args.upload_ms:.0f}ms，分块失败率: {args.chunk_fail_rate}")
+    print(f"{'并发':>4}{'耗时(秒)':>10}{'MB/秒':>8}{'内存增量(MB)':>14}{'调用次数':>10}{'分块(成功/拒绝)':>18}  结果")
+    failed = False
+    try:
+        for concurrency in args.concurrency:
+            chunks_before, failures_before, uploads_before = server.chunks, server.chunk_failures, server.uploads
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_itchat_upload', '--child-url', server.url,
+                 '--child-file', file_path, '--child-concurrency', str(concurrency),
+                 '--max-attempts', str(args.max_attempts)],
+                capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            verified = result['ok'] and server.uploads == uploads_before + 1 and result['media_id'] in server.media
+            failed = failed or not verified
+            print(f"{concurrency:>4}{result['elapsed']:>10.2f}{args.size_mb / result['elapsed']:>8.1f}"
+                  f"{(result['peak_kb'] - result['baseline_kb']) / 1024:>14.1f}{result['attempts']:>10}"
+                  f"{server.chunks - chunks_before:>10}/{server.chunk_failures - failures_before:<7}"
+                  f"  {'MD5 校验通过' if verified else '失败'}")
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
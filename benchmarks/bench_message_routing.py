@@ -0,0 +1,247 @@
+# benchmarks/bench_message_routing.py
+"""
+对比原来按列表查找监控群组、逐个 URL 调用 re.search 和 urlparse/urlunparse，与编译路由表时，
+MessageHandler.handle_group_message 每秒处理的群组消息数。
+
+配置 --groups 个监控群组（其中 --non-whole 个为非整体群组），消息来自 2 倍数量的群组，约一半来自非监控群组；
+约 1/3 的消息带资料链接，其中一部分带 fragment、结尾引号或空查询。
+积分检查、上传和添加下载任务使用桩对象，只记录调用参数，计时只包括路由、URL 提取和这些桩调用。
+- 原来的方式：按 handle_group_message 和 process_urls 的旧实现处理（监控群组和群组类型均为列表）；
+- 路由表：MessageHandler 当前的实现，按 RoutingTable 中的 ChatPolicy 和预编译规则处理。
+两种方式添加的下载任务和积分检查的群组类型应当一致。
+
+最后在一个线程持续处理消息时，另一个线程反复调用 update_config 在两份配置之间切换，
+校验每条消息积分检查使用的群组类型都与其中一份配置一致，不会出现新旧配置混合的结果。
+
+用法:
+    python -m benchmarks.bench_message_routing [--groups 1000] [--non-whole 200] [--messages 50000]
+"""
+
+import argparse
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from typing import List
+from urllib.parse import urlparse, urlunparse
+
+from src.itchat_module.itchat_handler import MessageHandler
+
+URL_TAILS = ('', '#reply', '」', '"', '?', '?id=1#top', '”')
+
+
+class StubPointManager:
+    """积分总是足够，记录每次检查时的群组类型。"""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def has_group_points(self, group_name):
+        self.calls.append((group_name, 'whole'))
+        return True
+
+    def ensure_user(self, group_name, nickname):
+        pass
+
+    def has_user_points(self, group_name, nickname):
+        self.calls.append((group_name, 'non-whole'))
+        return True
+
+
+class StubUploader:
+    def upload_group_id(self, **kwargs):
+        return True
+
+
+class LegacyMessageHandler(MessageHandler):
+    """原来的实现：监控群组和群组类型为列表，URL 逐个用 re.search 和 urlparse/urlunparse 处理。"""
+
+    def __init__(self, config, **kwargs):
+        super().__init__(**kwargs)
+        self.config = config
+        self.monitor_groups = config['wechat']['monitor_groups']
+        self.group_types = config['wechat']['group_types']
+        self.regex = re.compile(self.config.get('url', {}).get('regex', r'https?://[^\s"」]+'))
+        self.validation = self.config.get('url', {}).get('validation', True)
+
+    def legacy_process_urls(self, urls: List[str]):
+        valid_urls = []
+        for url in urls:
+            parsed = urlparse(url)
+            clean = parsed._replace(fragment='')
+            cleaned_url = urlunparse(clean).rstrip('」””"\'')
+            if self.validation and not cleaned_url.startswith(('http://', 'https://')):
+                logging.warning(f"URL 验证失败: {cleaned_url}")
+                continue
+            soft_id_match = re.search(r'/soft/(\d+)\.html', cleaned_url)
+            if soft_id_match:
+                soft_id = soft_id_match.group(1)
+            else:
+                logging.warning(f"无法从 URL 中提取 soft_id: {cleaned_url}")
+                soft_id = None
+            valid_urls.append((cleaned_url, soft_id))
+        return valid_urls
+
+    def legacy_check_points(self, group_name, sender_name, group_type):
+        logging.debug(f"开始积分检查 - 消息类型: group, 上下文名称: {group_name}, 发送者: {sender_name}, "
+                      f"群组类型: {group_type}")
+        if group_type == 'whole':
+            return self.point_manager.has_group_points(group_name)
+        self.point_manager.ensure_user(group_name, sender_name)
+        return self.point_manager.has_user_points(group_name, sender_name)
+
+    def handle_group_message(self, msg):
+        logging.debug(f"处理群组消息: {msg}")
+        group_name = msg.get('User', {}).get('NickName', '')
+        if group_name not in self.monitor_groups:
+            logging.debug(f"忽略来自非监控群组的消息: {group_name}")
+            return
+        if group_name in self.group_types.get('whole_groups', []):
+            group_type = 'whole'
+        elif group_name in self.group_types.get('non_whole_groups', []):
+            group_type = 'non-whole'
+        else:
+            group_type = 'whole'
+        sender_nickname = msg.get('ActualNickName', '')
+        urls = self.regex.findall(self.get_message_content(msg))
+        if not urls:
+            return
+        valid_urls = self.legacy_process_urls(urls)
+        if not valid_urls:
+            return
+        if not self.legacy_check_points(group_name, sender_nickname, group_type):
+            return
+        for url, soft_id in valid_urls:
+            if self.uploader and soft_id:
+                self.uploader.upload_group_id(recipient_name=group_name, soft_id=soft_id,
+                                              sender_nickname=sender_nickname if group_type == 'non-whole' else None,
+                                              recipient_type='group', group_type=group_type)
+            self.add_download_task_callback(url)
+
+
+def make_config(args, non_whole_offset=0):
+    groups = [f"课件下载群{i:04d}" for i in range(args.groups)]
+    non_whole = [groups[(non_whole_offset + i) % args.groups] for i in range(args.non_whole)]
+    return {
+        'wechat': {'monitor_groups': groups, 'target_individuals': [], 'admins': [],
+                   'group_types': {'whole_groups': [g for g in groups if g not in set(non_whole)],
+                                   'non_whole_groups': non_whole}},
+        'url': {'regex': r'https?://[^\s"」]+', 'validation': True},
+        'logging': {'directory': 'logs'},
+    }
+
+
+def make_messages(args):
+    rng = random.Random(42)
+    messages = []
+    for index in range(args.messages):
+        group = f"课件下载群{rng.randrange(args.groups * 2):04d}"
+        if rng.random() < 0.35:
+            links = ' '.join(f"https://www.zxxk.com/soft/{rng.randrange(10 ** 7, 10 ** 8)}.html{rng.choice(URL_TAILS)}"
+                             for _ in range(rng.choice((1, 1, 1, 2))))
+            text = f"老师好，麻烦下载 {links} 谢谢"
+        else:
+            text = f"第{index}条普通聊天消息，没有链接"
+        messages.append({'Type': 'Text', 'Text': text, 'User': {'NickName': group},
+                         'ActualNickName': f"成员{rng.randrange(300)}"})
+    return messages
+
+
+def make_handler(cls, config, tasks, calls, **kwargs):
+    wechat = config['wechat']
+    if cls is LegacyMessageHandler:
+        kwargs['config'] = config
+    handler = cls(error_handler=None, monitor_groups=wechat['monitor_groups'],
+                  target_individuals=wechat['target_individuals'], admins=wechat['admins'],
+                  point_manager=StubPointManager(calls),
+                  add_download_task_callback=lambda url, *args: tasks.append(url), **kwargs)
+    handler.set_uploader(StubUploader())
+    if cls is MessageHandler:
+        handler.update_config(config)
+    return handler
+
+
+def run(name, handler, messages, tasks, calls):
+    started = time.perf_counter()
+    for msg in messages:
+        handler.handle_group_message(msg)
+    elapsed = time.perf_counter() - started
+    return {'name': name, 'elapsed': elapsed, 'tasks': list(tasks), 'calls': list(calls)}
+
+
+def check_hot_swap(args, messages):
+    """处理消息的同时反复切换配置，校验每条消息的结果与其中一份配置一致。"""
+    configs = [make_config(args), make_config(args, non_whole_offset=args.groups // 2)]
+    expected = []
+    for config in configs:
+        monitored = set(config['wechat']['monitor_groups'])
+        non_whole = set(config['wechat']['group_types']['non_whole_groups'])
+        expected.append({g: ('non-whole' if g in non_whole else 'whole') for g in monitored})
+    calls = []
+    handler = make_handler(MessageHandler, configs[0], [], calls)
+    stop = threading.Event()
+    swaps = [0]
+
+    def swapper():
+        while not stop.is_set():
+            handler.update_config(configs[swaps[0] % 2 ^ 1])
+            swaps[0] += 1
+
+    thread = threading.Thread(target=swapper, daemon=True)
+    thread.start()
+    mismatches = 0
+    for msg in messages:
+        del calls[:]
+        handler.handle_group_message(msg)
+        for group_name, group_type in calls:
+            if all(e.get(group_name) != group_type for e in expected):
+                mismatches += 1
+    stop.set()
+    thread.join()
+    return swaps[0], mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比列表查找与编译路由表时 MessageHandler 每秒处理的群组消息数。')
+    parser.add_argument('--groups', type=int, default=1000, help='监控的群组数')
+    parser.add_argument('--non-whole', type=int, default=200, help='其中非整体群组数')
+    parser.add_argument('--messages', type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    config = make_config(args)
+    messages = make_messages(args)
+
+    tasks, calls = [], []
+    before = run('列表查找', make_handler(LegacyMessageHandler, config, tasks, calls), messages, tasks, calls)
+    tasks, calls = [], []
+    after = run('路由表', make_handler(MessageHandler, config, tasks, calls), messages, tasks, calls)
+    swaps, mismatches = check_hot_swap(args, messages[:min(len(messages), 20000)])
+    logging.disable(logging.NOTSET)
+
+    print(f"监控群组: {args.groups} 个（非整体 {args.non_whole} 个），消息: {len(messages)} 条，"
+          f"下载任务: {len(after['tasks'])} 个")
+    print(f"{'方式':<10}{'总耗时(毫秒)':>14}{'每秒消息数':>14}{'每条(微秒)':>12}")
+    for result in (before, after):
+        print(f"{result['name']:<10}{result['elapsed'] * 1000:>14.1f}{len(messages) / result['elapsed']:>14.0f}"
+              f"{result['elapsed'] * 1e6 / len(messages):>12.2f}")
+    print(f"吞吐量提高: {before['elapsed'] / after['elapsed']:.1f} 倍")
+    print(f"热替换: 处理消息期间切换配置 {swaps} 次，结果与任一配置不一致的消息 {mismatches} 条")
+
+    failures = []
+    if before['tasks'] != after['tasks'] or not after['tasks']:
+        failures.append('两种方式添加的下载任务不一致')
+    if before['calls'] != after['calls']:
+        failures.append('两种方式积分检查的群组类型不一致')
+    if mismatches:
+        failures.append('热替换期间出现与两份配置都不一致的结果')
+    if failures:
+        print("\n校验失败：" + '；'.join(failures))
+        sys.exit(1)
+    print("\n校验通过：两种方式添加的下载任务和群组类型一致，热替换期间每条消息都按其中一份配置处理。")
+
+
+if __name__ == '__main__':
+    main()
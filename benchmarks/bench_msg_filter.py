@@ -0,0 +1,226 @@
+# benchmarks/bench_msg_filter.py
+"""
+对比 itchat 接收循环逐条完整处理消息与先预过滤、再按需生成字段时，处理高流量 webwxsync 数据的耗时。
+
+数据默认按高流量账号的 webwxsync 响应合成（固定随机种子）：大部分消息来自未监控的活跃群聊，
+包含带表情和 HTML 转义的文本、图片、语音、分享和系统提示，少部分来自监控群聊和好友。
+也可以用 --payload 指定抓取的 webwxsync 响应（JSON，单个响应或响应列表），这时按消息中出现的群聊和成员生成本地联系人，
+并随机选 --monitor 个群聊作为监控群聊。
+
+处理函数与 ItChatHandler 相同：群聊和个人的 TEXT、SHARING 消息，只处理监控群聊和监控个人的消息。
+- 逐条完整处理：不设置预过滤，每条消息生成全部字段（原来的做法）；
+- 预过滤：itchat.set_msg_filter 按处理函数和监控会话丢弃消息，其余字段在处理函数读取时才生成。
+分别统计接收循环（produce_msg）和回复循环（分派和处理函数）的耗时，两种方式交给处理函数的消息应当一致。
+
+用法:
+    python -m benchmarks.bench_msg_filter [--batches 60] [--batch-size 50] [--rooms 200] [--members 300] [--monitor 5]
+    python -m benchmarks.bench_msg_filter --payload captured_sync.json
+"""
+
+import argparse
+import copy
+import json
+import random
+import re
+import sys
+import time
+
+from lib.itchat.components import load_components
+from lib.itchat.components.contact import update_local_chatrooms, update_local_friends
+from lib.itchat.components.messages import produce_msg
+from lib.itchat.content import SHARING, TEXT
+from lib.itchat.core import Core
+from lib.itchat.storage import templates
+
+SELF_USER_NAME = '@bench0self'
+RAW_FIELDS = {'MsgId': '', 'NewMsgId': 0, 'FromUserName': '', 'ToUserName': SELF_USER_NAME, 'MsgType': 1,
+              'Content': '', 'Url': '', 'AppMsgType': 0, 'FileName': '', 'MediaId': '', 'Status': 3,
+              'Ticket': '', 'RecommendInfo': {'UserName': '', 'NickName': ''}, 'CreateTime': 0}
+MEMBER_PATTERN = re.compile('(@[0-9a-z]*?):<br/>')
+
+
+def raw_message(rng, index, from_user, sender=None):
+    """生成一条 webwxsync AddMsgList 中的原始消息。"""
+    kind = rng.random()
+    msg = dict(RAW_FIELDS, MsgId=str(index), NewMsgId=10 ** 12 + index, FromUserName=from_user,
+               RecommendInfo=dict(RAW_FIELDS['RecommendInfo']), CreateTime=1700000000 + index)
+    if kind < 0.6:
+        text = (f"第{index}条 &lt;讨论&gt; &amp; 链接 https://example.com/soft/{index % 97}?id={index} "
+                f'<span class="emoji emoji1f604"></span><br/>换行')
+        msg.update(MsgType=1, Content=text)
+    elif kind < 0.75:
+        msg.update(MsgType=3, Content='&lt;?xml version="1.0"?&gt;&lt;msg&gt;&lt;img length="102400"/&gt;&lt;/msg&gt;')
+    elif kind < 0.85:
+        msg.update(MsgType=49, AppMsgType=5, FileName=f"分享{index}", Url=f"https://example.com/s/{index}",
+                   Content='&lt;msg&gt;&lt;appmsg&gt;&lt;title&gt;分享&lt;/title&gt;&lt;/appmsg&gt;&lt;/msg&gt;')
+    elif kind < 0.92:
+        msg.update(MsgType=34, Content='&lt;msg&gt;&lt;voicemsg length="2000"/&gt;&lt;/msg&gt;')
+    else:
+        msg.update(MsgType=10000, Content=f"成员{index}加入了群聊")
+        return msg
+    if sender:
+        msg['Content'] = f"{sender}:<br/>{msg['Content']}"
+    return msg
+
+
+def synthesize(args):
+    """合成 --batches 个 webwxsync 响应，返回 (响应列表, 群聊, 好友, 监控群聊名, 监控个人名)。"""
+    rng = random.Random(42)
+    rooms = [{'UserName': f"@@room{r}", 'NickName': f"群聊{r}",
+              'MemberList': [{'UserName': f"@m{r}x{i}", 'NickName': f"成员{r}-{i}", 'DisplayName': ''}
+                             for i in range(args.members)]} for r in range(args.rooms)]
+    friends = [{'UserName': f"@friend{i}", 'NickName': f"好友{i}", 'RemarkName': '', 'VerifyFlag': 0}
+               for i in range(args.friends)]
+    monitored = rooms[:args.monitor]
+    targets = friends[:max(1, args.friends // 20)]
+    responses, index = [], 0
+    for _ in range(args.batches):
+        batch = []
+        for _ in range(args.batch_size):
+            index += 1
+            kind = rng.random()
+            if kind < 0.9:
+                room = rng.choice(monitored) if kind < 0.15 else rng.choice(rooms)
+                batch.append(raw_message(rng, index, room['UserName'], rng.choice(room['MemberList'])['UserName']))
+            else:
+                friend = rng.choice(targets) if kind < 0.93 else rng.choice(friends)
+                batch.append(raw_message(rng, index, friend['UserName']))
+        responses.append({'BaseResponse': {'Ret': 0}, 'AddMsgCount': len(batch), 'AddMsgList': batch,
+                          'ModContactCount': 0, 'ModContactList': []})
+    return (responses, rooms, friends, [r['NickName'] for r in monitored],
+            [f['NickName'] for f in targets])
+
+
+def load_payload(args):
+    """读取抓取的 webwxsync 响应，按其中出现的群聊、成员和好友生成本地联系人。"""
+    with open(args.payload, encoding='utf8') as f:
+        data = json.load(f)
+    responses = data if isinstance(data, list) else [data]
+    rooms, friends = {}, {}
+    for response in responses:
+        for msg in response.get('AddMsgList', []):
+            for field, value in RAW_FIELDS.items():
+                msg.setdefault(field, copy.deepcopy(value))
+            user_name = msg['FromUserName']
+            if user_name.startswith('@@'):
+                members = rooms.setdefault(user_name, {})
+                match = MEMBER_PATTERN.match(msg['Content'])
+                if match:
+                    members[match.group(1)] = None
+            elif user_name != SELF_USER_NAME:
+                friends[user_name] = None
+    room_list = [{'UserName': user_name, 'NickName': f"群聊{r}",
+                  'MemberList': [{'UserName': m, 'NickName': f"成员{r}-{i}", 'DisplayName': ''}
+                                 for i, m in enumerate(members)]}
+                 for r, (user_name, members) in enumerate(rooms.items())]
+    friend_list = [{'UserName': user_name, 'NickName': f"好友{i}", 'RemarkName': '', 'VerifyFlag': 0}
+                   for i, user_name in enumerate(friends)]
+    rng = random.Random(42)
+    monitored = rng.sample(room_list, min(args.monitor, len(room_list)))
+    targets = rng.sample(friend_list, min(max(1, len(friend_list) // 20), len(friend_list)))
+    return (responses, room_list, friend_list, [r['NickName'] for r in monitored],
+            [f['NickName'] for f in targets])
+
+
+def make_core(rooms, friends):
+    load_components(Core)
+    core = Core()
+    core.loginInfo = {'wxuin': '1', 'url': 'https://wx.qq.com/cgi-bin/mmwebwx-bin', 'skey': '@crypt_bench',
+                      'User': {'UserName': SELF_USER_NAME, 'NickName': '基准账号'}}
+    core.storageClass.userName = SELF_USER_NAME
+    core.storageClass.nickName = '基准账号'
+    update_local_chatrooms(core, copy.deepcopy(rooms))
+    update_local_friends(core, copy.deepcopy(friends))
+    return core
+
+
+def run(name, args, data, use_filter):
+    responses, rooms, friends, monitor_groups, target_individuals = data
+    core = make_core(rooms, friends)
+    handled = []
+
+    def handle_group(msg):
+        group_name = msg.get('User', {}).get('NickName', '')
+        if group_name not in monitor_groups:
+            return
+        handled.append((msg['MsgId'], group_name, msg.get('ActualNickName', ''), msg['Type'], msg['Text']))
+
+    def handle_individual(msg):
+        sender = msg['User'].get('NickName', '')
+        if sender not in target_individuals:
+            return
+        handled.append((msg['MsgId'], sender, '', msg['Type'], msg['Text']))
+
+    core.msg_register([TEXT, SHARING], isGroupChat=True)(handle_group)
+    core.msg_register([TEXT, SHARING], isGroupChat=False)(handle_individual)
+    if use_filter:
+        core.set_msg_filter(groupNames=monitor_groups, friendNames=target_individuals)
+
+    batches = [copy.deepcopy(response['AddMsgList']) for response in responses]
+    receive_times, produced = [], []
+    for batch in batches:
+        started = time.perf_counter()
+        msgs = produce_msg(core, batch)
+        if not use_filter:
+            # 原来的接收循环在放入队列前生成全部字段
+            for msg in msgs:
+                msg.resolve_all()
+        receive_times.append(time.perf_counter() - started)
+        produced.extend(msgs)
+
+    # 按 configured_reply 的方式分派
+    started = time.perf_counter()
+    for msg in produced:
+        if isinstance(msg['User'], templates.User):
+            reply_fn = core.functionDict['FriendChat'].get(msg['Type'])
+        elif isinstance(msg['User'], templates.MassivePlatform):
+            reply_fn = core.functionDict['MpChat'].get(msg['Type'])
+        else:
+            reply_fn = core.functionDict['GroupChat'].get(msg['Type'])
+        if reply_fn is not None:
+            reply_fn(msg)
+    reply_elapsed = time.perf_counter() - started
+    return {'name': name, 'receive_times': receive_times, 'reply_elapsed': reply_elapsed,
+            'produced': len(produced), 'handled': handled,
+            'total': sum(len(batch) for batch in batches)}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比逐条完整处理与预过滤、按需生成字段时处理 webwxsync 消息的耗时。')
+    parser.add_argument('--payload', help='抓取的 webwxsync 响应 JSON 文件，不指定时合成')
+    parser.add_argument('--batches', type=int, default=60, help='合成的 webwxsync 响应数')
+    parser.add_argument('--batch-size', type=int, default=50, help='每个响应的消息数')
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--members', type=int, default=300, help='每个群聊的成员数')
+    parser.add_argument('--friends', type=int, default=500)
+    parser.add_argument('--monitor', type=int, default=5, help='监控的群聊数')
+    args = parser.parse_args()
+
+    data = load_payload(args) if args.payload else synthesize(args)
+    results = [run('逐条完整处理', args, data, use_filter=False), run('预过滤', args, data, use_filter=True)]
+
+    print(f"webwxsync 响应: {len(data[0])} 个，消息: {results[0]['total']} 条，群聊: {len(data[1])} 个，"
+          f"监控群聊: {len(data[3])} 个")
+    print(f"{'方式':<12}{'接收总耗时(毫秒)':>18}{'每批p50':>10}{'每批p95':>10}{'入队消息':>10}{'回复循环(毫秒)':>16}"
+          f"{'处理消息':>10}")
+    for result in results:
+        times = result['receive_times']
+        print(f"{result['name']:<12}{sum(times) * 1000:>18.1f}{percentile(times, 0.5) * 1000:>10.2f}"
+              f"{percentile(times, 0.95) * 1000:>10.2f}{result['produced']:>10}{result['reply_elapsed'] * 1000:>16.1f}"
+              f"{len(result['handled']):>10}")
+    before, after = results
+    print(f"接收循环耗时降低: {sum(before['receive_times']) / max(sum(after['receive_times']), 1e-9):.1f} 倍")
+
+    if before['handled'] != after['handled'] or not before['handled']:
+        print("\n校验失败：两种方式交给处理函数的消息不一致")
+        sys.exit(1)
+    print("\n校验通过：两种方式交给处理函数的消息一致。")
+
+
+if __name__ == '__main__':
+    main()
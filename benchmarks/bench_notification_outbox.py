@@ -0,0 +1,113 @@
+# benchmarks/bench_notification_outbox.py
+"""
+模拟一个实例故障时大量下载线程同时发送错误通知，对比直接发送与经过通知发件箱时调用方的阻塞时间和实际发出的消息数。
+
+假的发送对象每条消息耗时 --send-ms 毫秒（模拟 itchat.send_msg 的网络请求），并记录收到的消息。
+直接发送时每个线程在 notify 中串行等待网络请求；经过发件箱时 notify 立即返回，
+发件箱按频率限制发送，同类错误超过 max_individual 条后合并为汇总消息。
+
+用法:
+    python -m benchmarks.bench_notification_outbox [--threads 30] [--errors 5] [--send-ms 200]
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from src.notification.outbox import NotificationOutbox
+
+
+class FakeTarget:
+    """假的 WeChatNotifier：发送一条消息耗时 send_ms 毫秒，同一时间只能发送一条。"""
+
+    def __init__(self, recipient, send_ms):
+        self.recipient = recipient
+        self.send_ms = send_ms
+        self.lock = threading.Lock()
+        self.messages = []
+
+    def send_message(self, message):
+        with self.lock:
+            time.sleep(self.send_ms / 1000)
+            self.messages.append(message)
+        return True
+
+
+def error_messages(thread_index, count):
+    instance = f"xkw{thread_index % 3 + 1}"
+    return [f"[{instance}][tab{thread_index}][soft_id:{500000 + thread_index * 100 + n}] "
+            f"在60秒内未能找到匹配的下载文件: https://www.zxxk.com/soft/{500000 + thread_index * 100 + n}.html"
+            for n in range(count)]
+
+
+def run(args, notify):
+    """并发调用 notify，返回每次调用阻塞时间的列表和总耗时。"""
+    durations = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(index):
+        barrier.wait()
+        for message in error_messages(index, args.errors):
+            started = time.perf_counter()
+            notify(message)
+            with lock:
+                durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(durations), time.perf_counter() - started
+
+
+def describe(name, durations, elapsed, sent):
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{name:<8}{durations[len(durations) // 2] * 1000:>12.1f}{p95 * 1000:>12.1f}{durations[-1] * 1000:>12.1f}"
+          f"{elapsed:>12.2f}{sent:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比直接发送与通知发件箱的调用方阻塞时间和发出的消息数。')
+    parser.add_argument('--threads', type=int, default=30, help='同时报告错误的下载线程数')
+    parser.add_argument('--errors', type=int, default=5, help='每个线程报告的错误数')
+    parser.add_argument('--send-ms', type=float, default=200, help='每条消息的发送耗时（毫秒）')
+    parser.add_argument('--rate-per-minute', type=float, default=20)
+    parser.add_argument('--digest-interval', type=float, default=2, help='汇总周期（秒），基准中缩短以便观察')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    total = args.threads * args.errors
+
+    direct = FakeTarget('管理员', args.send_ms)
+    direct_durations, direct_elapsed = run(args, direct.send_message)
+
+    target = FakeTarget('管理员', args.send_ms)
+    outbox = NotificationOutbox(rate_per_minute=args.rate_per_minute, digest_interval=args.digest_interval)
+    outbox_durations, outbox_elapsed = run(args, lambda message: outbox.submit(target, message))
+    time.sleep(args.digest_interval + args.send_ms / 1000 * 2)
+    outbox.stop()
+    stats = outbox.get_stats()
+
+    print(f"错误通知: {total} 条（{args.threads} 个线程 × {args.errors} 条），单条发送耗时: {args.send_ms:.0f}ms")
+    print(f"{'方式':<8}{'p50(毫秒)':>12}{'p95(毫秒)':>12}{'最大(毫秒)':>12}{'调用耗时(秒)':>12}{'发出消息':>10}")
+    describe('直接发送', direct_durations, direct_elapsed, len(direct.messages))
+    describe('发件箱', outbox_durations, outbox_elapsed, len(target.messages))
+    print(f"发件箱统计: {stats}")
+    digests = [message for message in target.messages if message.startswith('通知汇总')]
+    if digests:
+        print(f"\n汇总消息示例:\n{digests[0]}")
+
+    counted = stats['sent'] - stats['digests'] + sum(
+        int(line.split(': ', 1)[1].split(' × ', 1)[0]) for digest in digests for line in digest.split('\n')[1:])
+    if counted != total or stats['pending'] or stats['folded_pending']:
+        print(f"\n校验失败：单独发送与汇总计数之和为 {counted}，预期 {total}")
+        sys.exit(1)
+    print(f"\n校验通过：{total} 条错误全部单独发送或计入汇总。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,449 @@
+# benchmarks/bench_pipeline.py
+"""
+离线端到端流水线基准：MessageHandler → DownloadTaskQueue → AutoDownloadManager/XKW → Uploader → PointManager。
+
+不需要微信登录、学科网账号和 Windows 桌面：
+- 消息由 MessageReplayer 按轨迹回放（可用 --trace 加载录制的轨迹，默认生成合成轨迹）；
+- DrissionPage 和 wxautox 替换为 benchmarks/e2e/fakes.py 中的假实现，页面和文件来自本地模拟站点；
+- 积分数据库使用临时目录中的 sqlite 文件。
+
+流水线中的固定等待按 --speedup 倍速运行，报告中的延迟和吞吐量都折算为模拟时间（即生产环境中的时间）。
+共享定时调度器（延迟删除、上传重试退避）和队列的阻塞超时仍按真实时间运行。
+
+报告内容：完成数、吞吐量、各阶段延迟分位数、队列峰值和资源占用。--json 保存结果，
+--baseline 与之前保存的结果比较，吞吐量下降或端到端 p95 延迟上升超过 --max-regression 时以非零状态退出。
+
+用法:
+    python -m benchmarks.bench_pipeline [--messages 60] [--instances 4] [--speedup 20] [--json result.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.e2e.clock import ScaledClock, ScaledQueue
+from benchmarks.e2e.fakes import FakeEnvironment, FakeWeChat, install_fake_modules
+from benchmarks.e2e.message_trace import MessageReplayer, generate_trace, load_trace, save_trace
+from benchmarks.e2e.zxxk_server import FakeZxxkServer
+
+SOFT_ID_PATTERN = re.compile(r'/soft/(\d+)\.html')
+LOGGED_LINK_PATTERN = re.compile(r'\[(\d+)\]')
+
+# 报告的阶段区间：(名称, 起始阶段, 结束阶段)
+STAGE_SPANS = [
+    ('消息入队', 'received', 'dispatched'),
+    ('页面加载', 'dispatched', 'clicked'),
+    ('文件下载', 'clicked', 'downloaded'),
+    ('匹配计数', 'downloaded', 'upload_queued'),
+    ('上传发送', 'upload_queued', 'sent'),
+    ('积分记账', 'sent', 'logged'),
+    ('端到端', 'received', 'logged'),
+]
+
+
+class StageRecorder:
+    """按 soft_id 记录每个任务到达各阶段的真实时间，只保留第一次到达的时间。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.marks = defaultdict(dict)
+        self.expected = set()
+        self.logged = set()
+        self.duplicate_logs = 0
+        self.done = threading.Event()
+
+    def expect(self, soft_ids):
+        self.expected = set(soft_ids)
+
+    def mark(self, stage: str, soft_id: str):
+        now = time.perf_counter()
+        with self.lock:
+            self.marks[soft_id].setdefault(stage, now)
+            if stage == 'logged':
+                if soft_id in self.logged:
+                    self.duplicate_logs += 1
+                self.logged.add(soft_id)
+                if self.expected and self.expected <= self.logged:
+                    self.done.set()
+
+    def spans(self, clock):
+        """返回各阶段区间的模拟秒数列表。"""
+        result = {name: [] for name, _, _ in STAGE_SPANS}
+        with self.lock:
+            for marks in self.marks.values():
+                for name, start, end in STAGE_SPANS:
+                    if start in marks and end in marks:
+                        result[name].append(clock.simulated_seconds(marks[end] - marks[start]))
+        return result
+
+
+class BenchNotifier:
+    """统计流水线发出的通知，不实际发送。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.errors = 0
+
+    def notify(self, message, is_error=False, coalesce=None):
+        with self.lock:
+            self.messages += 1
+            if is_error:
+                self.errors += 1
+                logging.debug(f"基准通知（错误）: {message}")
+
+
+class ResourceSampler:
+    """周期采样线程数、常驻内存和各队列长度，记录峰值。"""
+
+    def __init__(self, interval=0.2, probes=None):
+        self.interval = interval
+        self.probes = probes or {}
+        self.peaks = defaultdict(int)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='ResourceSampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def sample(self):
+        self.peaks['线程数'] = max(self.peaks['线程数'], threading.active_count())
+        rss = current_rss_kb()
+        if rss:
+            self.peaks['常驻内存(KB)'] = max(self.peaks['常驻内存(KB)'], rss)
+        for name, probe in self.probes.items():
+            try:
+                self.peaks[name] = max(self.peaks[name], probe())
+            except Exception:
+                pass
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+
+def current_rss_kb() -> int:
+    """读取当前进程的常驻内存（KB），非 Linux 平台返回 0。"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_specs(count, threads, first_port=19222):
+    """生成基准使用的实例配置，每个实例一个账号，昵称符合“全能数字”格式。"""
+    return [{'id': f"xkw{i}", 'port': first_port + i, 'user_data': f"data{i}", 'thread': threads,
+             'accounts': [{'username': f"bench{i}", 'password': 'bench', 'nickname': f"全能{i:02d}"}]}
+            for i in range(1, count + 1)]
+
+
+def run_benchmark(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    original_cwd = os.getcwd()
+    recorder = StageRecorder()
+    clock = ScaledClock(args.speedup)
+    server = FakeZxxkServer(clock, page_ms=args.page_ms, download_ms=args.download_ms, file_kb=args.file_kb,
+                            exclusive_every=args.exclusive_every).start()
+    env = FakeEnvironment(clock, server.url, on_event=recorder.mark)
+    install_fake_modules(env)
+    FakeWeChat.send_latency_ms = args.send_ms
+    FakeWeChat.per_file_ms = args.per_file_ms
+    FakeWeChat.fail_rate = args.send_fail_rate
+
+    # 假模块注册之后才能导入流水线模块；计数文件、日志和状态都写在临时目录中
+    os.chdir(workdir)
+    from src.auto_download import auto_download
+    from src.error_handling.error_handler import ErrorHandler
+    from src.file_upload import uploader as uploader_module
+    from src.itchat_module import itchat_handler
+    from src.point_manager import PointManager
+
+    logging.getLogger().setLevel(getattr(logging, args.log_level))
+    for module in (auto_download, uploader_module, itchat_handler):
+        module.time = clock
+    auto_download.DOWNLOAD_DIR = os.path.join(workdir, 'Downloads')
+    auto_download.STATE_DIR = os.path.join(workdir, 'state')
+    specs = build_specs(args.instances, args.threads)
+    auto_download.INSTANCE_SPECS = specs
+    env.nicknames = {spec['port']: spec['accounts'][0]['nickname'] for spec in specs}
+    auto_download.XKW.login_probe_url = f"{server.url}/user"
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        groups = [f"基准群{i:02d}" for i in range(1, args.groups + 1)]
+        individuals = [f"基准用户{i:02d}" for i in range(1, 4)]
+        trace = generate_trace(args.messages, groups, individuals, rate_per_minute=args.rate,
+                               individual_rate=args.individual_rate, seed=args.seed)
+    if args.save_trace:
+        save_trace(trace, os.path.join(original_cwd, args.save_trace))
+    groups = sorted({m['NickName'] for m in trace if m.get('chat') == 'group'})
+    individuals = sorted({m['NickName'] for m in trace if m.get('chat') != 'group'})
+    soft_ids = [match.group(1) for m in trace for match in SOFT_ID_PATTERN.finditer(m.get('Text', '') + m.get('Url', ''))]
+    recorder.expect(soft_id for soft_id in soft_ids if not server.is_exclusive(soft_id))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+
+    notifier = BenchNotifier()
+    error_handler = ErrorHandler(notifier)
+    point_manager = PointManager(db_path=os.path.join(workdir, 'points.db'))
+    for group in groups:
+        point_manager.ensure_group(group, is_whole=True, initial_points=10 ** 6)
+    for individual in individuals:
+        point_manager.add_recipient(individual, initial_points=10 ** 6)
+
+    record_uploads = point_manager.record_uploads
+
+    def traced_record_uploads(items, points=1):
+        results = record_uploads(items, points)
+        for item, result in zip(items, results):
+            match = LOGGED_LINK_PATTERN.search(os.path.basename(item['link']))
+            if match and result['logged']:
+                recorder.mark('logged', match.group(1))
+        return results
+
+    point_manager.record_uploads = traced_record_uploads
+
+    upload_config = {'batch_size': args.batch_size, 'max_files_per_send': args.max_files_per_send,
+                     'max_wait_seconds': args.max_wait, 'linger_seconds': args.linger,
+                     'journal_path': os.path.join(workdir, 'upload_journal.db')}
+    uploader = uploader_module.Uploader(upload_config=upload_config, error_notification_config={},
+                                        error_handler=error_handler, point_manager=point_manager)
+    uploader.upload_queue = ScaledQueue(clock)  # 上传线程按调度器给出的模拟时间等待新任务
+    add_upload_task = uploader.add_upload_task
+
+    def traced_add_upload_task(file_path, soft_id, recipient_type='group'):
+        recorder.mark('upload_queued', soft_id)
+        return add_upload_task(file_path, soft_id, recipient_type)
+
+    uploader.add_upload_task = traced_add_upload_task
+
+    manager = auto_download.AutoDownloadManager(uploader=uploader)
+    manager.notifier = notifier
+    for xkw in manager.xkw_instances:
+        xkw.notifier = notifier
+
+    class TracedController:
+        """DownloadTaskQueue 的下游，记录任务交给 AutoDownloadManager 的时间。"""
+
+        def add_task(self, url):
+            match = SOFT_ID_PATTERN.search(url)
+            if match:
+                recorder.mark('dispatched', match.group(1))
+            manager.add_task(url)
+
+    download_queue = itchat_handler.DownloadTaskQueue(browser_controller=TracedController())
+    handler = itchat_handler.MessageHandler(
+        error_handler=error_handler,
+        monitor_groups=groups,
+        target_individuals=individuals,
+        admins=[],
+        notifier=notifier,
+        browser_controller=manager,
+        point_manager=point_manager,
+        add_download_task_callback=download_queue.add_task,
+    )
+    handler.set_uploader(uploader)
+
+    def on_message(message):
+        for match in SOFT_ID_PATTERN.finditer(message.get('Text', '') + message.get('Url', '')):
+            recorder.mark('received', match.group(1))
+
+    sampler = ResourceSampler(probes={
+        '消息队列': download_queue.queue.qsize,
+        '实例队列': lambda: sum(xkw.task.qsize() for xkw in manager.xkw_instances),
+        '上传队列': uploader.upload_queue.qsize,
+    }).start()
+    replayer = MessageReplayer(trace, handler, clock, on_message=on_message)
+
+    started = time.perf_counter()
+    replayer.start()
+    completed_in_time = recorder.done.wait(args.timeout)
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else 0
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    spans = recorder.spans(clock)
+    completed = len(recorder.logged & recorder.expected)
+    simulated_elapsed = clock.simulated_seconds(elapsed)
+    result = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')},
+        'messages': len(trace),
+        'expected': len(recorder.expected),
+        'completed': completed,
+        'timed_out': not completed_in_time,
+        'duplicate_logs': recorder.duplicate_logs,
+        'pending_tasks': manager.pending_tasks.qsize(),
+        'error_notifications': notifier.errors,
+        'replay_errors': replayer.errors,
+        'elapsed_real': elapsed,
+        'elapsed_simulated': simulated_elapsed,
+        'throughput_per_hour': completed / simulated_elapsed * 3600 if simulated_elapsed else 0.0,
+        'throughput_real': completed / elapsed if elapsed else 0.0,
+        'latency': {name: {'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                           'max': max(values) if values else 0.0, 'count': len(values)}
+                    for name, values in spans.items()},
+        'peaks': dict(sampler.peaks),
+        'resources': {
+            'cpu_user': cpu_after.ru_utime - cpu_before.ru_utime,
+            'cpu_system': cpu_after.ru_stime - cpu_before.ru_stime,
+            'max_rss_kb': cpu_after.ru_maxrss,
+            'tracemalloc_peak_kb': traced_peak // 1024,
+            'server_requests': server.requests,
+            'server_mb': server.bytes_sent / 1024 / 1024,
+            'send_files_calls': FakeWeChat.calls,
+            'send_files_failures': FakeWeChat.failures,
+            'chat_switches': FakeWeChat.switches,
+        },
+        'upload_scheduler': uploader.upload_scheduler.get_metrics(),
+    }
+
+    try:
+        manager.stop()
+        uploader.stop()
+    except Exception as e:
+        logging.error(f"停止流水线时出错: {e}", exc_info=True)
+    finally:
+        server.stop()
+        os.chdir(original_cwd)
+        if args.keep_workdir:
+            print(f"临时目录已保留: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def format_report(result: dict) -> str:
+    config = result['config']
+    resources = result['resources']
+    lines = [
+        f"消息数: {result['messages']}，实例数: {config['instances']}，每实例标签页: {config['threads']}，"
+        f"加速倍数: {config['speedup']}",
+        f"完成: {result['completed']}/{result['expected']}" + ("（超时）" if result['timed_out'] else '') +
+        f"，挂起: {result['pending_tasks']}，重复记账: {result['duplicate_logs']}，错误通知: {result['error_notifications']}",
+        f"耗时: 真实 {result['elapsed_real']:.1f} 秒 / 模拟 {result['elapsed_simulated']:.0f} 秒，"
+        f"吞吐量: {result['throughput_per_hour']:.1f} 个/小时（模拟），{result['throughput_real']:.2f} 个/秒（真实）",
+        '',
+        f"{'阶段':<8}{'p50(秒)':>10}{'p95(秒)':>10}{'最大(秒)':>10}{'样本':>6}",
+    ]
+    for name, stats in result['latency'].items():
+        lines.append(f"{name:<8}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['max']:>10.1f}{stats['count']:>6}")
+    lines.append('')
+    lines.append('峰值: ' + '，'.join(f"{name} {value}" for name, value in result['peaks'].items()))
+    lines.append(
+        f"资源: CPU 用户态 {resources['cpu_user']:.2f} 秒，内核态 {resources['cpu_system']:.2f} 秒，"
+        f"最大常驻内存 {resources['max_rss_kb'] / 1024:.1f} MB" +
+        (f"，tracemalloc 峰值 {resources['tracemalloc_peak_kb'] / 1024:.1f} MB" if resources['tracemalloc_peak_kb'] else '')
+    )
+    lines.append(
+        f"模拟站点: 请求 {resources['server_requests']} 次，传输 {resources['server_mb']:.1f} MB；"
+        f"SendFiles: 调用 {resources['send_files_calls']} 次，失败 {resources['send_files_failures']} 次，"
+        f"窗口切换 {resources['chat_switches']} 次"
+    )
+    scheduler = result['upload_scheduler']
+    lines.append(
+        f"上传调度: 每文件切换 {scheduler['switches_per_file']:.2f} 次，每批 {scheduler['files_per_batch']:.1f} 个文件，"
+        f"排队时间 平均 {scheduler['wait_avg']:.1f} 秒 / p95 {scheduler['wait_p95']:.1f} 秒 / 最大 {scheduler['wait_max']:.1f} 秒，"
+        f"超出时限 {scheduler['sla_violations']} 个"
+    )
+    return "\n".join(lines)
+
+
+def compare_with_baseline(result: dict, baseline: dict, max_regression: float) -> list:
+    """返回超过允许退化比例的指标说明，列表为空表示没有退化。"""
+    problems = []
+    base_throughput = baseline.get('throughput_per_hour', 0)
+    if base_throughput and result['throughput_per_hour'] < base_throughput * (1 - max_regression):
+        problems.append(f"吞吐量从 {base_throughput:.1f} 下降到 {result['throughput_per_hour']:.1f} 个/小时")
+    base_p95 = baseline.get('latency', {}).get('端到端', {}).get('p95', 0)
+    p95 = result['latency']['端到端']['p95']
+    if base_p95 and p95 > base_p95 * (1 + max_regression):
+        problems.append(f"端到端 p95 延迟从 {base_p95:.1f} 上升到 {p95:.1f} 秒")
+    if result['completed'] < baseline.get('completed', 0):
+        problems.append(f"完成数从 {baseline['completed']} 减少到 {result['completed']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线运行消息到上传的完整流水线，报告吞吐量、阶段延迟和资源占用。')
+    parser.add_argument('--trace', help='回放的消息轨迹文件（JSON Lines），默认生成合成轨迹')
+    parser.add_argument('--save-trace', help='保存本次使用的消息轨迹')
+    parser.add_argument('--messages', type=int, default=60, help='合成轨迹的消息数')
+    parser.add_argument('--rate', type=float, default=30, help='合成轨迹每分钟的消息数（模拟时间）')
+    parser.add_argument('--groups', type=int, default=5, help='合成轨迹的群组数')
+    parser.add_argument('--individual-rate', type=float, default=0.1, help='合成轨迹中个人消息的比例')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--instances', type=int, default=4, help='XKW 实例数')
+    parser.add_argument('--threads', type=int, default=3, help='每个实例的标签页数')
+    parser.add_argument('--speedup', type=float, default=20, help='模拟时间相对真实时间的倍数')
+    parser.add_argument('--page-ms', type=float, default=300, help='页面响应延迟（模拟毫秒）')
+    parser.add_argument('--download-ms', type=float, default=2000, help='文件下载延迟（模拟毫秒）')
+    parser.add_argument('--file-kb', type=int, default=256, help='下载文件大小（KB）')
+    parser.add_argument('--exclusive-every', type=int, default=0, help='每隔多少个资料出现一个“独家教辅”页面')
+    parser.add_argument('--send-ms', type=float, default=1500, help='每次 SendFiles 的固定延迟（模拟毫秒）')
+    parser.add_argument('--per-file-ms', type=float, default=400, help='SendFiles 每个文件的延迟（模拟毫秒）')
+    parser.add_argument('--send-fail-rate', type=float, default=0.0, help='SendFiles 失败概率')
+    parser.add_argument('--batch-size', type=int, default=5, help='Uploader 每个接收者的批量大小')
+    parser.add_argument('--max-wait', type=float, default=20, help='上传调度器单个文件的最长排队时间（模拟秒）')
+    parser.add_argument('--linger', type=float, default=2, help='当前聊天窗口保持的时间（模拟秒）')
+    parser.add_argument('--max-files-per-send', type=int, default=10, help='每次 SendFiles 发送的最大文件数')
+    parser.add_argument('--timeout', type=float, default=300, help='等待全部完成的最长真实秒数')
+    parser.add_argument('--tracemalloc', action='store_true', help='统计 Python 内存分配峰值（会降低速度）')
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时目录以便检查')
+    parser.add_argument('--json', help='保存结果的 JSON 文件')
+    parser.add_argument('--baseline', help='用于比较的基准结果 JSON 文件')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='允许的最大退化比例')
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print(format_report(result))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare_with_baseline(result, baseline, args.max_regression)
+        for problem in problems:
+            print(f"性能退化: {problem}")
+        if problems:
+            sys.exit(1)
+    if result['timed_out']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/bench_point_bookkeeping.py
+"""
+对比逐个文件记账与按批次在一个事务中记账时，每 100 个上传的数据库提交次数和耗时。
+
+逐个记账按原来的 Uploader 方式，每个文件分别调用扣分方法和 log_download，各自提交一次；
+按批次记账每批文件调用一次 PointManager.record_uploads，整批只提交一次。
+接收者轮流为整体性群组、非整体性群组成员和个人，两种方式结束后的积分余额和下载记录数应当一致。
+
+用法:
+    python -m benchmarks.bench_point_bookkeeping [--uploads 100] [--batch-size 5] [--rounds 3]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from src.point_manager import PointManager
+
+RECIPIENTS = [
+    {'recipient_name': '基准整体群', 'recipient_type': 'group', 'group_type': 'whole', 'sender_nickname': None},
+    {'recipient_name': '基准成员群', 'recipient_type': 'group', 'group_type': 'non-whole', 'sender_nickname': '基准成员'},
+    {'recipient_name': '基准用户', 'recipient_type': 'individual', 'group_type': None, 'sender_nickname': None},
+]
+
+
+def make_point_manager(db_path):
+    point_manager = PointManager(db_path=db_path)
+    point_manager.ensure_group('基准整体群', is_whole=True, initial_points=10 ** 6)
+    point_manager.ensure_group('基准成员群', is_whole=False)
+    point_manager.ensure_user('基准成员群', '基准成员', initial_points=10 ** 6)
+    point_manager.add_recipient('基准用户', initial_points=10 ** 6)
+    commits = [0]
+    point_manager.conn.set_trace_callback(
+        lambda statement: commits.__setitem__(0, commits[0] + 1) if statement.strip().upper() == 'COMMIT' else None)
+    return point_manager, commits
+
+
+def make_items(count):
+    return [dict(RECIPIENTS[index % len(RECIPIENTS)], link=f"file:///tmp/[{400001 + index}]资料.docx")
+            for index in range(count)]
+
+
+def record_one_by_one(point_manager, items, batch_size):
+    """原来的方式：每个文件分别扣分和记录下载。"""
+    for item in items:
+        if item['recipient_type'] == 'individual':
+            point_manager.deduct_recipient_points(item['recipient_name'])
+        elif item['group_type'] == 'whole':
+            point_manager.deduct_whole_group_points(item['recipient_name'])
+        else:
+            point_manager.deduct_user_points(item['recipient_name'], item['sender_nickname'])
+        point_manager.log_download(PointManager.download_log_type(item['recipient_type'], item['group_type']),
+                                   item['recipient_name'], item['link'])
+
+
+def record_in_batches(point_manager, items, batch_size):
+    """每批文件在一个事务中扣分和记录下载。"""
+    for start in range(0, len(items), batch_size):
+        results = point_manager.record_uploads(items[start:start + batch_size])
+        if not all(result['charged'] and result['logged'] for result in results):
+            raise RuntimeError(f"批量记账失败：{results}")
+
+
+def snapshot(point_manager):
+    """返回积分余额和下载记录数，用于校验两种方式的结果一致。"""
+    cursor = point_manager.conn.cursor()
+    tables = {}
+    for table, query in (('groups', 'SELECT name, remaining_points FROM groups ORDER BY name'),
+                         ('users', 'SELECT nickname, remaining_points FROM users ORDER BY nickname'),
+                         ('recipients', 'SELECT name, remaining_points FROM recipients ORDER BY name'),
+                         ('download_logs', 'SELECT recipient_type, COUNT(*) FROM download_logs GROUP BY recipient_type'),
+                         ('daily_download_summary', 'SELECT recipient_type, SUM(download_count) FROM daily_download_summary '
+                                                    'GROUP BY recipient_type')):
+        cursor.execute(query)
+        tables[table] = cursor.fetchall()
+    return tables
+
+
+def run(mode, record, args, workdir):
+    point_manager, commits = make_point_manager(os.path.join(workdir, f"{mode}.db"))
+    items = make_items(args.uploads)
+    elapsed = []
+    commits_per_round = 0
+    for _ in range(args.rounds):
+        commits[0] = 0
+        started = time.perf_counter()
+        record(point_manager, items, args.batch_size)
+        elapsed.append(time.perf_counter() - started)
+        commits_per_round = commits[0]
+    result = {'commits': commits_per_round, 'elapsed': min(elapsed), 'snapshot': snapshot(point_manager)}
+    point_manager.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比逐个文件与按批次记账的提交次数和耗时。')
+    parser.add_argument('--uploads', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=5, help='每批记账的文件数（max_files_per_send 分组后的批次）')
+    parser.add_argument('--rounds', type=int, default=3, help='重复次数，报告最快的一次')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix='bench_bookkeeping_')
+    try:
+        before = run('one_by_one', record_one_by_one, args, workdir)
+        after = run('batched', record_in_batches, args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    scale = 100 / args.uploads
+    print(f"上传数: {args.uploads}，每批文件数: {args.batch_size}，重复 {args.rounds} 次")
+    print(f"{'方式':<10}{'每100个提交数':>14}{'每100个耗时(毫秒)':>20}")
+    for name, result in (('逐个记账', before), ('按批次记账', after)):
+        print(f"{name:<10}{result['commits'] * scale:>14.0f}{result['elapsed'] * scale * 1000:>20.1f}")
+    print(f"耗时降低: {before['elapsed'] / after['elapsed']:.1f} 倍")
+
+    if before['snapshot'] != after['snapshot']:
+        print(f"\n校验失败：积分余额或下载记录不一致\n逐个记账：{before['snapshot']}\n按批次记账：{after['snapshot']}")
+        sys.exit(1)
+    print("校验通过：两种方式的积分余额和下载记录一致。")
+
+
+if __name__ == '__main__':
+    main()
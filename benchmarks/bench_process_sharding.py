@@ -0,0 +1,148 @@
+# benchmarks/bench_process_sharding.py
+"""
+对比 1 个与 4 个工作进程托管 XKW 实例时的任务分发吞吐量和尾延迟。
+
+使用假的 XKW 后端：每个任务先做一段纯 Python 计算（模拟页面解析、文件名模糊匹配等持有 GIL 的工作），
+再休眠一段时间（模拟页面加载和下载等待），完成后上报文件事件和任务完成事件。
+
+用法:
+    python -m benchmarks.bench_process_sharding [--tasks 2000] [--cpu-ms 4] [--io-ms 20]
+"""
+
+import argparse
+import queue
+import threading
+import time
+
+from src.auto_download.process_broker import ProcessBroker
+
+INSTANCE_COUNT = 17
+THREADS_PER_INSTANCE = 3
+
+
+class FakeXKWBackend:
+    """假的 XKW 后端，按实例配置的线程数并发处理任务。"""
+
+    def __init__(self, spec, host):
+        self.id = spec['id']
+        self.host = host
+        self.cpu_ms = spec['cpu_ms']
+        self.io_ms = spec['io_ms']
+        self.task = queue.Queue()
+        self.work = True
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(spec['thread'])]
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        while self.work:
+            url = self.task.get()
+            if url is None:
+                break
+            burn_cpu(self.cpu_ms)
+            time.sleep(self.io_ms / 1000)
+            soft_id = url.rsplit('/', 1)[-1].split('.')[0]
+            self.host.uploader.add_upload_task(f"/tmp/{soft_id}.zip", soft_id)
+            self.host.task_done(self.id, url)
+
+    def add_task(self, url):
+        self.task.put(url)
+
+    def check_status(self):
+        return True
+
+    def stop(self):
+        self.work = False
+        for _ in self.threads:
+            self.task.put(None)
+
+
+def build_fake_backend(spec, host):
+    return FakeXKWBackend(spec, host)
+
+
+def burn_cpu(milliseconds):
+    """执行大约 milliseconds 毫秒的纯 Python 计算。"""
+    deadline = time.perf_counter() + milliseconds / 1000
+    value = 0
+    while time.perf_counter() < deadline:
+        for i in range(200):
+            value = (value * 31 + i) % 1000003
+    return value
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_once(workers, tasks, cpu_ms, io_ms):
+    specs = [{'id': f'xkw{i}', 'thread': THREADS_PER_INSTANCE, 'cpu_ms': cpu_ms, 'io_ms': io_ms, 'accounts': []}
+             for i in range(1, INSTANCE_COUNT + 1)]
+    ready = threading.Semaphore(0)
+    done = threading.Event()
+    dispatched_at = {}
+    latencies = []
+    files = [0]
+    lock = threading.Lock()
+
+    def on_event(event):
+        kind = event[0]
+        if kind == 'ready':
+            ready.release()
+        elif kind == 'file_ready':
+            files[0] += 1
+        elif kind == 'task_done':
+            finished = time.perf_counter()
+            with lock:
+                latencies.append(finished - dispatched_at.pop(event[1]))
+                if len(latencies) == tasks:
+                    done.set()
+
+    broker = ProcessBroker(specs, workers, 'benchmarks.bench_process_sharding:build_fake_backend',
+                           event_handler=on_event)
+    try:
+        for _ in range(len(broker.workers)):
+            ready.acquire()
+
+        started = time.perf_counter()
+        for index in range(tasks):
+            instance_id = specs[index % INSTANCE_COUNT]['id']
+            with lock:
+                task_id = broker.dispatch(instance_id, f"https://www.zxxk.com/soft/{100000 + index}.html")
+                dispatched_at[task_id] = time.perf_counter()
+        done.wait()
+        elapsed = time.perf_counter() - started
+    finally:
+        broker.stop()
+
+    return {
+        'workers': workers,
+        'throughput': tasks / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'files': files[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比 1 个与 4 个工作进程的任务分发吞吐量和尾延迟。')
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--cpu-ms', type=float, default=4, help='每个任务持有 GIL 的计算时间（毫秒）')
+    parser.add_argument('--io-ms', type=float, default=20, help='每个任务的等待时间（毫秒）')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    print(f"任务数: {args.tasks}，实例数: {INSTANCE_COUNT}，每实例线程数: {THREADS_PER_INSTANCE}，"
+          f"计算 {args.cpu_ms}ms + 等待 {args.io_ms}ms")
+    print(f"{'进程数':>6}{'吞吐(任务/秒)':>16}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for workers in args.workers:
+        result = run_once(workers, args.tasks, args.cpu_ms, args.io_ms)
+        print(f"{result['workers']:>6}{result['throughput']:>16.1f}{result['p50']:>10.1f}"
+              f"{result['p95']:>10.1f}{result['p99']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
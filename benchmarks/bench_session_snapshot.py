@@ -0,0 +1,179 @@
+# benchmarks/bench_session_snapshot.py
+"""
+对比原来用 pickle 保存整个 Storage 与版本化会话快照在写入、读取和恢复登录时的耗时。
+
+先载入 --rooms 个群聊（每个 --members 名成员）和 --friends 个好友，然后：
+- pickle：按原来的 dump_login_status 写入 loginInfo、cookies 和 Storage.dumps()，再读回并载入联系人；
+- 会话快照：首次写入（会话文件和联系人文件）、联系人未变化时再次写入（只写会话文件）、
+  合并一个群聊增量后写入，以及读取并载入联系人；
+- 恢复登录：新的 Core 调用 load_login_status，经 webwxsync 验证会话后启动消息接收，
+  统计到收到模拟接口放入的第一条消息为止的耗时（模拟接口见 benchmarks/e2e/webwx_server.py）。
+最后校验恢复的联系人与写入前一致，截断的快照被拒绝，不属于该会话的联系人文件被忽略。
+
+用法:
+    python -m benchmarks.bench_session_snapshot [--rooms 300] [--members 500] [--friends 2000]
+"""
+
+import argparse
+import copy
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.e2e.clock import ScaledClock
+from benchmarks.e2e.webwx_server import FakeWebWxServer, SELF_USER_NAME
+from lib.itchat.components import load_components
+from lib.itchat.components.contact import update_local_chatrooms, update_local_friends
+from lib.itchat.components.hotreload import load_snapshot
+from lib.itchat.config import VERSION
+from lib.itchat.core import Core
+from lib.itchat.storage import snapshot
+
+
+def make_core(server_url):
+    load_components(Core)
+    core = Core()
+    core.loginInfo = {
+        'url': server_url, 'fileUrl': server_url, 'syncUrl': server_url, 'pass_ticket': 'bench',
+        'skey': 'bench', 'wxsid': 'bench', 'wxuin': '1', 'deviceid': 'e000000000000000',
+        'logintime': int(time.time() * 1000), 'SyncKey': {'Count': 1, 'List': [{'Key': 1, 'Val': 0}]},
+        'synckey': '1_0', 'BaseRequest': {'Skey': 'bench', 'Sid': 'bench', 'Uin': 1, 'DeviceID': 'e000000000000000'},
+        'User': {'UserName': SELF_USER_NAME, 'NickName': '基准账号'}}
+    core.s.trust_env = False  # 不经过环境变量中的代理访问本地端口
+    core.s.cookies.set('webwx_data_ticket', 'bench', domain='127.0.0.1', path='/')
+    core.s.cookies.set('wxuin', '1', domain='127.0.0.1', path='/')
+    core.storageClass.userName = SELF_USER_NAME
+    core.storageClass.nickName = '基准账号'
+    return core
+
+
+def load_contacts(core, args):
+    update_local_chatrooms(core, [
+        {'UserName': f"@@room{r}", 'NickName': f"群聊{r}", 'ChatRoomOwner': f"@m{r}x0",
+         'MemberList': [{'UserName': f"@m{r}x{i}", 'NickName': f"成员{r}-{i}", 'DisplayName': '',
+                         'AttrStatus': 0, 'Uin': 0} for i in range(args.members)]}
+        for r in range(args.rooms)])
+    update_local_friends(core, [
+        {'UserName': f"@friend{i}", 'NickName': f"好友{i}", 'RemarkName': f"备注{i}", 'VerifyFlag': 0,
+         'Sex': 1, 'HeadImgUrl': f"/cgi-bin/mmwebwx-bin/webwxgeticon?username=@friend{i}"}
+        for i in range(args.friends)])
+
+
+def contacts_of(core):
+    return ([(f['UserName'], f['RemarkName']) for f in core.memberList],
+            [(c['UserName'], c['NickName'], [m['UserName'] for m in c['MemberList']]) for c in core.chatroomList])
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def legacy_dump(core, file_dir):
+    """原来的 dump_login_status：pickle 保存整个 Storage。"""
+    status = {'version': VERSION, 'loginInfo': core.loginInfo, 'cookies': core.s.cookies.get_dict(),
+              'storage': core.storageClass.dumps()}
+    with open(file_dir, 'wb') as f:
+        pickle.dump(status, f)
+
+
+def legacy_load(core, file_dir):
+    with open(file_dir, 'rb') as f:
+        j = pickle.load(f)
+    core.storageClass.loads(j['storage'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比 pickle 与版本化会话快照的写入、读取和恢复登录耗时。')
+    parser.add_argument('--rooms', type=int, default=300)
+    parser.add_argument('--members', type=int, default=500, help='每个群聊的成员数')
+    parser.add_argument('--friends', type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_session_snapshot_')
+    server = FakeWebWxServer(ScaledClock(), poll_seconds=1).start()
+    failures = []
+    try:
+        core = make_core(server.url)
+        load_contacts(core, args)
+        expected = contacts_of(core)
+
+        legacy_file = os.path.join(workdir, 'legacy.pkl')
+        legacy_dump_time, _ = timed(legacy_dump, core, legacy_file)
+        legacy_load_time, _ = timed(legacy_load, make_core(server.url), legacy_file)
+
+        session_file = os.path.join(workdir, 'itchat.pkl')
+        first_dump_time, _ = timed(core.dump_login_status, session_file)
+        unchanged_dump_time, _ = timed(core.dump_login_status, session_file)
+        update_local_chatrooms(core, [{'UserName': '@@room0', 'NickName': '群聊0（改名）',
+                                       'MemberList': copy.deepcopy(core.chatroomList[0]['MemberList'][1:])}])
+        expected = contacts_of(core)
+        changed_dump_time, _ = timed(core.dump_login_status, session_file)
+        load_time, _ = timed(load_snapshot, make_core(server.url), session_file)
+        sizes = (os.path.getsize(legacy_file), os.path.getsize(session_file),
+                 os.path.getsize(session_file + snapshot.CONTACTS_SUFFIX))
+
+        # 恢复登录：webwxsync 验证会话后启动接收，等待第一条消息
+        resumed = make_core(server.url)
+        received = threading.Event()
+        resumed.msgList.put = lambda msg: received.set()
+        server.push_message('@friend1', '恢复后的第一条消息')
+        started = time.perf_counter()
+        r = resumed.load_login_status(session_file)
+        resume_time = time.perf_counter() - started
+        received.wait(10)
+        first_msg_time = time.perf_counter() - started
+        if not r or not r.get('ContactsLoaded'):
+            failures.append(f"恢复登录失败: {r}")
+        if contacts_of(resumed) != expected:
+            failures.append('恢复的联系人与写入前不一致')
+        if not received.is_set():
+            failures.append('恢复后没有收到消息')
+        resumed.alive = False
+
+        # 截断的会话文件被拒绝
+        broken_file = os.path.join(workdir, 'broken.pkl')
+        with open(session_file, 'rb') as f:
+            data = f.read()
+        with open(broken_file, 'wb') as f:
+            f.write(data[:-10])
+        shutil.copy(session_file + snapshot.CONTACTS_SUFFIX, broken_file + snapshot.CONTACTS_SUFFIX)
+        r = make_core(server.url).load_login_status(broken_file)
+        if r or r['BaseResponse']['Ret'] != -1005:
+            failures.append(f"截断的快照没有被拒绝: {r}")
+        # 不属于该会话的联系人文件被忽略，会话仍然恢复
+        with open(broken_file, 'wb') as f:
+            f.write(data)
+        shutil.copy(legacy_file, broken_file + snapshot.CONTACTS_SUFFIX)
+        other = make_core(server.url)
+        r = other.load_login_status(broken_file)
+        other.alive = False
+        if not r or r.get('ContactsLoaded') or other.chatroomList:
+            failures.append(f"不匹配的联系人文件没有被忽略: {r}")
+    finally:
+        time.sleep(0.2)
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"群聊: {args.rooms} × {args.members} 名成员，好友: {args.friends}")
+    print(f"{'操作':<24}{'耗时(毫秒)':>12}")
+    for name, elapsed in (('pickle 写入', legacy_dump_time), ('pickle 读取', legacy_load_time),
+                          ('快照首次写入', first_dump_time), ('快照写入（联系人未变化）', unchanged_dump_time),
+                          ('快照写入（联系人有变化）', changed_dump_time), ('快照读取（含载入联系人）', load_time),
+                          ('恢复登录（含 webwxsync）', resume_time), ('恢复到收到第一条消息', first_msg_time)):
+        print(f"{name:<24}{elapsed * 1000:>12.1f}")
+    print(f"文件大小: pickle {sizes[0] / 1024:.0f}KB，快照会话 {sizes[1] / 1024:.1f}KB + 联系人 {sizes[2] / 1024:.0f}KB")
+
+    if failures:
+        print("\n校验失败：" + '；'.join(failures))
+        sys.exit(1)
+    print("\n校验通过：恢复的联系人与写入前一致，截断的快照被拒绝，不匹配的联系人文件被忽略。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# benchmarks/bench_upload_backends.py
+"""
+对比 wxauto 界面自动化与 itchat 协议两种上传后端的发送成本，并校验 itchat 后端的发送结果。
+
+wxauto 后端使用 benchmarks/e2e/fakes.py 中的假 WeChat；itchat 后端连接 benchmarks/e2e/webwx_server.py
+中模拟的 webwxuploadmedia/webwxsendappmsg 接口，服务端校验票据和文件 MD5，并记录每个接收者收到的文件。
+两种后端都通过 Uploader.upload_files 发送同一组文件。itchat 后端随后模拟同一份资料被 --fanout 个群组分别下载：
+内容相同、文件名不同的副本各自发给一个群组，应当只上传一次；重新加载持久化的 MediaId 缓存后再次发送也不应上传。
+
+用法:
+    python -m benchmarks.bench_upload_backends [--files 20] [--recipients 4] [--workers 4] [--file-kb 700] [--fanout 10]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.e2e.clock import ScaledClock
+from benchmarks.e2e.fakes import FakeEnvironment, FakeWeChat, install_fake_modules
+from benchmarks.e2e.webwx_server import FakeWebWxServer, make_core
+
+
+def make_tasks(directory, count, recipients, file_kb):
+    """生成内容各不相同的文件，按轮转分配给接收者。"""
+    tasks = {recipient: [] for recipient in recipients}
+    for index in range(count):
+        soft_id = f"{200001 + index}"
+        file_path = os.path.join(directory, f"[{soft_id}]资料{index}.docx")
+        with open(file_path, 'wb') as f:
+            f.write(os.urandom(file_kb * 1024))
+        tasks[recipients[index % len(recipients)]].append({
+            'file_path': file_path, 'soft_id': soft_id, 'recipient_type': 'group',
+            'sender_nickname': None, 'group_type': 'whole'})
+    return tasks
+
+
+def run_fanout(args, uploader, clock, server, core, workdir):
+    """同一份资料的 --fanout 个副本分别发给不同群组，返回 (上传次数, 发送次数, 模拟耗时, 问题列表)。"""
+    from src.file_upload.media_cache import MediaCache
+    from src.file_upload.upload_backends import ItchatUploadBackend
+
+    directory = os.path.join(workdir, 'fanout')
+    os.makedirs(directory)
+    content = os.urandom(args.file_kb * 1024)
+    groups = [f"扇出群{i:02d}" for i in range(1, args.fanout + 1)]
+    chatrooms = [{'UserName': f"@@fanout{i:03d}", 'NickName': name, 'MemberList': []}
+                 for i, name in enumerate(groups, 1)]
+    core.chatroomList.extend(chatrooms)
+    # 与 itchat 收到联系人更新时相同，通知接收者索引
+    for hook in core.contactHooks:
+        hook(chatrooms)
+    uploads_before, sends_before = server.uploads, server.sends
+    problems = []
+    started = time.perf_counter()
+    for index, group in enumerate(groups):
+        uploader.point_manager.ensure_group(group, is_whole=True, initial_points=10 ** 6)
+        file_path = os.path.join(directory, f"[{300001 + index}]同一份资料.docx")
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        uploader.upload_files(group, [{'file_path': file_path, 'soft_id': f"{300001 + index}", 'recipient_type': 'group',
+                                       'sender_nickname': None, 'group_type': 'whole'}])
+    elapsed = clock.simulated_seconds(time.perf_counter() - started)
+    uploads, sends = server.uploads - uploads_before, server.sends - sends_before
+    if uploads != 1 or sends != args.fanout:
+        problems.append(f"扇出：上传 {uploads} 次、发送 {sends} 次，预期上传 1 次、发送 {args.fanout} 次")
+
+    # 重新加载持久化的缓存，模拟重启后再次发送同一份资料
+    uploader.media_cache.flush()
+    restarted = ItchatUploadBackend(core=core, media_cache=MediaCache(uploader.media_cache.cache_path))
+    restarted.send_files(groups[0], [file_path])
+    restarted.close()
+    if server.uploads - uploads_before != 1:
+        problems.append("重启后再次发送时重新上传了文件，MediaId 缓存未持久化")
+    return uploads, sends, elapsed, problems
+
+
+def run_mode(mode, args, uploader, clock, recipients, workdir, server=None):
+    from src.file_upload.upload_backends import ItchatUploadBackend, WxautoUploadBackend
+
+    ui_backend = WxautoUploadBackend(uploader.wx)
+    core = None
+    if mode == 'itchat':
+        core = make_core(server.url, chatrooms=recipients)
+        uploader.backends = [ItchatUploadBackend(core=core, max_workers=args.workers, media_cache=uploader.media_cache),
+                             ui_backend]
+    else:
+        uploader.backends = [ui_backend]
+
+    directory = os.path.join(workdir, mode)
+    os.makedirs(directory)
+    tasks = make_tasks(directory, args.files, recipients, args.file_kb)
+    FakeWeChat.reset_stats()
+    started = time.perf_counter()
+    for recipient, recipient_tasks in tasks.items():
+        uploader.upload_files(recipient, recipient_tasks)
+    elapsed = clock.simulated_seconds(time.perf_counter() - started)
+    result = {'mode': mode, 'elapsed': elapsed, 'per_file': elapsed / args.files, 'ui_calls': FakeWeChat.calls,
+              'problems': []}
+
+    expected = {recipient: sorted(os.path.basename(task['file_path']) for task in recipient_tasks)
+                for recipient, recipient_tasks in tasks.items()}
+    if mode == 'itchat':
+        backend = uploader.backends[0]
+        delivered = {recipient: sorted(server.deliveries.get(backend.resolve_user_name(recipient), []))
+                     for recipient in recipients}
+        result.update({'uploads': server.uploads, 'sends': server.sends, 'max_concurrent': server.max_concurrent_uploads})
+        uploads, sends, elapsed, problems = run_fanout(args, uploader, clock, server, core, workdir)
+        result['fanout'] = f"{args.fanout} 个群组请求同一份资料：上传 {uploads} 次，发送 {sends} 次，模拟耗时 {elapsed:.1f} 秒"
+        result['problems'].extend(problems)
+    else:
+        delivered = {recipient: sorted(FakeWeChat.sent_files.get(recipient, [])) for recipient in recipients}
+    for recipient in recipients:
+        if delivered[recipient] != expected[recipient]:
+            result['problems'].append(f"{recipient} 收到的文件与预期不一致：{len(delivered[recipient])}/{len(expected[recipient])}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比 wxauto 与 itchat 上传后端的单文件发送成本。')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--recipients', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4, help='itchat 后端并发上传的文件数')
+    parser.add_argument('--file-kb', type=int, default=700, help='文件大小（KB），超过 512KB 时分块上传')
+    parser.add_argument('--send-ms', type=float, default=1500, help='每次 SendFiles 的固定界面开销（模拟毫秒）')
+    parser.add_argument('--per-file-ms', type=float, default=400, help='SendFiles 每个文件的额外开销（模拟毫秒）')
+    parser.add_argument('--upload-ms', type=float, default=800, help='每个上传分块的延迟（模拟毫秒）')
+    parser.add_argument('--appmsg-ms', type=float, default=200, help='每条文件消息的发送延迟（模拟毫秒）')
+    parser.add_argument('--fanout', type=int, default=10, help='请求同一份资料的群组数')
+    parser.add_argument('--speedup', type=float, default=2, help='模拟时间相对真实时间的倍数，过大时请求处理的真实耗时会放大模拟耗时')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_backends_')
+    clock = ScaledClock(args.speedup)
+    install_fake_modules(FakeEnvironment(clock, ''))
+    FakeWeChat.send_latency_ms = args.send_ms
+    FakeWeChat.per_file_ms = args.per_file_ms
+    server = FakeWebWxServer(clock, upload_ms=args.upload_ms, send_ms=args.appmsg_ms).start()
+
+    from src.error_handling.error_handler import ErrorHandler
+    from src.file_upload import uploader as uploader_module
+    from src.point_manager import PointManager
+
+    logging.getLogger().setLevel(logging.WARNING)
+    uploader_module.time = clock
+    recipients = [f"基准群{i:02d}" for i in range(1, args.recipients + 1)]
+    point_manager = PointManager(db_path=os.path.join(workdir, 'points.db'))
+    for recipient in recipients:
+        point_manager.ensure_group(recipient, is_whole=True, initial_points=10 ** 6)
+    upload_config = {'journal_path': os.path.join(workdir, 'upload_journal.db'),
+                     'media_cache_path': os.path.join(workdir, 'media_cache.json')}
+    uploader = uploader_module.Uploader(upload_config=upload_config, error_notification_config={},
+                                        error_handler=ErrorHandler(None), point_manager=point_manager)
+
+    print(f"文件数: {args.files}，接收者: {args.recipients}，文件大小: {args.file_kb}KB，itchat 并发: {args.workers}")
+    print(f"{'后端':<8}{'模拟耗时(秒)':>14}{'每文件(秒)':>12}{'界面调用':>10}{'上传':>6}{'发送':>6}{'最大并发':>10}")
+    problems = []
+    try:
+        for mode in ('wxauto', 'itchat'):
+            result = run_mode(mode, args, uploader, clock, recipients, workdir, server)
+            print(f"{mode:<8}{result['elapsed']:>14.1f}{result['per_file']:>12.2f}{result['ui_calls']:>10}"
+                  f"{result.get('uploads', '-'):>6}{result.get('sends', '-'):>6}{result.get('max_concurrent', '-'):>10}")
+            if 'fanout' in result:
+                print(f"{'':<8}{result['fanout']}")
+            problems.extend(f"[{mode}] {problem}" for problem in result['problems'])
+    finally:
+        uploader.stop()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if problems:
+        print("\n校验失败：\n" + "\n".join(problems))
+        sys.exit(1)
+    print("\n校验通过：每个接收者收到的文件与预期一致，内容相同的文件只上传一次。")
+
+
+if __name__ == '__main__':
+    main()
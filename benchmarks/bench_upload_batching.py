@@ -0,0 +1,83 @@
+# benchmarks/bench_upload_batching.py
+"""
+对比不同批量大小下 Uploader.upload_files 的单文件上传成本。
+
+使用 benchmarks/e2e/fakes.py 中的假 WeChat：每次 SendFiles 调用有固定的界面开销（切换聊天、粘贴、等待输入框、发送），
+每个文件另有少量开销。同一接收者的文件按批量大小分组后交给 upload_files，统计 SendFiles 调用次数、
+界面占用时间以及平均每个文件的成本（均为模拟时间）。
+
+用法:
+    python -m benchmarks.bench_upload_batching [--files 60] [--batch-sizes 1 2 5 10]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.e2e.clock import ScaledClock
+from benchmarks.e2e.fakes import FakeEnvironment, FakeWeChat, install_fake_modules
+
+RECIPIENT = '基准群01'
+
+
+def make_tasks(directory, count, prefix):
+    tasks = []
+    for index in range(count):
+        file_path = os.path.join(directory, f"[{prefix}{index:04d}]资料{index}.docx")
+        with open(file_path, 'wb') as f:
+            f.write(b'\0' * 1024)
+        tasks.append({'file_path': file_path, 'soft_id': f"{prefix}{index:04d}", 'recipient_type': 'group',
+                      'sender_nickname': None, 'group_type': 'whole'})
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比不同批量大小下单个文件的上传成本。')
+    parser.add_argument('--files', type=int, default=60)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 5, 10])
+    parser.add_argument('--send-ms', type=float, default=1500, help='每次 SendFiles 的固定界面开销（模拟毫秒）')
+    parser.add_argument('--per-file-ms', type=float, default=400, help='每个文件的额外开销（模拟毫秒）')
+    parser.add_argument('--speedup', type=float, default=50, help='模拟时间相对真实时间的倍数')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+    clock = ScaledClock(args.speedup)
+    install_fake_modules(FakeEnvironment(clock, ''))
+    FakeWeChat.send_latency_ms = args.send_ms
+    FakeWeChat.per_file_ms = args.per_file_ms
+
+    from src.error_handling.error_handler import ErrorHandler
+    from src.file_upload import uploader as uploader_module
+    from src.point_manager import PointManager
+
+    logging.getLogger().setLevel(logging.WARNING)
+    uploader_module.time = clock
+    point_manager = PointManager(db_path=os.path.join(workdir, 'points.db'))
+    point_manager.ensure_group(RECIPIENT, is_whole=True, initial_points=10 ** 6)
+    upload_config = {'journal_path': os.path.join(workdir, 'upload_journal.db')}
+    uploader = uploader_module.Uploader(upload_config=upload_config, error_notification_config={},
+                                        error_handler=ErrorHandler(None), point_manager=point_manager)
+
+    print(f"文件数: {args.files}，SendFiles 固定开销 {args.send_ms:.0f}ms，每文件 {args.per_file_ms:.0f}ms")
+    print(f"{'批量':>6}{'调用次数':>10}{'界面耗时(秒)':>14}{'每文件(秒)':>12}{'真实耗时(秒)':>14}")
+    try:
+        for batch_size in args.batch_sizes:
+            tasks = make_tasks(workdir, args.files, f"{batch_size:02d}")
+            uploader.upload_config['max_files_per_send'] = batch_size
+            FakeWeChat.reset_stats()
+            started = time.perf_counter()
+            for start in range(0, len(tasks), batch_size):
+                uploader.upload_files(RECIPIENT, tasks[start:start + batch_size])
+            elapsed = time.perf_counter() - started
+            print(f"{batch_size:>6}{FakeWeChat.calls:>10}{FakeWeChat.busy_seconds:>14.1f}"
+                  f"{FakeWeChat.busy_seconds / max(1, FakeWeChat.files_sent):>12.2f}{elapsed:>14.2f}")
+    finally:
+        uploader.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/e2e/clock.py
+"""
+基准测试使用的加速时钟。
+
+流水线中的等待大多是固定的 time.sleep（页面加载等待、下载间隔、随机延迟等），按真实时间运行一次基准需要数十分钟。
+ScaledClock 以 speedup 倍速推进模拟时间：sleep 按倍数缩短，time/monotonic/perf_counter 返回按倍数放大后的模拟时间，
+替换到被测模块的 time 全局变量后，模块内的等待和计时保持一致。
+"""
+
+import queue
+import threading
+import time as _time
+
+
+class ScaledClock:
+    """
+    按 speedup 倍速运行的时钟，接口与 time 模块兼容，未覆盖的属性直接转发到 time 模块。
+
+    参数:
+    - speedup: 模拟时间相对真实时间的倍数，1 表示不加速。
+    """
+
+    def __init__(self, speedup: float = 1.0):
+        self.speedup = max(1.0, float(speedup))
+        self._real_start = _time.monotonic()
+        self._wall_start = _time.time()
+        self._perf_start = _time.perf_counter()
+
+    def real_seconds(self, seconds: float) -> float:
+        """把模拟秒数换算为真实秒数。"""
+        return max(0.0, seconds) / self.speedup
+
+    def simulated_seconds(self, seconds: float) -> float:
+        """把真实秒数换算为模拟秒数。"""
+        return seconds * self.speedup
+
+    def sleep(self, seconds: float):
+        _time.sleep(self.real_seconds(seconds))
+
+    def time(self) -> float:
+        return self._wall_start + (_time.time() - self._wall_start) * self.speedup
+
+    def monotonic(self) -> float:
+        return self._real_start + (_time.monotonic() - self._real_start) * self.speedup
+
+    def perf_counter(self) -> float:
+        return self._perf_start + (_time.perf_counter() - self._perf_start) * self.speedup
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        """按模拟时间等待事件。"""
+        return event.wait(self.real_seconds(seconds))
+
+    def __getattr__(self, name):
+        return getattr(_time, name)
+
+
+class ScaledQueue(queue.Queue):
+    """get 的超时按模拟时间计算的队列，用于替换被测对象中以超时轮询的任务队列。"""
+
+    def __init__(self, clock: ScaledClock, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.clock = clock
+
+    def get(self, block=True, timeout=None):
+        if timeout is not None:
+            timeout = self.clock.real_seconds(timeout)
+        return super().get(block, timeout)
@@ -0,0 +1,405 @@
+# benchmarks/e2e/fakes.py
+"""
+端到端基准使用的假依赖：DrissionPage 浏览器和 wxautox 微信客户端。
+
+install_fake_modules() 把这些假实现注册到 sys.modules 中的 DrissionPage、DrissionPage.errors、
+lib.wxautox 和 lib.wxautox.wxauto，必须在导入 src.auto_download 和 src.file_upload 之前调用，只在基准进程中使用。
+
+- 假标签页把 zxxk.com 的地址转发到本地模拟站点（FakeZxxkServer），按页面内容响应流水线用到的定位语句；
+  点击下载按钮后在后台下载文件并写入 ChromiumOptions 设置的下载目录，同时产生下载链接的监听数据包。
+- 假 WeChat 的 SendFiles 按配置的延迟和失败率执行，filepath 可以是单个路径或路径列表。
+"""
+
+import html
+import itertools
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import types
+from typing import Callable, Dict, Optional
+from urllib.parse import unquote, urlparse
+from urllib.request import ProxyHandler, build_opener
+
+
+class FakeEnvironment:
+    """
+    假依赖共享的运行环境。
+
+    参数:
+    - clock: ScaledClock 实例，假依赖中的所有等待都使用模拟时间。
+    - server_url: 本地模拟站点地址。
+    - on_event: 阶段事件回调，签名为 (阶段名, soft_id)。
+    """
+
+    def __init__(self, clock, server_url: str, on_event: Optional[Callable[[str, str], None]] = None):
+        self.clock = clock
+        self.server_url = server_url.rstrip('/')
+        self.on_event = on_event
+        self.nicknames: Dict[int, str] = {}  # 浏览器调试端口 -> 已登录账号昵称
+
+    def emit(self, stage: str, soft_id: str):
+        if self.on_event and soft_id:
+            self.on_event(stage, soft_id)
+
+    def resolve(self, url: str) -> Optional[str]:
+        """把 zxxk.com 的地址映射到本地模拟站点，其它地址返回 None。"""
+        parsed = urlparse(url)
+        if parsed.scheme in ('http', 'https') and parsed.netloc.endswith('zxxk.com'):
+            path = parsed.path or '/'
+            return f"{self.server_url}{path}" + (f"?{parsed.query}" if parsed.query else '')
+        return None
+
+
+ENV: Optional[FakeEnvironment] = None
+
+# 直接访问本地站点，不使用环境变量中的代理
+OPENER = build_opener(ProxyHandler({}))
+
+SOFT_ID_PATTERN = re.compile(r'/soft/(\d+)\.html')
+SPAN_PATTERN = re.compile(r'<h1 class="res-title clearfix"><span>(.*?)</span></h1>', re.S)
+
+
+# ---------------------------------------------------------------------------
+# DrissionPage
+# ---------------------------------------------------------------------------
+
+class ContextLostError(Exception):
+    pass
+
+
+class FakeChromiumOptions:
+    def __init__(self):
+        self.download_path = '.'
+        self.local_port = 9222
+        self.user_data_path = None
+
+    def no_imgs(self, on_off=True):
+        return self
+
+    def set_download_path(self, path):
+        self.download_path = str(path)
+        return self
+
+    def set_local_port(self, port):
+        self.local_port = int(port)
+        return self
+
+    def set_user_data_path(self, path):
+        self.user_data_path = path
+        return self
+
+
+class FakeChromium:
+    def __init__(self, addr_or_opts=None):
+        self.options = addr_or_opts
+
+
+class FakeElement:
+    def __init__(self, text='', on_click=None):
+        self.text = text
+        self._on_click = on_click
+
+    def child(self, locator=None):
+        return self
+
+    def click(self, by_js=None):
+        if self._on_click:
+            self._on_click()
+        return True
+
+    def hover(self):
+        return None
+
+    def clear(self):
+        return self
+
+    def input(self, value):
+        return self
+
+
+class FakePacket:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeListener:
+    """模拟 tab.listen，下载开始时由标签页放入下载链接的数据包。"""
+
+    def __init__(self):
+        self.packets = queue.Queue()
+        self.listening = False
+
+    def start(self, targets=None, method=None):
+        self.listening = True
+        while not self.packets.empty():
+            self.packets.get_nowait()
+
+    def stop(self):
+        self.listening = False
+
+    def steps(self, timeout=None):
+        deadline = ENV.clock.monotonic() + (timeout or 0)
+        while self.listening:
+            remaining = deadline - ENV.clock.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                yield self.packets.get(timeout=ENV.clock.real_seconds(remaining))
+            except queue.Empty:
+                return
+
+
+class FakeWaiter:
+    def load_start(self, timeout=None):
+        return True
+
+    def doc_loaded(self, timeout=None):
+        return True
+
+
+class FakeTab:
+    """假的浏览器标签页，只支持流水线中用到的定位语句。"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, page):
+        self.page = page
+        self.tab_id = next(self._ids)
+        self.url = 'about:blank'
+        self.html = ''
+        self.listen = FakeListener()
+        self.wait = FakeWaiter()
+
+    def __repr__(self):
+        return f"<FakeTab {self.tab_id} {self.url}>"
+
+    def get(self, url, **kwargs):
+        self.url = url
+        target = ENV.resolve(url)
+        if target is None:
+            self.html = ''
+            return True
+        with OPENER.open(target, timeout=30) as response:
+            self.html = response.read().decode('utf-8')
+        return True
+
+    def stop_loading(self):
+        return None
+
+    def close(self):
+        self.page._close_tab(self)
+
+    def get_frame(self, locator, timeout=None):
+        return None
+
+    def s_ele(self, locator, timeout=None):
+        return self.ele(locator, timeout)
+
+    def __call__(self, locator, timeout=None):
+        return self.ele(locator, timeout)
+
+    def ele(self, locator, timeout=None):
+        if locator.startswith('t:h1'):
+            match = SPAN_PATTERN.search(self.html)
+            return FakeElement(html.unescape(match.group(1))) if match else None
+        if locator.startswith('tag:em@text()='):
+            word = locator.split('=', 1)[1]
+            return FakeElement(word) if f'<em>{word}</em>' in self.html else None
+        if locator == '#btnSoftDownload':
+            match = re.search(r'id="btnSoftDownload" href="([^"]+)"', self.html)
+            if not match:
+                return None
+            href = html.unescape(match.group(1))
+            return FakeElement('下载', on_click=lambda: self._start_download(href))
+        if locator == 'text:我的':
+            return FakeElement('我的') if '我的' in self.html else None
+        if locator == 'tag:a@@class=username':
+            return FakeElement(self.page.nickname) if 'class="username"' in self.html else None
+        return None
+
+    def _start_download(self, href):
+        soft_id = SOFT_ID_PATTERN.search(self.url)
+        soft_id = soft_id.group(1) if soft_id else ''
+        ENV.emit('clicked', soft_id)
+        if self.listen.listening:
+            self.listen.packets.put(FakePacket(f"https://files.zxxk.com/?mkey={soft_id}-{self.tab_id}"))
+        threading.Thread(target=self._download, args=(ENV.server_url + href, soft_id), daemon=True).start()
+
+    def _download(self, url, soft_id):
+        try:
+            with OPENER.open(url, timeout=60) as response:
+                disposition = response.headers.get('Content-Disposition', '')
+                data = response.read()
+            file_name = unquote(disposition.split("''", 1)[1]) if "''" in disposition else f"{soft_id}.bin"
+            download_dir = self.page.options.download_path
+            temp_path = os.path.join(download_dir, file_name + '.crdownload')
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, os.path.join(download_dir, file_name))
+            ENV.emit('downloaded', soft_id)
+        except Exception as e:
+            logging.error(f"模拟下载 {url} 时出错: {e}")
+
+
+class FakeChromiumPage:
+    def __init__(self, addr_or_opts=None):
+        self.options = addr_or_opts if isinstance(addr_or_opts, FakeChromiumOptions) else FakeChromiumOptions()
+        self.address = f"127.0.0.1:{self.options.local_port}"
+        self.user_agent = 'Mozilla/5.0 (X11; Linux x86_64) FakeDrissionPage'
+        self.lock = threading.Lock()
+        self.tabs = [FakeTab(self)]
+
+    @property
+    def nickname(self) -> str:
+        return ENV.nicknames.get(self.options.local_port, '')
+
+    def get_tabs(self):
+        with self.lock:
+            return list(self.tabs)
+
+    def new_tab(self, url=None):
+        tab = FakeTab(self)
+        with self.lock:
+            self.tabs.append(tab)
+        if url:
+            tab.get(url)
+        return tab
+
+    def _close_tab(self, tab):
+        with self.lock:
+            if tab in self.tabs:
+                self.tabs.remove(tab)
+
+    def cookies(self, all_domains=False, all_info=False):
+        if not self.nickname:
+            return []
+        return [{'name': 'xk_token', 'value': f"token-{self.options.local_port}", 'domain': '.zxxk.com',
+                 'expires': 0}]
+
+    def close(self):
+        with self.lock:
+            self.tabs.clear()
+
+
+# ---------------------------------------------------------------------------
+# wxautox
+# ---------------------------------------------------------------------------
+
+class FakeMessage:
+    def __init__(self, type, content):
+        self.type = type
+        self.content = content
+
+
+class FakeWeChat:
+    """
+    假的 wxauto WeChat 客户端。
+
+    类属性:
+    - send_latency_ms: 每次 SendFiles 调用的固定延迟（模拟毫秒），对应切换聊天窗口和打开文件对话框。
+    - per_file_ms: 每个文件额外的延迟（模拟毫秒）。
+    - fail_rate: SendFiles 抛出异常的概率。
+    """
+
+    send_latency_ms = 1500
+    per_file_ms = 400
+    fail_rate = 0.0
+
+    calls = 0
+    files_sent = 0
+    failures = 0
+    switches = 0  # 聊天窗口切换次数
+    busy_seconds = 0.0  # SendFiles 占用界面的模拟秒数
+    sent_files: Dict[str, list] = {}  # 接收者 -> 已发送的文件名，供 GetAllMessage 返回
+    stats_lock = threading.Lock()
+
+    @classmethod
+    def reset_stats(cls):
+        with cls.stats_lock:
+            cls.calls = cls.files_sent = cls.failures = cls.switches = 0
+            cls.busy_seconds = 0.0
+            cls.sent_files = {}
+
+    def __init__(self, *args, **kwargs):
+        self.current_chat = None
+        self.ui_lock = threading.Lock()  # 桌面客户端同一时间只能操作一个窗口
+
+    def SwitchToChat(self):
+        return None
+
+    def ChatWith(self, who, *args, **kwargs):
+        self.switch_chat(who)
+        return who
+
+    def switch_chat(self, who):
+        if who != self.current_chat:
+            with FakeWeChat.stats_lock:
+                FakeWeChat.switches += 1
+            self.current_chat = who
+
+    def SendMsg(self, msg, who=None, *args, **kwargs):
+        return True
+
+    def SendFiles(self, filepath, who=None, *args, **kwargs):
+        paths = list(filepath) if isinstance(filepath, (list, tuple)) else [filepath]
+        with self.ui_lock:
+            cost = (self.send_latency_ms + self.per_file_ms * len(paths)) / 1000
+            ENV.clock.sleep(cost)
+            with FakeWeChat.stats_lock:
+                FakeWeChat.calls += 1
+                FakeWeChat.busy_seconds += cost
+            if self.fail_rate and random.random() < self.fail_rate:
+                with FakeWeChat.stats_lock:
+                    FakeWeChat.failures += 1
+                raise RuntimeError(f"模拟的 SendFiles 失败: {who}")
+            self.switch_chat(who)
+        for path in paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            match = re.match(r'^\[(\d+)\]', os.path.basename(path))
+            ENV.emit('sent', match.group(1) if match else '')
+        with FakeWeChat.stats_lock:
+            FakeWeChat.files_sent += len(paths)
+            FakeWeChat.sent_files.setdefault(who, []).extend(os.path.basename(path) for path in paths)
+        return True
+
+    def GetAllMessage(self, *args, **kwargs):
+        with FakeWeChat.stats_lock:
+            names = list(FakeWeChat.sent_files.get(self.current_chat, []))
+        return [FakeMessage('self', f"[文件]{name}") for name in names]
+
+
+def install_fake_modules(env: FakeEnvironment):
+    """
+    注册假的 DrissionPage 和 lib.wxautox 模块。
+
+    参数:
+    - env: 假依赖共享的运行环境。
+    """
+    global ENV
+    ENV = env
+
+    drission = types.ModuleType('DrissionPage')
+    drission.ChromiumPage = FakeChromiumPage
+    drission.ChromiumOptions = FakeChromiumOptions
+    drission.Chromium = FakeChromium
+    errors = types.ModuleType('DrissionPage.errors')
+    errors.ContextLostError = ContextLostError
+    drission.errors = errors
+    sys.modules['DrissionPage'] = drission
+    sys.modules['DrissionPage.errors'] = errors
+
+    import lib
+    wxauto = types.ModuleType('lib.wxautox.wxauto')
+    wxauto.WeChat = FakeWeChat
+    wxautox = types.ModuleType('lib.wxautox')
+    wxautox.__path__ = []
+    wxautox.WeChat = FakeWeChat
+    wxautox.wxauto = wxauto
+    sys.modules['lib.wxautox'] = wxautox
+    sys.modules['lib.wxautox.wxauto'] = wxauto
+    lib.wxautox = wxautox
@@ -0,0 +1,123 @@
+# benchmarks/e2e/message_trace.py
+"""
+微信消息轨迹：生成、保存、加载和回放。
+
+轨迹文件为 JSON Lines，每行一条消息：
+    {"offset": 1.5, "chat": "group", "NickName": "课件下载01", "ActualNickName": "张老师",
+     "Type": "Text", "Text": "https://www.zxxk.com/soft/100001.html"}
+
+- offset: 相对轨迹开始的模拟秒数。
+- chat: "group" 或 "individual"。
+- 其余字段与 itchat 消息字段一致，个人消息没有 ActualNickName。
+"""
+
+import json
+import random
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+def generate_trace(messages: int, groups: List[str], individuals: Optional[List[str]] = None,
+                   rate_per_minute: float = 30, individual_rate: float = 0.0, first_soft_id: int = 100001,
+                   seed: int = 1) -> List[Dict]:
+    """
+    生成合成的消息轨迹，消息到达间隔服从指数分布，每条消息包含一个不重复的资料链接。
+
+    参数:
+    - messages: 消息数。
+    - groups: 发送消息的群组名称。
+    - individuals: 发送消息的个人昵称。
+    - rate_per_minute: 平均每分钟（模拟时间）的消息数。
+    - individual_rate: 个人消息所占比例。
+    - first_soft_id: 第一个资料的 soft_id。
+    - seed: 随机种子，相同参数生成相同轨迹。
+
+    返回:
+    - 按 offset 排序的消息列表。
+    """
+    rng = random.Random(seed)
+    offset = 0.0
+    trace = []
+    for index in range(messages):
+        offset += rng.expovariate(rate_per_minute / 60) if rate_per_minute > 0 else 0
+        url = f"https://www.zxxk.com/soft/{first_soft_id + index}.html"
+        if individuals and rng.random() < individual_rate:
+            message = {'chat': 'individual', 'NickName': rng.choice(individuals)}
+        else:
+            message = {'chat': 'group', 'NickName': rng.choice(groups), 'ActualNickName': f"成员{rng.randint(1, 50):02d}"}
+        message.update({'offset': round(offset, 3), 'Type': 'Text', 'Text': f"老师好，麻烦下载 {url}"})
+        trace.append(message)
+    return trace
+
+
+def save_trace(trace: List[Dict], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        for message in trace:
+            f.write(json.dumps(message, ensure_ascii=False) + '\n')
+
+
+def load_trace(path: str) -> List[Dict]:
+    trace = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                trace.append(json.loads(line))
+    trace.sort(key=lambda message: message.get('offset', 0))
+    return trace
+
+
+def to_itchat_message(message: Dict) -> Dict:
+    """把轨迹中的一条记录转换为 itchat 回调收到的消息结构。"""
+    msg = {
+        'Type': message.get('Type', 'Text'),
+        'Text': message.get('Text', ''),
+        'Url': message.get('Url', ''),
+        'User': {'NickName': message.get('NickName', '')},
+    }
+    if message.get('chat') == 'group':
+        msg['ActualNickName'] = message.get('ActualNickName', '')
+    return msg
+
+
+class MessageReplayer:
+    """
+    按轨迹中的时间间隔把消息交给消息处理器，替代 itchat 的消息回调。
+
+    参数:
+    - trace: 消息轨迹。
+    - handler: MessageHandler 实例。
+    - clock: ScaledClock 实例，按模拟时间回放。
+    - on_message: 每条消息交给处理器之前的回调，参数为轨迹记录。
+    """
+
+    def __init__(self, trace: List[Dict], handler, clock, on_message: Optional[Callable[[Dict], None]] = None):
+        self.trace = trace
+        self.handler = handler
+        self.clock = clock
+        self.on_message = on_message
+        self.finished = threading.Event()
+        self.errors = 0
+        self.thread = threading.Thread(target=self.run, name='MessageReplayer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        started = self.clock.monotonic()
+        for message in self.trace:
+            delay = started + message.get('offset', 0) - self.clock.monotonic()
+            if delay > 0:
+                self.clock.sleep(delay)
+            if self.on_message:
+                self.on_message(message)
+            msg = to_itchat_message(message)
+            try:
+                if message.get('chat') == 'group':
+                    self.handler.handle_group_message(msg)
+                else:
+                    self.handler.handle_individual_message(msg)
+            except Exception:
+                self.errors += 1
+        self.finished.set()
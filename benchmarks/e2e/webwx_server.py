@@ -0,0 +1,305 @@
+# benchmarks/e2e/webwx_server.py
+"""
+本地模拟的网页微信接口，供 itchat 上传后端按协议发送文件，以及异步 itchat 的消息收发测试。
+
+路由:
+- POST /webwxuploadmedia?f=json    分块上传文件，分块可以乱序到达并写入临时文件，最后一块返回 MediaId，
+                                   校验 webwx_data_ticket、pass_ticket、分块完整性和文件 MD5。
+- POST /webwxsendappmsg?fun=async  按 MediaId 发送文件消息，记录每个接收者收到的文件。
+- GET  /synccheck                  长轮询，有待收消息时立即返回 selector 2，否则最多保持 poll_seconds 后返回 selector 0。
+- POST /webwxsync                  返回并清空待收消息（由 push_message 放入）。
+- POST /webwxsendmsg               发送文本消息，记录每个接收者收到的文本。
+- GET  /webwxlogout                退出登录。
+
+make_core 返回一个已“登录”到模拟接口的 itchat Core 实例，群聊和好友列表由参数给出；
+make_async_core 返回加载了异步组件的 AsyncCore 实例。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+DATA_TICKET = 'bench_data_ticket'
+PASS_TICKET = 'bench_pass_ticket'
+SELF_USER_NAME = '@bench_self'
+
+ATTACH_PATTERN = re.compile(r'<attachid>(.*?)</attachid>')
+TITLE_PATTERN = re.compile(r'<title>(.*?)</title>')
+
+
+def parse_multipart(content_type: str, body: bytes) -> Dict[str, bytes]:
+    """解析 multipart/form-data 请求体，返回字段名到内容的映射。"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = part.get_payload(decode=True) or b''
+    return fields
+
+
+class FakeWebWxServer:
+    """
+    在本地端口上运行的模拟网页微信文件接口。延迟按 clock 的模拟时间计算。
+
+    参数:
+    - clock: ScaledClock 实例。
+    - upload_ms: 每个上传分块的延迟（模拟毫秒）。
+    - send_ms: 每条文件消息的发送延迟（模拟毫秒）。
+    - fail_rate: webwxsendappmsg 返回失败的概率。
+    - chunk_fail_rate: webwxuploadmedia 对非最后分块返回失败的概率，用于验证断点续传。
+    - poll_seconds: synccheck 长轮询没有消息时的保持时间（模拟秒）。
+    """
+
+    def __init__(self, clock, upload_ms: float = 800, send_ms: float = 200, fail_rate: float = 0.0,
+                 chunk_fail_rate: float = 0.0, poll_seconds: float = 25):
+        self.clock = clock
+        self.upload_ms = upload_ms
+        self.send_ms = send_ms
+        self.fail_rate = fail_rate
+        self.chunk_fail_rate = chunk_fail_rate
+        self.uploads = 0  # 完成的文件上传数
+        self.chunks = 0  # 成功接收的分块数
+        self.chunk_failures = 0
+        self.upload_bytes = 0
+        self.sends = 0
+        self.failures = 0
+        self.uploading = 0
+        self.max_concurrent_uploads = 0
+        self.spool_dir = tempfile.mkdtemp(prefix='webwx_uploads_')
+        self.partial: Dict[str, Dict] = {}  # ClientMediaId -> {'path': 临时文件, 'received': 已收到的分块}
+        self.media: Dict[str, Dict] = {}  # MediaId -> {'name', 'size', 'md5'}
+        self.deliveries: Dict[str, List[str]] = defaultdict(list)  # ToUserName -> 收到的文件名
+        self.poll_seconds = poll_seconds
+        self.inbox: List[Dict] = []  # 等待 webwxsync 取走的消息
+        self.inbox_cond = threading.Condition()
+        self.pushed_at: Dict[str, float] = {}  # MsgId -> 放入时的 time.perf_counter()
+        self.text_deliveries: Dict[str, List[str]] = defaultdict(list)  # ToUserName -> 收到的文本
+        self.sync_checks = 0
+        self.syncs = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='FakeWebWxServer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logging.info(f"模拟网页微信接口已启动: {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def handle_upload(self, fields: Dict[str, bytes]) -> Dict:
+        if fields.get('webwx_data_ticket', b'').decode() != DATA_TICKET or \
+                fields.get('pass_ticket', b'').decode() != PASS_TICKET:
+            return {'BaseResponse': {'Ret': 1, 'ErrMsg': 'ticket mismatch'}, 'MediaId': ''}
+        request = json.loads(fields['uploadmediarequest'])
+        chunk = int(fields.get('chunk', b'0') or 0)
+        chunks = int(fields.get('chunks', b'1') or 1)
+        key = str(request['ClientMediaId'])
+        with self.lock:
+            self.uploading += 1
+            self.max_concurrent_uploads = max(self.max_concurrent_uploads, self.uploading)
+        try:
+            self.clock.sleep(self.upload_ms / 1000)
+        finally:
+            with self.lock:
+                self.uploading -= 1
+        if chunk + 1 < chunks and self.chunk_fail_rate and random.random() < self.chunk_fail_rate:
+            with self.lock:
+                self.chunk_failures += 1
+            return {'BaseResponse': {'Ret': 1, 'ErrMsg': 'simulated chunk failure'}, 'MediaId': ''}
+
+        data = fields['filename']
+        with self.lock:
+            self.chunks += 1
+            self.upload_bytes += len(data)
+            partial = self.partial.get(key)
+            if partial is None:
+                partial = {'path': os.path.join(self.spool_dir, key), 'received': set()}
+                self.partial[key] = partial
+                open(partial['path'], 'wb').close()
+        # 除最后一块外分块大小相同，最后一块写在文件末尾
+        offset = chunk * len(data) if chunk + 1 < chunks else request['TotalLen'] - len(data)
+        with open(partial['path'], 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+        with self.lock:
+            partial['received'].add(chunk)
+            if chunk + 1 < chunks:
+                return {'BaseResponse': {'Ret': 0, 'ErrMsg': ''}, 'MediaId': ''}
+            complete = len(partial['received']) == chunks
+            del self.partial[key]
+        md5 = hashlib.md5()
+        with open(partial['path'], 'rb') as f:
+            for block in iter(lambda: f.read(1048576), b''):
+                md5.update(block)
+        size = os.path.getsize(partial['path'])
+        os.remove(partial['path'])
+        if not complete or size != request['TotalLen'] or md5.hexdigest() != request['FileMd5']:
+            return {'BaseResponse': {'Ret': 1, 'ErrMsg': 'incomplete upload or md5 mismatch'}, 'MediaId': ''}
+        media_id = '@crypt_' + hashlib.sha1(f"{key}:{request['FileMd5']}".encode()).hexdigest()
+        with self.lock:
+            self.uploads += 1
+            self.media[media_id] = {'name': unquote(fields['name'].decode()), 'size': size,
+                                    'md5': request['FileMd5']}
+        return {'BaseResponse': {'Ret': 0, 'ErrMsg': ''}, 'MediaId': media_id, 'StartPos': size}
+
+    def handle_send(self, payload: Dict) -> Dict:
+        self.clock.sleep(self.send_ms / 1000)
+        msg = payload.get('Msg', {})
+        attach = ATTACH_PATTERN.search(msg.get('Content', ''))
+        title = TITLE_PATTERN.search(msg.get('Content', ''))
+        with self.lock:
+            self.sends += 1
+            if self.fail_rate and random.random() < self.fail_rate:
+                self.failures += 1
+                return {'BaseResponse': {'Ret': 1205, 'ErrMsg': 'simulated failure'}}
+            if not attach or attach.group(1) not in self.media:
+                return {'BaseResponse': {'Ret': 1, 'ErrMsg': 'unknown media'}}
+            self.deliveries[msg.get('ToUserName', '')].append(title.group(1) if title else '')
+        return {'BaseResponse': {'Ret': 0, 'ErrMsg': ''}, 'MsgID': str(self.sends), 'LocalID': msg.get('LocalID')}
+
+    def push_message(self, from_user_name: str, content: str) -> str:
+        """放入一条发给本账号的文本消息，下一次 synccheck 立即返回。返回 MsgId。"""
+        with self.inbox_cond:
+            msg_id = str(len(self.pushed_at) + 1)
+            self.pushed_at[msg_id] = time.perf_counter()
+            self.inbox.append({'MsgId': msg_id, 'NewMsgId': msg_id, 'MsgType': 1, 'Content': content, 'Url': '',
+                               'FromUserName': from_user_name, 'ToUserName': SELF_USER_NAME,
+                               'CreateTime': int(time.time()), 'Status': 3, 'AppMsgType': 0})
+            self.inbox_cond.notify_all()
+        return msg_id
+
+    def handle_sync_check(self) -> str:
+        with self.inbox_cond:
+            self.sync_checks += 1
+            self.inbox_cond.wait_for(lambda: self.inbox, self.clock.real_seconds(self.poll_seconds))
+            selector = '2' if self.inbox else '0'
+        return f'window.synccheck={{retcode:"0",selector:"{selector}"}}'
+
+    def handle_sync(self) -> Dict:
+        with self.inbox_cond:
+            self.syncs += 1
+            messages, self.inbox = self.inbox, []
+        sync_key = {'Count': 1, 'List': [{'Key': 1, 'Val': self.syncs}]}
+        return {'BaseResponse': {'Ret': 0, 'ErrMsg': ''}, 'AddMsgCount': len(messages), 'AddMsgList': messages,
+                'ModContactCount': 0, 'ModContactList': [], 'SyncKey': sync_key, 'SyncCheckKey': sync_key}
+
+    def handle_send_text(self, payload: Dict) -> Dict:
+        self.clock.sleep(self.send_ms / 1000)
+        msg = payload.get('Msg', {})
+        with self.lock:
+            self.sends += 1
+            self.text_deliveries[msg.get('ToUserName', '')].append(msg.get('Content', ''))
+        return {'BaseResponse': {'Ret': 0, 'ErrMsg': ''}, 'MsgID': str(self.sends), 'LocalID': msg.get('LocalID')}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: Dict):
+                self._send_body(json.dumps(payload).encode('utf-8'), 'application/json')
+
+            def _send_body(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/synccheck':
+                    self._send_body(server.handle_sync_check().encode('utf-8'), 'text/javascript')
+                else:
+                    self._send_body(b'', 'text/html')
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if path == '/webwxuploadmedia':
+                    self._send_json(server.handle_upload(parse_multipart(self.headers['Content-Type'], body)))
+                elif path == '/webwxsendappmsg':
+                    self._send_json(server.handle_send(json.loads(body.decode('utf-8'))))
+                elif path == '/webwxsync':
+                    self._send_json(server.handle_sync())
+                elif path == '/webwxsendmsg':
+                    self._send_json(server.handle_send_text(json.loads(body.decode('utf-8'))))
+                else:
+                    self._send_json({'BaseResponse': {'Ret': 1, 'ErrMsg': 'not found'}})
+
+        return Handler
+
+
+def make_core(server_url: str, chatrooms: List[str], friends: Optional[List[str]] = None):
+    """
+    创建一个已登录到模拟接口的 itchat Core 实例。
+
+    参数:
+    - server_url: FakeWebWxServer 的地址，可以在其它进程中运行。
+    - chatrooms: 群聊昵称，UserName 为 '@@' 加序号。
+    - friends: 好友昵称，UserName 为 '@' 加序号。
+    """
+    from lib.itchat.core import Core
+    from lib.itchat.components import load_components
+
+    load_components(Core)
+    return _login(Core(), server_url, chatrooms, friends)
+
+
+def make_async_core(server_url: str, chatrooms: List[str], friends: Optional[List[str]] = None):
+    """创建一个已登录到模拟接口的 AsyncCore 实例，参数同 make_core。消息接收需要在事件循环中调用 start_receiving。"""
+    from lib.itchat.core import AsyncCore
+    from lib.itchat.async_components import load_components
+
+    load_components(AsyncCore)
+    core = _login(AsyncCore(), server_url, chatrooms, friends)
+    sync_key = {'Count': 1, 'List': [{'Key': 1, 'Val': 0}]}
+    core.loginInfo.update({
+        'syncUrl': server_url, 'skey': 'bench', 'wxsid': 'bench', 'wxuin': 1, 'deviceid': 'e000000000000000',
+        'logintime': int(time.time() * 1000), 'SyncKey': sync_key, 'synckey': '1_0',
+        'User': core.memberList[0],
+    })
+    return core
+
+
+def _login(core, server_url: str, chatrooms: List[str], friends: Optional[List[str]]):
+    core.loginInfo = {
+        'url': server_url,
+        'fileUrl': server_url,
+        'pass_ticket': PASS_TICKET,
+        'BaseRequest': {'Skey': 'bench', 'Sid': 'bench', 'Uin': 1, 'DeviceID': 'e000000000000000'},
+    }
+    core.s.cookies.set('webwx_data_ticket', DATA_TICKET)
+    core.s.trust_env = False  # 不经过环境变量中的代理访问本地端口
+    core.storageClass.userName = SELF_USER_NAME
+    core.memberList.append({'UserName': SELF_USER_NAME, 'NickName': '基准账号', 'RemarkName': ''})
+    for index, name in enumerate(friends or [], 1):
+        core.memberList.append({'UserName': f"@friend{index:03d}", 'NickName': name, 'RemarkName': ''})
+    for index, name in enumerate(chatrooms, 1):
+        core.chatroomList.append({'UserName': f"@@room{index:03d}", 'NickName': name, 'MemberList': []})
+    core.alive = True
+    return core
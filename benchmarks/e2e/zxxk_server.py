@@ -0,0 +1,136 @@
+# benchmarks/e2e/zxxk_server.py
+"""
+本地模拟的学科网站点，供假的 DrissionPage 标签页加载页面和下载文件。
+
+路由:
+- /                          首页，包含“我的”入口和账号昵称元素。
+- /soft/<soft_id>.html       资料详情页，包含标题和下载按钮，可按 exclusive_every 标记“独家”“教辅”。
+- /soft/softdownload?softid= 资料文件，文件名通过 Content-Disposition 返回。
+- /user                      用户中心，供登录快速探测使用。
+"""
+
+import html
+import logging
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+SOFT_PAGE_PATTERN = re.compile(r'^/soft/(\d+)\.html$')
+
+GRADES = ['七年级', '八年级', '九年级', '高一', '高二', '高三']
+SUBJECTS = ['语文', '数学', '英语', '物理', '化学', '生物', '历史', '地理']
+KINDS = ['期中试卷', '期末试卷', '单元测试', '课件', '教案', '学案']
+
+HEADER = '<div class="header"><span>我的</span><a class="username"></a><a href="/logout">退出</a></div>'
+
+
+def soft_title(soft_id: str) -> str:
+    """根据 soft_id 生成确定的资料标题，标题之间互不包含，保证文件匹配唯一。"""
+    number = int(soft_id)
+    grade = GRADES[number % len(GRADES)]
+    subject = SUBJECTS[(number // len(GRADES)) % len(SUBJECTS)]
+    kind = KINDS[(number // (len(GRADES) * len(SUBJECTS))) % len(KINDS)]
+    return f"{grade}{subject}{kind}（第{soft_id}号）"
+
+
+class FakeZxxkServer:
+    """
+    在本地端口上运行的模拟站点。延迟按 clock 的模拟时间计算。
+
+    参数:
+    - clock: ScaledClock 实例。
+    - page_ms: 页面响应延迟（模拟毫秒）。
+    - download_ms: 文件下载延迟（模拟毫秒）。
+    - file_kb: 下载文件大小（KB）。
+    - exclusive_every: 每隔多少个 soft_id 生成一个同时标记“独家”和“教辅”的页面，0 表示不生成。
+    """
+
+    def __init__(self, clock, page_ms: float = 300, download_ms: float = 2000, file_kb: int = 256,
+                 exclusive_every: int = 0):
+        self.clock = clock
+        self.page_ms = page_ms
+        self.download_ms = download_ms
+        self.file_kb = file_kb
+        self.exclusive_every = exclusive_every
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='FakeZxxkServer', daemon=True)
+
+    def is_exclusive(self, soft_id: str) -> bool:
+        """页面是否同时标记“独家”和“教辅”，这类任务会被 XKW 跳过。"""
+        return bool(self.exclusive_every) and int(soft_id) % self.exclusive_every == 0
+
+    def start(self):
+        self.thread.start()
+        logging.info(f"模拟学科网站点已启动: {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _render_home(self) -> str:
+        return f"<html><body>{HEADER}<h2>首页</h2></body></html>"
+
+    def _render_soft(self, soft_id: str) -> str:
+        title = html.escape(soft_title(soft_id))
+        tags = '<em>独家</em><em>教辅</em>' if self.is_exclusive(soft_id) else '<em>精品</em>'
+        return (
+            f"<html><body>{HEADER}"
+            f'<h1 class="res-title clearfix"><span>{title}</span></h1>{tags}'
+            f'<a id="btnSoftDownload" href="/soft/softdownload?softid={soft_id}">下载</a>'
+            "</body></html>"
+        )
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body: bytes, content_type='text/html; charset=utf-8', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with server.lock:
+                    server.requests += 1
+                    server.bytes_sent += len(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                path = parsed.path
+                if path in ('', '/'):
+                    server.clock.sleep(server.page_ms / 1000)
+                    self._send(200, server._render_home().encode('utf-8'))
+                elif path == '/user':
+                    self._send(200, server._render_home().encode('utf-8'))
+                elif path == '/soft/softdownload':
+                    soft_id = parse_qs(parsed.query).get('softid', [''])[0]
+                    if not soft_id.isdigit():
+                        self._send(404, b'not found')
+                        return
+                    server.clock.sleep(server.download_ms / 1000)
+                    file_name = f"{soft_title(soft_id)}.docx"
+                    self._send(200, b'\0' * (server.file_kb * 1024), 'application/octet-stream',
+                               {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(file_name)}"})
+                else:
+                    match = SOFT_PAGE_PATTERN.match(path)
+                    if not match:
+                        self._send(404, b'not found')
+                        return
+                    server.clock.sleep(server.page_ms / 1000)
+                    self._send(200, server._render_soft(match.group(1)).encode('utf-8'))
+
+        return Handler
@@ -1,4 +1,4 @@
-from .core import Core
+from .core import Core, AsyncCore
 from .config import VERSION, ASYNC_COMPONENTS
 from .log import set_logging
 
@@ -20,8 +20,8 @@ def load_async_itchat() -> Core:
         Core: the abstract interface of itchat
     """
     from .async_components import load_components
-    load_components(Core)
-    return Core()
+    load_components(AsyncCore)
+    return AsyncCore()
 
 
 def load_sync_itchat() -> Core:
@@ -88,6 +88,7 @@ load_login_status           = instance.load_login_status
 auto_login                  = instance.auto_login
 configured_reply            = instance.configured_reply
 msg_register                = instance.msg_register
+set_msg_filter              = instance.set_msg_filter
 run                         = instance.run
 # other functions
 search_friends              = instance.search_friends
@@ -1,13 +1,13 @@
-import pickle, os
+import asyncio
 import logging
 
 import requests  # type: ignore
 
-from ..config import VERSION
 from ..returnvalues import ReturnValue
-from ..storage import templates
+from ..storage import templates, snapshot
 from .contact import update_local_chatrooms, update_local_friends
 from .messages import produce_msg
+from ..components.hotreload import load_snapshot
 
 logger = logging.getLogger('itchat')
 
@@ -16,52 +16,31 @@ def load_hotreload(core):
     core.load_login_status = load_login_status
 
 async def dump_login_status(self, fileDir=None):
+    ''' write a snapshot of the session, see storage/snapshot.py
+        the contacts file is only written again if contacts changed since the last dump
+    '''
     fileDir = fileDir or self.hotReloadDir
     try:
-        with open(fileDir, 'w') as f:
-            f.write('itchat - DELETE THIS')
-        os.remove(fileDir)
-    except:
-        raise Exception('Incorrect fileDir')
-    status = {
-        'version'   : VERSION,
-        'loginInfo' : self.loginInfo,
-        'cookies'   : self.s.cookies.get_dict(),
-        'storage'   : self.storageClass.dumps()}
-    with open(fileDir, 'wb') as f:
-        pickle.dump(status, f)
-    logger.debug('Dump login status for hot reload successfully.')
+        # contacts are serialized in a thread, the loop keeps receiving
+        contactsWritten = await asyncio.to_thread(snapshot.dump, self, fileDir)
+    except (IOError, OSError) as e:
+        raise Exception('Incorrect fileDir: %s' % e)
+    logger.debug('Dump login status for hot reload successfully%s.' % (
+        '' if contactsWritten else ', contacts unchanged'))
 
 async def load_login_status(self, fileDir,
         loginCallback=None, exitCallback=None):
+    j = load_snapshot(self, fileDir)
+    if isinstance(j, ReturnValue):
+        return j
     try:
-        with open(fileDir, 'rb') as f:
-            j = pickle.load(f)
-    except Exception as e:
-        logger.debug('No such file, loading login status failed.')
-        return ReturnValue({'BaseResponse': {
-            'ErrMsg': 'No such file, loading login status failed.',
-            'Ret': -1002, }})
-
-    if j.get('version', '') != VERSION:
-        logger.debug(('you have updated itchat from %s to %s, ' +
-            'so cached status is ignored') % (
-            j.get('version', 'old version'), VERSION))
-        return ReturnValue({'BaseResponse': {
-            'ErrMsg': 'cached status ignored because of version',
-            'Ret': -1005, }})
-    self.loginInfo = j['loginInfo']
-    self.loginInfo['User'] = templates.User(self.loginInfo['User'])
-    self.loginInfo['User'].core = self
-    self.s.cookies = requests.utils.cookiejar_from_dict(j['cookies'])
-    self.storageClass.loads(j['storage'])
-    try:
-        msgList, contactList = self.get_msg()
+        msgList, contactList = await self.get_msg()
     except:
         msgList = contactList = None
     if (msgList or contactList) is None:
-        self.logout()
-        await load_last_login_status(self.s, j['cookies'])
+        await self.logout()
+        await load_last_login_status(self.s,
+            dict((c['name'], c['value']) for c in j['cookies']))
         logger.debug('server refused, loading login status failed.')
         return ReturnValue({'BaseResponse': {
             'ErrMsg': 'server refused, loading login status failed.',
@@ -75,14 +54,15 @@ async def load_login_status(self, fileDir,
                     update_local_friends(self, [contact])
         if msgList:
             msgList = produce_msg(self, msgList)
-            for msg in msgList: self.msgList.put(msg)
+            for msg in msgList: self.msgList.put_nowait(msg)
         await self.start_receiving(exitCallback)
         logger.debug('loading login status succeeded.')
         if hasattr(loginCallback, '__call__'):
             await loginCallback(self.storageClass.userName)
         return ReturnValue({'BaseResponse': {
             'ErrMsg': 'loading login status succeeded.',
-            'Ret': 0, }})
+            'Ret': 0, },
+            'ContactsLoaded': j['contactsLoaded'], })
 
 async def load_last_login_status(session, cookiesDict):
     try:
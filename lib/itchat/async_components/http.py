@@ -0,0 +1,279 @@
+''' a small pooled HTTP/1.1 client on asyncio streams for the async components
+
+    requests blocks the event loop, so every network call of the async
+    components goes through AsyncSession instead:
+        - keep-alive connections are pooled per host, at most poolSize per host
+        - timeout is (connect, read) like requests, read covers the whole response
+        - a cancelled or timed out request closes its connection, never reuses it
+        - a request failing on a reused keep-alive connection is retried once on
+          a new connection only if it was not sent yet or its method is idempotent,
+          so a POST the server may have processed is never sent twice
+        - cookies are shared with core.s.cookies, so login state set by either
+          the sync session or this one is seen by both
+    proxies are not supported: connections always go directly to the host and
+    HTTP_PROXY / HTTPS_PROXY are ignored, unlike the requests based sync session
+'''
+import asyncio
+import http.client
+import io
+import json as jsonlib
+import logging
+import ssl
+import urllib.request
+import uuid
+from email.parser import BytesParser
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from .. import config
+
+logger = logging.getLogger('itchat')
+
+MAX_REDIRECTS = 10
+MAX_HEADER_SIZE = 65536
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT', 'DELETE')
+
+
+class AsyncHTTPError(Exception):
+    def __init__(self, message, response=None):
+        Exception.__init__(self, message)
+        self.response = response
+
+
+class AsyncResponse(object):
+    ''' the subset of requests.Response used by itchat '''
+    def __init__(self, url, status_code, reason, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+    @property
+    def ok(self):
+        return self.status_code < 400
+    def __bool__(self):
+        return self.ok
+    @property
+    def encoding(self):
+        return self.headers.get_content_charset() or 'utf-8'
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+    def json(self):
+        return jsonlib.loads(self.text)
+    def info(self):
+        # http.cookiejar reads Set-Cookie headers through info()
+        return self.headers
+    def raise_for_status(self):
+        if not self.ok:
+            raise AsyncHTTPError('%s %s for url: %s' % (
+                self.status_code, self.reason, self.url), response=self)
+
+
+def encode_multipart(files):
+    ''' files uses the requests format: name -> (fileName or None, value[, contentType]) '''
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in files.items():
+        fileName, content = value[0], value[1]
+        if content is None:
+            continue
+        if isinstance(content, str):
+            content = content.encode('utf8')
+        body.write(('--%s\r\n' % boundary).encode('utf8'))
+        if fileName is None:
+            body.write(('Content-Disposition: form-data; name="%s"\r\n\r\n' % name).encode('utf8'))
+        else:
+            contentType = value[2] if len(value) > 2 else 'application/octet-stream'
+            body.write(('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (
+                name, fileName)).encode('utf8'))
+            body.write(('Content-Type: %s\r\n\r\n' % contentType).encode('utf8'))
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(('--%s--\r\n' % boundary).encode('utf8'))
+    return body.getvalue(), 'multipart/form-data; boundary=%s' % boundary
+
+
+class AsyncSession(object):
+    def __init__(self, cookies=None, poolSize=10, timeout=config.TIMEOUT):
+        if cookies is None:
+            import requests
+            cookies = requests.cookies.RequestsCookieJar()
+        self.cookies = cookies
+        self.poolSize = poolSize
+        self.timeout = timeout
+        self.idle = {}       # (scheme, host, port) -> [(reader, writer)]
+        self.semaphores = {} # (scheme, host, port) -> asyncio.Semaphore
+        self.sslContext = None
+        self.closed = False
+    def _ssl_context(self):
+        if self.sslContext is None:
+            try:
+                import certifi
+                self.sslContext = ssl.create_default_context(cafile=certifi.where())
+            except ImportError:
+                self.sslContext = ssl.create_default_context()
+        return self.sslContext
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+    async def post(self, url, data=None, **kwargs):
+        return await self.request('POST', url, data=data, **kwargs)
+    async def request(self, method, url, params=None, data=None, json=None, files=None,
+            headers=None, timeout=None, allow_redirects=True):
+        if self.closed:
+            raise RuntimeError('AsyncSession is closed')
+        if params:
+            url += ('&' if '?' in url else '?') + (
+                params if isinstance(params, str) else urlencode(params))
+        headers = dict(headers or {})
+        body = b''
+        if files is not None:
+            body, headers['Content-Type'] = encode_multipart(files)
+        elif json is not None:
+            body = jsonlib.dumps(json).encode('utf8')
+            headers.setdefault('Content-Type', 'application/json')
+        elif data is not None:
+            body = data.encode('utf8') if isinstance(data, str) else \
+                urlencode(data).encode('utf8') if isinstance(data, dict) else data
+        timeout = timeout or self.timeout
+        connectTimeout, readTimeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        for _ in range(MAX_REDIRECTS + 1):
+            r = await self._send(method, url, headers, body, connectTimeout, readTimeout)
+            location = r.headers.get('Location')
+            if not allow_redirects or r.status_code not in (301, 302, 303, 307, 308) or not location:
+                return r
+            url = urljoin(url, location)
+            if r.status_code in (301, 302, 303) and method != 'HEAD':
+                method, body = 'GET', b''
+                headers.pop('Content-Type', None)
+        raise AsyncHTTPError('Exceeded %s redirects' % MAX_REDIRECTS, response=r)
+    async def _send(self, method, url, headers, body, connectTimeout, readTimeout):
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        key = (parts.scheme, parts.hostname, parts.port or (443 if https else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        cookieRequest = urllib.request.Request(url, method=method)
+        self.cookies.add_cookie_header(cookieRequest)
+        requestHeaders = {
+            'Host': parts.netloc,
+            'Accept': '*/*',
+            'Accept-Encoding': 'identity',
+            'Connection': 'keep-alive',
+            'User-Agent': config.USER_AGENT, }
+        requestHeaders.update(headers)
+        if cookieRequest.has_header('Cookie'):
+            requestHeaders['Cookie'] = cookieRequest.get_header('Cookie')
+        if body or method in ('POST', 'PUT', 'PATCH'):
+            requestHeaders['Content-Length'] = str(len(body))
+        head = '%s %s HTTP/1.1\r\n%s\r\n' % (method, path, ''.join(
+            '%s: %s\r\n' % (k, v) for k, v in requestHeaders.items()))
+
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = self.semaphores[key] = asyncio.Semaphore(self.poolSize)
+        request = head.encode('utf8') + body
+        async with semaphore:
+            reader, writer, reused = await self._acquire(key, https, connectTimeout)
+            sent = []
+            try:
+                r, keepAlive = await asyncio.wait_for(
+                    self._exchange(reader, writer, request, url, method, sent), readTimeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                # the server closed an idle keep-alive connection, retry once on a new one
+                logger.debug('Pooled connection to %s:%s was closed: %s' % (key[1], key[2], e))
+                reader, writer, reused = await self._acquire(key, https, connectTimeout, fresh=True)
+                try:
+                    r, keepAlive = await asyncio.wait_for(
+                        self._exchange(reader, writer, request, url, method, []), readTimeout)
+                except BaseException:
+                    writer.close()
+                    raise
+            except BaseException:
+                # timeout, cancellation or parse error: the connection state is unknown
+                writer.close()
+                raise
+            if keepAlive and not self.closed:
+                self.idle.setdefault(key, []).append((reader, writer))
+            else:
+                writer.close()
+        self.cookies.extract_cookies(r, cookieRequest)
+        return r
+    async def _acquire(self, key, https, connectTimeout, fresh=False):
+        idle = self.idle.get(key) or []
+        while idle and not fresh:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            key[1], key[2], ssl=self._ssl_context() if https else None,
+            limit=MAX_HEADER_SIZE), connectTimeout)
+        return reader, writer, False
+    async def _exchange(self, reader, writer, request, url, method, sent):
+        ''' write the request, wait until it is flushed, then read the response
+            sent gets an item once the request is flushed, after that the
+            server may have processed it '''
+        writer.write(request)
+        await writer.drain()
+        sent.append(True)
+        return await self._read_response(reader, url, method)
+    async def _read_response(self, reader, url, method):
+        try:
+            statusLine = await reader.readuntil(b'\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                raise ConnectionResetError('Connection closed before response')
+            raise http.client.BadStatusLine(e.partial)
+        try:
+            version, status, reason = (statusLine.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(statusLine)
+        if not version.startswith('HTTP/'):
+            raise http.client.BadStatusLine(statusLine)
+        rawHeaders = await self._read_headers(reader)
+        headers = BytesParser(_class=http.client.HTTPMessage).parsebytes(rawHeaders)
+        keepAlive = version == 'HTTP/1.1' and (headers.get('Connection') or '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif 'chunked' in (headers.get('Transfer-Encoding') or '').lower():
+            content = await self._read_chunked(reader)
+        elif headers.get('Content-Length') is not None:
+            content = await reader.readexactly(int(headers['Content-Length']))
+        else:
+            content, keepAlive = await reader.read(), False
+        return AsyncResponse(url, status, reason, headers, content), keepAlive
+    async def _read_headers(self, reader):
+        lines = []
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                return b''.join(lines) + b'\r\n'
+            lines.append(line)
+    async def _read_chunked(self, reader):
+        content = io.BytesIO()
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                await self._read_headers(reader) # trailers
+                return content.getvalue()
+            content.write(await reader.readexactly(size))
+            await reader.readexactly(2)
+    async def close(self):
+        self.closed = True
+        for connections in self.idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+def get_async_session(core):
+    ''' the AsyncSession of a core, sharing cookies with core.s '''
+    session = getattr(core, 'asyncSession', None)
+    if session is None or session.closed or session.cookies is not core.s.cookies:
+        session = core.asyncSession = AsyncSession(cookies=core.s.cookies)
+    return session
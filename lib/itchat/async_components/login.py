@@ -1,6 +1,5 @@
 import asyncio
 import os, time, re, io
-import threading
 import json
 import random
 import traceback
@@ -10,13 +9,13 @@ try:
 except ImportError:
     from http.client import BadStatusLine
 
-import requests  # type: ignore
 from pyqrcode import QRCode
 
 from .. import config, utils
 from ..returnvalues import ReturnValue
 from ..storage.templates import wrap_user_dict
 from .contact import update_local_chatrooms, update_local_friends
+from .http import get_async_session
 from .messages import produce_msg
 
 logger = logging.getLogger('itchat')
@@ -35,86 +34,70 @@ def load_login(core):
 
 async def login(self, enableCmdQR=False, picDir=None, qrCallback=None, EventScanPayload=None,ScanStatus=None,event_stream=None,
         loginCallback=None, exitCallback=None):
+    ''' without event_stream (wechaty), the QR code is shown through
+        qrCallback or picDir like the sync login does
+        callbacks may be plain functions or coroutine functions
+    '''
     if self.alive or self.isLogging:
         logger.warning('itchat has already logged in.')
         return
     self.isLogging = True
+    async def emit_scan(status, qrcode=None):
+        if event_stream is None:
+            return
+        event_stream.emit('scan', EventScanPayload(
+            status=getattr(ScanStatus, status),
+            qrcode=qrcode or f"https://login.weixin.qq.com/l/{self.uuid}"))
+        await asyncio.sleep(0.1)
 
     while self.isLogging:
         uuid = await push_login(self)
+        qrStorage = io.BytesIO()
         if uuid:
-            payload = EventScanPayload(
-                status=ScanStatus.Waiting,
-                qrcode=f"qrcode/https://login.weixin.qq.com/l/{uuid}"
-            )
-            event_stream.emit('scan', payload)
-            await asyncio.sleep(0.1)
+            await emit_scan('Waiting', f"qrcode/https://login.weixin.qq.com/l/{uuid}")
         else:
             logger.info('Getting uuid of QR code.')
-            self.get_QRuuid()
-            payload = EventScanPayload(
-                status=ScanStatus.Waiting,
-                qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
-            )
-            print(f"https://wechaty.js.org/qrcode/https://login.weixin.qq.com/l/{self.uuid}")
-            event_stream.emit('scan', payload)
-            await asyncio.sleep(0.1)
+            while not await self.get_QRuuid():
+                await asyncio.sleep(1)
+            if event_stream is None:
+                qrStorage = await self.get_QR(enableCmdQR=enableCmdQR,
+                    picDir=picDir, qrCallback=qrCallback)
+            else:
+                print(f"https://wechaty.js.org/qrcode/https://login.weixin.qq.com/l/{self.uuid}")
+                await emit_scan('Waiting')
             # logger.info('Please scan the QR code to log in.')
         isLoggedIn = False
         while not isLoggedIn:
             status = await self.check_login()
-            # if hasattr(qrCallback, '__call__'):
-                # await qrCallback(uuid=self.uuid, status=status, qrcode=self.qrStorage.getvalue())
+            if event_stream is None and hasattr(qrCallback, '__call__'):
+                await utils.maybe_await(qrCallback(uuid=self.uuid, status=status,
+                    qrcode=qrStorage.getvalue()))
             if status == '200':
                 isLoggedIn = True
-                payload = EventScanPayload(
-                    status=ScanStatus.Scanned,
-                    qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
-                )
-                event_stream.emit('scan', payload)
-                await asyncio.sleep(0.1)
+                await emit_scan('Scanned')
             elif status == '201':
                 if isLoggedIn is not None:
                     logger.info('Please press confirm on your phone.')
                     isLoggedIn = None
-                    payload = EventScanPayload(
-                        status=ScanStatus.Waiting,
-                        qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
-                    )
-                    event_stream.emit('scan', payload)
-                    await asyncio.sleep(0.1)
+                    await emit_scan('Waiting')
+                await asyncio.sleep(0.5)
             elif status != '408':
-                payload = EventScanPayload(
-                    status=ScanStatus.Cancel,
-                    qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
-                )
-                event_stream.emit('scan', payload)
-                await asyncio.sleep(0.1)
+                await emit_scan('Cancel')
                 break
         if isLoggedIn:
-            payload = EventScanPayload(
-                status=ScanStatus.Confirmed,
-                qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
-            )
-            event_stream.emit('scan', payload)
-            await asyncio.sleep(0.1)
+            await emit_scan('Confirmed')
             break
         elif self.isLogging:
             logger.info('Log in time out, reloading QR code.')
-            payload = EventScanPayload(
-                status=ScanStatus.Timeout,
-                qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
-            )
-            event_stream.emit('scan', payload)
-            await asyncio.sleep(0.1)
+            await emit_scan('Timeout')
     else:
         return
     logger.info('Loading the contact, this may take a little while.')
     await self.web_init()
     await self.show_mobile_login()
-    self.get_contact(True)
+    await self.get_contact(True)
     if hasattr(loginCallback, '__call__'):
-        r = await loginCallback(self.storageClass.userName)
+        r = await utils.maybe_await(loginCallback(self.storageClass.userName))
     else:
         utils.clear_screen()
         if os.path.exists(picDir or config.DEFAULT_QR):
@@ -129,13 +112,13 @@ async def push_login(core):
         url = '%s/cgi-bin/mmwebwx-bin/webwxpushloginurl?uin=%s' % (
             config.BASE_URL, cookiesDict['wxuin'])
         headers = { 'User-Agent' : config.USER_AGENT}
-        r = core.s.get(url, headers=headers).json()
+        r = (await get_async_session(core).get(url, headers=headers)).json()
         if 'uuid' in r and r.get('ret') in (0, '0'):
             core.uuid = r['uuid']
             return r['uuid']
     return False
 
-def get_QRuuid(self):
+async def get_QRuuid(self):
     url = '%s/jslogin' % config.BASE_URL
     params = {
         'appid' : 'wx782c26e4c19acffb',
@@ -143,7 +126,7 @@ def get_QRuuid(self):
         'redirect_uri' : 'https://wx.qq.com/cgi-bin/mmwebwx-bin/webwxnewloginpage?mod=desktop',
         'lang'  : 'zh_CN' }
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.get(url, params=params, headers=headers)
+    r = await get_async_session(self).get(url, params=params, headers=headers)
     regx = r'window.QRLogin.code = (\d+); window.QRLogin.uuid = "(\S+?)";'
     data = re.search(regx, r.text)
     if data and data.group(1) == '200':
@@ -157,7 +140,7 @@ async def get_QR(self, uuid=None, enableCmdQR=False, picDir=None, qrCallback=Non
     qrCode = QRCode('https://login.weixin.qq.com/l/' + uuid)
     qrCode.png(qrStorage, scale=10)
     if hasattr(qrCallback, '__call__'):
-        await qrCallback(uuid=uuid, status='0', qrcode=qrStorage.getvalue())
+        await utils.maybe_await(qrCallback(uuid=uuid, status='0', qrcode=qrStorage.getvalue()))
     else:
         with open(picDir, 'wb') as f:
             f.write(qrStorage.getvalue())
@@ -174,7 +157,8 @@ async def check_login(self, uuid=None):
     params = 'loginicon=true&uuid=%s&tip=1&r=%s&_=%s' % (
         uuid, int(-localTime / 1579), localTime)
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.get(url, params=params, headers=headers)
+    # long poll, the server holds it for ~25s until the QR code is scanned
+    r = await get_async_session(self).get(url, params=params, headers=headers)
     regx = r'window.code=(\d+)'
     data = re.search(regx, r.text)
     if data and data.group(1) == '200':
@@ -200,7 +184,7 @@ async def process_login_info(core, loginContent):
                 'extspam' : config.UOS_PATCH_EXTSPAM,
                 'referer' : 'https://wx.qq.com/?&lang=zh_CN&target=t'
               }
-    r = core.s.get(core.loginInfo['url'], headers=headers, allow_redirects=False)
+    r = await get_async_session(core).get(core.loginInfo['url'], headers=headers, allow_redirects=False)
     core.loginInfo['url'] = core.loginInfo['url'][:core.loginInfo['url'].rfind('/')]
     for indexUrl, detailedUrl in (
             ("wx2.qq.com"      , ("file.wx2.qq.com", "webpush.wx2.qq.com")),
@@ -254,7 +238,7 @@ async def web_init(self):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT, }
-    r = self.s.post(url, params=params, data=json.dumps(data), headers=headers)
+    r = await get_async_session(self).post(url, params=params, data=json.dumps(data), headers=headers)
     dic = json.loads(r.content.decode('utf-8', 'replace'))
     # deal with login info
     utils.emoji_formatter(dic['User'], 'NickName')
@@ -296,60 +280,67 @@ async def show_mobile_login(self):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT, }
-    r = self.s.post(url, data=json.dumps(data), headers=headers)
+    r = await get_async_session(self).post(url, data=json.dumps(data), headers=headers)
     return ReturnValue(rawResponse=r)
 
 async def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
+    ''' receive on the running event loop
+        the synccheck long poll and webwxsync are awaited, so sending, uploading
+        and message handling keep running on the same loop while it waits
+    '''
     self.alive = True
-    def maintain_loop():
+    self.loop = asyncio.get_running_loop()
+    async def maintain_loop():
         retryCount = 0
-        while self.alive:
-            try:
-                i = sync_check(self)
-                if i is None:
-                    self.alive = False
-                elif i == '0':
+        try:
+            while self.alive:
+                try:
+                    i = await sync_check(self)
+                    if i is None:
+                        self.alive = False
+                    elif i == '0':
+                        pass
+                    else:
+                        msgList, contactList = await self.get_msg()
+                        if msgList:
+                            msgList = produce_msg(self, msgList)
+                            for msg in msgList:
+                                self.msgList.put_nowait(msg)
+                        if contactList:
+                            chatroomList, otherList = [], []
+                            for contact in contactList:
+                                if '@@' in contact['UserName']:
+                                    chatroomList.append(contact)
+                                else:
+                                    otherList.append(contact)
+                            chatroomMsg = update_local_chatrooms(self, chatroomList)
+                            chatroomMsg['User'] = self.loginInfo['User']
+                            self.msgList.put_nowait(chatroomMsg)
+                            update_local_friends(self, otherList)
+                    retryCount = 0
+                except asyncio.TimeoutError:
                     pass
-                else:
-                    msgList, contactList = self.get_msg()
-                    if msgList:
-                        msgList = produce_msg(self, msgList)
-                        for msg in msgList:
-                            self.msgList.put(msg)
-                    if contactList:
-                        chatroomList, otherList = [], []
-                        for contact in contactList:
-                            if '@@' in contact['UserName']:
-                                chatroomList.append(contact)
-                            else:
-                                otherList.append(contact)
-                        chatroomMsg = update_local_chatrooms(self, chatroomList)
-                        chatroomMsg['User'] = self.loginInfo['User']
-                        self.msgList.put(chatroomMsg)
-                        update_local_friends(self, otherList)
-                retryCount = 0
-            except requests.exceptions.ReadTimeout:
-                pass
-            except:
-                retryCount += 1
-                logger.error(traceback.format_exc())
-                if self.receivingRetryCount < retryCount:
-                    self.alive = False
-                else:
-                    time.sleep(1)
-        self.logout()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    retryCount += 1
+                    logger.error(traceback.format_exc())
+                    if self.receivingRetryCount < retryCount:
+                        self.alive = False
+                    else:
+                        await asyncio.sleep(1)
+        finally:
+            await self.logout()
         if hasattr(exitCallback, '__call__'):
-            exitCallback(self.storageClass.userName)
+            await utils.maybe_await(exitCallback(self.storageClass.userName))
         else:
             logger.info('LOG OUT!')
     if getReceivingFnOnly:
         return maintain_loop
     else:
-        maintainThread = threading.Thread(target=maintain_loop)
-        maintainThread.setDaemon(True)
-        maintainThread.start()
+        self.receivingTask = asyncio.ensure_future(maintain_loop())
 
-def sync_check(self):
+async def sync_check(self):
     url = '%s/synccheck' % self.loginInfo.get('syncUrl', self.loginInfo['url'])
     params = {
         'r'        : int(time.time() * 1000),
@@ -362,18 +353,13 @@ def sync_check(self):
     headers = { 'User-Agent' : config.USER_AGENT}
     self.loginInfo['logintime'] += 1
     try:
-        r = self.s.get(url, params=params, headers=headers, timeout=config.TIMEOUT)
-    except requests.exceptions.ConnectionError as e:
-        try:
-            if not isinstance(e.args[0].args[1], BadStatusLine):
-                raise
-            # will return a package with status '0 -'
-            # and value like:
-            # 6f:00:8a:9c:09:74:e4:d8:e0:14:bf:96:3a:56:a0:64:1b:a4:25:5d:12:f4:31:a5:30:f1:c6:48:5f:c3:75:6a:99:93
-            # seems like status of typing, but before I make further achievement code will remain like this
-            return '2'
-        except:
-            raise
+        r = await get_async_session(self).get(url, params=params, headers=headers, timeout=config.TIMEOUT)
+    except BadStatusLine:
+        # will return a package with status '0 -'
+        # and value like:
+        # 6f:00:8a:9c:09:74:e4:d8:e0:14:bf:96:3a:56:a0:64:1b:a4:25:5d:12:f4:31:a5:30:f1:c6:48:5f:c3:75:6a:99:93
+        # seems like status of typing, but before I make further achievement code will remain like this
+        return '2'
     r.raise_for_status()
     regx = r'window.synccheck={retcode:"(\d+)",selector:"(\d+)"}'
     pm = re.search(regx, r.text)
@@ -382,7 +368,7 @@ def sync_check(self):
         return None
     return pm.group(2)
 
-def get_msg(self):
+async def get_msg(self):
     self.loginInfo['deviceid'] = 'e' + repr(random.random())[2:17]
     url = '%s/webwxsync?sid=%s&skey=%s&pass_ticket=%s' % (
         self.loginInfo['url'], self.loginInfo['wxsid'],
@@ -394,7 +380,7 @@ def get_msg(self):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, data=json.dumps(data), headers=headers, timeout=config.TIMEOUT)
+    r = await get_async_session(self).post(url, data=json.dumps(data), headers=headers, timeout=config.TIMEOUT)
     dic = json.loads(r.content.decode('utf-8', 'replace'))
     if dic['BaseResponse']['Ret'] != 0: return None, None
     self.loginInfo['SyncKey'] = dic['SyncKey']
@@ -402,21 +388,29 @@ def get_msg(self):
         for item in dic['SyncCheckKey']['List']])
     return dic['AddMsgList'], dic['ModContactList']
 
-def logout(self):
+async def logout(self):
     if self.alive:
+        # set before awaiting, maintain_loop calls logout again when it is cancelled
+        self.alive = False
         url = '%s/webwxlogout' % self.loginInfo['url']
         params = {
             'redirect' : 1,
             'type'     : 1,
             'skey'     : self.loginInfo['skey'], }
         headers = { 'User-Agent' : config.USER_AGENT}
-        self.s.get(url, params=params, headers=headers)
-        self.alive = False
+        try:
+            await get_async_session(self).get(url, params=params, headers=headers)
+        except Exception:
+            logger.warning('Logout request failed: %s' % traceback.format_exc())
     self.isLogging = False
+    receivingTask = getattr(self, 'receivingTask', None)
+    if receivingTask is not None and receivingTask is not asyncio.current_task():
+        receivingTask.cancel()
     self.s.cookies.clear()
     del self.chatroomList[:]
     del self.memberList[:]
     del self.mpList[:]
+    self.storageClass.clear_indexes()
     return ReturnValue({'BaseResponse': {
         'ErrMsg': 'logout successfully.',
         'Ret': 0, }})
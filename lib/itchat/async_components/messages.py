@@ -1,14 +1,19 @@
 import os, time, re, io
+import asyncio
 import json
-import mimetypes, hashlib
+import mimetypes
 import logging
 from collections import OrderedDict
 
 
 from .. import config, utils
 from ..returnvalues import ReturnValue
-from ..storage import templates
 from .contact import update_local_uin
+from .http import get_async_session
+from ..components.dedup import get_msg_dedup
+from ..components.messages import _prepare_file
+from ..components.dispatch import LazyMessage, get_user_cache, produce_user
+from ..components.members import fill_group_member, get_member_refresher
 
 logger = logging.getLogger('itchat')
 
@@ -28,10 +33,8 @@ async def get_download_fn(core, url, msgId):
             'msgid': msgId,
             'skey': core.loginInfo['skey'],}
         headers = { 'User-Agent' : config.USER_AGENT}
-        r = core.s.get(url, params=params, stream=True, headers = headers)
-        tempStorage = io.BytesIO()
-        for block in r.iter_content(1024):
-            tempStorage.write(block)
+        r = await get_async_session(core).get(url, params=params, headers=headers)
+        tempStorage = io.BytesIO(r.content)
         if downloadDir is None:
             return tempStorage.getvalue()
         with open(downloadDir, 'wb') as f:
@@ -43,6 +46,11 @@ async def get_download_fn(core, url, msgId):
             'PostFix': utils.get_image_postfix(tempStorage.read(20)), })
     return download_fn
 
+def member_refresher(core):
+    # held messages are completed on the refresher thread, hand them back to the loop
+    return get_member_refresher(core, lambda msg:
+        core.loop.call_soon_threadsafe(core.msgList.put_nowait, msg))
+
 def produce_msg(core, msgList):
     ''' for messages types
      * 40 msg, 43 videochat, 50 VOIPMSG, 52 voipnotifymsg
@@ -51,6 +59,12 @@ def produce_msg(core, msgList):
     rl = []
     srl = [40, 43, 50, 52, 53, 9999]
     for m in msgList:
+        if core.msgFilter is not None and not core.msgFilter.accept(m):
+            continue
+        if get_msg_dedup(core).is_duplicate(m):
+            # redelivered by webwxsync after a retry, a reconnect or a resumed session
+            continue
+        pendingChatroom = None
         # get actual opposite
         if m['FromUserName'] == core.storageClass.userName:
             actualOpposite = m['ToUserName']
@@ -58,23 +72,13 @@ def produce_msg(core, msgList):
             actualOpposite = m['FromUserName']
         # produce basic message
         if '@@' in m['FromUserName'] or '@@' in m['ToUserName']:
-            produce_group_chat(core, m)
+            pendingChatroom = produce_group_chat(core, m)
         else:
             utils.msg_formatter(m, 'Content')
-        # set user of msg
-        if '@@' in actualOpposite:
-            m['User'] = core.search_chatrooms(userName=actualOpposite) or \
-                        templates.Chatroom({'UserName': actualOpposite})
-            # we don't need to update chatroom here because we have
-            # updated once when producing basic message
-        elif actualOpposite in ('filehelper', 'fmessage'):
-            m['User'] = templates.User({'UserName': actualOpposite})
-        else:
-            m['User'] = core.search_mps(userName=actualOpposite) or \
-                        core.search_friends(userName=actualOpposite) or \
-                        templates.User(userName=actualOpposite)
-            # by default we think there may be a user missing not a mp
-        m['User'].core = core
+        # User copies the local contact, it is produced when a handler reads it
+        # and shared by the messages of that chat, see UserCache
+        lazyFields = {'User': lambda actualOpposite=actualOpposite:
+            get_user_cache(core).get(actualOpposite)}
         if m['MsgType'] == 1: # words
             if m['Url']:
                 regx = r'(.+?\(.+?\))'
@@ -88,21 +92,22 @@ def produce_msg(core, msgList):
                     'Type': 'Text',
                     'Text': m['Content'],}
         elif m['MsgType'] == 3 or m['MsgType'] == 47: # picture
-            download_fn = get_download_fn(core,
-                '%s/webwxgetmsgimg' % core.loginInfo['url'], m['NewMsgId'])
+            lazyFields['Text'] = lambda newMsgId=m['NewMsgId']: get_download_fn(core,
+                '%s/webwxgetmsgimg' % core.loginInfo['url'], newMsgId)
             msg = {
                 'Type'     : 'Picture',
                 'FileName' : '%s.%s' % (time.strftime('%y%m%d-%H%M%S', time.localtime()),
-                    'png' if m['MsgType'] == 3 else 'gif'),
-                'Text'     : download_fn, }
+                    'png' if m['MsgType'] == 3 else 'gif'), }
         elif m['MsgType'] == 34: # voice
-            download_fn = get_download_fn(core,
-                '%s/webwxgetvoice' % core.loginInfo['url'], m['NewMsgId'])
+            lazyFields['Text'] = lambda newMsgId=m['NewMsgId']: get_download_fn(core,
+                '%s/webwxgetvoice' % core.loginInfo['url'], newMsgId)
             msg = {
                 'Type': 'Recording',
-                'FileName' : '%s.mp3' % time.strftime('%y%m%d-%H%M%S', time.localtime()),
-                'Text': download_fn,}
+                'FileName' : '%s.mp3' % time.strftime('%y%m%d-%H%M%S', time.localtime()), }
         elif m['MsgType'] == 37: # friends
+            # changed below, so not the shared copy
+            lazyFields.pop('User')
+            m['User'] = produce_user(core, actualOpposite)
             m['User']['UserName'] = m['RecommendInfo']['UserName']
             msg = {
                 'Type': 'Friends',
@@ -124,10 +129,8 @@ def produce_msg(core, msgList):
                     'msgid': msgId,
                     'skey': core.loginInfo['skey'],}
                 headers = {'Range': 'bytes=0-', 'User-Agent' : config.USER_AGENT}
-                r = core.s.get(url, params=params, headers=headers, stream=True)
-                tempStorage = io.BytesIO()
-                for block in r.iter_content(1024):
-                    tempStorage.write(block)
+                r = await get_async_session(core).get(url, params=params, headers=headers)
+                tempStorage = io.BytesIO(r.content)
                 if videoDir is None:
                     return tempStorage.getvalue()
                 with open(videoDir, 'wb') as f:
@@ -157,10 +160,8 @@ def produce_msg(core, msgList):
                         'pass_ticket': 'undefined',
                         'webwx_data_ticket': cookiesList['webwx_data_ticket'],}
                     headers = { 'User-Agent' : config.USER_AGENT}
-                    r = core.s.get(url, params=params, stream=True, headers=headers)
-                    tempStorage = io.BytesIO()
-                    for block in r.iter_content(1024):
-                        tempStorage.write(block)
+                    r = await get_async_session(core).get(url, params=params, headers=headers)
+                    tempStorage = io.BytesIO(r.content)
                     if attaDir is None:
                         return tempStorage.getvalue()
                     with open(attaDir, 'wb') as f:
@@ -219,11 +220,23 @@ def produce_msg(core, msgList):
             msg = {
                 'Type': 'Useless',
                 'Text': 'UselessMsg', }
-        m = dict(m, **msg)
-        rl.append(m)
+        m = LazyMessage(m, **msg)
+        for k, fn in lazyFields.items():
+            m.set_lazy(k, fn)
+        if pendingChatroom:
+            # the sender is fetched in a batched refresh, don't block the receiving loop
+            member_refresher(core).hold(pendingChatroom, m)
+        elif '@@' in actualOpposite and core.memberRefresher is not None \
+                and core.memberRefresher.is_waiting(actualOpposite):
+            member_refresher(core).hold(actualOpposite, m, refresh=False)
+        else:
+            rl.append(m)
     return rl
 
 def produce_group_chat(core, msg):
+    ''' returns the chatroom UserName if the sender is not in the member index yet,
+        the message is then completed by the member refresher
+    '''
     r = re.match('(@[0-9a-z]*?):<br/>(.*)$', msg['Content'])
     if r:
         actualUserName, content = r.groups()
@@ -238,26 +251,17 @@ def produce_group_chat(core, msg):
         msg['IsAt'] = False
         utils.msg_formatter(msg, 'Content')
         return
-    chatroom = core.storageClass.search_chatrooms(userName=chatroomUserName)
-    member = utils.search_dict_list((chatroom or {}).get(
-        'MemberList') or [], 'UserName', actualUserName)
-    if member is None:
-        chatroom = core.update_chatroom(chatroomUserName)
-        member = utils.search_dict_list((chatroom or {}).get(
-            'MemberList') or [], 'UserName', actualUserName)
-    if member is None:
-        logger.debug('chatroom member fetch failed with %s' % actualUserName)
-        msg['ActualNickName'] = ''
-        msg['IsAt'] = False
-    else:
-        msg['ActualNickName'] = member.get('DisplayName', '') or member['NickName']
-        atFlag = '@' + (chatroom['Self'].get('DisplayName', '') or core.storageClass.nickName)
-        msg['IsAt'] = (
-            (atFlag + (u'\u2005' if u'\u2005' in msg['Content'] else ' '))
-            in msg['Content'] or msg['Content'].endswith(atFlag))
     msg['ActualUserName'] = actualUserName
+    pendingChatroom = None
+    if not fill_group_member(core, chatroomUserName, msg):
+        if core.memberRefresher is not None and \
+                core.memberRefresher.recently_missed(chatroomUserName, actualUserName):
+            logger.debug('chatroom member fetch failed with %s' % actualUserName)
+        else:
+            pendingChatroom = chatroomUserName
     msg['Content']        = content
     utils.msg_formatter(msg, 'Content')
+    return pendingChatroom
 
 async def send_raw_msg(self, msgType, content, toUserName):
     url = '%s/webwxsendmsg' % self.loginInfo['url']
@@ -273,7 +277,7 @@ async def send_raw_msg(self, msgType, content, toUserName):
             },
         'Scene': 0, }
     headers = { 'ContentType': 'application/json; charset=UTF-8', 'User-Agent' : config.USER_AGENT}
-    r = self.s.post(url, headers=headers,
+    r = await get_async_session(self).post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -282,44 +286,32 @@ async def send_msg(self, msg='Test Message', toUserName=None):
     r = await self.send_raw_msg(1, msg, toUserName)
     return r
 
-def _prepare_file(fileDir, file_=None):
-    fileDict = {}
-    if file_:
-        if hasattr(file_, 'read'):
-            file_ = file_.read()
-        else:
-            return ReturnValue({'BaseResponse': {
-                'ErrMsg': 'file_ param should be opened file',
-                'Ret': -1005, }})
-    else:
-        if not utils.check_file(fileDir):
-            return ReturnValue({'BaseResponse': {
-                'ErrMsg': 'No file found in specific dir',
-                'Ret': -1002, }})
-        with open(fileDir, 'rb') as f:
-            file_ = f.read()
-    fileDict['fileSize'] = len(file_)
-    fileDict['fileMd5'] = hashlib.md5(file_).hexdigest()
-    fileDict['file_'] = io.BytesIO(file_)
-    return fileDict
-
-def upload_file(self, fileDir, isPicture=False, isVideo=False,
+async def upload_file(self, fileDir, isPicture=False, isVideo=False,
         toUserName='filehelper', file_=None, preparedFile=None):
+    ''' same protocol as components.messages.upload_file
+        hashing and chunk reads run in a thread so a large file never
+        blocks the event loop, chunks but the last are pipelined and
+        chunks acknowledged by an earlier failed attempt are skipped
+    '''
     logger.debug('Request to upload a %s: %s' % (
         'picture' if isPicture else 'video' if isVideo else 'file', fileDir))
     if not preparedFile:
-        preparedFile = _prepare_file(fileDir, file_)
+        preparedFile = await asyncio.to_thread(_prepare_file, fileDir, file_)
         if not preparedFile:
             return preparedFile
     fileSize, fileMd5, file_ = \
         preparedFile['fileSize'], preparedFile['fileMd5'], preparedFile['file_']
+    fileOffset = preparedFile.get('fileOffset', 0)
     fileSymbol = 'pic' if isPicture else 'video' if isVideo else'doc'
-    chunks = int((fileSize - 1) / 524288) + 1
-    clientMediaId = int(time.time() * 1e4)
+    chunkSize = config.UPLOAD_CHUNK_SIZE
+    chunks = int((fileSize - 1) / chunkSize) + 1
+    progressKey = (fileMd5, fileSize, fileSymbol, toUserName)
+    progress = self.uploadProgress.pop(progressKey, None) or \
+        {'clientMediaId': int(time.time() * 1e4), 'acked': set()}
     uploadMediaRequest = json.dumps(OrderedDict([
         ('UploadType', 2),
         ('BaseRequest', self.loginInfo['BaseRequest']),
-        ('ClientMediaId', clientMediaId),
+        ('ClientMediaId', progress['clientMediaId']),
         ('TotalLen', fileSize),
         ('StartPos', 0),
         ('DataLen', fileSize),
@@ -328,17 +320,54 @@ def upload_file(self, fileDir, isPicture=False, isVideo=False,
         ('ToUserName', toUserName),
         ('FileMd5', fileMd5)]
         ), separators = (',', ':'))
-    r = {'BaseResponse': {'Ret': -1005, 'ErrMsg': 'Empty file detected'}}
-    for chunk in range(chunks):
-        r = upload_chunk_file(self, fileDir, fileSymbol, fileSize,
-            file_, chunk, chunks, uploadMediaRequest)
-    file_.close()
-    if isinstance(r, dict):
-        return ReturnValue(r)
-    return ReturnValue(rawResponse=r)
+    readLock = asyncio.Lock()
+    def read_chunk(chunk):
+        file_.seek(fileOffset + chunk * chunkSize)
+        return file_.read(chunkSize)
+    async def send_chunk(chunk):
+        async with readLock:
+            data = await asyncio.to_thread(read_chunk, chunk)
+        try:
+            r = await upload_chunk_file(self, fileDir, fileSymbol, fileSize,
+                data, chunk, chunks, uploadMediaRequest)
+        except Exception as e:
+            logger.debug('Failed to upload chunk %s/%s of %s: %s' % (chunk, chunks, fileDir, e))
+            return ReturnValue({'BaseResponse': {'ErrMsg': str(e), 'Ret': -1005}})
+        r = ReturnValue(rawResponse=r)
+        if r:
+            progress['acked'].add(chunk)
+        return r
+    r = ReturnValue({'BaseResponse': {'Ret': -1005, 'ErrMsg': 'Empty file detected'}})
+    try:
+        # every chunk but the last is pipelined, the last one returns MediaId
+        pending = [c for c in range(chunks - 1) if c not in progress['acked']]
+        if pending:
+            semaphore = asyncio.Semaphore(max(1, config.UPLOAD_CONCURRENCY))
+            async def send_limited(chunk):
+                async with semaphore:
+                    return await send_chunk(chunk)
+            tasks = [asyncio.ensure_future(send_limited(c)) for c in pending]
+            try:
+                for task in tasks:
+                    r = await task
+                    if not r:
+                        break
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        if len(progress['acked']) == chunks - 1:
+            r = await send_chunk(chunks - 1)
+    finally:
+        file_.close()
+    if not r:
+        self.uploadProgress[progressKey] = progress
+        while len(self.uploadProgress) > 64:
+            self.uploadProgress.popitem(last=False)
+    return r
 
-def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
-        file_, chunk, chunks, uploadMediaRequest):
+async def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
+        chunkData, chunk, chunks, uploadMediaRequest):
     url = core.loginInfo.get('fileUrl', core.loginInfo['url']) + \
         '/webwxuploadmedia?f=json'
     # save it on server
@@ -357,13 +386,13 @@ def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
         ('uploadmediarequest', (None, uploadMediaRequest)),
         ('webwx_data_ticket', (None, cookiesList['webwx_data_ticket'])),
         ('pass_ticket', (None, core.loginInfo['pass_ticket'])),
-        ('filename' , (fileName, file_.read(524288), 'application/octet-stream'))])
+        ('filename' , (fileName, chunkData, 'application/octet-stream'))])
     if chunks == 1:
         del files['chunk']; del files['chunks']
     else:
         files['chunk'], files['chunks'] = (None, str(chunk)), (None, str(chunks))
     headers = { 'User-Agent' : config.USER_AGENT}
-    return core.s.post(url, files=files, headers=headers, timeout=config.TIMEOUT)
+    return await get_async_session(core).post(url, files=files, headers=headers, timeout=config.TIMEOUT)
 
 async def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
     logger.debug('Request to send a file(mediaId: %s) to %s: %s' % (
@@ -374,16 +403,26 @@ async def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
             'Ret': -1005, }})
     if toUserName is None:
         toUserName = self.storageClass.userName
-    preparedFile = _prepare_file(fileDir, file_)
-    if not preparedFile:
-        return preparedFile
-    fileSize = preparedFile['fileSize']
-    if mediaId is None:
-        r = self.upload_file(fileDir, preparedFile=preparedFile)
-        if r:
-            mediaId = r['MediaId']
+    if mediaId is not None and file_ is None:
+        # already uploaded, only the size is needed for the message
+        if not utils.check_file(fileDir):
+            return ReturnValue({'BaseResponse': {
+                'ErrMsg': 'No file found in specific dir',
+                'Ret': -1002, }})
+        fileSize = os.path.getsize(fileDir)
+    else:
+        preparedFile = await asyncio.to_thread(_prepare_file, fileDir, file_)
+        if not preparedFile:
+            return preparedFile
+        fileSize = preparedFile['fileSize']
+        if mediaId is None:
+            r = await self.upload_file(fileDir, preparedFile=preparedFile)
+            if r:
+                mediaId = r['MediaId']
+            else:
+                return r
         else:
-            return r
+            preparedFile['file_'].close()
     url = '%s/webwxsendappmsg?fun=async&f=json' % self.loginInfo['url']
     data = {
         'BaseRequest': self.loginInfo['BaseRequest'],
@@ -401,7 +440,7 @@ async def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
     headers = {
         'User-Agent': config.USER_AGENT,
         'Content-Type': 'application/json;charset=UTF-8', }
-    r = self.s.post(url, headers=headers,
+    r = await get_async_session(self).post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -420,7 +459,7 @@ async def send_image(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     if toUserName is None:
         toUserName = self.storageClass.userName
     if mediaId is None:
-        r = self.upload_file(fileDir, isPicture=not fileDir[-4:] == '.gif', file_=file_)
+        r = await self.upload_file(fileDir, isPicture=not fileDir[-4:] == '.gif', file_=file_)
         if r:
             mediaId = r['MediaId']
         else:
@@ -443,7 +482,7 @@ async def send_image(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     headers = {
         'User-Agent': config.USER_AGENT,
         'Content-Type': 'application/json;charset=UTF-8', }
-    r = self.s.post(url, headers=headers,
+    r = await get_async_session(self).post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -462,7 +501,7 @@ async def send_video(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     if toUserName is None:
         toUserName = self.storageClass.userName
     if mediaId is None:
-        r = self.upload_file(fileDir, isVideo=True, file_=file_)
+        r = await self.upload_file(fileDir, isVideo=True, file_=file_)
         if r:
             mediaId = r['MediaId']
         else:
@@ -482,7 +521,7 @@ async def send_video(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     headers = {
         'User-Agent' : config.USER_AGENT,
         'Content-Type': 'application/json;charset=UTF-8', }
-    r = self.s.post(url, headers=headers,
+    r = await get_async_session(self).post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -522,6 +561,6 @@ async def revoke(self, msgId, toUserName, localId=None):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, headers=headers,
+    r = await get_async_session(self).post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
@@ -1,12 +1,9 @@
-import logging, traceback, sys, threading
-try:
-    import Queue
-except ImportError:
-    import queue as Queue  # type: ignore
+import asyncio, logging, traceback, sys
 
 from ..log import set_logging
-from ..utils import test_connect
+from ..utils import test_connect, maybe_await
 from ..storage import templates
+from ..components.dispatch import set_msg_filter
 
 logger = logging.getLogger('itchat')
 
@@ -14,6 +11,7 @@ def load_register(core):
     core.auto_login       = auto_login
     core.configured_reply = configured_reply
     core.msg_register     = msg_register
+    core.set_msg_filter   = set_msg_filter
     core.run              = run
 
 async def auto_login(self, EventScanPayload=None,ScanStatus=None,event_stream=None,
@@ -36,7 +34,7 @@ async def auto_login(self, EventScanPayload=None,ScanStatus=None,event_stream=No
         await self.login(enableCmdQR=enableCmdQR, picDir=picDir, qrCallback=qrCallback, EventScanPayload=EventScanPayload, ScanStatus=ScanStatus, event_stream=event_stream,
             loginCallback=loginCallback, exitCallback=exitCallback)
 
-async def configured_reply(self, event_stream, payload, message_container):
+async def configured_reply(self, event_stream=None, payload=None, message_container=None):
     ''' determine the type of message and reply if its method is defined
         however, I use a strange way to determine whether a msg is from massive platform
         I haven't found a better solution here
@@ -44,12 +42,13 @@ async def configured_reply(self, event_stream, payload, message_container):
         If you have any good idea, pleeeease report an issue. I will be more than grateful.
     '''
     try:
-        msg = self.msgList.get(timeout=1)
-        if 'MsgId' in msg.keys():
+        msg = await asyncio.wait_for(self.msgList.get(), 1)
+        if message_container is not None and 'MsgId' in msg.keys():
             message_container[msg['MsgId']] = msg
-    except Queue.Empty:
+    except asyncio.TimeoutError:
         pass
     else:
+        replyFn = None
         if isinstance(msg['User'], templates.User):
             replyFn = self.functionDict['FriendChat'].get(msg['Type'])
         elif isinstance(msg['User'], templates.MassivePlatform):
@@ -60,7 +59,7 @@ async def configured_reply(self, event_stream, payload, message_container):
             r = None
         else:
             try:
-                r = await replyFn(msg)
+                r = await maybe_await(replyFn(msg))
                 if r is not None:
                     await self.send(r, msg.get('FromUserName'))
             except:
@@ -101,6 +100,6 @@ async def run(self, debug=False, blockThread=True):
     if blockThread:
         await reply_fn()
     else:
-        replyThread = threading.Thread(target=reply_fn)
-        replyThread.setDaemon(True)
-        replyThread.start()
+        # the reply loop shares the event loop with start_receiving instead of a thread
+        self.replyTask = asyncio.get_running_loop().create_task(reply_fn())
+        return self.replyTask
@@ -111,7 +111,12 @@ def update_local_chatrooms(core, l):
     '''
         get a list of chatrooms for updating local chatrooms
         return a list of given chatrooms with updated info
+        chatrooms and members are found through the storage indexes,
+            so merging a delta costs O(len(delta)), not O(members ** 2)
     '''
+    storage = core.storageClass
+    storage.sync_indexes()
+    changedList = []
     for chatroom in l:
         # format new chatrooms
         utils.emoji_formatter(chatroom, 'NickName')
@@ -123,41 +128,33 @@ def update_local_chatrooms(core, l):
             if 'RemarkName' in member:
                 utils.emoji_formatter(member, 'RemarkName')
         # update it to old chatrooms
-        oldChatroom = utils.search_dict_list(
-            core.chatroomList, 'UserName', chatroom['UserName'])
-        if oldChatroom:
+        oldChatroom = storage.chatroomIndex.get(chatroom['UserName'])
+        if oldChatroom is not None:
             update_info_dict(oldChatroom, chatroom)
             #  - update other values
             memberList = chatroom.get('MemberList', [])
             oldMemberList = oldChatroom['MemberList']
-            if memberList:
-                for member in memberList:
-                    oldMember = utils.search_dict_list(
-                        oldMemberList, 'UserName', member['UserName'])
-                    if oldMember:
-                        update_info_dict(oldMember, member)
-                    else:
-                        oldMemberList.append(member)
+            members = storage.chatroom_members(oldChatroom)
+            for member in memberList:
+                oldMember = members.get(member['UserName'])
+                if oldMember is not None:
+                    update_info_dict(oldMember, member)
+                else:
+                    oldMemberList.append(member)
+                    members[member['UserName']] = oldMemberList[-1]
+            # delete useless members
+            if memberList and len(memberList) != len(oldMemberList):
+                existsUserNames = set(member['UserName'] for member in memberList)
+                oldMemberList[:] = [member for member in oldMemberList
+                                    if member['UserName'] in existsUserNames]
+                for userName in set(members) - existsUserNames:
+                    del members[userName]
         else:
-            core.chatroomList.append(chatroom)
-            oldChatroom = utils.search_dict_list(
-                core.chatroomList, 'UserName', chatroom['UserName'])
-        # delete useless members
-        if len(chatroom['MemberList']) != len(oldChatroom['MemberList']) and \
-                chatroom['MemberList']:
-            existsUserNames = [member['UserName']
-                               for member in chatroom['MemberList']]
-            delList = []
-            for i, member in enumerate(oldChatroom['MemberList']):
-                if member['UserName'] not in existsUserNames:
-                    delList.append(i)
-            delList.sort(reverse=True)
-            for i in delList:
-                del oldChatroom['MemberList'][i]
+            oldChatroom = storage.add_chatroom(chatroom)
+            members = storage.memberIndex[oldChatroom['UserName']]
         #  - update OwnerUin
         if oldChatroom.get('ChatRoomOwner') and oldChatroom.get('MemberList'):
-            owner = utils.search_dict_list(oldChatroom['MemberList'],
-                                           'UserName', oldChatroom['ChatRoomOwner'])
+            owner = members.get(oldChatroom['ChatRoomOwner'])
             oldChatroom['OwnerUin'] = (owner or {}).get('Uin', 0)
         #  - update IsAdmin
         if 'OwnerUin' in oldChatroom and oldChatroom['OwnerUin'] != 0:
@@ -166,9 +163,10 @@ def update_local_chatrooms(core, l):
         else:
             oldChatroom['IsAdmin'] = None
         #  - update Self
-        newSelf = utils.search_dict_list(oldChatroom['MemberList'],
-                                         'UserName', core.storageClass.userName)
+        newSelf = members.get(storage.userName)
         oldChatroom['Self'] = newSelf or copy.deepcopy(core.loginInfo['User'])
+        changedList.append(oldChatroom)
+    call_contact_hooks(core, changedList)
     return {
         'Type': 'System',
         'Text': [chatroom['UserName'] for chatroom in l],
@@ -181,8 +179,11 @@ def update_local_chatrooms(core, l):
 def update_local_friends(core, l):
     '''
         get a list of friends or mps for updating local contact
+        contacts are found through storageClass.contactIndex
     '''
-    fullList = core.memberList + core.mpList
+    storage = core.storageClass
+    storage.sync_indexes()
+    changedList = []
     for friend in l:
         if 'NickName' in friend:
             utils.emoji_formatter(friend, 'NickName')
@@ -190,16 +191,27 @@ def update_local_friends(core, l):
             utils.emoji_formatter(friend, 'DisplayName')
         if 'RemarkName' in friend:
             utils.emoji_formatter(friend, 'RemarkName')
-        oldInfoDict = utils.search_dict_list(
-            fullList, 'UserName', friend['UserName'])
+        oldInfoDict = storage.contactIndex.get(friend['UserName'])
         if oldInfoDict is None:
-            oldInfoDict = copy.deepcopy(friend)
-            if oldInfoDict['VerifyFlag'] & 8 == 0:
-                core.memberList.append(oldInfoDict)
-            else:
-                core.mpList.append(oldInfoDict)
+            oldInfoDict = storage.add_contact(core.memberList
+                if friend['VerifyFlag'] & 8 == 0 else core.mpList, copy.deepcopy(friend))
         else:
             update_info_dict(oldInfoDict, friend)
+        changedList.append(oldInfoDict)
+    call_contact_hooks(core, changedList)
+
+
+def call_contact_hooks(core, contactList):
+    ''' notify core.contactHooks of merged contact dicts
+        hooks run under storageClass.updateLock, so they must not call search_* methods
+    '''
+    if not contactList:
+        return
+    for hook in getattr(core, 'contactHooks', ()):
+        try:
+            hook(contactList)
+        except Exception:
+            logger.warning('Contact hook %s failed' % hook, exc_info=True)
 
 
 @contact_change
@@ -248,7 +260,7 @@ def update_local_uin(core, msg):
                                 'UserName': username,
                                 'Uin': uin,
                                 'Self': copy.deepcopy(core.loginInfo['User'])})
-                            core.chatroomList.append(newChatroomDict)
+                            core.storageClass.add_chatroom(newChatroomDict)
                         else:
                             newChatroomDict['Uin'] = uin
                     elif '@' in username:
@@ -261,7 +273,7 @@ def update_local_uin(core, msg):
                             newFriendDict = utils.struct_friend_info({
                                 'UserName': username,
                                 'Uin': uin, })
-                            core.memberList.append(newFriendDict)
+                            core.storageClass.add_contact(core.memberList, newFriendDict)
                         else:
                             newFriendDict['Uin'] = uin
                     usernameChangedList.append(username)
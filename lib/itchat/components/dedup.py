@@ -0,0 +1,75 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from .. import config
+
+logger = logging.getLogger('itchat')
+
+
+class MsgDedup(object):
+    ''' drops messages webwxsync delivers again after retries or reconnects
+        - a message is known by NewMsgId, or by MsgId if it has none
+        - ids are kept in buckets of config.DEDUP_BUCKET seconds for config.DEDUP_WINDOW
+            seconds and at most config.DEDUP_MAX_IDS ids are kept, whole buckets are
+            dropped oldest first, so memory is bounded however long the process runs
+        - dumps and loads keep the window in session snapshots,
+            so a resumed session doesn't hand out messages received before the restart
+    '''
+    def __init__(self):
+        self.buckets = deque() # (bucket start, set of ids), oldest first
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'received': 0, 'duplicates': 0, 'expired': 0}
+    def _expire(self, now):
+        while self.buckets and (self.size > config.DEDUP_MAX_IDS or
+                self.buckets[0][0] + config.DEDUP_BUCKET <= now - config.DEDUP_WINDOW):
+            start, ids = self.buckets.popleft()
+            self.size -= len(ids)
+            self.stats['expired'] += len(ids)
+    def is_duplicate(self, m, now=None):
+        ''' returns whether m was received before, otherwise remembers it '''
+        msgId = str(m.get('NewMsgId') or m.get('MsgId') or '')
+        if not msgId:
+            return False
+        now = time.time() if now is None else now
+        with self.lock:
+            self._expire(now)
+            for start, ids in self.buckets:
+                if msgId in ids:
+                    self.stats['duplicates'] += 1
+                    logger.debug('Dropped a redelivered message %s' % msgId)
+                    return True
+            start = now - now % config.DEDUP_BUCKET
+            # a clock set back keeps adding to the newest bucket
+            if not self.buckets or start > self.buckets[-1][0]:
+                self.buckets.append((start, set()))
+            self.buckets[-1][1].add(msgId)
+            self.size += 1
+            self.stats['received'] += 1
+            self._expire(now)
+        return False
+    def dumps(self):
+        with self.lock:
+            return [[start, list(ids)] for start, ids in self.buckets]
+    def loads(self, buckets, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.buckets.clear()
+            self.size = 0
+            for start, ids in sorted(buckets or []):
+                self.buckets.append((start, set(ids)))
+                self.size += len(ids)
+            self._expire(now)
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['ids'] = self.size
+            return stats
+
+
+def get_msg_dedup(core):
+    if core.msgDedup is None:
+        core.msgDedup = MsgDedup()
+    return core.msgDedup
@@ -0,0 +1,214 @@
+from ..storage import templates
+
+# MsgType -> the Types produce_msg may give it, see produce_msg
+MSG_TYPES = {
+    1    : ('Text', 'Map'),
+    3    : ('Picture',),
+    47   : ('Picture',),
+    34   : ('Recording',),
+    37   : ('Friends',),
+    42   : ('Card',),
+    43   : ('Video',),
+    62   : ('Video',),
+    49   : ('Note', 'Attachment', 'Picture', 'Sharing'),
+    10000: ('Note',),
+    10002: ('Note',), }
+USELESS_TYPES = ('Useless',)
+# produced whether or not a handler wants them, producing them updates local contacts
+ALWAYS_PRODUCE = (51,)
+
+
+class MsgFilter(object):
+    ''' drops messages no handler will take before they are produced
+        - only FromUserName, ToUserName and MsgType of the raw message are read
+        - the chat kind and the Types a MsgType may become are checked against
+            core.functionDict, so handlers registered later are seen at once
+        - set_chats limits a chat kind to contacts with the given NickName or RemarkName,
+            a contact not in the local lists yet is let through
+    '''
+    def __init__(self, core):
+        self.core = core
+        self.chatNames = {'FriendChat': None, 'GroupChat': None, 'MpChat': None}
+        self.chatCache = {} # UserName -> (chat kind, whether its messages are wanted)
+        self.stats = {'accepted': 0, 'dropped': 0}
+        core.contactHooks.append(self.contacts_updated)
+    def set_chats(self, groupNames=None, friendNames=None, mpNames=None):
+        ''' None lets every chat of that kind through '''
+        self.chatNames = {
+            'FriendChat': None if friendNames is None else frozenset(friendNames),
+            'GroupChat' : None if groupNames is None else frozenset(groupNames),
+            'MpChat'    : None if mpNames is None else frozenset(mpNames), }
+        self.chatCache = {}
+    def contacts_updated(self, contacts):
+        for contact in contacts:
+            self.chatCache.pop(contact.get('UserName'), None)
+    def chat_of(self, userName):
+        ''' returns (chat kind, wanted) of a chat, like configured_reply tells them apart '''
+        r = self.chatCache.get(userName)
+        if r is not None:
+            return r
+        storage = self.core.storageClass
+        storage.sync_indexes()
+        if '@@' in userName:
+            chatKind, contact = 'GroupChat', storage.chatroomIndex.get(userName)
+        elif userName in ('filehelper', 'fmessage'):
+            return 'FriendChat', True
+        else:
+            contact = storage.contactIndex.get(userName)
+            chatKind = 'MpChat' if isinstance(contact, templates.MassivePlatform) else 'FriendChat'
+        names = self.chatNames[chatKind]
+        if names is None:
+            return chatKind, True
+        if contact is None:
+            # not known yet, decided again once the contact is fetched
+            return chatKind, True
+        r = self.chatCache[userName] = (chatKind, bool(
+            contact.get('NickName') in names or contact.get('RemarkName') in names))
+        return r
+    def accept(self, m):
+        if m['MsgType'] in ALWAYS_PRODUCE:
+            return True
+        if m['FromUserName'] == self.core.storageClass.userName:
+            chatKind, wanted = self.chat_of(m['ToUserName'])
+        else:
+            chatKind, wanted = self.chat_of(m['FromUserName'])
+        if wanted:
+            handlers = self.core.functionDict[chatKind]
+            wanted = any(msgType in handlers
+                for msgType in MSG_TYPES.get(m['MsgType'], USELESS_TYPES))
+        self.stats['accepted' if wanted else 'dropped'] += 1
+        return wanted
+    def get_stats(self):
+        return dict(self.stats)
+
+
+def get_msg_filter(core):
+    if core.msgFilter is None:
+        core.msgFilter = MsgFilter(core)
+    return core.msgFilter
+
+def set_msg_filter(self, groupNames=None, friendNames=None, mpNames=None):
+    ''' only produce messages some registered handler takes
+        for options
+            - groupNames, friendNames, mpNames: names of the chats to receive
+                - None receives every chat of that kind
+        returns the MsgFilter, see components/dispatch.py
+    '''
+    msgFilter = get_msg_filter(self)
+    msgFilter.set_chats(groupNames, friendNames, mpNames)
+    return msgFilter
+
+
+class LazyMessage(dict):
+    ''' a message whose costly fields are produced on first access
+        set_lazy registers a function producing a field, every dict access
+        resolves it first, so handlers see an ordinary message dict
+    '''
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.lazyFields = {}
+    def set_lazy(self, key, fn):
+        dict.pop(self, key, None)
+        self.lazyFields[key] = fn
+    def _resolve(self, key):
+        fn = self.lazyFields.pop(key, None)
+        if fn is not None:
+            dict.__setitem__(self, key, fn())
+    def resolve_all(self):
+        for key in list(self.lazyFields):
+            self._resolve(key)
+        return self
+    def __missing__(self, key):
+        if key not in self.lazyFields:
+            raise KeyError(key)
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+    def __contains__(self, key):
+        return key in self.lazyFields or dict.__contains__(self, key)
+    def get(self, key, default=None):
+        self._resolve(key)
+        return dict.get(self, key, default)
+    def __setitem__(self, key, value):
+        self.lazyFields.pop(key, None)
+        dict.__setitem__(self, key, value)
+    def __delitem__(self, key):
+        if self.lazyFields.pop(key, None) is None or dict.__contains__(self, key):
+            dict.__delitem__(self, key)
+    def pop(self, key, *default):
+        self._resolve(key)
+        return dict.pop(self, key, *default)
+    def setdefault(self, key, default=None):
+        self._resolve(key)
+        return dict.setdefault(self, key, default)
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        for key in other:
+            self.lazyFields.pop(key, None)
+        dict.update(self, other)
+    def __len__(self):
+        return dict.__len__(self) + len(self.lazyFields)
+    def __iter__(self):
+        return dict.__iter__(self.resolve_all())
+    def keys(self):
+        return dict.keys(self.resolve_all())
+    def values(self):
+        return dict.values(self.resolve_all())
+    def items(self):
+        return dict.items(self.resolve_all())
+    def copy(self):
+        return dict(self.resolve_all())
+    def __eq__(self, other):
+        if isinstance(other, LazyMessage):
+            other.resolve_all()
+        return dict.__eq__(self.resolve_all(), other)
+    def __ne__(self, other):
+        return not self == other
+    __hash__ = None
+    def __repr__(self):
+        return dict.__repr__(self.resolve_all())
+    def __reduce__(self):
+        # copied and pickled messages are produced completely
+        return (LazyMessage, (self.copy(),))
+
+
+class UserCache(object):
+    ''' the Users of messages, one per chat
+        produce_user deep-copies the local contact, for a chatroom its whole MemberList,
+        so messages of a chat share one copy until storageClass.contactVersion changes
+        - handlers should not change msg['User'], other messages of the chat may see it
+    '''
+    def __init__(self, core):
+        self.core = core
+        self.contactVersion = None
+        self.users = {}
+    def get(self, userName):
+        contactVersion = self.core.storageClass.contactVersion
+        if contactVersion != self.contactVersion:
+            self.users, self.contactVersion = {}, contactVersion
+        user = self.users.get(userName)
+        if user is None:
+            user = self.users[userName] = produce_user(self.core, userName)
+        return user
+
+
+def get_user_cache(core):
+    if core.userCache is None:
+        core.userCache = UserCache(core)
+    return core.userCache
+
+def produce_user(core, actualOpposite):
+    ''' the User of a message: a copy of the local chatroom, mp or friend '''
+    if '@@' in actualOpposite:
+        user = core.search_chatrooms(userName=actualOpposite) or \
+            templates.Chatroom({'UserName': actualOpposite})
+        # we don't need to update chatroom here because we have
+        # updated once when producing basic message
+    elif actualOpposite in ('filehelper', 'fmessage'):
+        user = templates.User({'UserName': actualOpposite})
+    else:
+        user = core.search_mps(userName=actualOpposite) or \
+            core.search_friends(userName=actualOpposite) or \
+            templates.User(userName=actualOpposite)
+        # by default we think there may be a user missing not a mp
+    user.core = core
+    return user
@@ -1,12 +1,11 @@
-import pickle, os
 import logging
 
 import requests
 
-from ..config import VERSION
 from ..returnvalues import ReturnValue
-from ..storage import templates
+from ..storage import templates, snapshot
 from .contact import update_local_chatrooms, update_local_friends
+from .dedup import get_msg_dedup
 from .messages import produce_msg
 
 logger = logging.getLogger('itchat')
@@ -16,52 +15,54 @@ def load_hotreload(core):
     core.load_login_status = load_login_status
 
 def dump_login_status(self, fileDir=None):
+    ''' write a snapshot of the session, see storage/snapshot.py
+        the contacts file is only written again if contacts changed since the last dump
+    '''
     fileDir = fileDir or self.hotReloadDir
     try:
-        with open(fileDir, 'w') as f:
-            f.write('itchat - DELETE THIS')
-        os.remove(fileDir)
-    except:
-        raise Exception('Incorrect fileDir')
-    status = {
-        'version'   : VERSION,
-        'loginInfo' : self.loginInfo,
-        'cookies'   : self.s.cookies.get_dict(),
-        'storage'   : self.storageClass.dumps()}
-    with open(fileDir, 'wb') as f:
-        pickle.dump(status, f)
-    logger.debug('Dump login status for hot reload successfully.')
+        contactsWritten = snapshot.dump(self, fileDir)
+    except (IOError, OSError) as e:
+        raise Exception('Incorrect fileDir: %s' % e)
+    logger.debug('Dump login status for hot reload successfully%s.' % (
+        '' if contactsWritten else ', contacts unchanged'))
 
-def load_login_status(self, fileDir,
-        loginCallback=None, exitCallback=None):
+def load_snapshot(self, fileDir):
+    ''' restore loginInfo, cookies and storage from a snapshot
+        returns the session dict, or a ReturnValue if the snapshot can't be used
+    '''
     try:
-        with open(fileDir, 'rb') as f:
-            j = pickle.load(f)
-    except Exception as e:
-        logger.debug('No such file, loading login status failed.')
-        return ReturnValue({'BaseResponse': {
-            'ErrMsg': 'No such file, loading login status failed.',
-            'Ret': -1002, }})
-
-    if j.get('version', '') != VERSION:
-        logger.debug(('you have updated itchat from %s to %s, ' + 
-            'so cached status is ignored') % (
-            j.get('version', 'old version'), VERSION))
+        j = snapshot.load(fileDir)
+    except snapshot.SnapshotError as e:
+        logger.debug('Loading login status failed: %s' % e)
         return ReturnValue({'BaseResponse': {
-            'ErrMsg': 'cached status ignored because of version',
-            'Ret': -1005, }})
+            'ErrMsg': str(e),
+            'Ret': e.ret, }})
     self.loginInfo = j['loginInfo']
     self.loginInfo['User'] = templates.User(self.loginInfo['User'])
     self.loginInfo['User'].core = self
-    self.s.cookies = requests.utils.cookiejar_from_dict(j['cookies'])
+    self.s.cookies = snapshot.load_cookies(j['cookies'])
     self.storageClass.loads(j['storage'])
+    # messages received before the restart are not handed out again
+    get_msg_dedup(self).loads(j.get('msgDedup'))
+    if j['contactsLoaded']:
+        # the loaded contacts equal the contacts file, the next dump keeps it
+        self.storageClass.snapshotState = dict(j['contactsState'],
+            version=self.storageClass.contactVersion)
+    return j
+
+def load_login_status(self, fileDir,
+        loginCallback=None, exitCallback=None):
+    j = load_snapshot(self, fileDir)
+    if isinstance(j, ReturnValue):
+        return j
     try:
         msgList, contactList = self.get_msg()
     except:
         msgList = contactList = None
     if (msgList or contactList) is None:
         self.logout()
-        load_last_login_status(self.s, j['cookies'])
+        load_last_login_status(self.s,
+            dict((c['name'], c['value']) for c in j['cookies']))
         logger.debug('server refused, loading login status failed.')
         return ReturnValue({'BaseResponse': {
             'ErrMsg': 'server refused, loading login status failed.',
@@ -82,7 +83,8 @@ def load_login_status(self, fileDir,
             loginCallback()
         return ReturnValue({'BaseResponse': {
             'ErrMsg': 'loading login status succeeded.',
-            'Ret': 0, }})
+            'Ret': 0, },
+            'ContactsLoaded': j['contactsLoaded'], })
 
 def load_last_login_status(session, cookiesDict):
     try:
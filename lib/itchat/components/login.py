@@ -413,6 +413,7 @@ def logout(self):
     del self.chatroomList[:]
     del self.memberList[:]
     del self.mpList[:]
+    self.storageClass.clear_indexes()
     return ReturnValue({'BaseResponse': {
         'ErrMsg': 'logout successfully.',
         'Ret': 0, }})
@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from .. import config
+
+logger = logging.getLogger('itchat')
+
+
+def fill_group_member(core, chatroomUserName, msg):
+    ''' set ActualNickName and IsAt of a group message from the member index
+        msg['ActualUserName'] should be set
+        returns whether the member is known
+    '''
+    chatroom, member = core.storageClass.get_chatroom_member(
+        chatroomUserName, msg['ActualUserName'])
+    if member is None:
+        msg['ActualNickName'] = ''
+        msg['IsAt'] = False
+        return False
+    msg['ActualNickName'] = member.get('DisplayName', '') or member['NickName']
+    atFlag = '@' + (chatroom['Self'].get('DisplayName', '') or core.storageClass.nickName)
+    msg['IsAt'] = (
+        (atFlag + (u'\u2005' if u'\u2005' in msg['Content'] else ' '))
+        in msg['Content'] or msg['Content'].endswith(atFlag))
+    return True
+
+
+class MemberRefresher(object):
+    ''' resolves unknown chatroom members off the receiving thread
+        - a message from an unknown member is held and its chatroom is queued
+        - queued chatrooms are fetched together, config.MEMBER_REFRESH_BATCH per
+            webwxbatchgetcontact, so the misses of many messages share one request
+        - later messages of a chatroom with held messages are held too, to keep their order
+        - held messages are completed by fill_group_member and handed to deliver
+        - a member still unknown after a refresh is not fetched again for
+            config.MEMBER_MISS_TTL seconds, its messages get an empty ActualNickName
+    '''
+    def __init__(self, core, deliver):
+        self.core = core
+        self.deliver = deliver
+        self.waiting = OrderedDict() # chatroom UserName -> held messages in order
+        self.queued = OrderedDict() # chatroom UserName -> None, waiting for a refresh
+        self.misses = {} # (chatroom UserName, member UserName) -> time of the refresh
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stats = {'held': 0, 'requests': 0, 'chatrooms': 0, 'misses': 0}
+    def is_waiting(self, chatroomUserName):
+        with self.cond:
+            return chatroomUserName in self.waiting
+    def recently_missed(self, chatroomUserName, userName):
+        with self.cond:
+            missedAt = self.misses.get((chatroomUserName, userName))
+        return missedAt is not None and time.time() - missedAt < config.MEMBER_MISS_TTL
+    def hold(self, chatroomUserName, msg, refresh=True):
+        ''' hold msg until chatroomUserName is refreshed
+            refresh=False only keeps the order behind messages already held
+        '''
+        with self.cond:
+            self.waiting.setdefault(chatroomUserName, []).append(msg)
+            if refresh:
+                self.queued[chatroomUserName] = None
+            self.stats['held'] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='MemberRefresher')
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify()
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queued:
+                    self.cond.wait()
+            # misses of messages arriving together go into one request
+            time.sleep(config.MEMBER_REFRESH_DELAY)
+            with self.cond:
+                batch = list(self.queued)[:config.MEMBER_REFRESH_BATCH]
+                heldCount = dict((c, len(self.waiting.get(c, ()))) for c in batch)
+                for c in batch:
+                    del self.queued[c]
+            try:
+                # AsyncCore runs the request on its loop and waits for it here
+                self.core.run_sync(self.core.update_chatroom(batch))
+            except Exception as e:
+                logger.warning('Failed to refresh members of %s chatrooms: %s' % (len(batch), e))
+            self._release(batch, heldCount)
+    def _release(self, batch, heldCount):
+        ''' deliver under the lock, so a message that is not held any more
+            can't overtake the released ones '''
+        now = time.time()
+        ready = []
+        with self.cond:
+            self.stats['requests'] += 1
+            self.stats['chatrooms'] += len(batch)
+            for c in batch:
+                held = self.waiting.get(c, [])
+                if c in self.queued:
+                    # new misses arrived during the request, they wait for the next one
+                    released, held[:] = held[:heldCount[c]], held[heldCount[c]:]
+                else:
+                    released = self.waiting.pop(c, [])
+                ready.extend((c, msg) for msg in released)
+            if len(self.misses) > 10000:
+                self.misses = dict((k, t) for k, t in self.misses.items()
+                    if now - t < config.MEMBER_MISS_TTL)
+            for chatroomUserName, msg in ready:
+                if not fill_group_member(self.core, chatroomUserName, msg):
+                    logger.debug('chatroom member fetch failed with %s' % msg['ActualUserName'])
+                    self.misses[(chatroomUserName, msg['ActualUserName'])] = now
+                    self.stats['misses'] += 1
+                try:
+                    self.deliver(msg)
+                except Exception:
+                    logger.warning('Failed to deliver a held message', exc_info=True)
+    def get_stats(self):
+        with self.cond:
+            stats = dict(self.stats)
+            stats['waiting'] = sum(len(l) for l in self.waiting.values())
+            return stats
+
+
+def get_member_refresher(core, deliver=None):
+    ''' the MemberRefresher of a core, created with deliver on first use
+        deliver defaults to core.msgList.put
+    '''
+    if core.memberRefresher is None:
+        core.memberRefresher = MemberRefresher(core, deliver or core.msgList.put)
+    return core.memberRefresher
@@ -2,14 +2,18 @@ import os, time, re, io
 import json
 import mimetypes, hashlib
 import logging
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
 from .. import config, utils
 from ..returnvalues import ReturnValue
-from ..storage import templates
 from .contact import update_local_uin
+from .dedup import get_msg_dedup
+from .dispatch import LazyMessage, get_user_cache, produce_user
+from .members import fill_group_member, get_member_refresher
 
 logger = logging.getLogger('itchat')
 
@@ -44,6 +48,9 @@ def get_download_fn(core, url, msgId):
             'PostFix': utils.get_image_postfix(tempStorage.read(20)), })
     return download_fn
 
+def member_refresher(core):
+    return get_member_refresher(core, core.msgList.put)
+
 def produce_msg(core, msgList):
     ''' for messages types
      * 40 msg, 43 videochat, 50 VOIPMSG, 52 voipnotifymsg
@@ -52,6 +59,12 @@ def produce_msg(core, msgList):
     rl = []
     srl = [40, 43, 50, 52, 53, 9999]
     for m in msgList:
+        if core.msgFilter is not None and not core.msgFilter.accept(m):
+            continue
+        if get_msg_dedup(core).is_duplicate(m):
+            # redelivered by webwxsync after a retry, a reconnect or a resumed session
+            continue
+        pendingChatroom = None
         # get actual opposite
         if m['FromUserName'] == core.storageClass.userName:
             actualOpposite = m['ToUserName']
@@ -59,23 +72,13 @@ def produce_msg(core, msgList):
             actualOpposite = m['FromUserName']
         # produce basic message
         if '@@' in m['FromUserName'] or '@@' in m['ToUserName']:
-            produce_group_chat(core, m)
+            pendingChatroom = produce_group_chat(core, m)
         else:
             utils.msg_formatter(m, 'Content')
-        # set user of msg
-        if '@@' in actualOpposite:
-            m['User'] = core.search_chatrooms(userName=actualOpposite) or \
-                templates.Chatroom({'UserName': actualOpposite})
-            # we don't need to update chatroom here because we have
-            # updated once when producing basic message
-        elif actualOpposite in ('filehelper', 'fmessage'):
-            m['User'] = templates.User({'UserName': actualOpposite})
-        else:
-            m['User'] = core.search_mps(userName=actualOpposite) or \
-                core.search_friends(userName=actualOpposite) or \
-                templates.User(userName=actualOpposite)
-            # by default we think there may be a user missing not a mp
-        m['User'].core = core
+        # User copies the local contact, it is produced when a handler reads it
+        # and shared by the messages of that chat, see UserCache
+        lazyFields = {'User': lambda actualOpposite=actualOpposite:
+            get_user_cache(core).get(actualOpposite)}
         if m['MsgType'] == 1: # words
             if m['Url']:
                 regx = r'(.+?\(.+?\))'
@@ -89,21 +92,22 @@ def produce_msg(core, msgList):
                     'Type': 'Text',
                     'Text': m['Content'],}
         elif m['MsgType'] == 3 or m['MsgType'] == 47: # picture
-            download_fn = get_download_fn(core,
-                '%s/webwxgetmsgimg' % core.loginInfo['url'], m['NewMsgId'])
+            lazyFields['Text'] = lambda newMsgId=m['NewMsgId']: get_download_fn(core,
+                '%s/webwxgetmsgimg' % core.loginInfo['url'], newMsgId)
             msg = {
                 'Type'     : 'Picture',
                 'FileName' : '%s.%s' % (time.strftime('%y%m%d-%H%M%S', time.localtime()),
-                    'png' if m['MsgType'] == 3 else 'gif'),
-                'Text'     : download_fn, }
+                    'png' if m['MsgType'] == 3 else 'gif'), }
         elif m['MsgType'] == 34: # voice
-            download_fn = get_download_fn(core,
-                '%s/webwxgetvoice' % core.loginInfo['url'], m['NewMsgId'])
+            lazyFields['Text'] = lambda newMsgId=m['NewMsgId']: get_download_fn(core,
+                '%s/webwxgetvoice' % core.loginInfo['url'], newMsgId)
             msg = {
                 'Type': 'Recording',
-                'FileName' : '%s.mp3' % time.strftime('%y%m%d-%H%M%S', time.localtime()),
-                'Text': download_fn,}
+                'FileName' : '%s.mp3' % time.strftime('%y%m%d-%H%M%S', time.localtime()), }
         elif m['MsgType'] == 37: # friends
+            # changed below, so not the shared copy
+            lazyFields.pop('User')
+            m['User'] = produce_user(core, actualOpposite)
             m['User']['UserName'] = m['RecommendInfo']['UserName']
             msg = {
                 'Type': 'Friends',
@@ -220,11 +224,23 @@ def produce_msg(core, msgList):
             msg = {
                 'Type': 'Useless',
                 'Text': 'UselessMsg', }
-        m = dict(m, **msg)
-        rl.append(m)
+        m = LazyMessage(m, **msg)
+        for k, fn in lazyFields.items():
+            m.set_lazy(k, fn)
+        if pendingChatroom:
+            # the sender is fetched in a batched refresh, don't block the receiving loop
+            member_refresher(core).hold(pendingChatroom, m)
+        elif '@@' in actualOpposite and core.memberRefresher is not None \
+                and core.memberRefresher.is_waiting(actualOpposite):
+            member_refresher(core).hold(actualOpposite, m, refresh=False)
+        else:
+            rl.append(m)
     return rl
 
 def produce_group_chat(core, msg):
+    ''' returns the chatroom UserName if the sender is not in the member index yet,
+        the message is then completed by the member refresher
+    '''
     r = re.match('(@[0-9a-z]*?):<br/>(.*)$', msg['Content'])
     if r:
         actualUserName, content = r.groups()
@@ -239,26 +255,17 @@ def produce_group_chat(core, msg):
         msg['IsAt'] = False
         utils.msg_formatter(msg, 'Content')
         return
-    chatroom = core.storageClass.search_chatrooms(userName=chatroomUserName)
-    member = utils.search_dict_list((chatroom or {}).get(
-        'MemberList') or [], 'UserName', actualUserName)
-    if member is None:
-        chatroom = core.update_chatroom(chatroomUserName)
-        member = utils.search_dict_list((chatroom or {}).get(
-            'MemberList') or [], 'UserName', actualUserName)
-    if member is None:
-        logger.debug('chatroom member fetch failed with %s' % actualUserName)
-        msg['ActualNickName'] = ''
-        msg['IsAt'] = False
-    else:
-        msg['ActualNickName'] = member.get('DisplayName', '') or member['NickName']
-        atFlag = '@' + (chatroom['Self'].get('DisplayName', '') or core.storageClass.nickName)
-        msg['IsAt'] = (
-            (atFlag + (u'\u2005' if u'\u2005' in msg['Content'] else ' '))
-            in msg['Content'] or msg['Content'].endswith(atFlag))
     msg['ActualUserName'] = actualUserName
+    pendingChatroom = None
+    if not fill_group_member(core, chatroomUserName, msg):
+        if core.memberRefresher is not None and \
+                core.memberRefresher.recently_missed(chatroomUserName, actualUserName):
+            logger.debug('chatroom member fetch failed with %s' % actualUserName)
+        else:
+            pendingChatroom = chatroomUserName
     msg['Content']        = content
     utils.msg_formatter(msg, 'Content')
+    return pendingChatroom
 
 def send_raw_msg(self, msgType, content, toUserName):
     url = '%s/webwxsendmsg' % self.loginInfo['url']
@@ -284,10 +291,15 @@ def send_msg(self, msg='Test Message', toUserName=None):
     return r
 
 def _prepare_file(fileDir, file_=None):
+    ''' compute size and md5 block by block without loading the file
+        file_ in the returned dict is an open file positioned at fileOffset
+        it is closed by upload_file
+    '''
     fileDict = {}
     if file_:
         if hasattr(file_, 'read'):
-            file_ = file_.read()
+            if not (hasattr(file_, 'seekable') and file_.seekable()):
+                file_ = io.BytesIO(file_.read())
         else:
             return ReturnValue({'BaseResponse': {
                 'ErrMsg': 'file_ param should be opened file',
@@ -297,11 +309,17 @@ def _prepare_file(fileDir, file_=None):
             return ReturnValue({'BaseResponse': {
                 'ErrMsg': 'No file found in specific dir',
                 'Ret': -1002, }})
-        with open(fileDir, 'rb') as f:
-            file_ = f.read()
-    fileDict['fileSize'] = len(file_)
-    fileDict['fileMd5'] = hashlib.md5(file_).hexdigest()
-    fileDict['file_'] = io.BytesIO(file_)
+        file_ = open(fileDir, 'rb')
+    fileOffset = file_.tell()
+    fileMd5, fileSize = hashlib.md5(), 0
+    for block in iter(lambda: file_.read(1048576), b''):
+        fileMd5.update(block)
+        fileSize += len(block)
+    file_.seek(fileOffset)
+    fileDict['fileSize'] = fileSize
+    fileDict['fileMd5'] = fileMd5.hexdigest()
+    fileDict['fileOffset'] = fileOffset
+    fileDict['file_'] = file_
     return fileDict
 
 def upload_file(self, fileDir, isPicture=False, isVideo=False,
@@ -314,13 +332,18 @@ def upload_file(self, fileDir, isPicture=False, isVideo=False,
             return preparedFile
     fileSize, fileMd5, file_ = \
         preparedFile['fileSize'], preparedFile['fileMd5'], preparedFile['file_']
+    fileOffset = preparedFile.get('fileOffset', 0)
     fileSymbol = 'pic' if isPicture else 'video' if isVideo else'doc'
-    chunks = int((fileSize - 1) / 524288) + 1
-    clientMediaId = int(time.time() * 1e4)
+    chunkSize = config.UPLOAD_CHUNK_SIZE
+    chunks = int((fileSize - 1) / chunkSize) + 1
+    # chunks acknowledged by an earlier failed attempt are not sent again
+    progressKey = (fileMd5, fileSize, fileSymbol, toUserName)
+    progress = self.uploadProgress.pop(progressKey, None) or \
+        {'clientMediaId': int(time.time() * 1e4), 'acked': set()}
     uploadMediaRequest = json.dumps(OrderedDict([
         ('UploadType', 2),
         ('BaseRequest', self.loginInfo['BaseRequest']),
-        ('ClientMediaId', clientMediaId),
+        ('ClientMediaId', progress['clientMediaId']),
         ('TotalLen', fileSize),
         ('StartPos', 0),
         ('DataLen', fileSize),
@@ -329,17 +352,47 @@ def upload_file(self, fileDir, isPicture=False, isVideo=False,
         ('ToUserName', toUserName),
         ('FileMd5', fileMd5)]
         ), separators = (',', ':'))
-    r = {'BaseResponse': {'Ret': -1005, 'ErrMsg': 'Empty file detected'}}
-    for chunk in range(chunks):
-        r = upload_chunk_file(self, fileDir, fileSymbol, fileSize,
-            file_, chunk, chunks, uploadMediaRequest)
-    file_.close()
-    if isinstance(r, dict):
-        return ReturnValue(r)
-    return ReturnValue(rawResponse=r)
+    readLock = threading.Lock()
+    def send_chunk(chunk):
+        with readLock:
+            file_.seek(fileOffset + chunk * chunkSize)
+            data = file_.read(chunkSize)
+        try:
+            r = upload_chunk_file(self, fileDir, fileSymbol, fileSize,
+                data, chunk, chunks, uploadMediaRequest)
+        except Exception as e:
+            logger.debug('Failed to upload chunk %s/%s of %s: %s' % (chunk, chunks, fileDir, e))
+            return ReturnValue({'BaseResponse': {'ErrMsg': str(e), 'Ret': -1005}})
+        r = ReturnValue(rawResponse=r)
+        if r:
+            progress['acked'].add(chunk)
+        return r
+    r = ReturnValue({'BaseResponse': {'Ret': -1005, 'ErrMsg': 'Empty file detected'}})
+    try:
+        # every chunk but the last is pipelined, the last one returns MediaId
+        pending = [c for c in range(chunks - 1) if c not in progress['acked']]
+        if pending:
+            with ThreadPoolExecutor(max_workers=
+                    max(1, min(config.UPLOAD_CONCURRENCY, len(pending)))) as executor:
+                futures = [executor.submit(send_chunk, c) for c in pending]
+                for future in futures:
+                    r = future.result()
+                    if not r:
+                        for f in futures:
+                            f.cancel()
+                        break
+        if len(progress['acked']) == chunks - 1:
+            r = send_chunk(chunks - 1)
+    finally:
+        file_.close()
+    if not r:
+        self.uploadProgress[progressKey] = progress
+        while len(self.uploadProgress) > 64:
+            self.uploadProgress.popitem(last=False)
+    return r
 
 def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
-        file_, chunk, chunks, uploadMediaRequest):
+        chunkData, chunk, chunks, uploadMediaRequest):
     url = core.loginInfo.get('fileUrl', core.loginInfo['url']) + \
         '/webwxuploadmedia?f=json'
     # save it on server
@@ -358,7 +411,7 @@ def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
         ('uploadmediarequest', (None, uploadMediaRequest)),
         ('webwx_data_ticket', (None, cookiesList['webwx_data_ticket'])),
         ('pass_ticket', (None, core.loginInfo['pass_ticket'])),
-        ('filename' , (fileName, file_.read(524288), 'application/octet-stream'))])
+        ('filename' , (fileName, chunkData, 'application/octet-stream'))])
     if chunks == 1:
         del files['chunk']; del files['chunks']
     else:
@@ -375,16 +428,26 @@ def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
             'Ret': -1005, }})
     if toUserName is None:
         toUserName = self.storageClass.userName
-    preparedFile = _prepare_file(fileDir, file_)
-    if not preparedFile:
-        return preparedFile
-    fileSize = preparedFile['fileSize']
-    if mediaId is None:
-        r = self.upload_file(fileDir, preparedFile=preparedFile)
-        if r:
-            mediaId = r['MediaId']
+    if mediaId is not None and file_ is None:
+        # already uploaded, only the size is needed for the message
+        if not utils.check_file(fileDir):
+            return ReturnValue({'BaseResponse': {
+                'ErrMsg': 'No file found in specific dir',
+                'Ret': -1002, }})
+        fileSize = os.path.getsize(fileDir)
+    else:
+        preparedFile = _prepare_file(fileDir, file_)
+        if not preparedFile:
+            return preparedFile
+        fileSize = preparedFile['fileSize']
+        if mediaId is None:
+            r = self.upload_file(fileDir, preparedFile=preparedFile)
+            if r:
+                mediaId = r['MediaId']
+            else:
+                return r
         else:
-            return r
+            preparedFile['file_'].close()
     url = '%s/webwxsendappmsg?fun=async&f=json' % self.loginInfo['url']
     data = {
         'BaseRequest': self.loginInfo['BaseRequest'],
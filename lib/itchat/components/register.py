@@ -7,6 +7,7 @@ except ImportError:
 from ..log import set_logging
 from ..utils import test_connect
 from ..storage import templates
+from .dispatch import set_msg_filter
 
 logger = logging.getLogger('itchat')
 
@@ -14,6 +15,7 @@ def load_register(core):
     core.auto_login       = auto_login
     core.configured_reply = configured_reply
     core.msg_register     = msg_register
+    core.set_msg_filter   = set_msg_filter
     core.run              = run
 
 def auto_login(self, hotReload=False, statusStorageDir='itchat.pkl',
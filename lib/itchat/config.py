@@ -11,6 +11,17 @@ DIR = os.getcwd()
 DEFAULT_QR = 'QR.png'
 TIMEOUT = (10, 60)
 
+UPLOAD_CHUNK_SIZE = 524288 # webwxuploadmedia accepts chunks of 512KB
+UPLOAD_CONCURRENCY = 2 # chunks in flight at once, the last chunk is always sent alone
+
+MEMBER_REFRESH_BATCH = 50 # chatrooms fetched in one webwxbatchgetcontact for unknown members
+MEMBER_REFRESH_DELAY = 0.5 # seconds to collect unknown members before fetching them
+MEMBER_MISS_TTL = 300 # seconds before a member still unknown after a refresh is fetched again
+
+DEDUP_WINDOW = 3600 # seconds a received message id is remembered to drop redeliveries
+DEDUP_BUCKET = 60 # ids are dropped a bucket of this many seconds at a time
+DEDUP_MAX_IDS = 50000 # at most this many ids are remembered, the oldest bucket goes first
+
 USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/54.0.2840.71 Safari/537.36'
 
 UOS_PATCH_CLIENT_VERSION = '2.0.0'
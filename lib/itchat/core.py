@@ -1,3 +1,8 @@
+import asyncio
+import concurrent.futures
+import inspect
+from collections import OrderedDict
+
 import requests
 
 from . import storage
@@ -26,6 +31,12 @@ class Core(object):
         self.functionDict = {'FriendChat': {}, 'GroupChat': {}, 'MpChat': {}}
         self.useHotReload, self.hotReloadDir = False, 'itchat.pkl'
         self.receivingRetryCount = 5
+        self.uploadProgress = OrderedDict() # acknowledged chunks of unfinished uploads
+        self.contactHooks = [] # called with updated contacts, under storageClass.updateLock
+        self.memberRefresher = None # resolves unknown chatroom members, see components/members.py
+        self.msgFilter = None # drops unwanted messages before producing them, see components/dispatch.py
+        self.userCache = None # the User of messages per chat, see components/dispatch.py
+        self.msgDedup = None # drops redelivered messages, see components/dedup.py
     def login(self, enableCmdQR=False, picDir=None, qrCallback=None,
             loginCallback=None, exitCallback=None):
         ''' log in like web wechat does
@@ -316,6 +327,9 @@ class Core(object):
                 - fileDir: dir for file ready for upload
                 - isPicture: whether file is a picture
                 - isVideo: whether file is a video
+            file is read chunk by chunk, chunks are uploaded with
+                config.UPLOAD_CONCURRENCY in flight, calling again after
+                a failure resumes from the last acknowledged chunk
             for return values
                 will return a ReturnValue
                 if succeeded, mediaId is in r['MediaId']
@@ -439,6 +453,16 @@ class Core(object):
             return a specific decorator based on information given
         '''
         raise NotImplementedError()
+    def set_msg_filter(self, groupNames=None, friendNames=None, mpNames=None):
+        ''' only produce messages some registered handler takes
+            the receiving loop then reads FromUserName and MsgType of other messages
+                and drops them, without formatting them or looking up their User
+            for options
+                - groupNames, friendNames, mpNames: names of the chats to receive
+                    - None receives every chat of that kind
+            it is defined in components/dispatch.py
+        '''
+        raise NotImplementedError()
     def run(self, debug=True, blockThread=True):
         ''' start auto respond
             for option
@@ -446,6 +470,12 @@ class Core(object):
             it is defined in components/register.py
         '''
         raise NotImplementedError()
+    def run_sync(self, result, timeout=None):
+        ''' return the result of a component call made from a plain thread
+            sync components return it directly, AsyncCore waits for the coroutine
+            so callers may write core.run_sync(core.send_msg(...)) for both
+        '''
+        return result
     def search_friends(self, name=None, userName=None, remarkName=None, nickName=None,
             wechatAccount=None):
         return self.storageClass.search_friends(name, userName, remarkName,
@@ -454,3 +484,40 @@ class Core(object):
         return self.storageClass.search_chatrooms(name, userName)
     def search_mps(self, name=None, userName=None):
         return self.storageClass.search_mps(name, userName)
+
+class AsyncCore(Core):
+    def __init__(self):
+        ''' Core for the async components
+            msgList is an asyncio queue, so the receiving loop and the reply loop
+                share one event loop without blocking it
+            loop is set by start_receiving, threads may submit coroutines to it
+                with asyncio.run_coroutine_threadsafe
+            async components are loaded into this class, not into Core,
+                so sync and async instances can be used in one process
+        '''
+        Core.__init__(self)
+        self.msgList = self.storageClass.msgList = storage.AsyncQueue()
+        self.loop = None
+    def run_sync(self, result, timeout=None):
+        ''' run a coroutine of the async components on self.loop from another thread
+            and wait at most timeout seconds for its result
+            - on timeout the coroutine is cancelled, so its connection is closed
+            - calling it on the loop itself would block the loop, await instead
+        '''
+        if not inspect.isawaitable(result):
+            return result
+        try:
+            runningLoop = asyncio.get_running_loop()
+        except RuntimeError:
+            runningLoop = None
+        if self.loop is None or self.loop.is_closed() or runningLoop is self.loop:
+            if inspect.iscoroutine(result):
+                result.close()
+            raise RuntimeError('run_sync needs a running itchat loop in another thread, '
+                'await the call on the loop instead')
+        future = asyncio.run_coroutine_threadsafe(result, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
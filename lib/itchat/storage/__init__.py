@@ -1,7 +1,7 @@
 import os, time, copy
 from threading import Lock
 
-from .messagequeue import Queue
+from .messagequeue import Queue, AsyncQueue
 from .templates import (
     ContactList, AbstractUserDict, User,
     MassivePlatform, Chatroom, ChatroomMember)
@@ -9,7 +9,10 @@ from .templates import (
 def contact_change(fn):
     def _contact_change(core, *args, **kwargs):
         with core.storageClass.updateLock:
-            return fn(core, *args, **kwargs)
+            try:
+                return fn(core, *args, **kwargs)
+            finally:
+                core.storageClass.contactVersion += 1
     return _contact_change
 
 class Storage(object):
@@ -20,6 +23,12 @@ class Storage(object):
         self.memberList        = ContactList()
         self.mpList            = ContactList()
         self.chatroomList      = ContactList()
+        self.chatroomIndex     = {} # chatroom UserName -> chatroom in chatroomList
+        self.memberIndex       = {} # chatroom UserName -> {member UserName: member}
+        self.contactIndex      = {} # friend or mp UserName -> contact in memberList or mpList
+        self.indexedLengths    = (0, 0, 0) # lengths of the lists when the indexes were last synced
+        self.contactVersion    = 0 # changed with the contact lists, see storage/snapshot.py
+        self.snapshotState     = {} # contacts file last written or loaded, and its contactVersion
         self.msgList           = Queue(-1)
         self.lastInputUserName = None
         self.memberList.set_default_value(contactClass=User)
@@ -56,9 +65,88 @@ class Storage(object):
                     member.core = chatroom.core
                     member.chatroom = chatroom
             if 'Self' in chatroom:
+                if not isinstance(chatroom['Self'], AbstractUserDict):
+                    # snapshots keep plain dicts, Self is the member of MemberList again
+                    chatroom['Self'] = next((m for m in chatroom['MemberList']
+                        if m['UserName'] == self.userName), None) or ChatroomMember(chatroom['Self'])
                 chatroom['Self'].core = chatroom.core
                 chatroom['Self'].chatroom = chatroom
+        self.clear_indexes()
+        self.sync_indexes()
         self.lastInputUserName = j.get('lastInputUserName', None)
+    def index_chatroom(self, chatroom):
+        ''' index a chatroom of chatroomList and its whole MemberList
+            call it under updateLock
+        '''
+        self.chatroomIndex.setdefault(chatroom['UserName'], chatroom)
+        members = self.memberIndex[chatroom['UserName']] = {}
+        for member in chatroom.get('MemberList') or []:
+            members.setdefault(member['UserName'], member)
+        return members
+    def clear_indexes(self):
+        ''' drop the indexes, the next sync_indexes rebuilds them from the lists '''
+        self.chatroomIndex.clear()
+        self.memberIndex.clear()
+        self.contactIndex.clear()
+        self.indexedLengths = (-1, -1, -1)
+        self.contactVersion += 1
+    def sync_indexes(self):
+        ''' rebuild the indexes if a list was changed without add_contact or add_chatroom
+            (loads, web_init, or user code), call it under updateLock
+            the first of duplicated UserNames wins, like search_dict_list
+        '''
+        lengths = (len(self.memberList), len(self.mpList), len(self.chatroomList))
+        if lengths == self.indexedLengths:
+            return
+        self.contactVersion += 1
+        if lengths[:2] != self.indexedLengths[:2]:
+            self.contactIndex.clear()
+            for contact in list(self.memberList) + list(self.mpList):
+                self.contactIndex.setdefault(contact['UserName'], contact)
+        if lengths[2] != self.indexedLengths[2]:
+            self.chatroomIndex.clear()
+            self.memberIndex.clear()
+            for chatroom in self.chatroomList:
+                if chatroom['UserName'] not in self.chatroomIndex:
+                    self.index_chatroom(chatroom)
+        self.indexedLengths = lengths
+    def add_contact(self, contactList, contact):
+        ''' append a friend (memberList) or mp (mpList) and index it
+            returns the stored contact, call it under updateLock
+        '''
+        self.sync_indexes()
+        contactList.append(contact)
+        contact = contactList[-1]
+        self.contactIndex.setdefault(contact['UserName'], contact)
+        self.indexedLengths = (len(self.memberList), len(self.mpList), len(self.chatroomList))
+        return contact
+    def add_chatroom(self, chatroom):
+        ''' append a chatroom and index it with its members
+            returns the stored chatroom, call it under updateLock
+        '''
+        self.sync_indexes()
+        self.chatroomList.append(chatroom)
+        chatroom = self.chatroomList[-1]
+        if chatroom['UserName'] not in self.chatroomIndex:
+            self.index_chatroom(chatroom)
+        self.indexedLengths = (len(self.memberList), len(self.mpList), len(self.chatroomList))
+        return chatroom
+    def chatroom_members(self, chatroom):
+        ''' the member index of a stored chatroom, reindexed if its MemberList
+            was changed outside update_local_chatrooms, call it under updateLock
+        '''
+        members = self.memberIndex.get(chatroom['UserName'])
+        if members is None or len(members) != len(chatroom['MemberList']):
+            members = self.index_chatroom(chatroom)
+        return members
+    def get_chatroom_member(self, chatroomUserName, userName):
+        ''' return (chatroom, member) from the index without scanning or copying
+            both are the stored dicts, so only read them
+            member is None if the chatroom or the member is not known yet
+        '''
+        chatroom = self.chatroomIndex.get(chatroomUserName)
+        members = self.memberIndex.get(chatroomUserName)
+        return chatroom, (members or {}).get(userName)
     def search_friends(self, name=None, userName=None, remarkName=None, nickName=None,
             wechatAccount=None):
         with self.updateLock:
@@ -94,9 +182,10 @@ class Storage(object):
     def search_chatrooms(self, name=None, userName=None):
         with self.updateLock:
             if userName is not None:
-                for m in self.chatroomList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                self.sync_indexes()
+                m = self.chatroomIndex.get(userName)
+                if m is not None:
+                    return copy.deepcopy(m)
             elif name is not None:
                 matchList = []
                 for m in self.chatroomList:
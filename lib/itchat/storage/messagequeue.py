@@ -1,3 +1,4 @@
+import asyncio
 import logging
 try:
     import Queue as queue
@@ -12,6 +13,10 @@ class Queue(queue.Queue):
     def put(self, message):
         queue.Queue.put(self, Message(message))
 
+class AsyncQueue(asyncio.Queue):
+    def put_nowait(self, message):
+        asyncio.Queue.put_nowait(self, Message(message))
+
 class Message(AttributeDict):
     def download(self, fileName):
         if hasattr(self.text, '__call__'):
@@ -0,0 +1,159 @@
+''' versioned session snapshots for hot reload
+
+    a snapshot is two files, each written to a temp file and moved in place:
+        - fileDir: loginInfo, cookies and the storage fields, small, written by every dump
+        - fileDir + CONTACTS_SUFFIX: the contact lists, written again only when
+            they changed since the last dump (Storage.contactVersion)
+    a file is MAGIC, a json header line and a zlib compressed json body
+    the header holds the format, the itchat VERSION and the sha1 of the body,
+    the session file holds the sha1 of its contacts file,
+    so truncated, foreign, outdated or mismatched files are refused on load
+'''
+import os, time
+import json, zlib, hashlib
+import logging
+import tempfile
+
+import requests
+
+from ..config import VERSION
+
+logger = logging.getLogger('itchat')
+
+MAGIC = b'ITCHAT-SNAPSHOT\n'
+FORMAT = 1
+CONTACTS_SUFFIX = '.contacts'
+COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'expires')
+
+
+class SnapshotError(Exception):
+    def __init__(self, message, ret=-1005):
+        Exception.__init__(self, message)
+        self.ret = ret
+
+
+def encode(kind, body):
+    data = zlib.compress(json.dumps(body, ensure_ascii=False,
+        separators=(',', ':')).encode('utf8'), 1)
+    header = {'format': FORMAT, 'version': VERSION, 'kind': kind,
+        'sha1': hashlib.sha1(data).hexdigest(), 'length': len(data), 'time': int(time.time())}
+    return MAGIC + json.dumps(header).encode('utf8') + b'\n' + data
+
+def decode(data, kind):
+    if not data.startswith(MAGIC):
+        raise SnapshotError('not a snapshot of this itchat, it may be an old pickle')
+    headerLine, _, body = data[len(MAGIC):].partition(b'\n')
+    try:
+        header = json.loads(headerLine.decode('utf8'))
+    except ValueError:
+        raise SnapshotError('broken snapshot header')
+    if header.get('format') != FORMAT or header.get('kind') != kind:
+        raise SnapshotError('snapshot format %s of %s is not supported' % (
+            header.get('format'), header.get('kind')))
+    if header.get('version') != VERSION:
+        raise SnapshotError(('you have updated itchat from %s to %s, ' +
+            'so cached status is ignored') % (header.get('version'), VERSION))
+    if len(body) != header.get('length') or hashlib.sha1(body).hexdigest() != header.get('sha1'):
+        raise SnapshotError('snapshot is truncated or damaged')
+    return header, json.loads(zlib.decompress(body).decode('utf8'))
+
+def write_atomic(fileDir, data):
+    ''' readers see the old file or the new one, never a part of it '''
+    dirName = os.path.dirname(os.path.abspath(fileDir))
+    fd, tempDir = tempfile.mkstemp(prefix='.%s.' % os.path.basename(fileDir), dir=dirName)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tempDir, fileDir)
+    except:
+        try:
+            os.remove(tempDir)
+        except OSError:
+            pass
+        raise
+
+def read(fileDir, kind):
+    try:
+        with open(fileDir, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        raise SnapshotError('No such file, loading login status failed.', ret=-1002)
+    header, body = decode(data, kind)
+    return hashlib.sha1(data).hexdigest(), body
+
+def dump_cookies(jar):
+    return [dict((k, getattr(cookie, k)) for k in COOKIE_FIELDS) for cookie in jar]
+
+def load_cookies(cookieList):
+    jar, now = requests.cookies.RequestsCookieJar(), time.time()
+    for c in cookieList:
+        if c.get('expires') and c['expires'] < now:
+            continue
+        jar.set_cookie(requests.cookies.create_cookie(**c))
+    return jar
+
+def dump(core, fileDir):
+    ''' write the snapshot of core to fileDir
+        returns whether the contacts file was written
+    '''
+    storage = core.storageClass
+    contactsDir = fileDir + CONTACTS_SUFFIX
+    contactsData = None
+    with storage.updateLock:
+        contactVersion = storage.contactVersion
+        state = storage.snapshotState
+        if state.get('fileDir') != contactsDir or state.get('version') != contactVersion \
+                or not os.path.exists(contactsDir):
+            contactsData = encode('contacts', {
+                'memberList'  : storage.memberList,
+                'mpList'      : storage.mpList,
+                'chatroomList': storage.chatroomList, })
+    if contactsData is not None:
+        write_atomic(contactsDir, contactsData)
+        state = storage.snapshotState = {'fileDir': contactsDir,
+            'version': contactVersion, 'sha1': hashlib.sha1(contactsData).hexdigest()}
+    write_atomic(fileDir, encode('session', {
+        'loginInfo'        : dict(core.loginInfo),
+        'cookies'          : dump_cookies(core.s.cookies),
+        'userName'         : storage.userName,
+        'nickName'         : storage.nickName,
+        'lastInputUserName': storage.lastInputUserName,
+        'msgDedup'         : core.msgDedup.dumps() if core.msgDedup is not None else [],
+        'contacts'         : {'file': os.path.basename(contactsDir), 'sha1': state['sha1']}, }))
+    return contactsData is not None
+
+def load(fileDir):
+    ''' returns the session dict, its 'storage' holds the contact lists too
+        if the contacts file is valid, otherwise only the storage fields
+        raises SnapshotError if the session file can't be used
+    '''
+    sha1, session = read(fileDir, 'session')
+    if not session.get('loginInfo', {}).get('url') or not session.get('cookies'):
+        raise SnapshotError('snapshot holds no login')
+    storage = {
+        'userName'         : session.get('userName'),
+        'nickName'         : session.get('nickName'),
+        'lastInputUserName': session.get('lastInputUserName'), }
+    contactsDir = fileDir + CONTACTS_SUFFIX
+    session['contactsLoaded'] = False
+    try:
+        contactsSha1, contacts = read(contactsDir, 'contacts')
+        if contactsSha1 != session.get('contacts', {}).get('sha1'):
+            raise SnapshotError('contacts file does not belong to this session')
+    except SnapshotError as e:
+        logger.info('Contacts of the snapshot are ignored, they will be fetched again: %s' % e)
+    else:
+        storage.update(contacts)
+        session['contactsLoaded'] = True
+        session['contactsState'] = {'fileDir': contactsDir, 'sha1': contactsSha1}
+    session['storage'] = storage
+    return session
+
+def remove(fileDir):
+    for path in (fileDir, fileDir + CONTACTS_SUFFIX):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,4 +1,5 @@
 import logging, copy, pickle
+import inspect
 from weakref import ref
 
 from ..returnvalues import ReturnValue
@@ -6,6 +7,21 @@ from ..utils import update_info_dict
 
 logger = logging.getLogger('itchat')
 
+def apply_update(r, apply):
+    ''' apply the result of update_friend or update_chatroom
+        AsyncCore returns a coroutine, which is wrapped so it is applied once awaited
+    '''
+    if inspect.isawaitable(r):
+        async def _apply():
+            result = await r
+            if result:
+                apply(result)
+            return result
+        return _apply()
+    if r:
+        apply(r)
+    return r
+
 class AttributeDict(dict):
     def __getattr__(self, value):
         keyName = value[0].upper() + value[1:]
@@ -146,10 +162,8 @@ class User(AbstractUserDict):
         super(User, self).__init__(*args, **kwargs)
         self.__setstate__(None)
     def update(self):
-        r = self.core.update_friend(self.userName)
-        if r:
-            update_info_dict(self, r)
-        return r
+        return apply_update(self.core.update_friend(self.userName),
+            lambda r: update_info_dict(self, r))
     def set_alias(self, alias):
         return self.core.set_alias(self.userName, alias)
     def set_pinned(self, isPinned=True):
@@ -197,11 +211,10 @@ class Chatroom(AbstractUserDict):
         for member in self.memberList:
             member.core = value
     def update(self, detailedMember=False):
-        r = self.core.update_chatroom(self.userName, detailedMember)
-        if r:
+        def _apply(r):
             update_info_dict(self, r)
             self['MemberList'] = r['MemberList']
-        return r
+        return apply_update(self.core.update_chatroom(self.userName, detailedMember), _apply)
     def set_alias(self, alias):
         return self.core.set_chatroom_name(self.userName, alias)
     def set_pinned(self, isPinned=True):
@@ -1,4 +1,4 @@
-import re, os, sys, subprocess, copy, traceback, logging
+import re, os, sys, subprocess, copy, traceback, logging, inspect
 
 try:
     from HTMLParser import HTMLParser
@@ -138,6 +138,12 @@ def test_connect(retryTime=5):
                 logger.error(traceback.format_exc())
                 return False
 
+async def maybe_await(value):
+    ''' callbacks of the async components may be plain functions or coroutine functions '''
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
 def contact_deep_copy(core, contact):
     with core.storageClass.updateLock:
         return copy.deepcopy(contact)
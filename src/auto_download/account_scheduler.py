@@ -0,0 +1,193 @@
+# src/auto_download/account_scheduler.py
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# 学科网账号下载上限
+DAILY_LIMIT = 51
+WEEKLY_LIMIT = 350
+
+
+def day_key(now: datetime) -> str:
+    """每日计数使用的日期键。"""
+    return now.strftime('%Y-%m-%d')
+
+
+def week_key(now: datetime) -> str:
+    """每周计数使用的周键，年份和周数组合，周从星期一开始。"""
+    return now.strftime('%Y-%W')
+
+
+class AccountScheduler:
+    """
+    基于剩余额度的账号调度器。
+
+    根据每个账号当天和本周的剩余额度以及实例当前积压的任务数选择实例，
+    并按本周剩余天数对额度做均衡分配，使账号在一周内均匀消耗额度，而不是在周一就全部用完。
+    所有实例都没有剩余额度时返回 None，由调用方在分配前挂起任务。
+
+    参数:
+    - daily_limit: 每个账号每日下载上限。
+    - weekly_limit: 每个账号每周下载上限。
+    - strict_pacing: 为 True 时超出当日均衡配额的任务直接挂起；
+      为 False 时在所有账号的均衡配额用完后继续使用剩余的每日额度。
+    - rate_window: 统计分配速率的时间窗口（秒），用于预测额度耗尽时间。
+    """
+
+    def __init__(self, daily_limit: int = DAILY_LIMIT, weekly_limit: int = WEEKLY_LIMIT,
+                 strict_pacing: bool = False, rate_window: int = 3600):
+        self.daily_limit = daily_limit
+        self.weekly_limit = weekly_limit
+        self.strict_pacing = strict_pacing
+        self.rate_window = rate_window
+        self.dispatch_times = deque()  # 最近的分配时间戳，用于计算分配速率
+        self.lock = threading.Lock()
+
+    def usage(self, counts: Dict, nickname: str, now: datetime) -> Tuple[int, int]:
+        """
+        从下载计数中读取账号当天和本周的已用次数。
+
+        参数:
+        - counts: 与 XKW.download_counts 相同结构的计数字典。
+        - nickname: 账号昵称。
+        - now: 当前时间。
+
+        返回:
+        - (每日已用, 每周已用)
+        """
+        account_counts = counts.get(nickname, {})
+        daily_info = account_counts.get('daily', {})
+        weekly_info = account_counts.get('weekly', {})
+        daily_used = daily_info.get('count', 0) if daily_info.get('date') == day_key(now) else 0
+        weekly_used = weekly_info.get('count', 0) if weekly_info.get('week') == week_key(now) else 0
+        return daily_used, weekly_used
+
+    def remaining(self, counts: Dict, nickname: str, now: datetime) -> Tuple[int, int, int]:
+        """
+        计算账号的剩余额度。
+
+        返回:
+        - (每日剩余, 每周剩余, 今日均衡配额剩余)
+        """
+        daily_used, weekly_used = self.usage(counts, nickname, now)
+        daily_remaining = max(0, self.daily_limit - daily_used)
+        weekly_remaining = max(0, self.weekly_limit - weekly_used)
+        # 本周剩余天数（含今天），周一为 7，周日为 1
+        days_left = 7 - now.weekday()
+        # 今天开始时的周剩余额度平均分配到剩余天数
+        allowance = math.ceil((weekly_remaining + daily_used) / days_left)
+        paced_remaining = max(0, min(allowance - daily_used, daily_remaining, weekly_remaining))
+        return min(daily_remaining, weekly_remaining), weekly_remaining, paced_remaining
+
+    def select_instance(self, instances: List, counts: Dict, now: Optional[datetime] = None):
+        """
+        从候选实例中选择剩余额度减去积压任务后余量最大的实例。
+
+        参数:
+        - instances: 候选实例列表，需提供 id、current_account_nickname() 和 backlog()。
+        - counts: 与 XKW.download_counts 相同结构的计数字典，调用方负责加锁。
+        - now: 当前时间，默认为 datetime.now()。
+
+        返回:
+        - 选中的实例；所有实例额度都已被占满时返回 None。
+        """
+        now = now or datetime.now()
+        best_paced, best_paced_score = None, 0
+        best_hard, best_hard_score = None, 0
+        for instance in instances:
+            nickname = instance.current_account_nickname()
+            if not nickname:
+                continue
+            hard_remaining, _, paced_remaining = self.remaining(counts, nickname, now)
+            backlog = instance.backlog()
+            paced_score = paced_remaining - backlog
+            hard_score = hard_remaining - backlog
+            if paced_score > best_paced_score:
+                best_paced, best_paced_score = instance, paced_score
+            if hard_score > best_hard_score:
+                best_hard, best_hard_score = instance, hard_score
+
+        selected = best_paced
+        if selected is None and not self.strict_pacing:
+            selected = best_hard
+            if selected is not None:
+                logging.info(f"所有账号今日均衡配额已用完，使用实例 {selected.id} 的剩余每日额度。")
+        if selected is not None:
+            self.record_dispatch()
+        return selected
+
+    def record_dispatch(self, timestamp: Optional[float] = None):
+        """记录一次任务分配，用于计算分配速率。"""
+        timestamp = timestamp or time.time()
+        with self.lock:
+            self.dispatch_times.append(timestamp)
+            cutoff = timestamp - self.rate_window
+            while self.dispatch_times and self.dispatch_times[0] < cutoff:
+                self.dispatch_times.popleft()
+
+    def dispatch_rate(self, now_ts: Optional[float] = None) -> float:
+        """返回最近 rate_window 内的每小时分配速率。"""
+        now_ts = now_ts or time.time()
+        with self.lock:
+            cutoff = now_ts - self.rate_window
+            while self.dispatch_times and self.dispatch_times[0] < cutoff:
+                self.dispatch_times.popleft()
+            count = len(self.dispatch_times)
+        return count * 3600 / self.rate_window
+
+    def forecast(self, nicknames: List[str], counts: Dict, now: Optional[datetime] = None,
+                 rate_per_hour: Optional[float] = None) -> Dict:
+        """
+        预测账号池的额度耗尽时间。
+
+        参数:
+        - nicknames: 参与统计的账号昵称列表（通常为活跃实例的当前账号）。
+        - counts: 与 XKW.download_counts 相同结构的计数字典。
+        - now: 当前时间。
+        - rate_per_hour: 预测使用的每小时下载速率，默认使用最近的分配速率。
+
+        返回:
+        - 包含每日剩余、每周剩余、速率以及预计耗尽时间的字典，速率为 0 时耗尽时间为 None。
+        """
+        now = now or datetime.now()
+        rate = self.dispatch_rate(now.timestamp()) if rate_per_hour is None else rate_per_hour
+        daily_remaining = weekly_remaining = 0
+        for nickname in nicknames:
+            hard_remaining, weekly, _ = self.remaining(counts, nickname, now)
+            daily_remaining += hard_remaining
+            weekly_remaining += weekly
+
+        result = {
+            'daily_remaining': daily_remaining,
+            'weekly_remaining': weekly_remaining,
+            'rate_per_hour': rate,
+            'daily_exhaust_at': None,
+            'weekly_exhaust_at': None,
+        }
+        if rate > 0:
+            daily_exhaust_at = now + timedelta(hours=daily_remaining / rate)
+            # 每日额度在午夜重置，超过午夜说明今天不会耗尽
+            midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            if daily_exhaust_at < midnight:
+                result['daily_exhaust_at'] = daily_exhaust_at
+            result['weekly_exhaust_at'] = now + timedelta(hours=weekly_remaining / rate)
+        return result
+
+    def format_forecast(self, forecast: Dict) -> str:
+        """将预测结果格式化为通知文本。"""
+        lines = [
+            "账号池额度预测：",
+            f"  - 今日剩余额度: {forecast['daily_remaining']}",
+            f"  - 本周剩余额度: {forecast['weekly_remaining']}",
+            f"  - 最近分配速率: {forecast['rate_per_hour']:.1f} 次/小时",
+        ]
+        if forecast['daily_exhaust_at']:
+            lines.append(f"  - 预计今日额度耗尽: {forecast['daily_exhaust_at'].strftime('%H:%M')}")
+        if forecast['weekly_exhaust_at']:
+            lines.append(f"  - 预计本周额度耗尽: {forecast['weekly_exhaust_at'].strftime('%Y-%m-%d %H:%M')}")
+        return "\n".join(lines)
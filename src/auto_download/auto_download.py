@@ -12,20 +12,63 @@ import uuid
 import datetime
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
-from typing import Tuple
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
 
+import requests
 from DrissionPage import ChromiumPage, ChromiumOptions, Chromium
 from DrissionPage.errors import ContextLostError
 from rapidfuzz import fuzz
 
+from src.auto_download.account_scheduler import AccountScheduler, DAILY_LIMIT, WEEKLY_LIMIT, day_key, week_key
+from src.auto_download.process_broker import ProcessBroker, RemoteXKW
+from src.itchat_module.routing import extract_soft_id
 from src.notification.notifier import Notifier
+from src.scheduler.timer_service import get_timer_service
 
 # 配置基础目录和下载目录
 BASE_DIR = os.path.dirname(__file__)
 DOWNLOAD_DIR = os.path.join(BASE_DIR, 'Downloads')
 STATE_DIR = os.path.join(BASE_DIR, 'state')  # 新增状态保存目录
 
+# XKW 实例配置：实例ID、浏览器调试端口、用户数据目录、下载线程数和实例独有的账号列表
+INSTANCE_SPECS = [
+    {'id': 'xkw1', 'port': 9222, 'user_data': 'data1', 'thread': 3,
+     'accounts': [{'username': '13143019361', 'password': '428199Li@', 'nickname': '全能01X'}]},
+    {'id': 'xkw2', 'port': 9333, 'user_data': 'data2', 'thread': 3,
+     'accounts': [{'username': '19061531853', 'password': '428199Li@', 'nickname': '全能02'}]},
+    {'id': 'xkw3', 'port': 9444, 'user_data': 'data3', 'thread': 3,
+     'accounts': [{'username': '19563630322', 'password': '428199Li@', 'nickname': '全能03X'}]},
+    {'id': 'xkw4', 'port': 9455, 'user_data': 'data4', 'thread': 3,
+     'accounts': [{'username': '13343297668', 'password': '428199Li@', 'nickname': '全能04X'}]},
+    {'id': 'xkw5', 'port': 9466, 'user_data': 'data5', 'thread': 3,
+     'accounts': [{'username': '15324485548', 'password': '428199Li@', 'nickname': '全能05'}]},
+    {'id': 'xkw6', 'port': 9477, 'user_data': 'data6', 'thread': 3,
+     'accounts': [{'username': '19536946597', 'password': '428199Li@', 'nickname': '全能06X'}]},
+    {'id': 'xkw7', 'port': 9488, 'user_data': 'data7', 'thread': 3,
+     'accounts': [{'username': '13820043716', 'password': '428199Li@', 'nickname': '全能08X'}]},
+    {'id': 'xkw8', 'port': 9499, 'user_data': 'data8', 'thread': 3,
+     'accounts': [{'username': '15512733826', 'password': '428199Li@', 'nickname': '全能09X'}]},
+    {'id': 'xkw9', 'port': 9500, 'user_data': 'data9', 'thread': 3,
+     'accounts': [{'username': '13920946017', 'password': '428199Li@', 'nickname': '全能11X'}]},
+    {'id': 'xkw10', 'port': 9511, 'user_data': 'data10', 'thread': 3,
+     'accounts': [{'username': '19358191853', 'password': '428199Li@', 'nickname': '全能12X'}]},
+    {'id': 'xkw11', 'port': 9522, 'user_data': 'data11', 'thread': 3,
+     'accounts': [{'username': '18589186420', 'password': '428199Li@', 'nickname': '全能13x'}]},
+    {'id': 'xkw12', 'port': 9533, 'user_data': 'data12', 'thread': 3,
+     'accounts': [{'username': '19316031853', 'password': '428199Li@', 'nickname': '全能14X'}]},
+    {'id': 'xkw13', 'port': 9544, 'user_data': 'data13', 'thread': 3,
+     'accounts': [{'username': '19568101843', 'password': '428199Li@', 'nickname': '全能15X'}]},
+    {'id': 'xkw14', 'port': 9555, 'user_data': 'data14', 'thread': 3,
+     'accounts': [{'username': '13370328920', 'password': '428199Li@', 'nickname': '全能16'}]},
+    {'id': 'xkw15', 'port': 9566, 'user_data': 'data15', 'thread': 3,
+     'accounts': [{'username': '18330529099', 'password': '428199Li@', 'nickname': '全能17'}]},
+    {'id': 'xkw16', 'port': 9577, 'user_data': 'data16', 'thread': 3,
+     'accounts': [{'username': '18730596893', 'password': '428199Li@', 'nickname': '全能18'}]},
+    {'id': 'xkw17', 'port': 9588, 'user_data': 'data17', 'thread': 3,
+     'accounts': [{'username': '17332853851', 'password': '428199Li@', 'nickname': '全能20'}]},
+]
+
 # 初始化日志记录器
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -65,6 +108,10 @@ class XKW:
     download_counts_file = 'download_counts.json'
     download_log_file = 'download_log.csv'
     download_counts_loaded = False  # 标记是否已加载
+    persist_download_counts = True  # 多进程模式下由主进程统一保存计数文件
+    counts_listener = None  # 计数变化回调，签名为 (昵称, 账号计数)
+    login_probe_url = 'https://user.zxxk.com/'  # 登录快速探测使用的用户中心地址
+    login_probe_ttl = 300  # 登录探测结果缓存时间（秒）
 
     def __init__(self, thread=1, work=False, download_dir=None, uploader=None, notifier=None, co=None, manager=None,
                  id=None, accounts=None):
@@ -90,6 +137,9 @@ class XKW:
         self.admin_intervention_required = False  # 是否需要管理员介入
         self.tab_ids = {}  # 新增：保存标签页与ID的映射
         self.tab_id_counter = 0  # 新增：用于给tab分配自增ID
+        self.timer_service = get_timer_service()  # 共享定时调度器
+        self.login_probe_cache = None  # 登录探测缓存：(时间戳, 是否已登录)
+        self.login_probe_lock = threading.Lock()
 
         # 添加账号列表和当前账号索引
         if accounts is not None:
@@ -99,24 +149,7 @@ class XKW:
         self.current_account_index = 0  # 当前账号索引
 
         # 只在第一次初始化时加载下载计数
-        if not XKW.download_counts_loaded:
-            with XKW.download_counts_lock:
-                if not XKW.download_counts_loaded:
-                    if os.path.exists(XKW.download_counts_file):
-                        with open(XKW.download_counts_file, 'r', encoding='utf-8') as f:
-                            try:
-                                XKW.download_counts = json.load(f)
-                                logging.info(f"[{self.id}] 已加载下载计数数据: {XKW.download_counts}")
-                            except json.JSONDecodeError:
-                                logging.error(f"[{self.id}] 下载计数文件 '{XKW.download_counts_file}' 格式错误，初始化为空。")
-                                XKW.download_counts = {}
-                    else:
-                        # 如果文件不存在，创建一个空的下载日志文件
-                        with open(XKW.download_log_file, 'w', encoding='utf-8', newline='') as csvfile:
-                            log_writer = csv.writer(csvfile)
-                            log_writer.writerow(['时间', '账号', '下载次数'])
-                        logging.info(f"[{self.id}] 下载计数文件 '{XKW.download_counts_file}' 不存在，已创建新的下载日志文件。")
-                    XKW.download_counts_loaded = True
+        XKW.load_download_counts()
 
         # 如果存在下载日志文件不存在则创建
         if not os.path.exists(XKW.download_log_file):
@@ -135,6 +168,10 @@ class XKW:
 
         self.handle_login_lock = threading.RLock()
 
+        # 多进程模式下由工作进程设置的回调：状态变化上报和任务完成通知
+        self.state_listener = None
+        self.task_done_callback = None
+
         # 初始化状态保存路径
         self.state_file = os.path.join(STATE_DIR, f"[{self.id}] {self.id}_state.json")
         self.save_state_lock = threading.RLock()
@@ -143,6 +180,32 @@ class XKW:
         self.failure_count = 0
         self.failure_threshold = 3  # 失败阈值
 
+    @classmethod
+    def load_download_counts(cls):
+        """
+        加载下载计数文件，只在第一次调用时执行。
+        """
+        if XKW.download_counts_loaded:
+            return
+        with XKW.download_counts_lock:
+            if XKW.download_counts_loaded:
+                return
+            if os.path.exists(XKW.download_counts_file):
+                with open(XKW.download_counts_file, 'r', encoding='utf-8') as f:
+                    try:
+                        XKW.download_counts = json.load(f)
+                        logging.info(f"已加载下载计数数据: {XKW.download_counts}")
+                    except json.JSONDecodeError:
+                        logging.error(f"下载计数文件 '{XKW.download_counts_file}' 格式错误，初始化为空。")
+                        XKW.download_counts = {}
+            else:
+                # 如果文件不存在，创建一个空的下载日志文件
+                with open(XKW.download_log_file, 'w', encoding='utf-8', newline='') as csvfile:
+                    log_writer = csv.writer(csvfile)
+                    log_writer.writerow(['时间', '账号', '下载次数'])
+                logging.info(f"下载计数文件 '{XKW.download_counts_file}' 不存在，已创建新的下载日志文件。")
+            XKW.download_counts_loaded = True
+
     def save_state(self):
         """
         保存当前实例的状态到 JSON 文件。
@@ -164,6 +227,8 @@ class XKW:
                 logging.error(f"[{self.id}] 保存实例状态时出错: {e}", exc_info=True)
                 if self.notifier:
                     self.notifier.notify(f"[{self.id}] 保存实例状态时出错: {e}", is_error=True)
+            if self.state_listener:
+                self.state_listener(state)
 
     def load_state(self):
         """
@@ -298,15 +363,54 @@ class XKW:
                 self.notifier.notify(f"[{self.id}][{tab_id}] 导航标签页到空白页时出错: {e}",
                                      is_error=True)
 
+    def cancel_reason(self, soft_id) -> Optional[str]:
+        """
+        询问上传器 soft_id 是否仍需下载。
+
+        返回:
+        - 不再需要下载的原因（已取消、文件已发送、请求超过截止时间或请求者积分不足），
+          仍需下载、soft_id 为空或未设置上传器时返回 None。
+        """
+        if not soft_id or not self.uploader:
+            return None
+        try:
+            return self.uploader.cancel_reason(soft_id)
+        except Exception as e:
+            logging.error(f"[{self.id}][soft_id:{soft_id}] 检查下载是否已取消时出错: {e}", exc_info=True)
+            return None
+
+    def drop_if_cancelled(self, target, soft_id, stage, tab_id='-') -> bool:
+        """soft_id 已不再需要下载时记录原因并返回 True，调用方在 stage 阶段放弃该任务，不再占用标签页和账号额度。"""
+        reason = self.cancel_reason(soft_id)
+        if reason is None:
+            return False
+        logging.info(f"[{self.id}][{tab_id}][soft_id:{soft_id}] {reason}，在{stage}阶段放弃下载: {target}")
+        return True
+
+    def abandon_download(self, url, soft_id, detail, tab_id='-'):
+        """
+        下载无法继续且不会再重试时调用：通知上传器关闭 soft_id 的请求，之后同一份资料的新请求会重新下载，
+        而不是一直等待这次已经失败的下载。
+        """
+        soft_id = soft_id or extract_soft_id(url)
+        logging.error(f"[{self.id}][{tab_id}][soft_id:{soft_id}] {detail}，放弃下载: {url}")
+        if not soft_id or not self.uploader:
+            return
+        try:
+            self.uploader.download_failed(soft_id, detail)
+        except Exception as e:
+            logging.error(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 关闭下载失败的请求时出错: {e}", exc_info=True)
+
     def match_downloaded_file(self, title, soft_id, tab_id):
         """
         匹配下载的文件，基于给定的标题在下载目录中寻找匹配的文件。
+        等待期间每隔 cancel_check_interval 秒检查一次 soft_id 是否仍需下载，已取消时提前结束等待。
 
         参数:
         - title: 要匹配的文件标题。
 
         返回:
-        - 匹配到的文件路径，若未找到则返回 None。
+        - 匹配到的文件路径，若未找到或下载已取消则返回 None。
         """
         logging.info(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 开始匹配下载的文件，标题: {title}")
 
@@ -323,7 +427,9 @@ class XKW:
             initial_wait = 60  # 初始等待时间（秒）
             initial_interval = 0.5  # 前60秒的重试间隔（秒）
             subsequent_interval = 5  # 后续的重试间隔（秒）
+            cancel_check_interval = 10  # 检查下载是否已取消的间隔（秒）
             elapsed_time = 0
+            last_cancel_check = 0
 
             # 预期的文件扩展名，可以根据需求调整
             expected_extensions = [
@@ -406,6 +512,12 @@ class XKW:
                 else:
                     retry_interval = subsequent_interval
 
+                # 下载已取消或请求已过期时不再等待文件
+                if elapsed_time - last_cancel_check >= cancel_check_interval:
+                    last_cancel_check = elapsed_time
+                    if self.drop_if_cancelled(title, soft_id, '文件等待', tab_id):
+                        return None
+
                 # 计算剩余时间，避免超过最大等待时间
                 remaining_time = max_wait_time - elapsed_time
                 sleep_time = min(retry_interval, remaining_time)
@@ -503,24 +615,33 @@ class XKW:
                 self.notifier.notify(f"[{self.id}][{tab_id}]提取 ID 和标题时出错: {e}", is_error=True)
             return None, None
 
-    def is_logged_in(self, tab):
+    def is_logged_in(self, tab, use_cache=True):
         """
         检查当前是否已登录，并更新登录状态属性。
+        先通过 Cookie 快速探测，只有探测结果无法判断时才加载页面检查。
         如果未登录，则自动执行登录程序。
         增加标签页 ID 以便追踪。
+
+        参数:
+        - tab: 当前浏览器标签页。
+        - use_cache: 是否使用缓存的探测结果。
         """
         tab_id = self.tab_ids.get(tab, "unknown_tab")  # 获取 tab 对应的 ID
         try:
-            results = []
-            for _ in range(2):
-                result = self._check_login_status(tab)
-                results.append(result)
-                time.sleep(1)  # 可选：增加一点延迟
-            if results[0] == results[1]:
-                logged_in = results[0]
-            else:
-                # 如果前两次结果不一致，进行第三次检查
-                logged_in = self._check_login_status(tab)
+            logged_in = self.probe_login_status(use_cache=use_cache)
+            if logged_in is None:
+                logging.info(f"[{self.id}][{tab_id}] 登录快速探测无法判断，回退到页面检查。")
+                results = []
+                for _ in range(2):
+                    result = self._check_login_status(tab)
+                    results.append(result)
+                    time.sleep(1)  # 可选：增加一点延迟
+                if results[0] == results[1]:
+                    logged_in = results[0]
+                else:
+                    # 如果前两次结果不一致，进行第三次检查
+                    logged_in = self._check_login_status(tab)
+                self.cache_login_status(logged_in)
 
             if not logged_in:
                 logging.info(f"[{self.id}][{tab_id}] 未登录，开始自动登录。")
@@ -538,6 +659,149 @@ class XKW:
             logging.error(f"[{self.id}][{tab_id}] 检查登录状态时出错: {e}", exc_info=True)
             return False
 
+    def probe_login_status(self, use_cache=True) -> Optional[bool]:
+        """
+        通过浏览器 Cookie 快速判断登录状态，不占用标签页，也不加载页面。
+        结果按 login_probe_ttl 缓存。
+
+        参数:
+        - use_cache: 是否使用缓存的探测结果。
+
+        返回:
+        - True / False: 探测结果明确。
+        - None: 无法判断，需要回退到页面检查。
+        """
+        with self.login_probe_lock:
+            if use_cache and self.login_probe_cache and time.time() - self.login_probe_cache[0] < self.login_probe_ttl:
+                return self.login_probe_cache[1]
+        result = self._probe_login_by_cookies()
+        if result is not None:
+            self.cache_login_status(result)
+        return result
+
+    def cache_login_status(self, logged_in: bool):
+        """缓存一次明确的登录检查结果。"""
+        with self.login_probe_lock:
+            self.login_probe_cache = (time.time(), logged_in)
+
+    def invalidate_login_probe(self):
+        """清除登录探测缓存，下次检查时重新探测。"""
+        with self.login_probe_lock:
+            self.login_probe_cache = None
+
+    def _probe_login_by_cookies(self) -> Optional[bool]:
+        """
+        读取浏览器中 zxxk.com 域下未过期的 Cookie，携带这些 Cookie 请求用户中心：
+        被重定向到登录页视为未登录，返回包含退出入口或账号昵称的页面视为已登录。
+
+        返回:
+        - True / False: 探测结果明确。
+        - None: 无法判断。
+        """
+        try:
+            cookies = self.page.cookies(all_domains=True, all_info=True)
+        except Exception as e:
+            logging.warning(f"[{self.id}] 读取浏览器 Cookie 失败，无法快速探测登录状态: {e}")
+            return None
+
+        now = time.time()
+        jar = {}
+        for cookie in cookies:
+            if not cookie.get('domain', '').endswith('zxxk.com'):
+                continue
+            expires = cookie.get('expires') or cookie.get('expiry')
+            if expires and 0 < expires < now:
+                continue  # 已过期的 Cookie 不参与判断
+            jar[cookie['name']] = cookie['value']
+
+        if not jar:
+            logging.info(f"[{self.id}] 浏览器中没有有效的 zxxk.com Cookie，判定为未登录。")
+            return False
+
+        try:
+            response = requests.get(
+                self.login_probe_url,
+                cookies=jar,
+                headers={'User-Agent': self.page.user_agent},
+                timeout=(3, 5),
+                allow_redirects=False
+            )
+        except requests.RequestException as e:
+            logging.warning(f"[{self.id}] 登录探测请求失败: {e}")
+            return None
+
+        location = response.headers.get('Location', '').lower()
+        if response.is_redirect and ('login' in location or 'sso.' in location):
+            logging.debug(f"[{self.id}] 登录探测被重定向到登录页，判定为未登录。")
+            return False
+        if response.status_code == 200:
+            text = response.text
+            nicknames = [account.get('nickname') for account in self.accounts if account.get('nickname')]
+            if '退出' in text or any(nickname in text for nickname in nicknames):
+                logging.debug(f"[{self.id}] 登录探测成功，判定为已登录。")
+                return True
+        logging.debug(f"[{self.id}] 登录探测结果无法判断，状态码: {response.status_code}")
+        return None
+
+    def check_status(self) -> bool:
+        """
+        检查实例的登录状态和下载上限，未登录时尝试重新登录。
+
+        返回:
+        - True: 实例可以继续使用（或无需处理）。
+        - False: 登录失败或达到下载上限，实例应被禁用。
+        """
+        # 先检查是否需要管理员介入
+        if self.admin_intervention_required:
+            logging.info(f"实例 {self.id} 需要管理员介入，跳过进一步检查。")
+            return True
+
+        # 先通过 Cookie 快速探测，确认已登录时不需要占用标签页
+        if self.probe_login_status():
+            self.set_login_status(True)
+        else:
+            try:
+                tab = self.tabs.get_nowait()  # 获取一个可用的标签页
+            except queue.Empty:
+                logging.warning(f"实例 {self.id} 没有可用的标签页进行状态检查。")
+                return True
+
+            # 获取 tab_id
+            tab_id = self.tab_ids.get(tab, "unknown_tab")
+
+            if not self.is_logged_in(tab):
+                logging.warning(f"实例 {self.id} 未登录，尝试重新登录。")
+                if self.login(tab):
+                    logging.info(f"实例 {self.id} 登录成功。")
+                else:
+                    logging.error(f"实例 {self.id} 登录失败，标记需要管理员介入。")
+                    self.set_admin_intervention_required(True)
+                    self.tabs.put(tab)  # 将标签页放回队列
+                    return False
+
+            # 正确调用 reset_tab，传递 tab_id
+            self.reset_tab(tab, tab_id)
+            self.tabs.put(tab)  # 将标签页放回队列
+
+        # 使用配置中的当前账号昵称检查上限，避免打开页面读取昵称
+        nickname = self.current_account_nickname()
+        if nickname and self.is_account_reached_limit(nickname):
+            logging.info(f"实例 {self.id} 达到下载上限，禁用实例。")
+            return False
+        return True
+
+    def backlog(self) -> int:
+        """返回实例中排队和正在执行的下载任务数。"""
+        in_flight = max(0, self.thread - self.tabs.qsize())
+        return self.task.qsize() + in_flight
+
+    def current_account_nickname(self) -> str:
+        """返回当前账号索引对应的配置昵称，不访问页面。"""
+        if not self.accounts:
+            return ""
+        account = self.accounts[self.current_account_index]
+        return account.get('nickname', account.get('username', ''))
+
     def _check_login_status(self, tab):
         """
         实际执行一次登录状态检查。
@@ -617,6 +881,7 @@ class XKW:
                     time.sleep(random.uniform(1, 2))  # 等待登录结果
 
                 # 检查是否登录成功
+                self.invalidate_login_probe()
                 if self.is_logged_in(tab):
                     logging.info(f"[{self.id}][{tab_id}] 账号 {nickname} ({username}) 登录成功。")
                     if self.notifier:
@@ -710,6 +975,9 @@ class XKW:
         """
         监听下载过程，处理下载链接的获取和确认按钮的点击。
         移除了与登录相关的逻辑。
+
+        返回:
+        - True: 下载成功或已切换实例重试；False: 下载失败；None: 等待文件期间下载已取消。
         """
         tab_id = self.tab_ids.get(tab, "unknown_tab")
         logging.info(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 开始下载 {url}")
@@ -729,9 +997,8 @@ class XKW:
                 if self.notifier:
                     self.notifier.notify(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 刷新页面时出错: {e}", is_error=True)
 
-        # 启动一个定时器，在60秒后刷新页面
-        refresh_timer = threading.Timer(61, refresh_page)
-        refresh_timer.start()
+        # 通过共享定时调度器安排在61秒后刷新页面
+        refresh_timer = self.timer_service.call_later(61, refresh_page, name=f"{self.id}-refresh-{soft_id}")
 
         try:
             for item in tab.listen.steps(timeout=60):
@@ -745,6 +1012,9 @@ class XKW:
                     self.tabs.put(tab)
                     # 匹配下载的文件
                     file_path = self.match_downloaded_file(title, soft_id, tab_id)
+                    if not file_path and self.cancel_reason(soft_id) is not None:
+                        # 等待期间下载已取消，不再切换浏览器重试
+                        return None
                     if not file_path:
                         self.switch_browser_and_retry(tab, url, soft_id)
                         logging.error(
@@ -786,7 +1056,7 @@ class XKW:
                 self.tabs.put(tab)
 
                 # 检查账号是否登录
-                if not self.is_logged_in(tab):
+                if not self.is_logged_in(tab, use_cache=False):
                     logging.warning(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 账号未登录，尝试重新登录。")
                     if self.notifier:
                         self.notifier.notify(
@@ -842,8 +1112,8 @@ class XKW:
         try:
             # 获取当前日期和时间
             today = datetime.today()
-            date_str = today.strftime('%Y-%m-%d')
-            week_number = today.strftime('%Y-%W')  # 年份和周数组合，周从星期一开始
+            date_str = day_key(today)
+            week_number = week_key(today)  # 年份和周数组合，周从星期一开始
 
             time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
@@ -894,8 +1164,11 @@ class XKW:
                     account_counts['weekly'] = weekly_count_info
                     XKW.download_counts[current_account_nickname] = account_counts
 
-                    with open(XKW.download_counts_file, 'w', encoding='utf-8') as f:
-                        json.dump(XKW.download_counts, f, ensure_ascii=False, indent=4)
+                    if XKW.persist_download_counts:
+                        with open(XKW.download_counts_file, 'w', encoding='utf-8') as f:
+                            json.dump(XKW.download_counts, f, ensure_ascii=False, indent=4)
+                    if XKW.counts_listener:
+                        XKW.counts_listener(current_account_nickname, account_counts)
 
                     with open(XKW.download_log_file, 'a', encoding='utf-8', newline='') as csvfile:
                         log_writer = csv.writer(csvfile)
@@ -910,8 +1183,8 @@ class XKW:
 
                     # 检查是否达到下载上限
                     if self.is_account_reached_limit(current_account_nickname):
-                        limit_type = "每日" if daily_count_info['count'] >= 51 else "每周"
-                        limit_value = 51 if daily_count_info['count'] >= 51 else 350
+                        limit_type = "每日" if daily_count_info['count'] >= DAILY_LIMIT else "每周"
+                        limit_value = DAILY_LIMIT if daily_count_info['count'] >= DAILY_LIMIT else WEEKLY_LIMIT
 
                         logging.info(f"[{self.id}]账号 {current_account_nickname} {limit_type}下载数量已达{limit_value}，切换账号。")
                         if self.notifier:
@@ -940,8 +1213,8 @@ class XKW:
 
             # 获取当前日期和周数
             today = datetime.today()
-            date_str = today.strftime('%Y-%m-%d')
-            week_number = today.strftime('%W')  # 年份和周数组合，周从星期一开始
+            date_str = day_key(today)
+            week_number = week_key(today)  # 与 account_count 使用相同的周键
 
             with XKW.download_counts_lock:
                 account_counts = XKW.download_counts.get(nickname, {})
@@ -964,8 +1237,8 @@ class XKW:
                 f"[{self.id}]当前账号信息：\n"
                 f"[{self.id}]昵称：{nickname}\n"
                 f"[{self.id}]用户名：{username}\n"
-                f"[{self.id}]今日下载次数：{daily_count}/51\n"
-                f"[{self.id}]本周下载次数：{weekly_count}/350\n"
+                f"[{self.id}]今日下载次数：{daily_count}/{DAILY_LIMIT}\n"
+                f"[{self.id}]本周下载次数：{weekly_count}/{WEEKLY_LIMIT}\n"
             )
             logging.info(f"[{self.id}]获取当前账号使用情况：\n{usage_info}")
             return usage_info
@@ -1073,8 +1346,8 @@ class XKW:
         """
         try:
             today = datetime.today()
-            date_str = today.strftime('%Y-%m-%d')
-            week_number = today.strftime('%Y-%W')  # 年份和周数组合，周从星期一开始
+            date_str = day_key(today)
+            week_number = week_key(today)  # 年份和周数组合，周从星期一开始
 
             with XKW.download_counts_lock:
                 account_counts = XKW.download_counts.get(nickname, {})
@@ -1094,17 +1367,17 @@ class XKW:
                     weekly_count = 0
 
             # 检查是否达到每日或每周上限
-            if daily_count >= 51 or weekly_count >= 350:
-                if daily_count >= 51:
+            if daily_count >= DAILY_LIMIT or weekly_count >= WEEKLY_LIMIT:
+                if daily_count >= DAILY_LIMIT:
                     self.set_daily_limit_reached(True)
-                if weekly_count >= 350:
+                if weekly_count >= WEEKLY_LIMIT:
                     self.set_weekly_limit_reached(True)
                 return True
             else:
                 # 如果未达到上限，确保属性为 False
-                if daily_count < 51:
+                if daily_count < DAILY_LIMIT:
                     self.set_daily_limit_reached(False)
-                if weekly_count < 350:
+                if weekly_count < WEEKLY_LIMIT:
                     self.set_weekly_limit_reached(False)
                 return False
         except Exception as e:
@@ -1116,20 +1389,23 @@ class XKW:
     def switch_browser_and_retry(self, tab, url, soft_id):
         """
         切换到另一个浏览器实例重新尝试下载。
-        如果没有可用的实例，直接将任务添加到 pending_tasks 队列中。
+        如果没有可用的实例，直接将任务添加到 pending_tasks 队列中；soft_id 已不再需要下载时不再重试。
 
         参数:
         - url: 需要重新下载的 URL。
 
         返回:
         - True: 如果成功切换并重新添加任务。
-        - False: 如果没有可用的实例，任务已被添加到 pending_tasks。
+        - False: 如果没有可用的实例，任务已被添加到 pending_tasks；或下载已取消。
         """
         tab_id = self.tab_ids.get(tab, "unknown_tab")
         try:
+            if self.drop_if_cancelled(url, soft_id or extract_soft_id(url), '重试', tab_id):
+                return False
             available_xkw_instances = self.manager.get_available_xkw_instances(self)
-            if available_xkw_instances:
-                xkw_instance = random.choice(available_xkw_instances)
+            # 按剩余额度和积压任务选择实例，所有实例额度都已占满时挂起任务
+            xkw_instance = self.manager.select_instance(available_xkw_instances) if available_xkw_instances else None
+            if xkw_instance:
                 logging.info(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 准备切换浏览器实例进行重试: {url}")
                 if self.notifier:
                     self.notifier.notify(f"[{self.id}]切换到新的 XKW 实例 {xkw_instance.id} 进行下载。")
@@ -1148,11 +1424,13 @@ class XKW:
             logging.error(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 切换浏览器实例时出错: {e}", exc_info=True)
             if self.notifier:
                 self.notifier.notify(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 切换浏览器实例时出错: {e}", is_error=True)
+            self.abandon_download(url, soft_id, '切换浏览器实例时出错', tab_id)
             return False
 
     def download(self, url, tab):
         """
         执行下载任务，不再进行重试。如果无法找到下载按钮，直接切换到其他浏览器实例进行下载。
+        加载页面和点击下载按钮前检查 soft_id 是否仍需下载，已取消的任务直接放弃，标签页交还给其它任务。
 
         参数:
         - url: 要下载的文件的 URL。
@@ -1161,6 +1439,10 @@ class XKW:
         tab_id = self.tab_ids.get(tab, "unknown_tab")
         soft_id = None  # 新增：提前定义soft_id变量，用于在下方步骤中使用
         try:
+            if self.drop_if_cancelled(url, extract_soft_id(url), '页面加载', tab_id):
+                self.tabs.put(tab)
+                return
+
             logging.info(f"[{self.id}][{tab_id}] 准备下载 URL: {url}")
             pre_download_delay = random.uniform(0.5, 1)
             logging.debug(f"[{self.id}][{tab_id}] 下载前随机延迟 {pre_download_delay:.1f} 秒")
@@ -1178,6 +1460,7 @@ class XKW:
             else:
                 # 无法提取soft_id和title，跳过
                 logging.error(f"[{self.id}][{tab_id}] 无法提取 soft_id 或 title，跳过 URL: {url}")
+                self.abandon_download(url, None, '无法提取 soft_id 或 title', tab_id)
                 self.reset_tab(tab, tab_id)
                 return
 
@@ -1197,8 +1480,16 @@ class XKW:
             logging.debug(f"[{self.id}][{tab_id}] 点击下载按钮前随机延迟 {click_delay:.1f} 秒")
             time.sleep(click_delay)
 
+            if self.drop_if_cancelled(url, soft_id, '点击下载', tab_id):
+                self.reset_tab(tab, tab_id)
+                self.tabs.put(tab)
+                return
+
             success = self.listener(tab, download_button, url, title, soft_id)
-            if success:
+            if success is None:
+                reason = self.cancel_reason(soft_id) or '下载已取消'
+                logging.info(f"[{self.id}][{tab_id}][soft_id:{soft_id}] {reason}，在文件等待阶段放弃下载: {url}")
+            elif success:
                 logging.info(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 下载成功: {url}")
             else:
                 logging.error(f"[{self.id}][{tab_id}][soft_id:{soft_id}] 下载失败，准备切换实例下载: {url}")
@@ -1227,11 +1518,16 @@ class XKW:
         with ThreadPoolExecutor(max_workers=self.thread) as executor:
             futures = []
             while self.work:
+                url = None
                 try:
                     url = self.task.get(timeout=5)  # 获取新任务
                     if url is None:
                         logging.info("接收到退出信号，停止下载管理。")
                         break
+                    if self.drop_if_cancelled(url, extract_soft_id(url), '分派'):
+                        if self.task_done_callback:
+                            self.task_done_callback(url)
+                        continue
 
                     # 控制下载启动间隔，确保至少2秒
                     current_time = time.time()
@@ -1249,10 +1545,15 @@ class XKW:
                         logging.error("获取标签页超时，无法执行下载任务。")
                         if self.notifier:
                             self.notifier.notify("获取标签页超时，无法执行下载任务。", is_error=True)
+                        self.abandon_download(url, None, '获取标签页超时')
+                        if self.task_done_callback:
+                            self.task_done_callback(url)
                         continue
 
                     # 提交下载任务到线程池
                     future = executor.submit(self.download, url, tab)
+                    if self.task_done_callback:
+                        future.add_done_callback(lambda _, done_url=url: self.task_done_callback(done_url))
                     futures.append(future)
                     logging.info(f"[{self.id}]已提交下载任务到线程池: {url}")
 
@@ -1266,6 +1567,8 @@ class XKW:
                     logging.error(f"[{self.id}]任务分发时出错: {e}", exc_info=True)
                     if self.notifier:
                         self.notifier.notify(f"[{self.id}]任务分发时出错: {e}", is_error=True)
+                    if url:
+                        self.abandon_download(url, None, '任务分发时出错')
 
             # 等待所有任务完成
             for future in futures:
@@ -1311,18 +1614,45 @@ class XKW:
                 self.notifier.notify(f"[{self.id}]停止过程中出错: {e}", is_error=True)
 
 
+def build_xkw_backend(spec, host):
+    """
+    在工作进程中创建 XKW 实例，供 ProcessBroker 使用。
+    实例的管理接口、上传和通知都通过 host 转发到主进程，下载计数由主进程统一保存。
+
+    参数:
+    - spec: INSTANCE_SPECS 中的实例配置。
+    - host: 工作进程中的 WorkerHost。
+
+    返回:
+    - XKW 实例。
+    """
+    XKW.persist_download_counts = False
+    XKW.counts_listener = host.report_counts
+    os.makedirs(STATE_DIR, exist_ok=True)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    co = ChromiumOptions().set_local_port(spec['port']).set_user_data_path(spec['user_data'])
+    Chromium(co)
+    xkw = XKW(thread=spec['thread'], work=True, download_dir=DOWNLOAD_DIR, uploader=host.uploader,
+              notifier=host.notifier, co=co, manager=host, id=spec['id'], accounts=spec['accounts'])
+    xkw.state_listener = lambda state: host.report_status(xkw.id, state)
+    xkw.task_done_callback = lambda url: host.task_done(xkw.id, url)
+    xkw.save_state()  # 上报初始状态
+    return xkw
+
+
 class AutoDownloadManager:
     """
     自动下载管理器，管理多个 XKW 实例，协调下载任务的分配和实例的状态。
     """
 
-    def __init__(self, uploader=None, notifier_config=None):
+    def __init__(self, uploader=None, notifier_config=None, worker_processes=0):
         """
         初始化 AutoDownloadManager。
 
         参数:
         - uploader: 上传器实例。
         - notifier_config: 通知器的配置。
+        - worker_processes: 托管 XKW 实例的工作进程数，0 表示所有实例运行在当前进程中。
         """
         self.notifier = None
         if notifier_config:
@@ -1336,112 +1666,49 @@ class AutoDownloadManager:
         self.uploader = uploader
         # 创建状态保存目录
         os.makedirs(STATE_DIR, exist_ok=True)
-        # 创建两个 ChromiumOptions，指定不同的端口和用户数据路径
-        co1 = ChromiumOptions().set_local_port(9222).set_user_data_path('data1')
-        co2 = ChromiumOptions().set_local_port(9333).set_user_data_path('data2')
-        co3 = ChromiumOptions().set_local_port(9444).set_user_data_path('data3')
-        co4 = ChromiumOptions().set_local_port(9455).set_user_data_path('data4')
-        co5 = ChromiumOptions().set_local_port(9466).set_user_data_path('data5')
-        co6 = ChromiumOptions().set_local_port(9477).set_user_data_path('data6')
-        co7 = ChromiumOptions().set_local_port(9488).set_user_data_path('data7')
-        co8 = ChromiumOptions().set_local_port(9499).set_user_data_path('data8')
-        co9 = ChromiumOptions().set_local_port(9500).set_user_data_path('data9')
-        co10 = ChromiumOptions().set_local_port(9511).set_user_data_path('data10')
-        co11 = ChromiumOptions().set_local_port(9522).set_user_data_path('data11')
-        co12 = ChromiumOptions().set_local_port(9533).set_user_data_path('data12')
-        co13 = ChromiumOptions().set_local_port(9544).set_user_data_path('data13')
-        co14 = ChromiumOptions().set_local_port(9555).set_user_data_path('data14')
-        co15 = ChromiumOptions().set_local_port(9566).set_user_data_path('data15')
-        co16 = ChromiumOptions().set_local_port(9577).set_user_data_path('data16')
-        co17 = ChromiumOptions().set_local_port(9588).set_user_data_path('data17')
-
-        # 启动两个 Chromium 浏览器实例
-        browser1 = Chromium(co1)
-        browser2 = Chromium(co2)
-        browser3 = Chromium(co3)
-        browser4 = Chromium(co4)
-        browser5 = Chromium(co5)
-        browser6 = Chromium(co6)
-        browser7 = Chromium(co7)
-        browser8 = Chromium(co8)
-        browser9 = Chromium(co9)
-        browser10 = Chromium(co10)
-        browser11 = Chromium(co11)
-        browser12 = Chromium(co12)
-        browser13 = Chromium(co13)
-        browser14 = Chromium(co14)
-        browser15 = Chromium(co15)
-        browser16 = Chromium(co16)
-        browser17 = Chromium(co17)
-
         os.makedirs(DOWNLOAD_DIR, exist_ok=True)
         download_dir = DOWNLOAD_DIR
 
-        # 为每个实例提供不同的账号列表
-        accounts_xkw1 = [{'username': '13143019361', 'password': '428199Li@', 'nickname': '全能01X'},]
-        accounts_xkw2 = [{'username': '19061531853', 'password': '428199Li@', 'nickname': '全能02'},]
-        accounts_xkw3 = [{'username': '19563630322', 'password': '428199Li@', 'nickname': '全能03X'},]
-        accounts_xkw4 = [{'username': '13343297668', 'password': '428199Li@', 'nickname': '全能04X'},]
-        accounts_xkw5 = [{'username': '15324485548', 'password': '428199Li@', 'nickname': '全能05'},]
-        accounts_xkw6 = [{'username': '19536946597', 'password': '428199Li@', 'nickname': '全能06X'},]
-        accounts_xkw7 = [{'username': '13820043716', 'password': '428199Li@', 'nickname': '全能08X'},]
-        accounts_xkw8 = [{'username': '15512733826', 'password': '428199Li@', 'nickname': '全能09X'},]
-        accounts_xkw9 = [{'username': '13920946017', 'password': '428199Li@', 'nickname': '全能11X'},]
-        accounts_xkw10 = [{'username': '19358191853', 'password': '428199Li@', 'nickname': '全能12X'},]
-        accounts_xkw11 = [{'username': '18589186420', 'password': '428199Li@', 'nickname': '全能13x'},]
-        accounts_xkw12 = [{'username': '19316031853', 'password': '428199Li@', 'nickname': '全能14X'},]
-        accounts_xkw13 = [{'username': '19568101843', 'password': '428199Li@', 'nickname': '全能15X'},]
-        accounts_xkw14 = [{'username': '13370328920', 'password': '428199Li@', 'nickname': '全能16'},]
-        accounts_xkw15 = [{'username': '18330529099', 'password': '428199Li@', 'nickname': '全能17'},]
-        accounts_xkw16 = [{'username': '18730596893', 'password': '428199Li@', 'nickname': '全能18'},]
-        accounts_xkw17 = [{'username': '17332853851', 'password': '428199Li@', 'nickname': '全能20'},]
-
-        # 创建两个 XKW 实例，分配唯一 ID，并传入各自的账号列表
-        xkw1 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co1, manager=self, id='xkw1', accounts=accounts_xkw1)
-        xkw2 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co2, manager=self, id='xkw2', accounts=accounts_xkw2)
-        xkw3 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co3, manager=self, id='xkw3', accounts=accounts_xkw3)
-        xkw4 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co4, manager=self, id='xkw4', accounts=accounts_xkw4)
-        xkw5 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co5, manager=self, id='xkw5', accounts=accounts_xkw5)
-        xkw6 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co6, manager=self, id='xkw6', accounts=accounts_xkw6)
-        xkw7 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co7, manager=self, id='xkw7', accounts=accounts_xkw7)
-        xkw8 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co8, manager=self, id='xkw8', accounts=accounts_xkw8)
-        xkw9 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                   co=co9, manager=self, id='xkw9', accounts=accounts_xkw9)
-        xkw10 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co10, manager=self, id='xkw10', accounts=accounts_xkw10)
-        xkw11 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co11, manager=self, id='xkw11', accounts=accounts_xkw11)
-        xkw12 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co12, manager=self, id='xkw12', accounts=accounts_xkw12)
-        xkw13 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co13, manager=self, id='xkw13', accounts=accounts_xkw13)
-        xkw14 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co14, manager=self, id='xkw14', accounts=accounts_xkw14)
-        xkw15 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co15, manager=self, id='xkw15', accounts=accounts_xkw15)
-        xkw16 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co16, manager=self, id='xkw16', accounts=accounts_xkw16)
-        xkw17 = XKW(thread=3, work=True, download_dir=download_dir, uploader=uploader, notifier=self.notifier,
-                     co=co17, manager=self, id='xkw17', accounts=accounts_xkw17)
-
-        self.xkw_instances = [xkw1, xkw2, xkw3, xkw4, xkw5, xkw6, xkw7, xkw8, xkw9, xkw10, xkw11, xkw12, xkw13, xkw14, xkw15, xkw16, xkw17]  # 所有的 XKW 实例
-        self.active_xkw_instances = self.xkw_instances.copy()  # 活跃的 XKW 实例
-        self.next_xkw_index = 0  # 用于轮询选择 XKW 实例
         self.xkw_lock = threading.RLock()
-        self.status_check_thread = threading.Thread(target=self.periodic_status_check, daemon=True)
-        self.schedule_daily_reset()
-        self.status_check_thread.start()
+        self.timer_service = get_timer_service()  # 共享定时调度器
+        self.account_scheduler = AccountScheduler()  # 按剩余额度分配任务
         self.pending_tasks = queue.Queue()  # 用于保存挂起的下载任务
+        self.pending_lock = threading.Lock()  # 同一时间只有一个线程重新分配挂起的任务
+        self.pending_retry_interval = 60  # 定期重新分配挂起任务的间隔（秒）
         self.paused = False  # 标志是否暂停任务分配
+
+        self.broker = None
+        if worker_processes > 0:
+            # 多进程模式：实例运行在工作进程中，主进程只保留代理
+            XKW.load_download_counts()
+            self.broker = ProcessBroker(INSTANCE_SPECS, worker_processes,
+                                        'src.auto_download.auto_download:build_xkw_backend',
+                                        event_handler=self.handle_worker_event, counts=XKW.download_counts)
+            self.xkw_instances = [RemoteXKW(self.broker, spec) for spec in INSTANCE_SPECS]
+            if uploader is not None:
+                # 主进程关闭的 soft_id 广播给工作进程，进程内尚未完成的下载随之放弃
+                uploader.request_contexts.on_close = self.broker.cancel
+        else:
+            self.xkw_instances = []  # 所有的 XKW 实例
+            for spec in INSTANCE_SPECS:
+                # 为每个实例指定不同的端口和用户数据路径，并启动 Chromium 浏览器
+                co = ChromiumOptions().set_local_port(spec['port']).set_user_data_path(spec['user_data'])
+                Chromium(co)
+                xkw = XKW(thread=spec['thread'], work=True, download_dir=download_dir, uploader=uploader,
+                          notifier=self.notifier, co=co, manager=self, id=spec['id'], accounts=spec['accounts'])
+                # 下载任务结束后释放了额度，重新分配挂起的任务
+                xkw.task_done_callback = lambda url: self.request_pending_redistribution()
+                self.xkw_instances.append(xkw)
+        self.xkw_by_id = {xkw.id: xkw for xkw in self.xkw_instances}
+        self.active_xkw_instances = self.xkw_instances.copy()  # 活跃的 XKW 实例
+        self.next_xkw_index = 0  # 用于轮询选择 XKW 实例
+        self.daily_reset_handle = None
+        self.schedule_daily_reset()
         self.load_instances_state()
+        self.status_check_handle = self.periodic_status_check()
+        self.pending_retry_handle = self.timer_service.call_every(
+            self.pending_retry_interval, self.request_pending_redistribution,
+            initial_delay=self.pending_retry_interval, name="pending-tasks-redistribute")
     state_file = 'xkw_states.json'
 
     def save_instances_state(self):
@@ -1553,43 +1820,12 @@ class AutoDownloadManager:
 
     def check_instance_status(self, xkw):
         """
-        检查单个实例的状态。
+        检查单个实例的状态，实例不可用时禁用。
         """
         try:
-            # 先检查是否需要管理员介入
-            if xkw.admin_intervention_required:
-                logging.info(f"实例 {xkw.id} 需要管理员介入，跳过进一步检查。")
-                return
-
-            try:
-                tab = xkw.tabs.get_nowait()  # 获取一个可用的标签页
-            except queue.Empty:
-                logging.warning(f"实例 {xkw.id} 没有可用的标签页进行状态检查。")
-                return
-
-            # 获取 tab_id
-            tab_id = xkw.tab_ids.get(tab, "unknown_tab")
-
-            if not xkw.is_logged_in(tab):
-                logging.warning(f"实例 {xkw.id} 未登录，尝试重新登录。")
-                if xkw.login(tab):
-                    logging.info(f"实例 {xkw.id} 登录成功。")
-                else:
-                    logging.error(f"实例 {xkw.id} 登录失败，标记需要管理员介入。")
-                    xkw.set_admin_intervention_required(True)
-                    self.disable_xkw_instance(xkw)
-                    xkw.tabs.put(tab)  # 将标签页放回队列
-                    return
-
-            nickname = xkw.get_nickname_current_account()
-            if nickname and xkw.is_account_reached_limit(nickname):
-                logging.info(f"实例 {xkw.id} 达到下载上限，禁用实例。")
+            if not xkw.check_status():
                 self.disable_xkw_instance(xkw)
 
-            # 正确调用 reset_tab，传递 tab_id
-            xkw.reset_tab(tab, tab_id)
-            xkw.tabs.put(tab)  # 将标签页放回队列
-
         except Exception as e:
             logging.error(f"检查实例 {xkw.id} 状态时出错: {e}", exc_info=True)
             if self.notifier:
@@ -1600,10 +1836,19 @@ class AutoDownloadManager:
         检查所有活跃实例的状态，首先查看是否需要管理员介入。
         如果不需要，检查登录状态和下载上限。
         """
+        if self.broker:
+            # 多进程模式下由各工作进程检查自己托管的实例，需要禁用的实例以事件形式上报
+            self.broker.check_status()
+            return
+
         with self.xkw_lock:
             instances = self.active_xkw_instances.copy()
 
-        with ThreadPoolExecutor(max_workers=min(10, len(instances))) as executor:
+        if not instances:
+            return
+
+        # 快速探测是 I/O 操作，所有实例并行检查
+        with ThreadPoolExecutor(max_workers=len(instances)) as executor:
             futures = {executor.submit(self.check_instance_status, xkw): xkw for xkw in instances}
             for future in as_completed(futures):
                 xkw = futures[future]
@@ -1616,14 +1861,15 @@ class AutoDownloadManager:
 
     def periodic_status_check(self, interval=21600):
         """
-        定期检查所有实例的状态。
+        通过共享定时调度器定期检查所有实例的状态，启动时立即执行一次。
 
         参数:
         - interval: 检查间隔（秒）。
+
+        返回:
+        - TimerHandle: 周期任务句柄，可用于取消。
         """
-        while True:
-            self.check_instances_status()
-            time.sleep(interval)
+        return self.timer_service.call_every(interval, self.check_instances_status, name="instances-status-check")
 
     def query_all_instances_status(self) -> str:
         """
@@ -1684,19 +1930,78 @@ class AutoDownloadManager:
             logging.error(f"设置实例 '{instance_id}' 的管理员介入状态时出错: {e}", exc_info=True)
             return f"设置实例 '{instance_id}' 的管理员介入状态时出错: {e}"
 
-    def add_task(self, url: str, current_instance=None):
+    def cancel_reason(self, url: str) -> Optional[str]:
+        """返回 URL 对应的 soft_id 不再需要下载的原因，仍需下载或无法判断时返回 None。"""
+        soft_id = extract_soft_id(url)
+        if not soft_id or not self.uploader:
+            return None
+        try:
+            return self.uploader.cancel_reason(soft_id)
+        except Exception as e:
+            logging.error(f"[soft_id:{soft_id}] 检查下载是否已取消时出错: {e}", exc_info=True)
+            return None
+
+    def cancel_downloads(self, soft_id: Optional[str] = None, recipient_name: Optional[str] = None) -> str:
+        """
+        取消下载：按 soft_id 取消全部请求，或取消某个群组或个人的全部请求。
+        排队和进行中的下载在下一个阶段检查时放弃，已下载的文件不再发送给被取消的请求者。
+
+        返回:
+        - 操作结果的字符串描述。
+        """
+        if not self.uploader:
+            return "Uploader 未设置，无法取消下载。"
+        store = self.uploader.request_contexts
+        if soft_id:
+            contexts = store.cancel_soft_id(soft_id)
+            if not contexts:
+                return f"soft_id {soft_id} 没有等待中的请求，已标记为取消，排队中的相同资料将不再下载。"
+            recipients = '、'.join(dict.fromkeys(context.recipient_name for context in contexts))
+            return f"已取消 soft_id {soft_id} 的 {len(contexts)} 个请求（{recipients}）。"
+        contexts = store.cancel_recipient(recipient_name)
+        if not contexts:
+            return f"'{recipient_name}' 没有等待中的下载请求。"
+        soft_ids = set(context.soft_id for context in contexts)
+        stopped = sum(1 for item in soft_ids if store.check(item) is not None)
+        return (f"已取消 '{recipient_name}' 的 {len(contexts)} 个请求，涉及 {len(soft_ids)} 份资料，"
+                f"其中 {stopped} 份没有其他请求者，将停止下载。")
+
+    def add_task(self, url: str, current_instance=None, notify: bool = True) -> bool:
+        """
+        将任务分配给剩余额度最充足的实例，没有可用实例或额度已占满时挂起到 pending_tasks。
+
+        参数:
+        - notify: 任务被挂起时是否通知管理员；重新分配挂起任务时再次挂起不重复通知。
+
+        返回:
+        - False: 任务被挂起；True: 任务已分配、已放弃或分配出错。
+        """
         try:
+            reason = self.cancel_reason(url)
+            if reason is not None:
+                logging.info(f"{reason}，不再分配下载任务: {url}")
+                return True
             logging.info(f"准备添加 URL 到下载任务队列: {url}")
             with self.xkw_lock:
                 available_instances = self.get_available_xkw_instances(current_instance)
                 if not available_instances:
                     self.pending_tasks.put(url)
                     logging.info(f"没有活跃实例，任务已添加到 pending_tasks 队列：{url}")
-                    if self.notifier:
+                    if self.notifier and notify:
                         self.notifier.notify(f"没有活跃实例，任务已添加到 pending_tasks 队列：{url}", is_error=True)
-                    return
+                    return False
+
+                selected_instance = self.select_instance(available_instances)
+                if not selected_instance:
+                    # 剩余额度已被排队任务占满，分配前挂起，避免实例超额后才被禁用
+                    self.pending_tasks.put(url)
+                    logging.info(f"所有实例的剩余额度已被占满，任务已添加到 pending_tasks 队列：{url}")
+                    if self.notifier and notify:
+                        self.notifier.notify(
+                            f"所有实例的剩余额度已被占满，任务已添加到 pending_tasks 队列：{url}\n{self.get_quota_forecast()}",
+                            is_error=True)
+                    return False
 
-                selected_instance = random.choice(available_instances)
                 selected_instance.add_task(url)
                 logging.info(f"已将 URL 添加到 XKW 实例 {selected_instance.id} 的任务队列: {url}")
 
@@ -1704,15 +2009,105 @@ class AutoDownloadManager:
                 delay_seconds = random.uniform(1, 2)
                 logging.debug(f"分配任务后暂停 {delay_seconds:.1f} 秒")
                 time.sleep(delay_seconds)
+            return True
         except Exception as e:
             logging.error(f"添加 URL 时发生错误: {e}", exc_info=True)
             if self.notifier:
                 self.notifier.notify(f"添加 URL 时发生错误: {e}", is_error=True)
+            return True
+
+    def handle_worker_event(self, event):
+        """
+        处理工作进程上报的事件（多进程模式）。
+
+        参数:
+        - event: 事件元组，第一个元素为事件类型。
+        """
+        kind = event[0]
+        if kind == 'status':
+            _, instance_id, state = event
+            xkw = self.xkw_by_id.get(instance_id)
+            if xkw:
+                xkw.update_state(state)
+        elif kind == 'file_ready':
+            _, file_path, soft_id, recipient_type = event
+            if self.uploader:
+                self.uploader.add_upload_task(file_path, soft_id, recipient_type)
+            else:
+                logging.warning(f"[soft_id:{soft_id}] Uploader 未设置，无法传递上传任务。")
+        elif kind == 'notify':
+            _, message, is_error, coalesce = event
+            if self.notifier:
+                self.notifier.notify(message, is_error=is_error, coalesce=coalesce)
+        elif kind == 'disable':
+            xkw = self.xkw_by_id.get(event[1])
+            if xkw:
+                self.disable_xkw_instance(xkw)
+        elif kind == 'retry':
+            # add_task 会在分配后短暂休眠，放到定时调度器中执行，避免阻塞事件处理
+            _, instance_id, url = event
+            self.timer_service.call_later(0, self.add_task, url, self.xkw_by_id.get(instance_id),
+                                          name=f"retry-{instance_id}")
+        elif kind == 'pending':
+            self.enqueue_pending_task(event[1])
+        elif kind == 'download_failed':
+            _, soft_id, detail = event
+            if self.uploader:
+                self.uploader.download_failed(soft_id, detail)
+        elif kind == 'task_done':
+            # 任务结束后释放了额度，重新分配挂起的任务
+            self.request_pending_redistribution()
+        elif kind == 'counts':
+            _, nickname, account_counts = event
+            with XKW.download_counts_lock:
+                XKW.download_counts[nickname] = account_counts
+                with open(XKW.download_counts_file, 'w', encoding='utf-8') as f:
+                    json.dump(XKW.download_counts, f, ensure_ascii=False, indent=4)
+        elif kind == 'ready':
+            _, worker_index, instance_ids = event
+            logging.info(f"工作进程 {worker_index} 已就绪，托管实例: {', '.join(instance_ids)}")
+        elif kind == 'worker_restarted':
+            _, worker_index, exitcode, resent = event
+            logging.error(f"工作进程 {worker_index} 异常退出（退出码 {exitcode}），已重启并重新下发 {resent} 个任务。")
+            if self.notifier:
+                self.notifier.notify(f"工作进程 {worker_index} 异常退出（退出码 {exitcode}），已重启并重新下发 {resent} 个任务。",
+                                     is_error=True)
+
+    def select_instance(self, instances):
+        """
+        使用账号调度器从候选实例中选择剩余额度最充足的实例。
+
+        参数:
+        - instances: 候选实例列表。
+
+        返回:
+        - 选中的 XKW 实例，额度都已占满时返回 None。
+        """
+        # 调用方通常持有 xkw_lock，而 account_count 在持有 download_counts_lock 时会获取 xkw_lock，
+        # 这里只按键读取计数，不加 download_counts_lock 以避免锁顺序反转
+        return self.account_scheduler.select_instance(instances, XKW.download_counts)
+
+    def get_quota_forecast(self) -> str:
+        """
+        预测活跃实例账号池的额度耗尽时间。
+
+        返回:
+        - 预测结果的字符串描述。
+        """
+        with self.xkw_lock:
+            nicknames = [xkw.current_account_nickname() for xkw in self.active_xkw_instances]
+        with XKW.download_counts_lock:
+            forecast = self.account_scheduler.forecast(nicknames, XKW.download_counts)
+        return self.account_scheduler.format_forecast(forecast)
 
     def enqueue_pending_task(self, url: str):
         """
-        将任务添加到 pending_tasks 队列，并暂停任务分配。
+        将任务添加到 pending_tasks 队列，并暂停任务分配。已不再需要下载的任务直接放弃。
         """
+        reason = self.cancel_reason(url)
+        if reason is not None:
+            logging.info(f"{reason}，不再挂起下载任务: {url}")
+            return
         with self.xkw_lock:
             self.pending_tasks.put(url)
             self.paused = True
@@ -1730,21 +2125,52 @@ class AutoDownloadManager:
             if self.notifier:
                 self.notifier.notify("任务分配已暂停，因为所有账号均达到下载次数限制。", is_error=True)
 
-    def redistribute_pending_tasks(self):
+    def request_pending_redistribution(self):
         """
-        重新分配 pending_tasks 队列中的任务到活跃的 XKW 实例中。
+        pending_tasks 非空时在后台线程中重新分配挂起的任务。
+        由定时调度器、任务结束和每日重置调用；分配时每个任务会短暂休眠，因此不在调用方线程中执行。
         """
-        # 先恢复 paused 状态，以便 add_task 能够正常分配任务
-        with self.xkw_lock:
-            self.paused = False
+        if self.pending_tasks.empty() or self.pending_lock.locked():
+            return
+        threading.Thread(target=self.redistribute_pending_tasks, name='PendingTasks', daemon=True).start()
+
+    def redistribute_pending_tasks(self) -> int:
+        """
+        重新分配 pending_tasks 队列中的任务到活跃的 XKW 实例中。
 
-            while not self.pending_tasks.empty():
-                url = self.pending_tasks.get()
-                self.add_task(url)  # 通过 AutoDownloadManager 的 add_task 进行任务分配
+        最多处理开始时队列中的任务数；某个任务再次被挂起说明仍没有可用额度，立即停止，
+        剩余任务等下次触发。不在整个过程中持有 xkw_lock，其它线程可以继续分配新任务。
+        已有线程在重新分配时直接返回。
 
-        logging.info("已重新分配所有 pending_tasks，恢复任务分配。")
-        if self.notifier:
-            self.notifier.notify("已重新分配所有 pending_tasks，恢复任务分配。")
+        返回:
+        - 本次分配或放弃的任务数。
+        """
+        if not self.pending_lock.acquire(blocking=False):
+            return 0
+        handled = 0
+        try:
+            # 先恢复 paused 状态，以便 add_task 能够正常分配任务
+            with self.xkw_lock:
+                self.paused = False
+            for _ in range(self.pending_tasks.qsize()):
+                try:
+                    url = self.pending_tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if not self.add_task(url, notify=False):  # 通过 AutoDownloadManager 的 add_task 进行任务分配
+                    break
+                handled += 1
+        finally:
+            self.pending_lock.release()
+
+        remaining = self.pending_tasks.qsize()
+        if handled:
+            logging.info(f"已重新分配 {handled} 个 pending_tasks，仍挂起 {remaining} 个。")
+            if self.notifier:
+                self.notifier.notify(f"已重新分配 {handled} 个挂起的下载任务，仍挂起 {remaining} 个。")
+        elif remaining:
+            logging.debug(f"仍没有可用额度，{remaining} 个 pending_tasks 继续挂起。")
+        return handled
 
     def restore_instance(self, xkw_instance):
         """
@@ -1785,6 +2211,7 @@ class AutoDownloadManager:
                     usage_infos.append(f"实例 {xkw_instance.id}:\n{usage_info}")
 
             if usage_infos:
+                usage_infos.append(self.get_quota_forecast())
                 full_usage_info = "\n\n".join(usage_infos)
                 logging.info(f"获取当前所有活跃实例的账号使用情况：\n{full_usage_info}")
                 return full_usage_info
@@ -1822,6 +2249,8 @@ class AutoDownloadManager:
             logging.info("每日重置任务完成。")
             if self.notifier:
                 self.notifier.notify("每日下载计数已重置。")
+            # 额度已恢复，重新分配挂起的任务
+            self.request_pending_redistribution()
         except Exception as e:
             logging.error(f"执行每日重置任务时出错: {e}", exc_info=True)
             if self.notifier:
@@ -1834,14 +2263,12 @@ class AutoDownloadManager:
         """
         计算距离下一个午夜的时间，并安排`daily_reset`方法执行。
         """
-        now = datetime.datetime.now()
+        now = datetime.now()
         # 计算下一个午夜的时间
-        next_midnight = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        next_midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
         delay = (next_midnight - now).total_seconds()
         logging.info(f"计划在 {next_midnight} 执行每日重置任务。延迟 {delay} 秒。")
-        timer = threading.Timer(delay, self.daily_reset)
-        timer.daemon = True
-        timer.start()
+        self.daily_reset_handle = self.timer_service.call_later(delay, self.daily_reset, name="daily-reset")
 
     def stop(self):
         """
@@ -1849,8 +2276,15 @@ class AutoDownloadManager:
         """
         try:
             logging.info("停止 AutoDownloadManager 和所有 XKW 实例。")
+            # 取消周期检查和每日重置任务
+            self.status_check_handle.cancel()
+            self.pending_retry_handle.cancel()
+            if self.daily_reset_handle:
+                self.daily_reset_handle.cancel()
             for xkw in self.xkw_instances:
                 xkw.stop()
+            if self.broker:
+                self.broker.stop()
             # 保存所有实例状态
             self.save_instances_state()
         except Exception as e:
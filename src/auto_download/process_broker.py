@@ -0,0 +1,466 @@
+# src/auto_download/process_broker.py
+
+import copy
+import importlib
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from src.auto_download.account_scheduler import DAILY_LIMIT, WEEKLY_LIMIT, AccountScheduler
+from src.itchat_module.routing import extract_soft_id
+from src.scheduler.timer_service import get_timer_service
+
+
+def resolve_factory(path: str) -> Callable:
+    """将 'module:attr' 形式的路径解析为后端工厂函数，便于在 spawn 启动的子进程中重新导入。"""
+    module_name, attr = path.split(':', 1)
+    return getattr(importlib.import_module(module_name), attr)
+
+
+# ---------------------------------------------------------------------------
+# 工作进程侧
+# ---------------------------------------------------------------------------
+
+class UploaderProxy:
+    """
+    工作进程中的上传器代理，把下载完成的文件作为事件交给主进程的 Uploader。
+    主进程关闭 soft_id 时广播取消命令，这里按收到的取消记录回答 cancel_reason。
+    """
+
+    def __init__(self, host):
+        self.host = host
+
+    def add_upload_task(self, file_path: str, soft_id: str, recipient_type: str = 'group'):
+        self.host.emit('file_ready', file_path, soft_id, recipient_type)
+
+    def cancel_reason(self, soft_id: str) -> Optional[str]:
+        return self.host.cancelled.get(soft_id) if soft_id else None
+
+    def download_failed(self, soft_id: str, detail: str = ''):
+        self.host.emit('download_failed', soft_id, detail)
+
+
+class NotifierProxy:
+    """工作进程中的通知器代理，通知统一由主进程的 Notifier 发送。"""
+
+    def __init__(self, host):
+        self.host = host
+
+    def notify(self, message: str, is_error: bool = False, coalesce: Optional[bool] = None) -> bool:
+        self.host.emit('notify', message, is_error, coalesce)
+        return True
+
+
+class RetryTarget:
+    """工作进程中代表“其它实例”的占位对象，切换实例重试的任务交回主进程重新分配。"""
+
+    def __init__(self, host, origin_id: str):
+        self.host = host
+        self.origin_id = origin_id
+        self.id = 'broker'
+
+    def add_task(self, url: str):
+        self.host.emit('retry', self.origin_id, url)
+
+
+class WorkerHost:
+    """
+    工作进程内的实例宿主。
+
+    为进程内的实例提供 AutoDownloadManager 的管理接口（禁用实例、切换实例重试、挂起任务），
+    并把上传、通知、状态和计数变化作为事件发送给主进程。
+
+    参数:
+    - worker_index: 工作进程编号。
+    - specs: 本进程负责的实例配置列表。
+    - task_queue: 主进程发送命令的队列。
+    - event_queue: 发送事件到主进程的队列。
+    - backend_factory: 'module:attr' 形式的后端工厂，签名为 factory(spec, host)。
+    """
+
+    def __init__(self, worker_index: int, specs: List[Dict], task_queue, event_queue, backend_factory: str):
+        self.worker_index = worker_index
+        self.specs = specs
+        self.task_queue = task_queue
+        self.event_queue = event_queue
+        self.backend_factory = backend_factory
+        self.instances = {}
+        self.inflight = defaultdict(deque)  # (实例ID, URL) -> 任务ID 队列
+        self.cancelled: 'OrderedDict[str, str]' = OrderedDict()  # 主进程已关闭的 soft_id -> 原因
+        self.max_cancelled = 5000
+        self.lock = threading.Lock()
+        self.uploader = UploaderProxy(self)
+        self.notifier = NotifierProxy(self)
+
+    def emit(self, *event):
+        """发送事件到主进程。"""
+        self.event_queue.put(event)
+
+    # XKW 使用的管理接口
+    def disable_xkw_instance(self, xkw_instance):
+        xkw_instance.is_active = False
+        self.emit('disable', xkw_instance.id)
+
+    def get_available_xkw_instances(self, current_instance):
+        return [RetryTarget(self, current_instance.id)]
+
+    def select_instance(self, instances):
+        return instances[0] if instances else None
+
+    def enqueue_pending_task(self, url: str):
+        self.emit('pending', url)
+
+    # 后端回调
+    def task_done(self, instance_id: str, url: str):
+        """后端完成一个任务（无论成功与否）时调用。"""
+        with self.lock:
+            task_ids = self.inflight.get((instance_id, url))
+            if not task_ids:
+                return
+            task_id = task_ids.popleft()
+            if not task_ids:
+                del self.inflight[(instance_id, url)]
+        self.emit('task_done', task_id, instance_id)
+
+    def report_status(self, instance_id: str, state: Dict):
+        self.emit('status', instance_id, dict(state))
+
+    def report_counts(self, nickname: str, account_counts: Dict):
+        # 队列在后台线程中序列化，先复制一份避免计数继续变化
+        self.emit('counts', nickname, copy.deepcopy(account_counts))
+
+    def check_status(self):
+        """检查本进程内所有实例的状态，需要禁用的实例通知主进程。"""
+        for instance in list(self.instances.values()):
+            try:
+                if not instance.check_status():
+                    self.disable_xkw_instance(instance)
+            except Exception as e:
+                logging.error(f"检查实例 {instance.id} 状态时出错: {e}", exc_info=True)
+                self.notifier.notify(f"检查实例 {instance.id} 状态时出错: {e}", is_error=True)
+
+    def serve(self):
+        """创建实例并处理主进程发送的命令，直到收到停止命令。"""
+        factory = resolve_factory(self.backend_factory)
+        for spec in self.specs:
+            self.instances[spec['id']] = factory(spec, self)
+        self.emit('ready', self.worker_index, list(self.instances))
+
+        while True:
+            try:
+                message = self.task_queue.get(timeout=5)
+            except queue.Empty:
+                continue
+            kind = message[0]
+            if kind == 'stop':
+                break
+            try:
+                if kind == 'task':
+                    _, task_id, instance_id, url = message
+                    with self.lock:
+                        self.inflight[(instance_id, url)].append(task_id)
+                    # 主进程分派前已确认 soft_id 仍需下载，清除之前收到的取消记录
+                    self.cancelled.pop(extract_soft_id(url), None)
+                    self.instances[instance_id].add_task(url)
+                elif kind == 'cancel':
+                    _, soft_id, reason = message
+                    self.cancelled[soft_id] = reason
+                    while len(self.cancelled) > self.max_cancelled:
+                        self.cancelled.popitem(last=False)
+                elif kind == 'check_status':
+                    threading.Thread(target=self.check_status, daemon=True).start()
+                elif kind == 'call':
+                    _, instance_id, method, args = message
+                    targets = self.instances.values() if instance_id is None else [self.instances[instance_id]]
+                    for instance in targets:
+                        getattr(instance, method)(*args)
+            except Exception as e:
+                logging.error(f"[worker{self.worker_index}] 处理命令 {kind} 时出错: {e}", exc_info=True)
+                self.notifier.notify(f"[worker{self.worker_index}] 处理命令 {kind} 时出错: {e}", is_error=True)
+
+        for instance in self.instances.values():
+            try:
+                instance.stop()
+            except Exception as e:
+                logging.error(f"[worker{self.worker_index}] 停止实例 {instance.id} 时出错: {e}", exc_info=True)
+
+
+def worker_main(worker_index: int, specs: List[Dict], task_queue, event_queue, backend_factory: str):
+    """工作进程入口。"""
+    logging.basicConfig(level=logging.INFO,
+                        format=f'%(asctime)s - [worker{worker_index}] %(levelname)s - %(message)s')
+    host = WorkerHost(worker_index, specs, task_queue, event_queue, backend_factory)
+    try:
+        host.serve()
+    except Exception as e:
+        logging.critical(f"[worker{worker_index}] 工作进程异常退出: {e}", exc_info=True)
+        host.emit('notify', f"[worker{worker_index}] 工作进程异常退出: {e}", True)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# 主进程侧
+# ---------------------------------------------------------------------------
+
+class RemoteXKW:
+    """
+    主进程中运行在工作进程内的 XKW 实例的代理。
+
+    镜像工作进程上报的实例状态，提供 AutoDownloadManager 使用的属性和方法，
+    修改状态的操作转发给实例所在的工作进程。
+    """
+
+    def __init__(self, broker, spec: Dict):
+        self.broker = broker
+        self.id = spec['id']
+        self.accounts = spec.get('accounts', [])
+        self.thread = spec.get('thread', 3)
+        self._is_active = True
+        self.login_status = False
+        self.daily_limit_reached = False
+        self.weekly_limit_reached = False
+        self.admin_intervention_required = False
+        self.current_account_index = 0
+
+    def __repr__(self):
+        return f"RemoteXKW(id={self.id})"
+
+    @property
+    def is_active(self) -> bool:
+        return self._is_active
+
+    @is_active.setter
+    def is_active(self, value: bool):
+        self._is_active = value
+        self.broker.call(self.id, 'set_instance_status', 'active' if value else 'inactive')
+
+    @property
+    def instance_status(self) -> str:
+        return 'active' if self._is_active else 'inactive'
+
+    def update_state(self, state: Dict):
+        """用工作进程上报的状态更新镜像。"""
+        self._is_active = state.get('instance_status', self.instance_status) == 'active'
+        self.login_status = state.get('login_status', self.login_status)
+        self.daily_limit_reached = state.get('daily_limit_reached', self.daily_limit_reached)
+        self.weekly_limit_reached = state.get('weekly_limit_reached', self.weekly_limit_reached)
+        self.admin_intervention_required = state.get('admin_intervention_required', self.admin_intervention_required)
+        self.current_account_index = state.get('current_account_index', self.current_account_index)
+
+    def set_instance_status(self, status: str):
+        self._is_active = status == 'active'
+        self.broker.call(self.id, 'set_instance_status', status)
+
+    def set_login_status(self, status: bool):
+        self.login_status = status
+        self.broker.call(self.id, 'set_login_status', status)
+
+    def set_daily_limit_reached(self, reached: bool):
+        self.daily_limit_reached = reached
+        self.broker.call(self.id, 'set_daily_limit_reached', reached)
+
+    def set_weekly_limit_reached(self, reached: bool):
+        self.weekly_limit_reached = reached
+        self.broker.call(self.id, 'set_weekly_limit_reached', reached)
+
+    def set_admin_intervention_required(self, required: bool):
+        self.admin_intervention_required = required
+        self.broker.call(self.id, 'set_admin_intervention_required', required)
+
+    def add_task(self, url: str):
+        self.broker.dispatch(self.id, url)
+
+    def backlog(self) -> int:
+        return self.broker.inflight_count(self.id)
+
+    def current_account_nickname(self) -> str:
+        if not self.accounts:
+            return ""
+        account = self.accounts[self.current_account_index]
+        return account.get('nickname', account.get('username', ''))
+
+    def get_current_account_usage(self) -> str:
+        nickname = self.current_account_nickname()
+        daily_count, weekly_count = AccountScheduler().usage(self.broker.counts, nickname, datetime.now())
+        return (
+            f"[{self.id}]当前账号信息：\n"
+            f"[{self.id}]昵称：{nickname}\n"
+            f"[{self.id}]今日下载次数：{daily_count}/{DAILY_LIMIT}\n"
+            f"[{self.id}]本周下载次数：{weekly_count}/{WEEKLY_LIMIT}\n"
+        )
+
+    def start(self):
+        self.broker.call(self.id, 'start')
+
+    def save_state(self):
+        # 状态文件由工作进程中的实例维护
+        pass
+
+    def stop(self):
+        # 工作进程由 ProcessBroker.stop 统一停止
+        pass
+
+
+class ProcessBroker:
+    """
+    在多个工作进程中托管 XKW 实例的任务代理。
+
+    实例按配置轮流分配到 num_workers 个进程，主进程通过每个进程的命令队列下发任务和操作，
+    工作进程通过共享的事件队列上报状态、账号计数、下载完成的文件和任务完成事件。
+    工作进程意外退出时自动重启，并重新下发尚未完成的任务。
+
+    参数:
+    - specs: 实例配置列表，每项至少包含 id。
+    - num_workers: 工作进程数。
+    - backend_factory: 'module:attr' 形式的后端工厂路径。
+    - event_handler: 主进程中处理事件的回调，参数为事件元组。
+    - counts: 主进程中的账号下载计数字典，供代理查询使用情况。
+    - restart_delay: 两次重启同一工作进程之间的最小间隔（秒）。
+    """
+
+    def __init__(self, specs: List[Dict], num_workers: int, backend_factory: str,
+                 event_handler: Optional[Callable] = None, counts: Optional[Dict] = None, restart_delay: float = 5):
+        self.ctx = multiprocessing.get_context('spawn')
+        num_workers = max(1, min(num_workers, len(specs)))
+        self.shards = [specs[index::num_workers] for index in range(num_workers)]
+        self.backend_factory = backend_factory
+        self.event_handler = event_handler
+        self.counts = counts if counts is not None else {}
+        self.restart_delay = restart_delay
+        self.event_queue = self.ctx.Queue()
+        self.workers = [None] * num_workers
+        self.instance_worker = {}
+        for index, shard in enumerate(self.shards):
+            for spec in shard:
+                self.instance_worker[spec['id']] = index
+        self.inflight = {}  # 任务ID -> (实例ID, URL, 下发时间)
+        self.inflight_per_instance = Counter()
+        self.restart_counts = Counter()
+        self.lock = threading.RLock()
+        self.task_ids = itertools.count(1)
+        self.stopping = False
+
+        for index in range(num_workers):
+            self._start_worker(index)
+
+        self.event_thread = threading.Thread(target=self._drain_events, name='ProcessBrokerEvents', daemon=True)
+        self.event_thread.start()
+        self.monitor_handle = get_timer_service().call_every(1, self._check_workers, initial_delay=1,
+                                                             name='process-broker-monitor')
+        logging.info(f"ProcessBroker 已启动 {num_workers} 个工作进程，托管 {len(self.instance_worker)} 个实例。")
+
+    def _start_worker(self, index: int):
+        task_queue = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=worker_main,
+            args=(index, self.shards[index], task_queue, self.event_queue, self.backend_factory),
+            name=f"xkw-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.workers[index] = {'process': process, 'task_queue': task_queue, 'started_at': time.time()}
+        logging.info(f"工作进程 {index} 已启动，PID: {process.pid}，实例: {[spec['id'] for spec in self.shards[index]]}")
+
+    def dispatch(self, instance_id: str, url: str) -> int:
+        """
+        把下载任务发送到实例所在的工作进程。
+
+        返回:
+        - 任务ID。
+        """
+        with self.lock:
+            task_id = next(self.task_ids)
+            self.inflight[task_id] = (instance_id, url, time.time())
+            self.inflight_per_instance[instance_id] += 1
+            worker = self.workers[self.instance_worker[instance_id]]
+        worker['task_queue'].put(('task', task_id, instance_id, url))
+        return task_id
+
+    def call(self, instance_id: Optional[str], method: str, *args):
+        """调用工作进程中实例的方法；instance_id 为 None 时广播到所有实例。"""
+        with self.lock:
+            if instance_id is None:
+                workers = list(self.workers)
+            else:
+                workers = [self.workers[self.instance_worker[instance_id]]]
+        for worker in workers:
+            worker['task_queue'].put(('call', instance_id, method, args))
+
+    def cancel(self, soft_id: str, reason: str):
+        """通知所有工作进程 soft_id 已不再需要下载，进程内尚未完成的下载在下一个阶段放弃。"""
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            worker['task_queue'].put(('cancel', soft_id, reason))
+
+    def check_status(self):
+        """让所有工作进程检查各自实例的状态。"""
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            worker['task_queue'].put(('check_status',))
+
+    def inflight_count(self, instance_id: str) -> int:
+        with self.lock:
+            return self.inflight_per_instance[instance_id]
+
+    def _drain_events(self):
+        while not self.stopping:
+            try:
+                event = self.event_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if event[0] == 'task_done':
+                with self.lock:
+                    task = self.inflight.pop(event[1], None)
+                    if task:
+                        self.inflight_per_instance[task[0]] -= 1
+            if self.event_handler:
+                try:
+                    self.event_handler(event)
+                except Exception as e:
+                    logging.error(f"处理工作进程事件 {event[0]} 时出错: {e}", exc_info=True)
+
+    def _check_workers(self):
+        if self.stopping:
+            return
+        for index, worker in enumerate(self.workers):
+            process = worker['process']
+            if process.is_alive():
+                continue
+            if time.time() - worker['started_at'] < self.restart_delay:
+                continue
+            self.restart_counts[index] += 1
+            logging.error(f"工作进程 {index} 已退出（退出码 {process.exitcode}），第 {self.restart_counts[index]} 次重启。")
+            self._start_worker(index)
+            # 重新下发该进程中尚未完成的任务
+            shard_ids = {spec['id'] for spec in self.shards[index]}
+            with self.lock:
+                pending = [(task_id, instance_id, url) for task_id, (instance_id, url, _) in self.inflight.items()
+                           if instance_id in shard_ids]
+            for task_id, instance_id, url in pending:
+                self.workers[index]['task_queue'].put(('task', task_id, instance_id, url))
+            if self.event_handler:
+                self.event_handler(('worker_restarted', index, process.exitcode, len(pending)))
+
+    def stop(self, timeout: float = 30):
+        """停止所有工作进程。"""
+        self.stopping = True
+        self.monitor_handle.cancel()
+        for worker in self.workers:
+            worker['task_queue'].put(('stop',))
+        for index, worker in enumerate(self.workers):
+            process = worker['process']
+            process.join(timeout)
+            if process.is_alive():
+                logging.warning(f"工作进程 {index} 未能按时退出，强制终止。")
+                process.terminate()
+        logging.info("ProcessBroker 已停止所有工作进程。")
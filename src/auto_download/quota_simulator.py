@@ -0,0 +1,187 @@
+# src/auto_download/quota_simulator.py
+"""
+账号额度调度模拟器。
+
+回放 download_log.csv 中一周的历史下载记录，把每条记录视为一次下载需求，
+分别按历史实际使用的账号和 AccountScheduler 的分配结果重新计数，对比两者每天的额度消耗、
+达到每日上限的次数、每周额度耗尽时间以及因额度不足而挂起的需求数。
+
+用法:
+    python -m src.auto_download.quota_simulator download_log.csv [--week 2024-50] [--strict]
+"""
+
+import argparse
+import csv
+import re
+import statistics
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from src.auto_download.account_scheduler import AccountScheduler, DAILY_LIMIT, WEEKLY_LIMIT, day_key, week_key
+
+INSTANCE_ID_PATTERN = re.compile(r'^\[([^\]]+)\]')
+WEEKDAY_NAMES = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+
+class SimulatedInstance:
+    """模拟的 XKW 实例，只提供调度器需要的接口。"""
+
+    def __init__(self, id: str, nickname: str):
+        self.id = id
+        self.nickname = nickname
+
+    def current_account_nickname(self) -> str:
+        return self.nickname
+
+    def backlog(self) -> int:
+        # 历史记录是已完成的下载，回放时视为逐条到达并立即完成
+        return 0
+
+
+def load_download_log(path: str) -> List[Tuple[datetime, str, Optional[str]]]:
+    """
+    读取下载日志。
+
+    返回:
+    - 按时间排序的 (时间, 账号昵称, 实例ID) 列表，未知账号的记录被跳过。
+    """
+    events = []
+    with open(path, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        for row in reader:
+            if len(row) < 3 or row[0] == '时间' or row[2] == '未知账号':
+                continue
+            try:
+                timestamp = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                continue
+            match = INSTANCE_ID_PATTERN.match(row[2])
+            events.append((timestamp, row[1], match.group(1) if match else None))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def select_week(events: List, week: Optional[str] = None) -> List:
+    """选出指定周（'%Y-%W'）的记录，默认为日志中最后一周。"""
+    if not events:
+        return []
+    week = week or week_key(events[-1][0])
+    return [event for event in events if week_key(event[0]) == week]
+
+
+def replay(events: List, instances: List[SimulatedInstance], scheduler: Optional[AccountScheduler] = None,
+           daily_limit: int = DAILY_LIMIT, weekly_limit: int = WEEKLY_LIMIT) -> Dict:
+    """
+    回放一周的下载需求。
+
+    参数:
+    - events: select_week 返回的记录。
+    - instances: 参与调度的模拟实例。
+    - scheduler: 为 None 时使用历史记录中的账号，否则由调度器分配账号。
+
+    返回:
+    - 统计结果字典。
+    """
+    counts = {}
+    per_day = Counter()  # 星期 -> 下载数
+    per_account_day = defaultdict(Counter)  # 昵称 -> 日期 -> 下载数
+    daily_limit_hits = 0
+    weekly_exhausted_at = {}
+    deferred = 0
+    served = 0
+
+    for timestamp, nickname, _ in events:
+        if scheduler:
+            instance = scheduler.select_instance(instances, counts, now=timestamp)
+            if instance is None:
+                deferred += 1
+                continue
+            nickname = instance.nickname
+
+        date_str = day_key(timestamp)
+        week_number = week_key(timestamp)
+        account_counts = counts.setdefault(nickname, {})
+        daily_info = account_counts.get('daily', {})
+        weekly_info = account_counts.get('weekly', {})
+        if daily_info.get('date') != date_str:
+            daily_info = {'date': date_str, 'count': 0}
+        if weekly_info.get('week') != week_number:
+            weekly_info = {'week': week_number, 'count': 0}
+        if daily_info['count'] >= daily_limit or weekly_info['count'] >= weekly_limit:
+            # 历史账号已超额，实际系统中该实例会被禁用
+            deferred += 1
+            continue
+
+        daily_info['count'] += 1
+        weekly_info['count'] += 1
+        account_counts['daily'] = daily_info
+        account_counts['weekly'] = weekly_info
+        served += 1
+        per_day[timestamp.weekday()] += 1
+        per_account_day[nickname][date_str] += 1
+        if daily_info['count'] == daily_limit:
+            daily_limit_hits += 1
+        if weekly_info['count'] == weekly_limit:
+            weekly_exhausted_at[nickname] = timestamp
+
+    daily_totals = [per_day.get(day, 0) for day in range(7)]
+    return {
+        'served': served,
+        'deferred': deferred,
+        'per_day': daily_totals,
+        'daily_stdev': statistics.pstdev(daily_totals),
+        'daily_limit_hits': daily_limit_hits,
+        'weekly_exhausted_at': weekly_exhausted_at,
+        'accounts_used': len(per_account_day),
+    }
+
+
+def format_report(results: Dict[str, Dict]) -> str:
+    """将多种策略的回放结果格式化为对比表。"""
+    header = f"{'策略':<10}{'完成':>6}{'挂起':>6}{'日上限':>8}{'周耗尽':>8}{'日标准差':>10}  " + \
+             "".join(f"{name:>6}" for name in WEEKDAY_NAMES)
+    lines = [header]
+    for name, result in results.items():
+        lines.append(
+            f"{name:<10}{result['served']:>6}{result['deferred']:>6}{result['daily_limit_hits']:>8}"
+            f"{len(result['weekly_exhausted_at']):>8}{result['daily_stdev']:>10.1f}  " +
+            "".join(f"{count:>6}" for count in result['per_day'])
+        )
+        for nickname, timestamp in sorted(result['weekly_exhausted_at'].items(), key=lambda item: item[1]):
+            lines.append(f"    {nickname} 于 {timestamp.strftime('%Y-%m-%d %H:%M')}（{WEEKDAY_NAMES[timestamp.weekday()]}）耗尽本周额度")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='回放 download_log.csv，对比历史账号分配与额度调度器。')
+    parser.add_argument('log_file', nargs='?', default='download_log.csv', help='下载日志路径')
+    parser.add_argument('--week', help="回放的周，格式为 '%%Y-%%W'，默认为日志中最后一周")
+    parser.add_argument('--daily-limit', type=int, default=DAILY_LIMIT)
+    parser.add_argument('--weekly-limit', type=int, default=WEEKLY_LIMIT)
+    parser.add_argument('--strict', action='store_true', help='严格按均衡配额分配，超出部分挂起')
+    args = parser.parse_args(argv)
+
+    events = select_week(load_download_log(args.log_file), args.week)
+    if not events:
+        print("日志中没有可回放的记录。")
+        return
+
+    # 历史中出现过的账号组成模拟的实例池
+    instances = {}
+    for _, nickname, instance_id in events:
+        instances.setdefault(nickname, SimulatedInstance(instance_id or nickname, nickname))
+    instances = list(instances.values())
+
+    scheduler = AccountScheduler(daily_limit=args.daily_limit, weekly_limit=args.weekly_limit,
+                                 strict_pacing=args.strict)
+    results = {
+        '历史分配': replay(events, instances, None, args.daily_limit, args.weekly_limit),
+        '额度调度': replay(events, instances, scheduler, args.daily_limit, args.weekly_limit),
+    }
+    print(f"回放周: {week_key(events[0][0])}，记录数: {len(events)}，账号数: {len(instances)}")
+    print(format_report(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -41,7 +41,7 @@ class ErrorHandler:
             if self.notify_on_exception:
                 # 发送简短的错误通知
                 notification_message = f"异常发生: {exception_type}: {exception_message}"
-                success = self.notifier.notify(notification_message)
+                success = self.notifier.notify(notification_message, is_error=True)
                 if not success:
                     logging.warning("发送异常通知失败。")
 
@@ -53,7 +53,7 @@ class ErrorHandler:
             if self.log_callback:
                 self.log_callback("发生未知错误。")
             if self.notify_on_exception:
-                success = self.notifier.notify("发生未知错误。")
+                success = self.notifier.notify("发生未知错误。", is_error=True)
                 if not success:
                     logging.warning("发送未知错误通知失败。")
 
@@ -73,7 +73,8 @@ class ErrorHandler:
                 max_length = 2000  # 根据 Notifier 的限制调整
                 for i in range(0, len(detailed_message), max_length):
                     segment = detailed_message[i:i + max_length]
-                    success = self.notifier.notify(segment)
+                    # 各段不参与去重和汇总，否则首行相同的后续段会被并入汇总而丢失
+                    success = self.notifier.notify(segment, is_error=True, coalesce=False)
                     if not success:
                         logging.warning("发送详细异常信息的通知失败。")
             except Exception as e:
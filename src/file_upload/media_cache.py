@@ -0,0 +1,173 @@
+# src/file_upload/media_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from src.scheduler.timer_service import get_timer_service
+
+
+def file_content_key(file_path: str) -> str:
+    """按块计算文件内容的 MD5，与文件大小组合为缓存键，不把整个文件读入内存。"""
+    md5 = hashlib.md5()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1048576), b''):
+            md5.update(block)
+            size += len(block)
+    return f"{md5.hexdigest()}:{size}"
+
+
+class MediaCache:
+    """
+    文件内容到已上传 MediaId 的缓存。
+
+    同一份资料被多个群组请求时，只有第一次需要上传，之后按 MediaId 直接发送。
+    条目在 ttl 秒后过期（服务器端的 MediaId 不会永久有效），超过 capacity 时淘汰最久未使用的条目；
+    缓存保存在 JSON 文件中，重启后继续使用；条目变化后延迟 save_delay 秒合并写入一次，停止时调用 flush 写入剩余的变化。
+
+    参数:
+    - cache_path: 持久化文件路径，为 None 时只保存在内存中。
+    - capacity: 最多保存的条目数。
+    - ttl: 条目的有效期（秒）。
+    - save_delay: 条目变化后延迟写入的秒数，为 0 时立即写入。
+    """
+
+    def __init__(self, cache_path: Optional[str] = 'media_cache.json', capacity: int = 500, ttl: float = 24 * 3600,
+                 save_delay: float = 5.0):
+        self.cache_path = cache_path
+        self.capacity = max(1, capacity)
+        self.ttl = ttl
+        self.entries: 'OrderedDict[str, Dict]' = OrderedDict()  # 内容键 -> {'media_id', 'expires_at'}，按使用顺序排列
+        self.path_keys: Dict[str, Tuple[float, int, str]] = {}  # 文件路径 -> (修改时间, 大小, 内容键)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # 同一时间只有一个线程写入持久化文件
+        self.save_delay = save_delay
+        self.save_handle = None  # 已安排的延迟写入
+        self.dirty = False  # 条目有尚未写入的变化
+        self.load()
+
+    def load(self):
+        """从持久化文件加载未过期的条目。"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"MediaId 缓存文件 '{self.cache_path}' 读取失败，使用空缓存：{e}")
+            return
+        now = time.time()
+        with self.lock:
+            for key, entry in data.get('entries', []):
+                if entry.get('expires_at', 0) > now:
+                    self.entries[key] = entry
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        logging.info(f"已加载 {len(self.entries)} 个 MediaId 缓存条目")
+
+    def save(self):
+        """
+        把缓存写入同目录下唯一的临时文件后替换持久化文件，避免写入中断时损坏。
+        写入在 save_lock 下进行，并发保存不会互相覆盖临时文件，后一次保存总是写入最新的条目。
+        """
+        if not self.cache_path:
+            return
+        with self.save_lock:
+            with self.lock:
+                self.dirty = False
+                self.save_handle = None
+                data = {'entries': list(self.entries.items())}
+            temp_path = None
+            try:
+                with tempfile.NamedTemporaryFile('w', encoding='utf-8', delete=False,
+                                                 dir=os.path.dirname(os.path.abspath(self.cache_path)),
+                                                 prefix=os.path.basename(self.cache_path), suffix='.tmp') as f:
+                    temp_path = f.name
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(temp_path, self.cache_path)
+            except OSError as e:
+                logging.error(f"保存 MediaId 缓存时出错：{e}", exc_info=True)
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def schedule_save(self):
+        """条目已变化，save_delay 秒后写入；已安排写入时合并到那一次。"""
+        if not self.cache_path:
+            return
+        if self.save_delay <= 0:
+            self.save()
+            return
+        with self.lock:
+            self.dirty = True
+            if self.save_handle is not None:
+                return
+            self.save_handle = get_timer_service().call_later(self.save_delay, self.save, name="media-cache-save")
+
+    def flush(self):
+        """立即写入尚未保存的变化，并取消已安排的延迟写入。"""
+        with self.lock:
+            handle, self.save_handle = self.save_handle, None
+            dirty = self.dirty
+        if handle is not None:
+            handle.cancel()
+        if dirty:
+            self.save()
+
+    def key_for(self, file_path: str) -> str:
+        """返回文件的内容键，文件未修改时复用上次计算的结果。"""
+        stat = os.stat(file_path)
+        with self.lock:
+            cached = self.path_keys.get(file_path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        key = file_content_key(file_path)
+        with self.lock:
+            self.path_keys[file_path] = (stat.st_mtime, stat.st_size, key)
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        """返回内容键对应的 MediaId，不存在或已过期时返回 None。"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry['expires_at'] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry['media_id']
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, media_id: str):
+        """保存新上传的 MediaId，超出容量时淘汰最久未使用的条目。"""
+        with self.lock:
+            self.entries[key] = {'media_id': media_id, 'expires_at': time.time() + self.ttl}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        self.schedule_save()
+
+    def invalidate(self, key: str):
+        """服务器不再接受 MediaId 时删除条目。"""
+        with self.lock:
+            removed = self.entries.pop(key, None)
+        if removed:
+            self.schedule_save()
+
+    def forget_path(self, file_path: str):
+        """文件已删除，丢弃路径到内容键的记录，缓存条目保留给内容相同的其它文件。"""
+        with self.lock:
+            self.path_keys.pop(file_path, None)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
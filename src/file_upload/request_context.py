@@ -0,0 +1,242 @@
+# src/file_upload/request_context.py
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# soft_id 不再需要下载的原因
+REASON_DELIVERED = '文件已发送'
+REASON_EXPIRED = '请求已超过截止时间'
+REASON_NO_POINTS = '请求者积分不足'
+REASON_EXPIRED_OR_NO_POINTS = '请求已超过截止时间或请求者积分不足'
+REASON_ADMIN_CANCELLED = '管理员已取消'
+REASON_DOWNLOAD_FAILED = '下载失败'
+
+
+class RequestContext:
+    """一次资料请求的上下文：谁在哪个群组或私聊中请求了哪个 soft_id，以及请求的截止时间。"""
+
+    __slots__ = ('request_id', 'soft_id', 'recipient_name', 'recipient_type', 'sender_nickname', 'group_type',
+                 'created_at', 'deadline')
+
+    def __init__(self, request_id: str, soft_id: str, recipient_name: str, recipient_type: str,
+                 sender_nickname: Optional[str], group_type: Optional[str], created_at: float, deadline: float):
+        self.request_id = request_id
+        self.soft_id = soft_id
+        self.recipient_name = recipient_name
+        self.recipient_type = recipient_type
+        self.sender_nickname = sender_nickname
+        self.group_type = group_type
+        self.created_at = created_at
+        self.deadline = deadline
+
+
+class RequestContextStore:
+    """
+    按请求 ID 保存等待下载完成的请求上下文。
+
+    同一个 soft_id 可以有多个请求（不同群组或个人），下载完成时一次取出全部请求，文件发给每个请求者。
+    上下文在取出后即删除；下载一直没有完成的请求在 ttl 秒后过期，条目数超过 max_entries 时淘汰最早的请求，
+    因此长时间运行时内存占用保持稳定。
+
+    每个请求带有截止时间（创建后 deadline 秒）。下载流水线的各个阶段通过 check 询问 soft_id 是否仍需下载：
+    请求全部超过截止时间、请求者积分不足、被管理员取消、下载失败或文件已发送时，soft_id 被关闭，
+    check 返回关闭原因，各阶段据此放弃尚未完成的下载。关闭记录最多保留 max_closed 个，
+    同一个 soft_id 有新请求时重新打开。已超过截止时间的请求不再代表进行中的下载，
+    add 时先删除这些请求，新请求会重新触发下载。
+
+    参数:
+    - ttl: 请求的保存期限（秒）。
+    - max_entries: 最多保存的请求数。
+    - deadline: 请求的截止时间（创建后的秒数），为 None 或超过 ttl 时等于 ttl。
+    - max_closed: 最多保留的已关闭 soft_id 数。
+    - on_close: soft_id 被关闭时以 (soft_id, 原因) 调用的回调。
+    - clock: 计算创建时间和截止时间的时钟。
+    """
+
+    def __init__(self, ttl: float = 24 * 3600, max_entries: int = 5000, deadline: Optional[float] = None,
+                 max_closed: int = 5000, on_close: Optional[Callable[[str, str], None]] = None,
+                 clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.max_entries = max(1, max_entries)
+        self.deadline = ttl
+        self.set_deadline(deadline)
+        self.max_closed = max(1, max_closed)
+        self.on_close = on_close
+        self.contexts: 'OrderedDict[str, RequestContext]' = OrderedDict()  # 请求 ID -> 上下文，按创建时间排列
+        self.by_soft_id: Dict[str, 'OrderedDict[str, None]'] = {}  # soft_id -> 请求 ID 集合（保持请求顺序）
+        self.closed: 'OrderedDict[str, str]' = OrderedDict()  # 已关闭的 soft_id -> 关闭原因
+        self.counter = itertools.count(1)
+        self.expired = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+
+    def set_deadline(self, deadline: Optional[float]):
+        """设置之后创建的请求的截止时间（秒），已有请求的截止时间不变。"""
+        self.deadline = self.ttl if deadline is None else min(max(0, deadline), self.ttl)
+
+    def add(self, soft_id: str, recipient_name: str, recipient_type: str = 'group',
+            sender_nickname: Optional[str] = None, group_type: Optional[str] = None) -> Tuple[RequestContext, bool]:
+        """
+        保存一个新请求，soft_id 之前已关闭时重新打开。
+        先删除该 soft_id 已超过截止时间的请求：原来的下载可能已经失败或丢失，不能让新请求一直等待。
+
+        返回:
+        - (请求上下文, 是否为该 soft_id 当前唯一的请求)，后者为 False 时已有请求在等待同一个文件，无需再次下载。
+        """
+        now = self.clock()
+        with self.lock:
+            self._evict(now)
+            for request_id in list(self.by_soft_id.get(soft_id, ())):
+                context = self.contexts[request_id]
+                if now >= context.deadline:
+                    self._remove(request_id)
+                    self.expired += 1
+                    logging.warning(f"请求 {request_id} 已超过截止时间，soft_id {soft_id} 的新请求将重新下载，"
+                                    f"接收者：{context.recipient_name}")
+            request_id = f"{soft_id}-{next(self.counter)}"
+            context = RequestContext(request_id, soft_id, recipient_name, recipient_type, sender_nickname,
+                                     group_type, now, now + self.deadline)
+            self.contexts[request_id] = context
+            requests = self.by_soft_id.setdefault(soft_id, OrderedDict())
+            requests[request_id] = None
+            self.closed.pop(soft_id, None)
+            return context, len(requests) == 1
+
+    def pop_for_soft_id(self, soft_id: str) -> List[RequestContext]:
+        """
+        下载完成时取出并删除该 soft_id 的全部请求，按请求顺序返回；已超过截止时间的请求被丢弃，不再返回。
+        取出后 soft_id 以“文件已发送”关闭，仍在流水线中的同一 soft_id 的其它下载随之放弃。
+        """
+        now = self.clock()
+        with self.lock:
+            self._evict(now)
+            request_ids = self.by_soft_id.pop(soft_id, None)
+            self._close(soft_id, REASON_DELIVERED)
+            if not request_ids:
+                return []
+            contexts = []
+            for request_id in request_ids:
+                context = self.contexts.pop(request_id)
+                if now < context.deadline:
+                    contexts.append(context)
+                else:
+                    self.expired += 1
+                    logging.warning(f"请求 {request_id} 已超过截止时间，文件不再发送给：{context.recipient_name}")
+        self._notify_closed(soft_id, REASON_DELIVERED)
+        return contexts
+
+    def get(self, request_id: str) -> Optional[RequestContext]:
+        with self.lock:
+            return self.contexts.get(request_id)
+
+    def check(self, soft_id: str,
+              still_wanted: Optional[Callable[[RequestContext], bool]] = None) -> Optional[str]:
+        """
+        检查 soft_id 是否仍需下载。
+
+        删除已超过截止时间的请求，以及 still_wanted 返回 False 的请求（例如请求者积分已不足），
+        没有剩余请求时关闭 soft_id。still_wanted 在锁外调用。
+
+        返回:
+        - soft_id 已关闭时返回关闭原因；仍有有效请求或 soft_id 不在请求中（无法判断）时返回 None。
+        """
+        now = self.clock()
+        with self.lock:
+            self._evict(now)
+            request_ids = self.by_soft_id.get(soft_id)
+            if not request_ids:
+                return self.closed.get(soft_id)
+            contexts = [self.contexts[request_id] for request_id in request_ids]
+
+        expired = [context for context in contexts if now >= context.deadline]
+        unwanted = [context for context in contexts
+                    if now < context.deadline and still_wanted is not None and not still_wanted(context)]
+        if not expired and not unwanted:
+            return None
+        if not unwanted:
+            reason = REASON_EXPIRED
+        elif not expired:
+            reason = REASON_NO_POINTS
+        else:
+            reason = REASON_EXPIRED_OR_NO_POINTS
+        self._discard(expired + unwanted, reason)
+        with self.lock:
+            return self.closed.get(soft_id)
+
+    def cancel_soft_id(self, soft_id: str, reason: str = REASON_ADMIN_CANCELLED) -> List[RequestContext]:
+        """取消 soft_id 的全部请求并关闭 soft_id，返回被取消的请求。"""
+        with self.lock:
+            request_ids = list(self.by_soft_id.get(soft_id, ()))
+            contexts = [self.contexts[request_id] for request_id in request_ids]
+        self._discard(contexts, reason, force_close=soft_id)
+        return contexts
+
+    def cancel_recipient(self, recipient_name: str, reason: str = REASON_ADMIN_CANCELLED) -> List[RequestContext]:
+        """取消某个群组或个人的全部请求，soft_id 没有其它请求者时随之关闭，返回被取消的请求。"""
+        with self.lock:
+            contexts = [context for context in self.contexts.values() if context.recipient_name == recipient_name]
+        self._discard(contexts, reason)
+        return contexts
+
+    def _discard(self, contexts: List[RequestContext], reason: str, force_close: Optional[str] = None):
+        """删除一组请求，关闭因此没有剩余请求的 soft_id；请求可能已被其它线程取出，这时跳过。"""
+        closed = []
+        with self.lock:
+            soft_ids = OrderedDict()
+            for context in contexts:
+                if context.request_id in self.contexts:
+                    self._remove(context.request_id)
+                    self.cancelled += 1
+                    logging.info(f"请求 {context.request_id} 已取消（{reason}），接收者：{context.recipient_name}")
+                soft_ids[context.soft_id] = None
+            if force_close is not None:
+                soft_ids[force_close] = None
+            for soft_id in soft_ids:
+                if soft_id not in self.by_soft_id and self.closed.get(soft_id) is None:
+                    self._close(soft_id, reason)
+                    closed.append(soft_id)
+        for soft_id in closed:
+            self._notify_closed(soft_id, reason)
+
+    def _close(self, soft_id: str, reason: str):
+        """记录 soft_id 的关闭原因，调用方需持有锁。"""
+        self.closed[soft_id] = reason
+        self.closed.move_to_end(soft_id)
+        while len(self.closed) > self.max_closed:
+            self.closed.popitem(last=False)
+
+    def _notify_closed(self, soft_id: str, reason: str):
+        if self.on_close is None:
+            return
+        try:
+            self.on_close(soft_id, reason)
+        except Exception as e:
+            logging.error(f"通知 soft_id {soft_id} 已关闭时出错: {e}", exc_info=True)
+
+    def _remove(self, request_id: str):
+        context = self.contexts.pop(request_id)
+        requests = self.by_soft_id.get(context.soft_id)
+        if requests is not None:
+            requests.pop(request_id, None)
+            if not requests:
+                del self.by_soft_id[context.soft_id]
+        return context
+
+    def _evict(self, now: float):
+        """删除过期和超出数量上限的请求，调用方需持有锁。"""
+        while self.contexts:
+            request_id, context = next(iter(self.contexts.items()))
+            if now - context.created_at < self.ttl and len(self.contexts) < self.max_entries:
+                break
+            self._remove(request_id)
+            self.expired += 1
+            logging.warning(f"请求 {request_id} 在下载完成前已过期，接收者：{context.recipient_name}")
+
+    def __len__(self):
+        with self.lock:
+            return len(self.contexts)
@@ -0,0 +1,169 @@
+# src/file_upload/upload_backends.py
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from src.file_upload.media_cache import MediaCache
+from src.notification.recipient_directory import RecipientDirectory, get_recipient_directory
+
+
+class UploadBackend:
+    """
+    上传后端接口。Uploader 通过后端把文件发送给接收者，后端按配置顺序尝试，前一个后端失败时使用下一个。
+
+    send_files 返回实际发送成功的文件路径；一个文件都没有发送成功时抛出异常。
+    """
+
+    name = 'base'
+
+    def send_files(self, recipient_name: str, file_paths: List[str]) -> List[str]:
+        raise NotImplementedError
+
+    def release(self, file_path: str):
+        """文件已删除，释放后端为该文件保存的状态。"""
+
+    def close(self):
+        """停止后端并释放资源。"""
+
+
+class WxautoUploadBackend(UploadBackend):
+    """
+    通过 wxautox 界面自动化发送文件：一次 SendFiles 调用粘贴并发送整组文件。
+    只能在单个线程中操作桌面客户端，作为协议发送失败时的后备方式。
+
+    参数:
+    - wx: wxautox 的 WeChat 实例。
+    """
+
+    name = 'wxauto'
+
+    def __init__(self, wx):
+        self.wx = wx
+
+    def send_files(self, recipient_name: str, file_paths: List[str]) -> List[str]:
+        if self.wx.SendFiles(filepath=list(file_paths), who=recipient_name) is False:
+            raise RuntimeError(f"发送文件失败：{file_paths}")
+        return list(file_paths)
+
+
+class ItchatUploadBackend(UploadBackend):
+    """
+    通过已登录的 itchat 会话按协议发送文件。
+
+    上传得到的 MediaId 按文件内容保存在 MediaCache 中，内容相同的文件（包括不同群组分别下载的同一份资料）
+    发给任何接收者都只需调用 webwxsendappmsg。同一批文件的上传在线程池中并发进行，发送按文件顺序依次进行。
+    使用异步 itchat 时，上传和发送的协程通过 core.run_sync 提交到 itchat 的事件循环执行。
+    接收者的 UserName 每次发送前通过 RecipientDirectory 查找，重新登录后 UserName 变化时自动使用新值。
+
+    参数:
+    - core: itchat Core 实例，默认使用 lib.itchat 的全局实例。
+    - max_workers: 并发上传的文件数。
+    - media_cache: MediaId 缓存，默认使用只保存在内存中的缓存。
+    """
+
+    name = 'itchat'
+
+    def __init__(self, core=None, max_workers: int = 3, media_cache: Optional[MediaCache] = None):
+        if core is None:
+            from lib import itchat
+            core = itchat.instance
+            self.directory = get_recipient_directory()
+        else:
+            self.directory = RecipientDirectory(core)
+        self.core = core
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='ItchatUpload')
+        self.media_cache = media_cache if media_cache is not None else MediaCache(cache_path=None)
+        self.uploads = 0  # 实际调用 webwxuploadmedia 的文件数
+        self.lock = threading.Lock()
+
+    def resolve_user_name(self, recipient_name: str) -> str:
+        """
+        通过接收者索引查找 UserName，不缓存结果：索引随联系人更新和重新登录刷新。
+
+        返回:
+        - UserName，找不到时抛出 LookupError。
+        """
+        user_name = self.directory.resolve(recipient_name)
+        if not user_name:
+            raise LookupError(f"itchat 中未找到接收者：{recipient_name}")
+        return user_name
+
+    def upload_media(self, file_path: str, refresh: bool = False) -> Tuple[str, str]:
+        """
+        返回文件的 (内容键, MediaId)。缓存中有内容相同的文件时直接使用缓存的 MediaId，否则上传文件。
+
+        参数:
+        - refresh: 为 True 时忽略缓存重新上传。
+        """
+        key = self.media_cache.key_for(file_path)
+        media_id = None if refresh else self.media_cache.get(key)
+        if media_id:
+            logging.debug(f"文件 {os.path.basename(file_path)} 使用缓存的 MediaId")
+            return key, media_id
+
+        r = self.core.run_sync(self.core.upload_file(file_path))
+        if not r or not r.get('MediaId'):
+            raise RuntimeError(f"上传文件失败：{file_path}，返回：{r}")
+        with self.lock:
+            self.uploads += 1
+        self.media_cache.put(key, r['MediaId'])
+        logging.info(f"已上传文件 {os.path.basename(file_path)}，MediaId：{r['MediaId'][:16]}...")
+        return key, r['MediaId']
+
+    def send_files(self, recipient_name: str, file_paths: List[str]) -> List[str]:
+        if not self.core.alive:
+            raise RuntimeError("itchat 未登录，无法按协议发送文件")
+        user_name = self.resolve_user_name(recipient_name)
+
+        futures = [(file_path, self.executor.submit(self.upload_media, file_path)) for file_path in file_paths]
+        sent = []
+        last_error: Optional[Exception] = None
+        for file_path, future in futures:
+            try:
+                key, media_id = future.result()
+                r = self.core.run_sync(self.core.send_file(file_path, toUserName=user_name, mediaId=media_id))
+                if not r:
+                    # 缓存的 MediaId 可能已在服务器端失效，重新上传后再发送一次
+                    logging.warning(f"按 MediaId 发送 {file_path} 失败，重新上传：{r}")
+                    self.media_cache.invalidate(key)
+                    key, media_id = self.upload_media(file_path, refresh=True)
+                    r = self.core.run_sync(self.core.send_file(file_path, toUserName=user_name, mediaId=media_id))
+                if not r:
+                    raise RuntimeError(f"发送文件失败：{file_path}，返回：{r}")
+                sent.append(file_path)
+            except Exception as e:
+                last_error = e
+                logging.warning(f"通过 itchat 发送文件 {file_path} 至 '{recipient_name}' 失败：{e}")
+        if not sent and last_error:
+            raise last_error
+        return sent
+
+    def release(self, file_path: str):
+        self.media_cache.forget_path(file_path)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def create_upload_backends(upload_config: Dict, wx, media_cache: Optional[MediaCache] = None) -> List[UploadBackend]:
+    """
+    按配置创建上传后端列表。
+
+    参数:
+    - upload_config: 上传配置，backend 为 'itchat' 时先按协议发送，失败后使用界面自动化；
+      为 'wxauto'（默认）时只使用界面自动化。itchat_workers 为并发上传的文件数。
+    - wx: wxautox 的 WeChat 实例。
+    - media_cache: itchat 后端使用的 MediaId 缓存。
+
+    返回:
+    - 按尝试顺序排列的后端列表。
+    """
+    backends: List[UploadBackend] = []
+    if upload_config.get('backend', 'wxauto') == 'itchat':
+        backends.append(ItchatUploadBackend(max_workers=upload_config.get('itchat_workers', 3), media_cache=media_cache))
+    backends.append(WxautoUploadBackend(wx))
+    logging.info(f"上传后端：{' -> '.join(backend.name for backend in backends)}")
+    return backends
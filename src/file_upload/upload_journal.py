@@ -0,0 +1,115 @@
+# src/file_upload/upload_journal.py
+
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+# 单个文件的上传状态，按顺序推进
+STATE_PENDING = 'pending'  # 等待发送
+STATE_SENT = 'sent'  # 已发送到微信
+STATE_LOGGED = 'logged'  # 已记录下载事件，上传完成
+STATE_FAILED = 'failed'  # 文件丢失或重试次数用尽
+
+UNFINISHED_STATES = (STATE_PENDING, STATE_SENT)
+
+
+class UploadJournal:
+    """
+    上传日志，持久化记录每个文件的上传进度。
+
+    Uploader 在每一步完成后推进文件状态，重试时跳过已发送的文件；扣分时以记录 ID 作为记账标识，
+    与扣分在同一个事务中写入积分数据库，扣分后、推进状态前异常退出也不会重复扣分；
+    程序异常退出后，启动时根据未完成的记录继续处理。
+    """
+
+    def __init__(self, db_path='upload_journal.db'):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.cursor = self.conn.cursor()
+        self.lock = threading.RLock()
+        self.initialize_database()
+        logging.info("UploadJournal 数据库已初始化")
+
+    def initialize_database(self):
+        """创建 upload_items 表"""
+        with self.lock:
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS upload_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_path TEXT NOT NULL,
+                    soft_id TEXT,
+                    recipient_name TEXT NOT NULL,
+                    recipient_type TEXT,
+                    sender_nickname TEXT,
+                    group_type TEXT,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_items_state ON upload_items (state)')
+            self.conn.commit()
+
+    def add(self, file_path: str, soft_id: str, recipient_name: str, recipient_type: str = 'group',
+            sender_nickname: Optional[str] = None, group_type: Optional[str] = None) -> int:
+        """
+        添加一个待发送的文件。
+
+        返回:
+        - 记录 ID。
+        """
+        with self.lock:
+            self.cursor.execute('''
+                INSERT INTO upload_items (file_path, soft_id, recipient_name, recipient_type, sender_nickname, group_type)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (file_path, soft_id, recipient_name, recipient_type, sender_nickname, group_type))
+            self.conn.commit()
+            return self.cursor.lastrowid
+
+    def mark(self, item_ids: Union[int, Iterable[int]], state: str):
+        """在一个事务中把一个或多个记录推进到指定状态。"""
+        ids = [item_ids] if isinstance(item_ids, int) else list(item_ids)
+        if not ids:
+            return
+        with self.lock:
+            self.cursor.executemany('''
+                UPDATE upload_items SET state = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            ''', [(state, item_id) for item_id in ids])
+            self.conn.commit()
+
+    def record_attempt(self, item_ids: Iterable[int]):
+        """记录一次发送尝试。尝试次数大于 0 的待发送记录在异常退出后需要先核对聊天窗口。"""
+        ids = list(item_ids)
+        if not ids:
+            return
+        with self.lock:
+            self.cursor.executemany('''
+                UPDATE upload_items SET attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            ''', [(item_id,) for item_id in ids])
+            self.conn.commit()
+
+    def unfinished(self) -> List[Dict]:
+        """返回所有未完成的记录，按 ID 排序。"""
+        with self.lock:
+            self.cursor.execute(f'''
+                SELECT * FROM upload_items WHERE state IN ({','.join('?' * len(UNFINISHED_STATES))}) ORDER BY id
+            ''', UNFINISHED_STATES)
+            return [dict(row) for row in self.cursor.fetchall()]
+
+    def purge(self, days: int = 7) -> int:
+        """删除 days 天前已完成或失败的记录，返回删除的条数。"""
+        with self.lock:
+            self.cursor.execute('''
+                DELETE FROM upload_items
+                WHERE state IN (?, ?) AND updated_at < datetime('now', ?)
+            ''', (STATE_LOGGED, STATE_FAILED, f'-{days} days'))
+            self.conn.commit()
+            return self.cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+            logging.info("UploadJournal 数据库连接已关闭")
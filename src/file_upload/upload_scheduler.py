@@ -0,0 +1,198 @@
+# src/file_upload/upload_scheduler.py
+
+import heapq
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+SLA_TOLERANCE = 1.0  # 统计超出时限的文件时允许的误差（秒），覆盖上传线程的轮询间隔
+SEND_ESTIMATE = 2.0  # 发送一个批次的初始估计耗时（秒），之后按实际耗时平滑更新
+SEND_ESTIMATE_ALPHA = 0.3
+
+
+class UploadScheduler:
+    """
+    按接收者亲和性安排上传批次，减少微信聊天窗口的切换次数。
+
+    每个接收者有一个待发送的文件桶，桶的截止时间为其中最早文件的入队时间加上 max_wait，
+    所有截止时间保存在最小堆中。桶在文件数达到 batch_size 或到达截止时间时可以发送，
+    发送顺序遵循以下规则：
+    - 当前打开的聊天窗口优先，不需要切换窗口；
+    - 当前窗口在 linger 秒内仍有新文件到达时保持窗口，其它只是已满、尚未到期的桶延后发送；
+    - 其余可发送的桶按截止时间先后发送，任何文件的排队时间不超过 max_wait（加上界面忙碌的时间）。
+
+    上传线程一次只能发送一个批次，多个桶的截止时间相近时，到期才开始发送会让排在后面的桶超时。
+    因此按截止时间排序后，第 i 个桶（从 1 开始）发出前上传线程可能还要发送 i 个批次（包括正在发送的一批），
+    最早的桶在所有桶都能按时发出的最晚时刻开始发送，每批的发送耗时由 note_sent 报告的实际耗时估计。
+
+    参数:
+    - max_wait: 单个文件的最长排队时间（秒）。
+    - batch_size: 桶内文件数达到该值时不再等待。
+    - linger: 当前窗口最近一次收到文件后保持窗口的时间（秒）。
+    - wait_samples: 保留用于统计排队时间分位数的样本数。
+    """
+
+    def __init__(self, max_wait: float = 20.0, batch_size: int = 5, linger: float = 2.0, wait_samples: int = 1000):
+        self.max_wait = max_wait
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.buckets: Dict[str, Dict] = {}  # 接收者 -> {'tasks': [(入队时间, 任务)], 'deadline': 截止时间, 'last': 最近入队时间}
+        self.deadlines: List[Tuple[float, int, str]] = []  # (截止时间, 序号, 接收者)，桶发送后留下的过期条目在弹出时丢弃
+        self.sequence = 0
+        self.current_recipient: Optional[str] = None
+        self.send_estimate = SEND_ESTIMATE
+        self.lock = threading.Lock()
+
+        # 统计
+        self.files_dispatched = 0
+        self.batches_dispatched = 0
+        self.switches = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+        self.sla_violations = 0
+        self.recent_waits = deque(maxlen=wait_samples)
+
+    def update_settings(self, max_wait: Optional[float] = None, batch_size: Optional[int] = None,
+                        linger: Optional[float] = None):
+        """更新调度参数，已在桶中的文件保持原截止时间。"""
+        with self.lock:
+            if max_wait is not None:
+                self.max_wait = max_wait
+            if batch_size is not None:
+                self.batch_size = max(1, batch_size)
+            if linger is not None:
+                self.linger = linger
+
+    def add(self, recipient_name: str, task: Dict, queued_at: float):
+        """
+        把一个文件放入接收者的桶。
+
+        参数:
+        - recipient_name: 接收者名称。
+        - task: 上传任务。
+        - queued_at: 文件进入上传队列的时间，排队时间和截止时间从该时间开始计算。
+        """
+        with self.lock:
+            bucket = self.buckets.get(recipient_name)
+            if bucket is None:
+                bucket = {'tasks': [], 'deadline': queued_at + self.max_wait, 'last': queued_at}
+                self.buckets[recipient_name] = bucket
+                self.sequence += 1
+                heapq.heappush(self.deadlines, (bucket['deadline'], self.sequence, recipient_name))
+            bucket['tasks'].append((queued_at, task))
+            bucket['last'] = max(bucket['last'], queued_at)
+
+    def _is_due(self, bucket: Dict, now: float) -> bool:
+        return bucket['deadline'] <= now
+
+    def _is_full(self, bucket: Dict) -> bool:
+        return len(bucket['tasks']) >= self.batch_size
+
+    def _current_is_hot(self, now: float) -> bool:
+        bucket = self.buckets.get(self.current_recipient)
+        return bucket is not None and now - bucket['last'] < self.linger
+
+    def _latest_start(self) -> float:
+        """所有桶都在截止时间前发出时，最早的桶最晚的开始发送时间。"""
+        deadlines = sorted(bucket['deadline'] for bucket in self.buckets.values())
+        return min(deadline - index * self.send_estimate for index, deadline in enumerate(deadlines, 1))
+
+    def _earliest_due(self, now: float) -> Optional[str]:
+        """弹出过期的堆条目，已到最晚开始发送时间时返回截止时间最早的接收者。"""
+        while self.deadlines:
+            deadline, _, recipient_name = self.deadlines[0]
+            bucket = self.buckets.get(recipient_name)
+            if bucket is None or bucket['deadline'] != deadline:
+                heapq.heappop(self.deadlines)
+                continue
+            return recipient_name if self._latest_start() <= now else None
+        return None
+
+    def _select(self, now: float) -> Optional[str]:
+        current = self.buckets.get(self.current_recipient)
+        if current is not None and (self._is_due(current, now) or self._is_full(current)):
+            return self.current_recipient
+
+        due = self._earliest_due(now)
+        if due is not None:
+            return due
+
+        if self._current_is_hot(now):
+            # 当前窗口仍有文件陆续到达，已满但未到期的其它桶等待
+            return None
+
+        full = [name for name, bucket in self.buckets.items() if self._is_full(bucket)]
+        if not full:
+            return None
+        if current is not None:
+            return self.current_recipient
+        return min(full, key=lambda name: self.buckets[name]['deadline'])
+
+    def next_batch(self, now: float) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        取出下一个应发送的桶。
+
+        返回:
+        - (接收者, 任务列表)，当前没有应发送的桶时返回 None。
+        """
+        with self.lock:
+            recipient_name = self._select(now)
+            if recipient_name is None:
+                return None
+            bucket = self.buckets.pop(recipient_name)
+            waits = [now - queued_at for queued_at, _ in bucket['tasks']]
+            self.files_dispatched += len(waits)
+            self.batches_dispatched += 1
+            self.total_wait += sum(waits)
+            self.max_observed_wait = max(self.max_observed_wait, max(waits))
+            self.sla_violations += sum(1 for wait in waits if wait > self.max_wait + SLA_TOLERANCE)
+            self.recent_waits.extend(waits)
+            return recipient_name, [task for _, task in bucket['tasks']]
+
+    def time_until_next(self, now: float) -> Optional[float]:
+        """返回距离下一个桶可能变为可发送的秒数，没有待发送的文件时返回 None。"""
+        with self.lock:
+            if not self.buckets:
+                return None
+            candidates = [self._latest_start() - now]
+            if self._current_is_hot(now):
+                candidates.append(self.buckets[self.current_recipient]['last'] + self.linger - now)
+            return max(0.0, min(candidates))
+
+    def note_sent(self, seconds: float):
+        """报告发送一个批次的实际耗时（包括失败和重试），用于估计后续批次的发送耗时。"""
+        with self.lock:
+            self.send_estimate += SEND_ESTIMATE_ALPHA * (max(0.0, seconds) - self.send_estimate)
+
+    def note_chat(self, recipient_name: str):
+        """记录即将在哪个聊天窗口中发送文件，窗口变化时计为一次切换。"""
+        with self.lock:
+            if recipient_name != self.current_recipient:
+                self.switches += 1
+                self.current_recipient = recipient_name
+
+    def get_metrics(self) -> Dict:
+        """返回窗口切换次数、每个文件的平均切换次数和排队时间统计。"""
+        with self.lock:
+            waits = sorted(self.recent_waits)
+            files = self.files_dispatched
+            return {
+                'files': files,
+                'batches': self.batches_dispatched,
+                'switches': self.switches,
+                'switches_per_file': self.switches / files if files else 0.0,
+                'files_per_batch': files / self.batches_dispatched if self.batches_dispatched else 0.0,
+                'wait_avg': self.total_wait / files if files else 0.0,
+                'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                'wait_max': self.max_observed_wait,
+                'sla_violations': self.sla_violations,
+                'pending': sum(len(bucket['tasks']) for bucket in self.buckets.values()),
+            }
+
+    def log_metrics(self):
+        metrics = self.get_metrics()
+        logging.info(
+            f"上传调度统计：文件 {metrics['files']} 个，批次 {metrics['batches']} 个，窗口切换 {metrics['switches']} 次"
+            f"（每文件 {metrics['switches_per_file']:.2f} 次），排队时间 平均 {metrics['wait_avg']:.1f} 秒 / "
+            f"p95 {metrics['wait_p95']:.1f} 秒 / 最大 {metrics['wait_max']:.1f} 秒，超出时限 {metrics['sla_violations']} 个")
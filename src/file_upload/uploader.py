@@ -7,7 +7,13 @@ import queue
 import time
 from typing import Optional, List, Dict
 from lib.wxautox.wxauto import WeChat
+from src.file_upload.upload_journal import UploadJournal, STATE_FAILED, STATE_LOGGED, STATE_PENDING, STATE_SENT
+from src.file_upload.media_cache import MediaCache
+from src.file_upload.request_context import REASON_DOWNLOAD_FAILED, RequestContext, RequestContextStore
+from src.file_upload.upload_backends import create_upload_backends
+from src.file_upload.upload_scheduler import UploadScheduler
 from src.point_manager import PointManager
+from src.scheduler.timer_service import get_timer_service
 
 
 class Uploader:
@@ -15,68 +21,97 @@ class Uploader:
         self.target_groups = upload_config.get('target_groups', [])
         self.target_individuals = upload_config.get('target_individuals', [])
         self.upload_config = upload_config
-        self.processed_soft_ids = set()
         self.error_handler = error_handler
         self.max_retries = 3
         self.retry_delay = 5
+        self.delete_delay = 30  # 上传后延迟删除文件的秒数
+        self.timer_service = get_timer_service()  # 共享定时调度器，用于延迟删除和重试退避
 
         self.lock = threading.Lock()  # 确保线程安全
 
-        # 维护 soft_id 到 recipient 和 sender 映射
-        self.softid_to_recipient = {}
-        self.softid_to_sender = {}  # 用于维护 soft_id 到发送者昵称的映射
-        self.softid_to_group_type = {}  # 新增：维护 soft_id 到 group_type 的映射
+        # 等待下载完成的请求上下文，同一个 soft_id 的多个请求在下载完成后分别发送；
+        # 请求超过截止时间、请求者积分不足或被取消后，下载流水线的各个阶段放弃该 soft_id 的下载
+        self.request_contexts = RequestContextStore(
+            ttl=upload_config.get('request_ttl_hours', 24) * 3600,
+            max_entries=upload_config.get('max_pending_requests', 5000),
+            deadline=upload_config.get('request_deadline_minutes', 120) * 60
+        )
+        self.file_refs = {}  # 文件路径 -> 尚未发送完成的接收者数，归零后安排删除
 
         # 获取错误通知接收者
         self.error_recipient = error_notification_config.get('recipient')
 
-        # 初始化上传任务队列
+        # 上传日志，记录每个文件的发送、扣分和记录进度
+        self.journal = UploadJournal(upload_config.get('journal_path', 'upload_journal.db'))
+
+        # 按接收者亲和性安排上传批次，max_wait_seconds 为单个文件的最长排队时间
+        self.upload_scheduler = UploadScheduler(
+            max_wait=upload_config.get('max_wait_seconds', 20),
+            batch_size=upload_config.get('batch_size', 5),
+            linger=upload_config.get('linger_seconds', 2)
+        )
+
+        # 初始化上传任务队列和重试队列（重试任务由定时调度器在退避结束后放入）
         self.upload_queue = queue.Queue()
+        self.retry_queue = queue.Queue()
         self.stop_event = threading.Event()
         self.upload_thread = threading.Thread(target=self.process_uploads, daemon=True)
         self.upload_thread.start()
         logging.info("上传任务处理线程已启动")
 
-        # 初始化文件删除队列和线程
-        self.delete_queue = queue.Queue()
-        self.delete_thread = threading.Thread(target=self.process_file_deletion, daemon=True)
-        self.delete_thread.start()
-        logging.info("文件删除线程已启动")
-
         # 初始化 wxauto WeChat 实例
         self.wx = WeChat()
         self.initialize_wechat()
         logging.info("wxauto WeChat 实例已初始化")
 
+        # 文件内容到 MediaId 的缓存，同一份资料发给多个接收者时只上传一次
+        self.media_cache = MediaCache(
+            cache_path=upload_config.get('media_cache_path', 'media_cache.json'),
+            capacity=upload_config.get('media_cache_size', 500),
+            ttl=upload_config.get('media_cache_ttl_hours', 24) * 3600
+        )
+
+        # 上传后端，按顺序尝试，界面自动化始终作为最后的后备
+        self.backends = create_upload_backends(upload_config, self.wx, self.media_cache)
+
         # 初始化 PointManager
         self.point_manager = point_manager if point_manager else PointManager()
         logging.info("PointManager 已初始化")
 
+        # 继续处理上次运行中未完成的上传
+        self.recover_unfinished_uploads()
+
     def add_file_to_delete(self, file_path):
-        """将待删除的文件路径添加到删除队列"""
-        self.delete_queue.put(file_path)
-        logging.info(f"文件已添加到删除队列：{file_path}")
+        """通过定时调度器安排在 delete_delay 秒后删除文件"""
+        self.timer_service.call_later(self.delete_delay, self.delete_file, file_path, name=f"delete-{file_path}")
+        logging.info(f"文件已安排在 {self.delete_delay} 秒后删除：{file_path}")
 
-    def process_file_deletion(self):
-        """处理文件删除的线程"""
-        while not self.stop_event.is_set():
-            try:
-                file_path = self.delete_queue.get(timeout=1)
-                time.sleep(30)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logging.info(f"已删除文件：{file_path}")
-                else:
-                    logging.warning(f"文件不存在，无法删除：{file_path}")
-                self.delete_queue.task_done()
-            except queue.Empty:
-                continue
-            except Exception as e:
-                logging.error(f"删除文件时发生错误：{e}", exc_info=True)
-                self.error_handler.handle_exception(e)
+    def delete_file(self, file_path):
+        """删除已上传的文件，由定时调度器调用"""
+        try:
+            for backend in self.backends:
+                backend.release(file_path)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                logging.info(f"已删除文件：{file_path}")
+            else:
+                logging.warning(f"文件不存在，无法删除：{file_path}")
+        except Exception as e:
+            logging.error(f"删除文件时发生错误：{e}", exc_info=True)
+            self.error_handler.handle_exception(e)
 
     def update_config(self, new_upload_config):
+        if new_upload_config.get('backend', 'wxauto') != self.upload_config.get('backend', 'wxauto'):
+            for backend in self.backends:
+                backend.close()
+            self.backends = create_upload_backends(new_upload_config, self.wx, self.media_cache)
         self.upload_config = new_upload_config
+        self.request_contexts.set_deadline(new_upload_config.get('request_deadline_minutes', 120) * 60)
+        self.upload_scheduler.update_settings(
+            max_wait=new_upload_config.get('max_wait_seconds', 20),
+            batch_size=new_upload_config.get('batch_size', 5),
+            linger=new_upload_config.get('linger_seconds', 2)
+        )
         logging.info("Uploader 配置已更新")
 
     def initialize_wechat(self):
@@ -87,37 +122,66 @@ class Uploader:
         logging.info("已切换到微信聊天页面")
         time.sleep(1)  # 等待界面切换完成
 
-    def upload_group_id(self, recipient_name: str, soft_id: str, sender_nickname: str = None, recipient_type: str = 'group', group_type: str = None):
+    def upload_group_id(self, recipient_name: str, soft_id: str, sender_nickname: str = None, recipient_type: str = 'group', group_type: str = None) -> bool:
         """
-        接收群组或个人名称和 soft_id，并维护映射关系。
+        接收群组或个人名称和 soft_id，保存为一个请求上下文，下载完成后把文件发给该接收者。
         recipient_type: 'group' 或 'individual'
         group_type: 'whole' 或 'non-whole'，仅当 recipient_type 为 'group' 时有效
-        """
-        with self.lock:
-            # 维护 soft_id 到 recipient_name 的映射
-            self.softid_to_recipient[soft_id] = recipient_name
-            logging.info(f"映射 soft_id {soft_id} 到接收者 '{recipient_name}'")
 
-            if sender_nickname:
-                self.softid_to_sender[soft_id] = sender_nickname
-                logging.info(f"映射 soft_id {soft_id} 到发送者 '{sender_nickname}'")
+        返回:
+        - 是否需要下载。已有其它请求在等待同一个 soft_id 时返回 False，下载完成后文件会同时发给所有请求者。
+        """
+        if recipient_type == 'group':
+            group_type = group_type if group_type else 'whole'
+        context, is_first = self.request_contexts.add(soft_id, recipient_name, recipient_type,
+                                                      sender_nickname, group_type)
+        logging.info(f"请求 {context.request_id}：soft_id {soft_id}，接收者 '{recipient_name}'" +
+                     (f"，发送者 '{sender_nickname}'" if sender_nickname else ''))
 
+        with self.lock:
             if recipient_type == 'group':
-                if group_type:
-                    # 根据 group_type 确定是否为整体群组
-                    is_whole = (group_type == 'whole')
-                    self.point_manager.ensure_group(recipient_name, is_whole=is_whole)
-                else:
-                    # 默认设为整体群组
-                    self.point_manager.ensure_group(recipient_name, is_whole=True)
-                # 新增：维护 soft_id 到 group_type 的映射
-                self.softid_to_group_type[soft_id] = group_type if group_type else 'whole'
+                # 根据 group_type 确定是否为整体群组
+                self.point_manager.ensure_group(recipient_name, is_whole=(group_type == 'whole'))
             elif recipient_type == 'individual':
                 # 使用新添加的 add_recipient 方法
                 add_result = self.point_manager.add_recipient(recipient_name, initial_points=100)
                 logging.info(add_result)
             if sender_nickname and recipient_type == 'group':
                 self.point_manager.ensure_user(recipient_name, sender_nickname)
+        if not is_first:
+            logging.info(f"soft_id {soft_id} 已有请求在等待下载，下载完成后一并发送给 '{recipient_name}'")
+        return is_first
+
+    def has_points_for(self, context: RequestContext) -> bool:
+        """请求者是否仍有积分：整体群组查群组积分，非整体群组查发送者积分，个人查个人积分。"""
+        if context.recipient_type == 'group':
+            if context.group_type == 'non-whole' and context.sender_nickname:
+                return self.point_manager.has_user_points(context.recipient_name, context.sender_nickname)
+            return self.point_manager.has_group_points(context.recipient_name)
+        return self.point_manager.has_recipient_points(context.recipient_name)
+
+    def cancel_reason(self, soft_id: str) -> Optional[str]:
+        """
+        下载流水线的各个阶段在占用浏览器、账号额度或上传之前调用，检查 soft_id 是否仍需下载。
+
+        返回:
+        - 不再需要下载的原因（已取消、文件已发送、请求超过截止时间或请求者积分不足）；
+          仍有有效请求或 soft_id 不在请求中时返回 None。
+        """
+        if not soft_id:
+            return None
+        return self.request_contexts.check(soft_id, still_wanted=self.has_points_for)
+
+    def download_failed(self, soft_id: str, detail: str = ''):
+        """
+        下载流水线无法继续且不会再重试时调用：关闭 soft_id 的全部请求，之后同一份资料的新请求会重新下载。
+        """
+        if not soft_id:
+            return
+        contexts = self.request_contexts.cancel_soft_id(soft_id, REASON_DOWNLOAD_FAILED)
+        if contexts:
+            recipients = '、'.join(dict.fromkeys(context.recipient_name for context in contexts))
+            logging.warning(f"soft_id {soft_id} 下载失败（{detail}），已关闭 {len(contexts)} 个请求：{recipients}")
 
     def rename_file_with_id(self, file_path: str, soft_id: str) -> Optional[str]:
         """
@@ -147,173 +211,294 @@ class Uploader:
 
     def add_upload_task(self, file_path: str, soft_id: str, recipient_type: str = 'group'):
         """
-        添加上传任务前，先将文件重命名为 [soft_id]文件名。
-        recipient_type: 'group' 或 'individual'
+        下载完成后调用：先将文件重命名为 [soft_id]文件名，再为该 soft_id 的每个请求添加一个上传任务。
+        已超过截止时间和积分已不足的请求不再发送。接收者类型取自请求上下文，recipient_type 参数仅为兼容保留。
         """
+        contexts = []
+        for context in self.request_contexts.pop_for_soft_id(soft_id):
+            if self.has_points_for(context):
+                contexts.append(context)
+            else:
+                logging.info(f"请求 {context.request_id} 的请求者积分不足，文件不再发送给：{context.recipient_name}")
+        if not contexts:
+            logging.warning(f"soft_id {soft_id} 没有等待中的请求（可能已过期或已取消），文件将被删除：{file_path}")
+            self.add_file_to_delete(file_path)
+            return
+
         renamed_file_path = self.rename_file_with_id(file_path, soft_id)
-        if renamed_file_path:
-            with self.lock:
-                self.processed_soft_ids.add(soft_id)
-            self.upload_queue.put((renamed_file_path, soft_id, recipient_type))
-            logging.info(f"添加上传任务: {renamed_file_path}, soft_id: {soft_id}, recipient_type: {recipient_type}")
-        else:
+        if not renamed_file_path:
             logging.error(f"文件重命名失败，无法添加上传任务: {file_path}, soft_id: {soft_id}")
+            return
+
+        with self.lock:
+            self.file_refs[renamed_file_path] = self.file_refs.get(renamed_file_path, 0) + len(contexts)
+        for context in contexts:
+            journal_id = self.journal.add(renamed_file_path, soft_id, context.recipient_name, context.recipient_type,
+                                          context.sender_nickname, context.group_type)
+            task = {
+                'file_path': renamed_file_path,
+                'soft_id': soft_id,
+                'recipient_type': context.recipient_type,
+                'sender_nickname': context.sender_nickname,
+                'group_type': context.group_type,
+                'journal_id': journal_id
+            }
+            self.upload_queue.put((context.recipient_name, task, time.time()))
+            logging.info(f"添加上传任务: {renamed_file_path}, 请求: {context.request_id}, 接收者: {context.recipient_name}")
+
+    def release_file(self, file_path: str):
+        """一个接收者的上传已完成，所有接收者都完成后安排删除文件。"""
+        with self.lock:
+            remaining = self.file_refs.get(file_path, 1) - 1
+            if remaining > 0:
+                self.file_refs[file_path] = remaining
+                return
+            self.file_refs.pop(file_path, None)
+        self.add_file_to_delete(file_path)
 
     def process_uploads(self):
         """
-        处理上传队列中的任务，支持批量发送。
+        处理上传队列中的任务。任务按接收者放入上传调度器，由调度器决定发送顺序：
+        优先当前打开的聊天窗口，其余接收者在文件数达到 batch_size 或等待 max_wait_seconds 后按截止时间发送。
         """
-        recipient_tasks = {}
-        last_send_time = time.time()
-        batch_interval = 5  # 批量发送的时间间隔，单位：秒
-
         while not self.stop_event.is_set():
             try:
-                # 从队列中获取任务
-                file_path, soft_id, recipient_type = self.upload_queue.get(timeout=1)
-                with self.lock:
-                    recipient_name = self.softid_to_recipient.get(soft_id)
-                    sender_nickname = self.softid_to_sender.get(soft_id)
-                    group_type = self.softid_to_group_type.get(soft_id)
-
-                if not recipient_name:
-                    logging.error(f"未找到 soft_id {soft_id} 对应的接收者。")
+                # 先处理退避结束的重试任务
+                self.process_retry_uploads()
+
+                # 发送调度器中已可发送的批次
+                batch = self.upload_scheduler.next_batch(time.time())
+                if batch:
+                    started = time.time()
+                    self.upload_files(*batch)
+                    self.upload_scheduler.note_sent(time.time() - started)
                     continue
 
-                # 将任务添加到 recipient_tasks 中
-                if recipient_name not in recipient_tasks:
-                    recipient_tasks[recipient_name] = []
-                recipient_tasks[recipient_name].append({
-                    'file_path': file_path,
-                    'soft_id': soft_id,
-                    'recipient_type': recipient_type,
-                    'sender_nickname': sender_nickname,
-                    'group_type': group_type
-                })
+                # 等待新任务，最长等到下一个批次可能可发送的时间
+                wait_time = self.upload_scheduler.time_until_next(time.time())
+                timeout = 1 if wait_time is None else min(1, max(0.05, wait_time))
+                recipient_name, task, queued_at = self.upload_queue.get(timeout=timeout)
                 self.upload_queue.task_done()
-
-                # 检查是否需要批量发送
-                current_time = time.time()
-                if (current_time - last_send_time >= batch_interval) or \
-                        any(len(tasks) >= self.upload_config.get('batch_size', 5) for tasks in
-                            recipient_tasks.values()):
-                    # 批量发送
-                    for recipient_name, tasks in recipient_tasks.items():
-                        self.upload_files(recipient_name, tasks)
-                    # 清空 recipient_tasks
-                    recipient_tasks.clear()
-                    last_send_time = current_time
+                self.upload_scheduler.add(recipient_name, task, queued_at)
 
             except queue.Empty:
-                # 队列为空，检查是否有待发送的任务
-                current_time = time.time()
-                if recipient_tasks and (current_time - last_send_time >= batch_interval):
-                    for recipient_name, tasks in recipient_tasks.items():
-                        self.upload_files(recipient_name, tasks)
-                    recipient_tasks.clear()
-                    last_send_time = current_time
                 continue
             except Exception as e:
                 logging.error(f"处理上传任务时出错：{e}", exc_info=True)
                 self.error_handler.handle_exception(e)
 
-    def upload_files(self, recipient_name, tasks):
+    def process_retry_uploads(self):
+        """处理重试队列中已结束退避的上传任务"""
+        while True:
+            try:
+                recipient_name, tasks, attempt = self.retry_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.upload_files(recipient_name, tasks, attempt)
+
+    def upload_files(self, recipient_name, tasks, attempt=1):
+        """
+        上传一批文件到接收者。同一接收者的文件按 max_files_per_send 分组，每组交给上传后端发送
+        （itchat 按协议并发上传，wxauto 一次 SendFiles 调用粘贴整组文件），发送成功后逐个文件扣除积分、安排删除并记录下载。
+        失败时不在上传线程中休眠，而是通过定时调度器在 retry_delay 秒后将任务放回重试队列，
+        退避期间上传线程可以继续处理其它接收者。
+        每个文件的进度记录在任务和上传日志中，重试时从第一个未发送的文件继续，已发送的文件不会重复发送和扣分。
+        """
+        max_total_retries = self.max_retries * 2  # 允许最多双倍的重试次数
+        max_files_per_send = max(1, self.upload_config.get('max_files_per_send', 10))
+        self.upload_scheduler.note_chat(recipient_name)
         try:
-            max_total_retries = self.max_retries * 2  # 允许最多双倍的重试次数
-            attempt = 1
-            while attempt <= max_total_retries:
-                try:
-                    if attempt == self.max_retries + 1:
-                        # 在初始 max_retries 次尝试后，重新激活聊天窗口
-                        self.wx.ChatWith(who=recipient_name)
-                        logging.info(f"重新激活接收者 '{recipient_name}' 的聊天窗口")
-                        time.sleep(0.5)  # 等待窗口激活完成
-
-                    logging.info(
-                        f"正在上传文件至接收者：{recipient_name}，文件数：{len(tasks)}，尝试次数：{attempt}")
-                    for task in tasks:
-                        file_path = task['file_path']
-                        self.wx.SendFiles(filepath=file_path, who=recipient_name)
-                        logging.info(f"已上传文件：{file_path}")
-                        # 扣除积分并处理文件删除
-                        self.deduct_points(
-                            recipient_name=recipient_name,
-                            sender_nickname=task['sender_nickname'],
-                            recipient_type=task['recipient_type'],
-                            group_type=task['group_type']
-                        )
-                        # 将文件路径添加到删除队列
-                        self.add_file_to_delete(file_path)
-
-                        # 记录下载事件
-                        link = f"file://{os.path.abspath(file_path)}"  # 根据实际情况生成链接
-                        recipient_type = 'whole_group' if task['group_type'] == 'whole' else 'non_whole_group' if task[
-                                                                                                                      'group_type'] == 'non-whole' else 'individual'
-                        self.point_manager.log_download(
-                            recipient_type=recipient_type,
-                            recipient_name=recipient_name,
-                            link=link
-                        )
-
-                    break  # 上传成功，退出循环
-                except Exception as e:
-                    if attempt < max_total_retries:
-                        logging.warning(f"上传失败，稍后重试... (尝试次数：{attempt}) - 错误：{e}")
-                        time.sleep(self.retry_delay)
-                        attempt += 1
+            if attempt == self.max_retries + 1:
+                # 在初始 max_retries 次尝试后，重新激活聊天窗口
+                self.wx.ChatWith(who=recipient_name)
+                logging.info(f"重新激活接收者 '{recipient_name}' 的聊天窗口")
+                time.sleep(0.5)  # 等待窗口激活完成
+
+            # 已发送的文件只补做扣分和记录；列表形式的 SendFiles 会静默跳过不存在的文件，发送前先剔除，避免为未发送的文件扣分
+            unsent_tasks = []
+            self.record_uploaded_files(recipient_name, [task for task in tasks
+                                                        if task.get('state', STATE_PENDING) == STATE_SENT])
+            for task in tasks:
+                if task.get('state', STATE_PENDING) == STATE_PENDING:
+                    if os.path.exists(task['file_path']):
+                        unsent_tasks.append(task)
                     else:
-                        logging.error(f"上传失败 (接收者: {recipient_name}) - 错误：{e}")
-                        self.error_handler.handle_exception(e)
-                        break
+                        logging.error(f"文件不存在，跳过上传：{task['file_path']}")
+                        self.set_task_state([task], STATE_FAILED)
+
+            logging.info(
+                f"正在上传文件至接收者：{recipient_name}，待发送文件数：{len(unsent_tasks)}，尝试次数：{attempt}")
+            for start in range(0, len(unsent_tasks), max_files_per_send):
+                batch = unsent_tasks[start:start + max_files_per_send]
+                file_paths = [task['file_path'] for task in batch]
+                self.journal.record_attempt(task['journal_id'] for task in batch if task.get('journal_id') is not None)
+                sent_paths = set(self.send_files(recipient_name, file_paths))
+                sent_batch = [task for task in batch if task['file_path'] in sent_paths]
+                self.set_task_state(sent_batch, STATE_SENT)
+                logging.info(f"已上传 {len(sent_batch)} 个文件至接收者 '{recipient_name}'：{sorted(sent_paths)}")
+                self.record_uploaded_files(recipient_name, sent_batch)
+                if len(sent_batch) < len(batch):
+                    # 部分文件未发送成功，保持待发送状态，由重试继续处理
+                    raise RuntimeError(f"{len(batch) - len(sent_batch)} 个文件发送失败")
+        except Exception as e:
+            if attempt < max_total_retries:
+                logging.warning(f"上传失败，{self.retry_delay} 秒后重试... (尝试次数：{attempt}) - 错误：{e}")
+                self.timer_service.call_later(self.retry_delay, self.retry_queue.put,
+                                              (recipient_name, tasks, attempt + 1),
+                                              name=f"upload-retry-{recipient_name}")
+            else:
+                logging.error(f"上传失败 (接收者: {recipient_name}) - 错误：{e}")
+                self.set_task_state([task for task in tasks if task.get('state', STATE_PENDING) == STATE_PENDING],
+                                    STATE_FAILED)
+                self.error_handler.handle_exception(e)
+
+    def send_files(self, recipient_name, file_paths) -> List[str]:
+        """
+        依次尝试上传后端发送一组文件，后端抛出异常时使用下一个后端。
+
+        返回:
+        - 实际发送成功的文件路径，所有后端都失败时抛出最后一个异常。
+        """
+        last_error = None
+        for backend in self.backends:
+            try:
+                return backend.send_files(recipient_name, file_paths)
+            except Exception as e:
+                last_error = e
+                logging.warning(f"上传后端 {backend.name} 发送文件至 '{recipient_name}' 失败：{e}")
+        raise last_error
+
+    def set_task_state(self, tasks, state):
+        """更新任务的上传状态，并写入上传日志。"""
+        journal_ids = []
+        for task in tasks:
+            task['state'] = state
+            if task.get('journal_id') is not None:
+                journal_ids.append(task['journal_id'])
+        self.journal.mark(journal_ids, state)
+
+    def record_uploaded_files(self, recipient_name, tasks):
+        """
+        记录一批已发送的文件：在一个数据库事务中扣除积分并记录下载事件，然后安排延迟删除。
+        上传日志的记录 ID 作为记账标识随扣分一起提交，记账后、推进状态前异常退出时，
+        恢复时 PointManager 跳过已记账的文件，同一个文件只扣一次积分、只记录一次下载。
+        记账出错的文件保持已发送状态、不释放，由重试或下次启动时的恢复补做。
+        """
+        tasks = [task for task in tasks if task.get('state', STATE_SENT) == STATE_SENT]
+        if not tasks:
+            return
+        items = [{
+            'recipient_name': recipient_name,
+            'recipient_type': task['recipient_type'],
+            'group_type': task['group_type'],
+            'sender_nickname': task['sender_nickname'],
+            'link': f"file://{os.path.abspath(task['file_path'])}",  # 根据实际情况生成链接
+            'key': self.upload_key(task)
+        } for task in tasks]
+        try:
+            results = self.point_manager.record_uploads(items)
         except Exception as e:
-            logging.error(f"批量上传文件时发生错误 (接收者: {recipient_name}) - 错误：{e}", exc_info=True)
+            # 记账失败时任务保持原状态，由下次恢复时补做
+            logging.error(f"记录接收者 '{recipient_name}' 的 {len(tasks)} 个上传时出错：{e}", exc_info=True)
             self.error_handler.handle_exception(e)
+            return
 
-    def deduct_points(self, recipient_name: str, sender_nickname: Optional[str] = None, recipient_type: str = 'group', group_type: Optional[str] = None):
+        recorded = []
+        for task, result in zip(tasks, results):
+            if result['error']:
+                # 该文件的记账已回滚，保持已发送状态，由下次恢复时补做
+                logging.error(f"记录发送至 '{recipient_name}' 的文件时出错，稍后补做：{os.path.basename(task['file_path'])}")
+                continue
+            recorded.append(task)
+            if result.get('duplicate'):
+                logging.info(f"发送至 '{recipient_name}' 的文件已记账，跳过扣分：{os.path.basename(task['file_path'])}")
+            elif result['charged']:
+                logging.info(f"已为发送至 '{recipient_name}' 的文件扣除积分：{os.path.basename(task['file_path'])}")
+            else:
+                logging.warning(f"为发送至 '{recipient_name}' 的文件扣除积分失败：{os.path.basename(task['file_path'])}")
+        self.set_task_state(recorded, STATE_LOGGED)
+        # 所有接收者都发送完成后安排延迟删除文件
+        for task in recorded:
+            self.release_file(task['file_path'])
+
+    @staticmethod
+    def upload_key(task) -> Optional[str]:
+        """上传的记账标识：上传日志记录 ID 加文件路径，没有日志记录时返回 None（不去重）。"""
+        if task.get('journal_id') is None:
+            return None
+        return f"{task['journal_id']}:{os.path.abspath(task['file_path'])}"
+
+    def recover_unfinished_uploads(self):
         """
-        扣除积分。
+        处理上次运行中未完成的上传记录：已发送的文件补做扣分和记录；发送过但未确认的文件先核对接收者的聊天窗口，
+        窗口中已有该文件的视为已发送，其余文件放入重试队列重新发送。
         """
         try:
-            if recipient_type == 'group':
-                # 检查群组类型
-                if not group_type:
-                    # 如果 group_type 未提供，尝试从数据库获取
-                    group_info = self.point_manager.get_group_info(recipient_name)
-                    if group_info:
-                        group_type = 'whole' if group_info['is_whole'] else 'non-whole'
-                    else:
-                        logging.error(f"群组 '{recipient_name}' 信息未找到，无法扣除积分。")
-                        return
-
-                if group_type == 'whole':
-                    # 整体性群组，从群组中扣除积分
-                    success = self.point_manager.deduct_whole_group_points(recipient_name, points=1)
-                    if success:
-                        logging.info(f"已从整体性群组 '{recipient_name}' 中扣除积分。")
-                    else:
-                        logging.warning(f"从整体性群组 '{recipient_name}' 中扣除积分失败。")
-                elif group_type == 'non-whole':
-                    # 非整体性群组，从发送者中扣除积分
-                    if sender_nickname:
-                        success = self.point_manager.deduct_user_points(recipient_name, sender_nickname, points=1)
-                        if success:
-                            logging.info(f"已从非整体性群组 '{recipient_name}' 的成员 '{sender_nickname}' 中扣除积分。")
-                        else:
-                            logging.warning(f"从非整体性群组 '{recipient_name}' 的成员 '{sender_nickname}' 中扣除积分失败。")
-                    else:
-                        logging.error("缺少发送者昵称，无法从非整体性群组成员中扣除积分。")
-                else:
-                    logging.error(f"未知的群组类型 '{group_type}'，无法扣除积分。")
-            elif recipient_type == 'individual':
-                # 个人用户，从个人接收者中扣除积分
-                success = self.point_manager.deduct_recipient_points(recipient_name, points=1)
-                if success:
-                    logging.info(f"已从个人接收者 '{recipient_name}' 中扣除积分。")
+            purged = self.journal.purge()
+            if purged:
+                logging.info(f"已清理 {purged} 条过期的上传记录")
+            purged = self.point_manager.purge_recorded_uploads()
+            if purged:
+                logging.info(f"已清理 {purged} 条过期的上传记账标识")
+            items = self.journal.unfinished()
+        except Exception as e:
+            logging.error(f"读取上传日志时出错：{e}", exc_info=True)
+            return
+        if not items:
+            return
+
+        logging.info(f"发现 {len(items)} 个未完成的上传记录，开始恢复")
+        recipient_items = {}
+        for item in items:
+            task = {
+                'file_path': item['file_path'],
+                'soft_id': item['soft_id'],
+                'recipient_type': item['recipient_type'],
+                'sender_nickname': item['sender_nickname'],
+                'group_type': item['group_type'],
+                'journal_id': item['id'],
+                'state': item['state']
+            }
+            recipient_items.setdefault(item['recipient_name'], []).append((task, item['attempts']))
+            with self.lock:
+                self.file_refs[item['file_path']] = self.file_refs.get(item['file_path'], 0) + 1
+
+        for recipient_name, entries in recipient_items.items():
+            sent_messages = None
+            if any(task['state'] == STATE_PENDING and attempts > 0 for task, attempts in entries):
+                sent_messages = self.find_sent_messages(recipient_name)
+
+            resend_tasks, sent_tasks = [], []
+            for task, attempts in entries:
+                if task['state'] == STATE_PENDING and attempts > 0 and sent_messages:
+                    file_name = os.path.basename(task['file_path'])
+                    if any(file_name in message for message in sent_messages):
+                        logging.info(f"聊天窗口中已有文件 {file_name}，视为已发送给 '{recipient_name}'")
+                        self.set_task_state([task], STATE_SENT)
+                if task['state'] == STATE_PENDING:
+                    resend_tasks.append(task)
                 else:
-                    logging.warning(f"从个人接收者 '{recipient_name}' 中扣除积分失败。")
+                    sent_tasks.append(task)
+            self.record_uploaded_files(recipient_name, sent_tasks)
+
+            if resend_tasks:
+                logging.info(f"重新发送 {len(resend_tasks)} 个未确认的文件至接收者 '{recipient_name}'")
+                self.retry_queue.put((recipient_name, resend_tasks, 1))
+
+    def find_sent_messages(self, recipient_name) -> Optional[List[str]]:
+        """
+        打开接收者的聊天窗口，返回当前加载的自己发送的消息内容，用于核对文件是否已发送。
+        无法读取聊天记录时返回 None。
+        """
+        try:
+            self.upload_scheduler.note_chat(recipient_name)
+            self.wx.ChatWith(who=recipient_name)
+            time.sleep(0.5)  # 等待窗口激活完成
+            messages = self.wx.GetAllMessage()
+            return [message.content for message in messages if getattr(message, 'type', '') == 'self']
         except Exception as e:
-            logging.error(f"扣除积分时发生错误：{e}", exc_info=True)
-            self.error_handler.handle_exception(e)
+            logging.warning(f"读取接收者 '{recipient_name}' 的聊天记录失败，未确认的文件将重新发送：{e}")
+            return None
 
     def add_recipient(self, recipient_name: str, initial_count: int) -> str:
         """
@@ -357,7 +542,12 @@ class Uploader:
         """停止上传线程并清理资源。"""
         self.stop_event.set()
         self.upload_thread.join()
-        self.delete_thread.join()  # 确保文件删除线程正常关闭
+        # 调度器中尚未发送的文件保留在上传日志中，下次启动时继续发送
+        self.upload_scheduler.log_metrics()
+        for backend in self.backends:
+            backend.close()
+        self.media_cache.flush()
+        self.journal.close()
         self.point_manager.close()
         logging.info("Uploader 已停止并清理资源")
 
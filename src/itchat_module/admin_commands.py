@@ -4,15 +4,21 @@ import os
 from typing import Optional, List
 from datetime import datetime, timezone
 from src.config.config_manager import ConfigManager
+from src.itchat_module.command_router import CommandExecutor, CommandJob, CommandRouter
+
+ADMIN_URL_PATTERN = re.compile(r'https?://(?:www\.|m\.)?zxxk\.com/soft/\d+\.html(?:[?#]\S+)?')
+SOFT_ID_PATTERN = re.compile(r'/soft/(\d+)\.html')
 
 
 class AdminCommandsHandler:
-    def __init__(self, config, point_manager, notifier=None, browser_controller=None, error_handler=None):
+    def __init__(self, config, point_manager, notifier=None, browser_controller=None, error_handler=None,
+                 download_queue=None):
         self.config = config
         self.point_manager = point_manager
         self.notifier = notifier
         self.browser_controller = browser_controller
         self.error_handler = error_handler
+        self.download_queue = download_queue  # 用于查询下载队列的指标
         self.help_templates = {
             # 【数据库命令】
             '1': "更新个人积分 <个人名称> <变化量>",
@@ -43,80 +49,98 @@ class AdminCommandsHandler:
             '22': "查询所有实例状态",
             '23': "检查所有实例状态",
             '24': "设置实例需要管理员介入 <实例ID> <True/False>",
+            '25': "查询后台命令",
+            '26': "查询下载队列",
+            '27': "取消下载 <soft_id>",
+            '28': "取消群组下载 <群组名称>",
         }
-        self.commands = {
-            # 数据库命令
-            'update_individual_points': r'^更新个人积分\s+(\S+)\s+([+-]?\d+)$',
-            'update_non_whole_group_points': r'^更新群组积分\s+(\S+)\s+([+-]?\d+)$',
-            'update_user_points': r'^更新用户积分\s+群组名:\s*(\S+)\s+昵称:\s*(\S+)\s*积分:\s*([+-]?\d+)$',
-
-            # 新增查询积分命令
-            'query_individual_points': r'^查询个人积分\s+(\S+)$',
-            'query_whole_group_points': r'^查询群组积分\s+(\S+)$',
-            'query_user_points': r'^查询用户积分\s+群组名:\s*(\S+)\s+昵称:\s*(\S+)$',
-
-            # 配置文件命令
-            'add_monitor_group': r'^添加监听群组\s+(.+)$',
-            'remove_monitor_group': r'^删除监听群组\s+(.+)$',
-            'add_monitor_individual': r'^添加监听个人\s+(.+)$',
-            'remove_monitor_individual': r'^删除监听个人\s+(.+)$',
-            'add_whole_group': r'^添加整体群组\s+(.+)$',
-            'remove_whole_group': r'^删除整体群组\s+(.+)$',
-            'add_non_whole_group': r'^添加非整体群组\s+(.+)$',
-            'remove_non_whole_group': r'^删除非整体群组\s+(.+)$',
-
-            # 其他命令
-            'help': r'^帮助$|^help$',
-            'query_logs': r'^查询日志$|^query logs$',
-            'disable_all_instances': r'^禁用全部实例$|^disable all instances$',
-
-            # 新增下载份数查询命令
-            'query_group_today_downloads': r'^查询群组\s+(\S+)\s+今天\s+下载份数$',
-            'query_group_this_week_downloads': r'^查询群组\s+(\S+)\s+这周\s+下载份数$',
-            'query_group_last_week_downloads': r'^查询群组\s+(\S+)\s+上周\s+下载份数$',
-            'query_group_this_month_downloads': r'^查询群组\s+(\S+)\s+这个月\s+下载份数$',
-            'query_group_last_month_downloads': r'^查询群组\s+(\S+)\s+上个月\s+下载份数$',
-
-            'query_individual_today_downloads': r'^查询个人\s+(\S+)\s+今天\s+下载份数$',
-            'query_individual_this_week_downloads': r'^查询个人\s+(\S+)\s+这周\s+下载份数$',
-            'query_individual_last_week_downloads': r'^查询个人\s+(\S+)\s+上周\s+下载份数$',
-            'query_all_groups_today_downloads': r'^查询所有群组今天下载量$',
-            'query_all_groups_this_week_downloads': r'^查询所有群组这周下载量$',
-            'query_current_account_usage': r'^查询当前账号使用情况$',
-            'check_all_instances_status': r'^检查所有实例状态$|^check all instances status$',
-            'query_all_instances_status': r'^查询所有实例状态$|^query all instances status$',
-            'set_instance_admin_intervention': r'^设置实例需要管理员介入\s+(\S+)\s+(\S+)$',
-        }
+        # 命令按关键字前缀树分派，参数解析正则预先编译；耗时的命令在后台线程中执行
+        self.router = self.build_router()
+        self.executor = CommandExecutor(max_workers=2, on_done=self.reply_job)
+
+    def build_router(self) -> CommandRouter:
+        """注册全部管理员命令"""
+        router = CommandRouter()
+        # 数据库命令
+        router.add('update_individual_points', '更新个人积分', r'\s+(\S+)\s+([+-]?\d+)$',
+                   self.update_individual_points)
+        router.add('update_non_whole_group_points', '更新群组积分', r'\s+(\S+)\s+([+-]?\d+)$',
+                   self.update_group_points)
+        router.add('update_user_points', '更新用户积分', r'\s+群组名:\s*(\S+)\s+昵称:\s*(\S+)\s*积分:\s*([+-]?\d+)$',
+                   self.update_user_points)
+
+        # 查询积分命令
+        router.add('query_individual_points', '查询个人积分', r'\s+(\S+)$', self.query_individual_points)
+        router.add('query_whole_group_points', '查询群组积分', r'\s+(\S+)$', self.query_group_points)
+        router.add('query_user_points', '查询用户积分', r'\s+群组名:\s*(\S+)\s+昵称:\s*(\S+)$', self.query_user_points)
+
+        # 配置文件命令
+        router.add('add_monitor_group', '添加监听群组', r'\s+(.+)$',
+                   lambda names: self.modify_monitor_groups(names, 'add'))
+        router.add('remove_monitor_group', '删除监听群组', r'\s+(.+)$',
+                   lambda names: self.modify_monitor_groups(names, 'remove'))
+        router.add('add_monitor_individual', '添加监听个人', r'\s+(.+)$',
+                   lambda names: self.modify_monitor_individuals(names, 'add'))
+        router.add('remove_monitor_individual', '删除监听个人', r'\s+(.+)$',
+                   lambda names: self.modify_monitor_individuals(names, 'remove'))
+        router.add('add_whole_group', '添加整体群组', r'\s+(.+)$',
+                   lambda names: self.modify_group_type(names, 'whole', 'add'))
+        router.add('remove_whole_group', '删除整体群组', r'\s+(.+)$',
+                   lambda names: self.modify_group_type(names, 'whole', 'remove'))
+        router.add('add_non_whole_group', '添加非整体群组', r'\s+(.+)$',
+                   lambda names: self.modify_group_type(names, 'non_whole', 'add'))
+        router.add('remove_non_whole_group', '删除非整体群组', r'\s+(.+)$',
+                   lambda names: self.modify_group_type(names, 'non_whole', 'remove'))
+
+        # 其他命令
+        router.add('help', ['帮助', 'help'], r'$', self.get_help_message)
+        router.add('query_logs', ['查询日志', 'query logs'], r'$', self.query_logs, background=True)
+        router.add('query_background_commands', '查询后台命令', r'$', self.query_background_commands)
+        router.add('query_download_queue', '查询下载队列', r'$', self.query_download_queue)
+        router.add('cancel_soft_id_download', '取消下载', r'\s+(\d+)$', self.cancel_soft_id_download)
+        router.add('cancel_recipient_download', ['取消群组下载', '取消个人下载'], r'\s+(.+)$',
+                   self.cancel_recipient_download)
+
+        # 下载份数查询命令
+        router.add('query_group_downloads', '查询群组', r'\s+(\S+)\s+(今天|这周|上周|这个月|上个月)\s+下载份数$',
+                   lambda name, period: self.query_download_count('whole_group', '群组', name, period))
+        router.add('query_individual_downloads', '查询个人', r'\s+(\S+)\s+(今天|这周|上周)\s+下载份数$',
+                   lambda name, period: self.query_download_count('individual', '个人', name, period))
+        router.add('query_all_groups_today_downloads', '查询所有群组今天下载量', r'$',
+                   lambda: self.query_all_groups_downloads('今天'))
+        router.add('query_all_groups_this_week_downloads', '查询所有群组这周下载量', r'$',
+                   lambda: self.query_all_groups_downloads('这周'))
+
+        # 实例管理命令：操作浏览器实例，耗时较长，在后台执行
+        router.add('disable_all_instances', ['禁用全部实例', 'disable all instances'], r'$',
+                   lambda: self.browser_controller.disable_all_instances(), background=True)
+        router.add('query_current_account_usage', '查询当前账号使用情况', r'$',
+                   lambda: self.browser_controller.get_current_account_usage(), background=True)
+        router.add('check_all_instances_status', ['检查所有实例状态', 'check all instances status'], r'$',
+                   self.check_all_instances_status, background=True)
+        router.add('query_all_instances_status', ['查询所有实例状态', 'query all instances status'], r'$',
+                   self.query_all_instances_status, background=True)
+        router.add('set_instance_admin_intervention', '设置实例需要管理员介入', r'\s+(\S+)\s+(\S+)$',
+                   lambda instance_id, status: self.browser_controller.set_instance_admin_intervention(
+                       instance_id, status.lower() == 'true'))
+        return router
 
     def handle_command(self, message: str) -> Optional[str]:
-        """处理管理员发送的命令并执行相应操作"""
+        """
+        处理管理员发送的命令并执行相应操作。
+        包含资料链接的消息查询该 soft_id 的日志，其余消息按命令处理。
+        在后台执行的命令立即返回任务编号，执行结束后再把结果发送给管理员。
+        """
         message = message.strip()  # 去除前后空格
-        # 首先检测消息是否包含链接
+        # 首先检测消息是否包含链接，有链接时查询第一个链接的日志
         links = self.extract_urls(message)
         if links:
-            for link in links:
-                logging.info(f"检测到链接: {link}")
-                soft_id = self.extract_soft_id_from_url(link)
-                if soft_id:
-                    try:
-                        logs = self.get_soft_id_logs(soft_id)
-                    except Exception as e:
-                        logging.error(f"获取 soft_id '{soft_id}' 的日志时出错: {e}")
-                        return "获取日志时发生错误，请稍后再试。"
-
-                    if logs.strip():
-                        MAX_LOG_LENGTH = 4000  # 根据实际平台调整
-                        if len(logs) > MAX_LOG_LENGTH and self.notifier:
-                            self.send_long_message(logs)
-                            return "已分段发送与该 soft_id 相关的日志。"
-                        else:
-                            return logs
-                    else:
-                        return f"未找到与 soft_id '{soft_id}' 相关的日志。"
-                else:
-                    return "无法从提供的链接中提取 soft_id，请检查链接格式。"
-        else:
-            return "消息中未检测到有效的链接。"
+            logging.info(f"检测到链接: {links[0]}")
+            soft_id = self.extract_soft_id_from_url(links[0])
+            if not soft_id:
+                return "无法从提供的链接中提取 soft_id，请检查链接格式。"
+            return self.run_command(f"查询 soft_id {soft_id} 的日志", self.query_soft_id_logs, (soft_id,),
+                                    background=True)
 
         # 检查是否为数字，发送对应的命令模板
         if message.isdigit():
@@ -126,204 +150,172 @@ class AdminCommandsHandler:
             else:
                 return "无效的命令序号，请输入帮助命令查看可用命令列表。"
 
-        for cmd, pattern in self.commands.items():
-            match = re.match(pattern, message)
-            if match:
-                logging.debug(f"匹配到命令: {cmd}，参数: {match.groups()}")
-                try:
-                    if cmd == 'update_individual_points':
-                        # 处理逻辑
-                        name, delta = match.groups()
-                        delta = int(delta)
-                        success = self.point_manager.update_recipient_points(name, delta)
-                        if success:
-                            return f"个人 '{name}' 的剩余积分已更新，变化量为 {delta}。"
-                        else:
-                            return f"个人 '{name}' 的积分更新失败。"
-
-                    elif cmd == 'update_non_whole_group_points':
-                        # 处理逻辑
-                        group_name, delta = match.groups()
-                        delta = int(delta)
-                        success = self.point_manager.update_group_points(group_name, delta)
-                        if success:
-                            return f"整体群组 '{group_name}' 的剩余积分已更新，变化量为 {delta}。"
-                        else:
-                            return f"整体群组 '{group_name}' 的积分更新失败。"
-
-                    elif cmd == 'update_user_points':
-                        # 处理逻辑
-                        group_name, nickname, points = match.groups()
-                        points = int(points) if points else 0
-                        group_exists = self.point_manager.get_group_info(group_name)
-                        if not group_exists:
-                            return f"群组 '{group_name}' 不存在，无法更新用户积分。请先添加群组。"
-                        success = self.point_manager.update_user_points(group_name, nickname, points)
-                        if success:
-                            return f"用户 '{nickname}' 在群组 '{group_name}' 的积分已更新，变化量为 {points}。"
-                        else:
-                            return f"用户 '{nickname}' 的积分更新失败。"
-
-                    # 查询积分命令
-                    elif cmd == 'query_individual_points':
-                        (name,) = match.groups()
-                        points = self.point_manager.get_individual_points(name)
-                        if points is not None:
-                            return f"个人 '{name}' 当前的积分为 {points}。"
-                        else:
-                            return f"未找到个人 '{name}' 的积分信息。"
-
-                    elif cmd == 'query_whole_group_points':
-                        (group_name,) = match.groups()
-                        points = self.point_manager.get_group_points(group_name)
-                        if points is not None:
-                            return f"整体群组 '{group_name}' 当前的积分为 {points}。"
-                        else:
-                            return f"未找到整体群组 '{group_name}' 的积分信息。"
-
-                    elif cmd == 'query_user_points':
-                        group_name, nickname = match.groups()
-                        points = self.point_manager.get_user_points(group_name, nickname)
-                        if points is not None:
-                            return f"用户 '{nickname}' 在群组 '{group_name}' 当前的积分为 {points}。"
-                        else:
-                            return f"未找到用户 '{nickname}' 在群组 '{group_name}' 的积分信息。"
-
-                    elif cmd == 'disable_all_instances':
-                        # 禁用全部实例
-                        response = self.browser_controller.disable_all_instances()
-                        return response
-
-                    elif cmd == 'query_current_account_usage':
-                        # 查询当前账号使用情况
-                        usage_info = self.browser_controller.get_current_account_usage()
-                        return usage_info
-
-                    # 下载份数查询命令处理逻辑
-                    elif cmd.startswith('query_group') and cmd.endswith('_downloads'):
-                        group_name = match.group(1)
-                        recipient_type = 'whole_group'  # 假设群组都是整体性群组
-                        if cmd == 'query_group_today_downloads':
-                            count = self.point_manager.get_today_download_count(recipient_type, group_name)
-                            return f"群组 '{group_name}' 今天的下载份数为 {count}。"
-                        elif cmd == 'query_group_this_week_downloads':
-                            count = self.point_manager.get_week_download_count(recipient_type, group_name)
-                            return f"群组 '{group_name}' 这周的下载份数为 {count}。"
-                        elif cmd == 'query_group_last_week_downloads':
-                            count = self.point_manager.get_last_week_download_count(recipient_type, group_name)
-                            return f"群组 '{group_name}' 上周的下载份数为 {count}。"
-                        elif cmd == 'query_group_this_month_downloads':
-                            count = self.point_manager.get_month_download_count(recipient_type, group_name)
-                            return f"群组 '{group_name}' 这个月的下载份数为 {count}。"
-                        elif cmd == 'query_group_last_month_downloads':
-                            count = self.point_manager.get_last_month_download_count(recipient_type, group_name)
-                            return f"群组 '{group_name}' 上个月的下载份数为 {count}。"
-
-                    elif cmd.startswith('query_individual') and cmd.endswith('_downloads'):
-                        individual_name = match.group(1)
-                        recipient_type = 'individual'
-                        if cmd == 'query_individual_today_downloads':
-                            count = self.point_manager.get_today_download_count(recipient_type, individual_name)
-                            return f"个人 '{individual_name}' 今天的下载份数为 {count}。"
-                        elif cmd == 'query_individual_this_week_downloads':
-                            count = self.point_manager.get_week_download_count(recipient_type, individual_name)
-                            return f"个人 '{individual_name}' 这周的下载份数为 {count}。"
-                        elif cmd == 'query_individual_last_week_downloads':
-                            count = self.point_manager.get_last_week_download_count(recipient_type, individual_name)
-                            return f"个人 '{individual_name}' 上周的下载份数为 {count}。"
-                        elif cmd == 'query_individual_this_month_downloads':
-                            count = self.point_manager.get_month_download_count(recipient_type, individual_name)
-                            return f"个人 '{individual_name}' 这个月的下载份数为 {count}。"
-                        elif cmd == 'query_individual_last_month_downloads':
-                            count = self.point_manager.get_last_month_download_count(recipient_type, individual_name)
-                            return f"个人 '{individual_name}' 上个月的下载份数为 {count}。"
-
-                    elif cmd == 'query_all_groups_today_downloads':
-                        counts = self.point_manager.get_all_groups_today_download_counts()
-                        if counts:
-                            message_lines = ["所有群组今天的下载量："]
-                            for item in counts:
-                                message_lines.append(f"群组 '{item['group_name']}': {item['download_count']} 次")
-                            return '\n'.join(message_lines)
-                        else:
-                            return "没有群组的下载记录。"
-
-                    elif cmd == 'query_all_groups_this_week_downloads':
-                        counts = self.point_manager.get_all_groups_week_download_counts()
-                        if counts:
-                            message_lines = ["所有群组这周的下载量："]
-                            for item in counts:
-                                message_lines.append(f"群组 '{item['group_name']}': {item['download_count']} 次")
-                            return '\n'.join(message_lines)
-                        else:
-                            return "没有群组的下载记录。"
-
-                    # 处理非配置文件相关的管理员命令
-                    elif cmd == 'query_all_instances_status':
-                        status = self.browser_controller.query_all_instances_status()
-                        logging.info("查询所有实例状态成功")
-                        return status
-
-                    elif cmd == 'check_all_instances_status':
-                        self.browser_controller.check_instances_status()
-                        return "已执行所有实例的状态检查。"
-
-                    elif cmd == 'set_instance_admin_intervention':
-                        instance_id, status_str = match.groups()
-                        status = True if status_str.lower() == 'true' else False
-                        response = self.browser_controller.set_instance_admin_intervention(instance_id, status)
-                        return response
-
-                    # 配置文件命令处理逻辑
-                    elif cmd in ['add_monitor_group', 'remove_monitor_group',
-                                 'add_monitor_individual', 'remove_monitor_individual',
-                                 'add_whole_group', 'remove_whole_group',
-                                 'add_non_whole_group', 'remove_non_whole_group']:
-                        if cmd.startswith('add_monitor_group') or cmd.startswith('remove_monitor_group'):
-                            group_names = match.group(1)
-                            action = 'add' if 'add' in cmd else 'remove'
-                            return self.modify_monitor_groups(group_names, action)
-
-                        elif cmd.startswith('add_monitor_individual') or cmd.startswith('remove_monitor_individual'):
-                            individual_names = match.group(1)
-                            action = 'add' if 'add' in cmd else 'remove'
-                            return self.modify_monitor_individuals(individual_names, action)
-
-                        elif cmd.startswith('add_whole_group') or cmd.startswith('remove_whole_group'):
-                            group_names = match.group(1)
-                            group_type = 'whole'
-                            action = 'add' if 'add' in cmd else 'remove'
-                            return self.modify_group_type(group_names, group_type, action)
-
-                        elif cmd.startswith('add_non_whole_group') or cmd.startswith('remove_non_whole_group'):
-                            group_names = match.group(1)
-                            group_type = 'non_whole'
-                            action = 'add' if 'add' in cmd else 'remove'
-                            return self.modify_group_type(group_names, group_type, action)
-
-                    # 其他命令处理逻辑
-                    elif cmd == 'help':
-                        return self.get_help_message()
-
-                    elif cmd == 'query_logs':
-                        if self.notifier:
-                            logs = self.get_last_n_logs(20)
-                            if logs:
-                                self.send_long_message(logs)
-                            else:
-                                self.notifier.notify("无法读取日志文件或日志文件为空。")
-                        else:
-                            logging.error("Notifier 未设置，无法发送日志。")
-                        return None
-
-                except Exception as e:
-                    logging.error(f"执行命令 '{cmd}' 时发生错误: {e}", exc_info=True)
-                    if self.error_handler:
-                        self.error_handler.handle_exception(e)
-                    return f"执行命令时发生错误: {e}"
-
-        logging.warning(f"未知的管理员命令：{message}")
-        return "未知的命令，请检查命令格式。"
+        matched = self.router.match(message)
+        if matched is None:
+            logging.warning(f"未知的管理员命令：{message}")
+            return "未知的命令，请检查命令格式。"
+        command, args = matched
+        logging.debug(f"匹配到命令: {command.name}，参数: {args}")
+        return self.run_command(command.keyword, command.handler, args, command.background)
+
+    def run_command(self, name: str, handler, args, background: bool) -> Optional[str]:
+        """
+        执行命令。后台命令提交到 CommandExecutor 并返回任务编号；
+        未设置 Notifier 时无法在结束后回复，后台命令也在当前线程执行。
+        """
+        if background and self.notifier:
+            job = self.executor.submit(name, handler, *args)
+            return f"命令「{name}」已在后台执行（任务 {job.job_id}），完成后发送结果。发送“查询后台命令”查看进度。"
+        try:
+            return handler(*args)
+        except Exception as e:
+            logging.error(f"执行命令 '{name}' 时发生错误: {e}", exc_info=True)
+            if self.error_handler:
+                self.error_handler.handle_exception(e)
+            return f"执行命令时发生错误: {e}"
+
+    def reply_job(self, job: CommandJob, result: Optional[str], error: Optional[Exception]):
+        """后台命令结束后，把结果或错误发送给管理员"""
+        if error is not None:
+            if self.error_handler:
+                self.error_handler.handle_exception(error)
+            self.notifier.notify(f"任务 {job.job_id}「{job.name}」执行时发生错误: {error}")
+        elif result:
+            self.send_long_message(result)
+
+    def stop(self):
+        """停止接收后台命令，不等待执行中的命令"""
+        self.executor.stop(wait=False)
+
+    def update_individual_points(self, name: str, delta: str) -> str:
+        delta = int(delta)
+        success = self.point_manager.update_recipient_points(name, delta)
+        if success:
+            return f"个人 '{name}' 的剩余积分已更新，变化量为 {delta}。"
+        else:
+            return f"个人 '{name}' 的积分更新失败。"
+
+    def update_group_points(self, group_name: str, delta: str) -> str:
+        delta = int(delta)
+        success = self.point_manager.update_group_points(group_name, delta)
+        if success:
+            return f"整体群组 '{group_name}' 的剩余积分已更新，变化量为 {delta}。"
+        else:
+            return f"整体群组 '{group_name}' 的积分更新失败。"
+
+    def update_user_points(self, group_name: str, nickname: str, points: str) -> str:
+        points = int(points) if points else 0
+        group_exists = self.point_manager.get_group_info(group_name)
+        if not group_exists:
+            return f"群组 '{group_name}' 不存在，无法更新用户积分。请先添加群组。"
+        success = self.point_manager.update_user_points(group_name, nickname, points)
+        if success:
+            return f"用户 '{nickname}' 在群组 '{group_name}' 的积分已更新，变化量为 {points}。"
+        else:
+            return f"用户 '{nickname}' 的积分更新失败。"
+
+    def query_individual_points(self, name: str) -> str:
+        points = self.point_manager.get_individual_points(name)
+        if points is not None:
+            return f"个人 '{name}' 当前的积分为 {points}。"
+        else:
+            return f"未找到个人 '{name}' 的积分信息。"
+
+    def query_group_points(self, group_name: str) -> str:
+        points = self.point_manager.get_group_points(group_name)
+        if points is not None:
+            return f"整体群组 '{group_name}' 当前的积分为 {points}。"
+        else:
+            return f"未找到整体群组 '{group_name}' 的积分信息。"
+
+    def query_user_points(self, group_name: str, nickname: str) -> str:
+        points = self.point_manager.get_user_points(group_name, nickname)
+        if points is not None:
+            return f"用户 '{nickname}' 在群组 '{group_name}' 当前的积分为 {points}。"
+        else:
+            return f"未找到用户 '{nickname}' 在群组 '{group_name}' 的积分信息。"
+
+    def query_download_count(self, recipient_type: str, label: str, name: str, period: str) -> str:
+        """查询群组（按整体性群组统计）或个人在时间段内的下载份数"""
+        count_method = {
+            '今天': self.point_manager.get_today_download_count,
+            '这周': self.point_manager.get_week_download_count,
+            '上周': self.point_manager.get_last_week_download_count,
+            '这个月': self.point_manager.get_month_download_count,
+            '上个月': self.point_manager.get_last_month_download_count,
+        }[period]
+        count = count_method(recipient_type, name)
+        return f"{label} '{name}' {period}的下载份数为 {count}。"
+
+    def query_all_groups_downloads(self, period: str) -> str:
+        if period == '今天':
+            counts = self.point_manager.get_all_groups_today_download_counts()
+        else:
+            counts = self.point_manager.get_all_groups_week_download_counts()
+        if counts:
+            message_lines = [f"所有群组{period}的下载量："]
+            for item in counts:
+                message_lines.append(f"群组 '{item['group_name']}': {item['download_count']} 次")
+            return '\n'.join(message_lines)
+        else:
+            return "没有群组的下载记录。"
+
+    def query_all_instances_status(self) -> str:
+        status = self.browser_controller.query_all_instances_status()
+        logging.info("查询所有实例状态成功")
+        return status
+
+    def check_all_instances_status(self) -> str:
+        self.browser_controller.check_instances_status()
+        return "已执行所有实例的状态检查。"
+
+    def query_logs(self) -> Optional[str]:
+        """返回最近 20 行日志，由调用方分段发送"""
+        if not self.notifier:
+            logging.error("Notifier 未设置，无法发送日志。")
+            return None
+        return self.get_last_n_logs(20) or "无法读取日志文件或日志文件为空。"
+
+    def query_soft_id_logs(self, soft_id: str) -> str:
+        """返回当天日志中与 soft_id 相关的日志行"""
+        try:
+            logs = self.get_soft_id_logs(soft_id)
+        except Exception as e:
+            logging.error(f"获取 soft_id '{soft_id}' 的日志时出错: {e}")
+            return "获取日志时发生错误，请稍后再试。"
+        if logs.strip():
+            return logs
+        return f"未找到与 soft_id '{soft_id}' 相关的日志。"
+
+    def query_background_commands(self) -> str:
+        """列出后台命令的进度"""
+        jobs = self.executor.jobs()
+        if not jobs:
+            return "没有后台命令。"
+        return '\n'.join(["后台命令："] + [job.describe() for job in jobs])
+
+    def query_download_queue(self) -> str:
+        """按优先级通道列出下载队列的排队数和等待时间"""
+        if self.download_queue is None:
+            return "下载队列未设置。"
+        return (f"{self.download_queue.queue.format_metrics()}\n"
+                f"分派前已放弃 {self.download_queue.dropped} 个已取消或过期的任务")
+
+    def cancel_soft_id_download(self, soft_id: str) -> str:
+        """取消 soft_id 的全部请求，排队和进行中的下载随之放弃"""
+        if not self.browser_controller:
+            return "下载管理器未设置，无法取消下载。"
+        result = self.browser_controller.cancel_downloads(soft_id=soft_id)
+        logging.info(result)
+        return result
+
+    def cancel_recipient_download(self, recipient_name: str) -> str:
+        """取消群组或个人的全部请求，没有其他请求者的资料随之停止下载"""
+        if not self.browser_controller:
+            return "下载管理器未设置，无法取消下载。"
+        result = self.browser_controller.cancel_downloads(recipient_name=recipient_name.strip())
+        logging.info(result)
+        return result
 
     def modify_monitor_groups(self, group_names: str, action: str) -> str:
         """添加或删除监听群组"""
@@ -531,6 +523,19 @@ class AdminCommandsHandler:
             "24. 设置实例需要管理员介入 <实例ID> <True/False>\n"
             "    示例：设置实例需要管理员介入 xkw1 True\n\n"
 
+            "25. 查询后台命令\n"
+            "    查询日志、实例状态等耗时命令在后台执行，完成后发送结果；此命令查看执行进度\n\n"
+
+            "26. 查询下载队列\n"
+            "    查看管理员、个人、群组三个通道的排队数和等待时间\n\n"
+
+            "27. 取消下载 <soft_id>\n"
+            "    示例：取消下载 12345678\n\n"
+
+            "28. 取消群组下载 <群组名称>\n"
+            "    取消该群组（个人使用“取消个人下载”）所有等待中的下载请求\n"
+            "    示例：取消群组下载 群组A\n\n"
+
             "📄 【命令模板】\n"
             "发送序号以获取对应的命令模板。\n"
             "例如，发送 '1' 获取命令模板。"
@@ -585,8 +590,7 @@ class AdminCommandsHandler:
         返回:
         - URL字符串列表，若未找到则返回空列表。
         """
-        url_pattern = r'https?://(?:www\.|m\.)?zxxk\.com/soft/\d+\.html(?:[?#]\S+)?'
-        return re.findall(url_pattern, message)
+        return ADMIN_URL_PATTERN.findall(message)
 
     def extract_soft_id_from_url(self, url: str) -> Optional[str]:
         """
@@ -598,8 +602,7 @@ class AdminCommandsHandler:
         返回:
         - 提取到的 soft_id，若未找到则返回 None。
         """
-        pattern = r'/soft/(\d+)\.html'
-        match = re.search(pattern, url)
+        match = SOFT_ID_PATTERN.search(url)
         if match:
             soft_id = match.group(1)
             logging.info(f"从链接中提取到 soft_id: {soft_id}")
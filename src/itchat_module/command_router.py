@@ -0,0 +1,191 @@
+# src/itchat_module/command_router.py
+
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Command:
+    """
+    一条管理员命令：命令关键字、预编译的参数解析正则和处理函数。
+
+    参数解析正则从关键字之后开始匹配，分组即处理函数的参数；background 为 True 的命令在后台线程中执行。
+    """
+
+    __slots__ = ('name', 'keyword', 'args', 'handler', 'background')
+
+    def __init__(self, name: str, keyword: str, args: str, handler: Callable, background: bool):
+        self.name = name
+        self.keyword = keyword
+        self.args = re.compile(args)
+        self.handler = handler
+        self.background = background
+
+    def parse(self, message: str) -> Optional[Tuple]:
+        """解析关键字之后的参数，格式不符时返回 None。"""
+        match = self.args.match(message, len(self.keyword))
+        return match.groups() if match else None
+
+    def __repr__(self):
+        return f"<Command {self.name} keyword={self.keyword!r} background={self.background}>"
+
+
+class _TrieNode:
+    __slots__ = ('children', 'commands')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.commands: List[Command] = []
+
+
+class CommandRouter:
+    """
+    按命令关键字的前缀树分派管理员命令。
+
+    消息沿前缀树逐字匹配，只有关键字是消息前缀的命令才会解析参数，关键字较长的命令优先；
+    不必对每条消息依次尝试全部命令的正则。同一个命令可以注册多个关键字（例如中文和英文）。
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.commands: List[Command] = []
+
+    def add(self, name: str, keywords, args: str, handler: Callable, background: bool = False):
+        """
+        注册命令。
+
+        参数:
+        - name: 命令名称，用于日志。
+        - keywords: 命令关键字，字符串或字符串列表。
+        - args: 关键字之后的参数解析正则，应以 $ 结尾，没有参数时为 r'$'。
+        - handler: 处理函数，参数为解析出的分组，返回回复内容。
+        - background: 是否在后台线程中执行。
+        """
+        for keyword in ([keywords] if isinstance(keywords, str) else keywords):
+            command = Command(name, keyword, args, handler, background)
+            node = self.root
+            for char in keyword:
+                node = node.children.setdefault(char, _TrieNode())
+            node.commands.append(command)
+            self.commands.append(command)
+
+    def match(self, message: str) -> Optional[Tuple[Command, Tuple]]:
+        """返回 (命令, 参数)，没有匹配的命令时返回 None。"""
+        candidates = []
+        node = self.root
+        for char in message:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.commands:
+                candidates.append(node.commands)
+        for commands in reversed(candidates):
+            for command in commands:
+                args = command.parse(message)
+                if args is not None:
+                    return command, args
+        return None
+
+
+class CommandJob:
+    """
+    后台命令的进度句柄，由 CommandExecutor.submit 返回。
+
+    status 依次为 'queued'、'running'，结束后为 'done' 或 'failed'。
+    """
+
+    __slots__ = ('job_id', 'name', 'status', 'submitted_at', 'started_at', 'finished_at', 'result', 'error',
+                 'future')
+
+    def __init__(self, job_id: int, name: str):
+        self.job_id = job_id
+        self.name = name
+        self.status = 'queued'
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def elapsed(self) -> float:
+        """已执行的秒数，尚未开始时为 0。"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def describe(self) -> str:
+        status = {'queued': '排队中', 'running': '执行中', 'done': '已完成', 'failed': '失败'}[self.status]
+        return f"任务 {self.job_id}「{self.name}」{status}，已执行 {self.elapsed():.1f} 秒"
+
+    def __repr__(self):
+        return f"<CommandJob {self.job_id} {self.name} {self.status}>"
+
+
+class CommandExecutor:
+    """
+    在后台线程池中执行耗时的管理员命令，提交后立即返回进度句柄，不阻塞 itchat 的消息处理。
+    命令结束后以 (句柄, 结果, 异常) 调用 on_done，由调用方把结果回复给管理员。
+
+    参数:
+    - max_workers: 后台线程数。
+    - on_done: 命令结束后的回调。
+    - history: 保留的已结束任务数。
+    """
+
+    def __init__(self, max_workers: int = 2, on_done: Optional[Callable] = None, history: int = 20):
+        self.on_done = on_done
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='AdminCommand')
+        self.active: Dict[int, CommandJob] = {}
+        self.finished = deque(maxlen=history)
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, name: str, fn: Callable, *args) -> CommandJob:
+        """提交命令，返回进度句柄。"""
+        with self.lock:
+            job = CommandJob(next(self.counter), name)
+            self.active[job.job_id] = job
+        job.future = self.executor.submit(self._run, job, fn, args)
+        logging.info(f"管理员命令「{name}」已提交到后台执行，任务 {job.job_id}")
+        return job
+
+    def _run(self, job: CommandJob, fn: Callable, args: Tuple):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args)
+            job.status = 'done'
+        except Exception as e:
+            job.error = e
+            job.status = 'failed'
+            logging.error(f"后台执行管理员命令「{job.name}」时发生错误: {e}", exc_info=True)
+        job.finished_at = time.time()
+        with self.lock:
+            self.active.pop(job.job_id, None)
+            self.finished.append(job)
+        logging.info(job.describe())
+        if self.on_done:
+            try:
+                self.on_done(job, job.result, job.error)
+            except Exception as e:
+                logging.error(f"回复后台命令「{job.name}」的结果时发生错误: {e}", exc_info=True)
+        return job.result
+
+    def jobs(self) -> List[CommandJob]:
+        """返回执行中和排队中的任务，以及最近结束的任务。"""
+        with self.lock:
+            return sorted(self.active.values(), key=lambda job: job.job_id) + list(self.finished)
+
+    def stop(self, wait: bool = False):
+        """停止接收新命令；wait 为 True 时等待执行中的命令结束。"""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,185 @@
+# src/itchat_module/download_scheduler.py
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from src.itchat_module.routing import PRIORITY_ADMIN, PRIORITY_GROUP, PRIORITY_INDIVIDUAL
+
+# 优先级通道名称，下标即 ChatPolicy.priority，数值越小越优先
+LANE_NAMES = {PRIORITY_ADMIN: 'admin', PRIORITY_INDIVIDUAL: 'individual', PRIORITY_GROUP: 'group'}
+MIN_WEIGHT = 0.01
+
+
+class DownloadTask:
+    """一个等待分派的下载请求：链接、优先级通道、公平调度的流（群组或发送者）和入队时间。"""
+
+    __slots__ = ('url', 'lane', 'flow', 'enqueued_at')
+
+    def __init__(self, url: str, lane: int, flow: str, enqueued_at: float):
+        self.url = url
+        self.lane = lane
+        self.flow = flow
+        self.enqueued_at = enqueued_at
+
+    def __repr__(self):
+        return f"<DownloadTask {LANE_NAMES.get(self.lane, self.lane)}/{self.flow} {self.url}>"
+
+
+class _Lane:
+    __slots__ = ('flows', 'active', 'deficits', 'depth', 'enqueued', 'dispatched', 'waits')
+
+    def __init__(self, wait_samples: int):
+        self.flows: Dict[str, deque] = {}  # 流 -> 排队的任务
+        self.active = deque()  # 有排队任务的流，按轮转顺序排列
+        self.deficits: Dict[str, float] = {}  # 流 -> 本轮剩余的可分派任务数
+        self.depth = 0
+        self.enqueued = 0
+        self.dispatched = 0
+        self.waits = deque(maxlen=wait_samples)  # 最近分派的任务的等待秒数
+
+
+class FairScheduler:
+    """
+    下载请求的优先级通道和加权公平队列。
+
+    通道按优先级严格排序（管理员 > 个人 > 群组），只有高优先级通道为空时才分派低优先级通道的任务。
+    同一通道内按流（群组名或发送者）做赤字轮转（DRR）：每个流每轮可分派 weight × quantum 个任务，
+    一个群组一次粘贴大量链接时只占用自己的份额，其他群组的请求不必排在它后面。
+    流的权重来自配置，未配置的流使用 default_weight。
+
+    提供与 queue.Queue 相同的 get、get_nowait 和 qsize，可以直接替换原来的 FIFO 队列。
+
+    参数:
+    - weights: 流名称 -> 权重。
+    - default_weight: 未配置的流的权重。
+    - quantum: 每轮每单位权重可分派的任务数。
+    - clock: 计算等待时间的时钟。
+    - wait_samples: 每个通道保留的等待时间样本数，用于计算分位数。
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, default_weight: float = 1, quantum: float = 1,
+                 clock: Callable[[], float] = time.monotonic, wait_samples: int = 1000):
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.quantum = quantum
+        self.clock = clock
+        self.lanes = {lane: _Lane(wait_samples) for lane in sorted(LANE_NAMES)}
+        self.size = 0
+        self.not_empty = threading.Condition(threading.Lock())
+
+    def set_weights(self, weights: Optional[Dict[str, float]], default_weight: float = 1):
+        """更新流的权重，从下一次补充份额时生效。"""
+        with self.not_empty:
+            self.weights = dict(weights or {})
+            self.default_weight = default_weight
+
+    def weight(self, flow: str) -> float:
+        return max(MIN_WEIGHT, self.weights.get(flow, self.default_weight))
+
+    def put(self, url: str, lane: int = PRIORITY_GROUP, flow: Optional[str] = None) -> DownloadTask:
+        """加入一个下载请求，flow 为 None 时同一通道内的这些请求归为一个流。"""
+        if lane not in self.lanes:
+            lane = PRIORITY_GROUP
+        task = DownloadTask(url, lane, flow or '', self.clock())
+        with self.not_empty:
+            state = self.lanes[lane]
+            flow_queue = state.flows.get(task.flow)
+            if flow_queue is None:
+                flow_queue = state.flows[task.flow] = deque()
+                state.active.append(task.flow)
+                state.deficits[task.flow] = 0.0
+            flow_queue.append(task)
+            state.depth += 1
+            state.enqueued += 1
+            self.size += 1
+            self.not_empty.notify()
+        return task
+
+    def _pop(self) -> DownloadTask:
+        for state in self.lanes.values():
+            if state.depth:
+                break
+        while True:
+            flow = state.active[0]
+            if state.deficits[flow] < 1:
+                # 轮到该流时补充本轮份额，份额不足一个任务（权重小于 1）时留到下一轮
+                state.deficits[flow] += self.weight(flow) * self.quantum
+                if state.deficits[flow] < 1:
+                    state.active.rotate(-1)
+                    continue
+            flow_queue = state.flows[flow]
+            task = flow_queue.popleft()
+            state.deficits[flow] -= 1
+            if not flow_queue:
+                # 流排空后退出轮转，剩余份额清零，不能攒到以后突发使用
+                state.active.popleft()
+                del state.flows[flow]
+                del state.deficits[flow]
+            elif state.deficits[flow] < 1:
+                state.active.rotate(-1)
+            break
+        state.depth -= 1
+        state.dispatched += 1
+        state.waits.append(self.clock() - task.enqueued_at)
+        self.size -= 1
+        return task
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> DownloadTask:
+        """取出下一个应分派的任务，没有任务时与 queue.Queue.get 一样等待或抛出 queue.Empty。"""
+        with self.not_empty:
+            if not block:
+                if not self.size:
+                    raise queue.Empty
+            elif timeout is None:
+                while not self.size:
+                    self.not_empty.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+            return self._pop()
+
+    def get_nowait(self) -> DownloadTask:
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return self.size
+
+    def empty(self) -> bool:
+        return not self.size
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        """
+        返回每个通道的指标：排队任务数、有排队任务的流数、累计入队和分派数，
+        以及最近分派的任务的等待时间中位数、p95 和最大值（秒）。
+        """
+        with self.not_empty:
+            metrics = {}
+            for lane, state in self.lanes.items():
+                waits = sorted(state.waits)
+                metrics[LANE_NAMES[lane]] = {
+                    'depth': state.depth,
+                    'flows': len(state.flows),
+                    'enqueued': state.enqueued,
+                    'dispatched': state.dispatched,
+                    'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+                    'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                    'wait_max': waits[-1] if waits else 0.0,
+                }
+            return metrics
+
+    def format_metrics(self) -> str:
+        """按通道格式化指标，用于管理员查询"""
+        labels = {'admin': '管理员', 'individual': '个人', 'group': '群组'}
+        lines = ["下载队列："]
+        for name, item in self.get_metrics().items():
+            lines.append(f"{labels[name]}：排队 {item['depth']} 个（{item['flows']} 个来源），"
+                         f"已分派 {item['dispatched']} 个，等待中位数 {item['wait_p50']:.0f} 秒，"
+                         f"p95 {item['wait_p95']:.0f} 秒，最长 {item['wait_max']:.0f} 秒")
+        return '\n'.join(lines)
@@ -1,20 +1,24 @@
+import asyncio
 import logging
 import os
 import queue
-import re
 import threading
 import time
 from collections import deque
 from io import BytesIO
-from typing import Optional, List, Any
-from urllib.parse import urlparse, urlunparse
+from typing import Optional, List, Tuple
 
 from PIL import Image
 
 from lib import itchat
 from lib.itchat.content import TEXT, SHARING
+from lib.itchat.core import AsyncCore
+from lib.itchat.storage import snapshot
 from src.config.config_manager import ConfigManager
 from src.itchat_module.admin_commands import AdminCommandsHandler
+from src.itchat_module.download_scheduler import FairScheduler
+from src.itchat_module.routing import PRIORITY_ADMIN, PRIORITY_GROUP, ChatPolicy, RoutingTable, extract_soft_id
+from src.notification.recipient_directory import get_recipient_directory
 
 
 class ItChatHandler:
@@ -40,19 +44,37 @@ class ItChatHandler:
         self.retry_interval = self.config.get('wechat', {}).get('itchat', {}).get('qr_check', {}).get('retry_interval', 2)
         # 登录事件，用于线程同步
         self.login_event = threading.Event()
+        # 会话快照：启动时从快照恢复登录，无需扫码；联系人先用快照中的数据，再在后台刷新
+        session_config = self.config.get('itchat', {}).get('session', {})
+        self.session_file = session_config.get('file', 'itchat.pkl')
+        self.resume_enabled = session_config.get('resume', True)
+        self.snapshot_interval = session_config.get('snapshot_interval_seconds', 300)
+        self.snapshot_stop = threading.Event()
+        self.snapshot_thread = None
+        # 设置环境变量 ITCHAT_UOS_ASYNC 时使用异步 itchat，接收、发送和通知在同一个事件循环中并发执行
+        self.async_mode = isinstance(itchat.instance, AsyncCore)
+        self.loop = None
         self.point_manager = point_manager
         self.uploader = None  # Uploader 实例
         logging.info("消息处理器初始化完成，但尚未绑定 Uploader")
 
-        # 初始化 DownloadTaskQueue
-        self.download_queue = DownloadTaskQueue(browser_controller=browser_controller)
+        # 初始化 DownloadTaskQueue，按优先级通道和群组权重公平分派下载请求
+        fair_queue_config = self.config.get('download', {}).get('fair_queue', {})
+        self.download_queue = DownloadTaskQueue(
+            browser_controller=browser_controller,
+            weights=fair_queue_config.get('weights', {}),
+            default_weight=fair_queue_config.get('default_weight', 1),
+            cancel_reason=self.download_cancel_reason,
+            on_failed=self.download_failed
+        )
         # 初始化 AdminCommandsHandler，用于处理管理员命令
         self.admin_commands_handler = AdminCommandsHandler(
             config=self.config,
             point_manager=self.point_manager,
             notifier=notifier,
             browser_controller=browser_controller,
-            error_handler=error_handler
+            error_handler=error_handler,
+            download_queue=self.download_queue
         )
 
         # 初始化消息处理器
@@ -78,21 +100,28 @@ class ItChatHandler:
     def login(self):
         """执行微信登录过程，处理二维码显示和会话管理"""
         for attempt in range(1, self.max_retries + 1):
-            session_file = 'itchat.pkl'
-            if os.path.exists(session_file):
-                os.remove(session_file)  # 删除已有的会话文件，确保每次都是新的登录
-
-            # 调用 itchat 的自动登录功能
-            itchat.auto_login(
-                hotReload=False,
-                enableCmdQR=False,
-                qrCallback=self.qr_callback  # 设置二维码回调函数
-            )
-            logging.info("微信登录成功")
-
-            # 更新好友列表和群组列表
-            itchat.get_friends(update=True)
-            itchat.get_chatrooms(update=True)
+            if self.async_mode:
+                self.start_loop()
+            resumed = self.resume_enabled and self.resume_session()
+            if not resumed:
+                if os.path.exists(self.session_file):
+                    # 快照不可用（过期、损坏或会话已失效），删除后扫码登录
+                    snapshot.remove(self.session_file)
+                # 调用 itchat 的自动登录功能，异步 itchat 下在事件循环中执行，登录后消息接收也在该循环中运行
+                # 登录过程中已经分页拉取了完整的联系人列表，不再重复拉取
+                itchat.instance.run_sync(itchat.auto_login(
+                    hotReload=False,
+                    enableCmdQR=False,
+                    qrCallback=self.qr_callback  # 设置二维码回调函数
+                ))
+                logging.info("微信登录成功")
+                self.save_session()
+
+            # 登录后 UserName 全部变化，重建通知接收者索引，之后由联系人更新增量维护
+            get_recipient_directory().rebuild()
+            if resumed:
+                self.start_contact_refresh()
+            self.start_session_snapshots()
 
             # 设置登录事件为已完成
             self.login_event.set()
@@ -101,20 +130,108 @@ class ItChatHandler:
         logging.critical("多次登录失败，应用启动失败。")
         raise Exception("多次登录失败，应用启动失败。")
 
+    def resume_session(self) -> bool:
+        """
+        从会话快照恢复登录。快照的格式、版本或校验不通过，或服务器拒绝该会话时返回 False。
+
+        返回:
+        - 是否已恢复登录，恢复后消息接收已经启动。
+        """
+        if not os.path.exists(self.session_file):
+            return False
+        started = time.monotonic()
+        r = itchat.instance.run_sync(itchat.load_login_status(self.session_file))
+        if not r:
+            logging.info(f"会话快照不可用，改为扫码登录: {r['BaseResponse'].get('ErrMsg')}")
+            return False
+        logging.info(f"已从会话快照恢复登录，耗时 {time.monotonic() - started:.2f} 秒，"
+                     f"好友 {len(itchat.instance.memberList)} 个，群聊 {len(itchat.instance.chatroomList)} 个"
+                     f"{'' if r.get('ContactsLoaded') else '（快照中的联系人不可用，等待后台刷新）'}")
+        return True
+
+    def save_session(self):
+        """写入会话快照，联系人没有变化时只重写会话部分。"""
+        if not self.resume_enabled:
+            return
+        try:
+            itchat.instance.run_sync(itchat.dump_login_status(self.session_file), timeout=60)
+        except Exception as e:
+            logging.error(f"写入会话快照失败: {e}")
+
+    def start_contact_refresh(self):
+        """在后台线程中重新拉取完整的联系人列表，合并到本地联系人后写入快照，不阻塞启动。"""
+        def refresh():
+            started = time.monotonic()
+            try:
+                itchat.instance.run_sync(itchat.get_contact(update=True))
+            except Exception as e:
+                logging.error(f"后台刷新联系人失败: {e}")
+                return
+            logging.info(f"后台刷新联系人完成，耗时 {time.monotonic() - started:.1f} 秒，"
+                         f"好友 {len(itchat.instance.memberList)} 个，群聊 {len(itchat.instance.chatroomList)} 个")
+            self.save_session()
+
+        threading.Thread(target=refresh, name='ContactRefresh', daemon=True).start()
+
+    def start_session_snapshots(self):
+        """按 snapshot_interval_seconds 定期写入会话快照，保存最新的 SyncKey 和联系人变化。"""
+        if not self.resume_enabled or self.snapshot_interval <= 0 or self.snapshot_thread:
+            return
+
+        def run():
+            while not self.snapshot_stop.wait(self.snapshot_interval):
+                if itchat.instance.alive:
+                    self.save_session()
+
+        self.snapshot_thread = threading.Thread(target=run, name='SessionSnapshot', daemon=True)
+        self.snapshot_thread.start()
+
+    def start_loop(self):
+        """在后台线程中启动异步 itchat 的事件循环，其它线程通过 itchat.instance.run_sync 在其中执行协程。"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            itchat.instance.loop = self.loop
+            threading.Thread(target=self.loop.run_forever, name='ItChatLoop', daemon=True).start()
+            logging.info("异步 itchat 事件循环已启动")
+        return self.loop
+
     def run(self):
         """注册消息处理函数并启动 ItChat 客户端监听消息"""
-        # 注册群聊消息的处理函数
-        @itchat.msg_register([TEXT, SHARING], isGroupChat=True)
         def handle_group(msg):
             self.message_handler.handle_group_message(msg)
 
-        # 注册个人消息的处理函数
-        @itchat.msg_register([TEXT, SHARING], isGroupChat=False)
         def handle_individual(msg):
             self.message_handler.handle_individual_message(msg)
 
-        # 启动消息循环
-        itchat.run()
+        if self.async_mode:
+            # 消息处理会查询数据库、操作浏览器，放到线程中执行，不阻塞事件循环上的接收和发送
+            handle_group, handle_individual = self.offload(handle_group), self.offload(handle_individual)
+
+        # 注册群聊消息和个人消息的处理函数
+        itchat.msg_register([TEXT, SHARING], isGroupChat=True)(handle_group)
+        itchat.msg_register([TEXT, SHARING], isGroupChat=False)(handle_individual)
+        self.apply_msg_filter()
+
+        # 启动消息循环，异步 itchat 下阻塞当前线程直到退出登录
+        itchat.instance.run_sync(itchat.run())
+
+    def apply_msg_filter(self):
+        """
+        按已注册的处理函数和监控的群组、个人设置 itchat 的消息预过滤。
+        接收循环只读取消息的 FromUserName 和 MsgType，丢弃非监控会话的消息和没有处理函数的消息类型，
+        不再为它们格式化内容、查找发送者和复制联系人。
+        """
+        itchat.set_msg_filter(groupNames=self.monitor_groups,
+                              friendNames=self.target_individuals + self.admins)
+        logging.info(f"消息预过滤已设置，监控群组 {len(self.monitor_groups)} 个，"
+                     f"个人和管理员 {len(self.target_individuals) + len(self.admins)} 个")
+
+    @staticmethod
+    def offload(handler):
+        """把同步的消息处理函数包装为协程函数，在默认线程池中执行。"""
+        async def _handler(msg):
+            return await asyncio.to_thread(handler, msg)
+        return _handler
 
     def qr_callback(self, uuid, status, qrcode):
         """处理二维码回调，保存并显示二维码图像"""
@@ -135,11 +252,28 @@ class ItChatHandler:
             logging.warning(f"未知的QR回调状态: {status}")
 
     def logout(self):
-        """登出微信账号，结束当前会话"""
-        itchat.logout()
+        """登出微信账号，结束当前会话。登出后会话快照失效，一并删除。"""
+        self.snapshot_stop.set()
+        itchat.instance.run_sync(itchat.logout(), timeout=30)
+        snapshot.remove(self.session_file)
+
+    def shutdown(self):
+        """
+        程序退出时调用。启用会话恢复时写入最新的会话快照并保留网页微信会话，下次启动无需扫码；
+        未启用时登出微信。
+        """
+        self.admin_commands_handler.stop()
+        if not self.resume_enabled:
+            self.logout()
+            return
+        self.snapshot_stop.set()
+        self.save_session()
+        logging.info("会话快照已保存，下次启动将恢复登录")
 
     def update_config(self, new_config):
         """更新配置并应用变化"""
+        # 先更新 MessageHandler：新配置编译路由表失败时抛出异常，这里的配置也不做修改
+        self.message_handler.update_config(new_config)
         self.config = new_config
         # 更新监控的群组、个人和管理员列表
         self.monitor_groups = self.config.get('wechat', {}).get('monitor_groups', [])
@@ -149,15 +283,32 @@ class ItChatHandler:
         self.qr_path = self.config.get('wechat', {}).get('login_qr_path', 'qr.png')
         self.max_retries = self.config.get('wechat', {}).get('itchat', {}).get('qr_check', {}).get('max_retries', 5)
         self.retry_interval = self.config.get('wechat', {}).get('itchat', {}).get('qr_check', {}).get('retry_interval', 2)
+        # 更新下载队列的群组权重
+        fair_queue_config = self.config.get('download', {}).get('fair_queue', {})
+        self.download_queue.queue.set_weights(fair_queue_config.get('weights', {}),
+                                              fair_queue_config.get('default_weight', 1))
 
-        # 更新 MessageHandler 的配置
-        self.message_handler.update_config(new_config)
+        # 监控列表变化后更新消息预过滤
+        if itchat.instance.msgFilter is not None:
+            self.apply_msg_filter()
 
         logging.info("ItChatHandler 配置已更新")
 
-    def add_download_task(self, url: str):
-        """将下载任务添加到队列"""
-        self.download_queue.add_task(url)
+    def add_download_task(self, url: str, priority: int = PRIORITY_GROUP, flow: Optional[str] = None):
+        """将下载任务添加到队列，priority 为优先级通道，flow 为公平调度的来源（群组名或发送者）"""
+        self.download_queue.add_task(url, priority, flow)
+
+    def download_cancel_reason(self, url: str) -> Optional[str]:
+        """下载任务分派前调用，返回不再需要下载的原因，仍需下载或未绑定 Uploader 时返回 None"""
+        if not self.uploader:
+            return None
+        return self.uploader.cancel_reason(extract_soft_id(url))
+
+    def download_failed(self, url: str, detail: str):
+        """下载任务分派失败时调用，关闭该 soft_id 的请求，之后的新请求会重新下载"""
+        if self.uploader:
+            self.uploader.download_failed(extract_soft_id(url), detail)
+
 
 class MessageHandler:
     """
@@ -169,37 +320,38 @@ class MessageHandler:
                  add_download_task_callback=None):
         # 加载配置
         self.config = ConfigManager.load_config()
-        # 初始化正则表达式，用于匹配URL
-        self.regex = re.compile(self.config.get('url', {}).get('regex', r'https?://[^\s"」]+'))
-        # URL 验证开关
-        self.validation = self.config.get('url', {}).get('validation', True)
+        # 路由表：监控的群组、个人和管理员的处理策略，以及预编译的 URL 提取规则，配置变化时整体替换
+        self.routing = RoutingTable(
+            monitor_groups=monitor_groups,
+            target_individuals=target_individuals,
+            admins=admins,
+            group_types=self.config.get('wechat', {}).get('group_types', {}),
+            url_config=self.config.get('url', {}),
+        )
         self.uploader = None  # Uploader 实例
         self.error_handler = error_handler
-        # 监控的群组、个人和管理员列表
-        self.monitor_groups = monitor_groups
-        self.target_individuals = target_individuals
-        self.admins = admins
         self.notifier = notifier
         self.browser_controller = browser_controller
         # 日志目录
         self.log_dir = self.config.get('logging', {}).get('directory', 'logs')
         self.point_manager = point_manager
-        # 群组类型配置
-        self.group_types = self.config.get('wechat', {}).get('group_types', {})
         self.admin_commands_handler = admin_commands_handler
         self.add_download_task_callback = add_download_task_callback
 
     def update_config(self, new_config):
-        """更新配置并应用变化"""
+        """
+        更新配置并应用变化。
+        先从新配置编译完整的路由表，再一次替换 self.routing；处理线程每条消息只读取一次 self.routing，
+        因此不会看到新旧配置混合的状态。新配置编译失败时抛出异常，旧的路由表和配置保持不变。
+        """
+        routing = RoutingTable.from_config(new_config)
         self.config = new_config
-        # 更新正则表达式和验证设置
-        self.regex = re.compile(self.config.get('url', {}).get('regex', r'https?://[^\s"」]+'))
-        self.validation = self.config.get('url', {}).get('validation', True)
-        # 更新日志目录和群组类型配置
+        self.routing = routing
+        # 更新日志目录
         self.log_dir = self.config.get('logging', {}).get('directory', 'logs')
-        self.group_types = self.config.get('wechat', {}).get('group_types', {})
 
-        logging.info("MessageHandler 配置已更新")
+        logging.info(f"MessageHandler 配置已更新，监控群组 {len(routing.groups)} 个，"
+                     f"个人和管理员 {len(routing.individuals)} 个")
 
     def set_uploader(self, uploader):
         """设置 Uploader 实例用于上传相关信息"""
@@ -217,42 +369,38 @@ class MessageHandler:
             return msg.get('Url', msg.get('url', ''))
         return ''
 
-    def check_points(self, message_type, context_name, sender_name=None, group_type=None) -> bool:
+    def check_points(self, policy: ChatPolicy, context_name, sender_name=None) -> bool:
         """
-        检查消息发送者或群组是否有足够的积分
+        按会话策略的 point_mode 检查群组、群成员或个人是否有足够的积分
 
-        :param message_type: 消息类型，'group' 或 'individual'
+        :param policy: 会话的处理策略，point_mode 为 'group'、'user' 或 'recipient'
         :param context_name: 群组名或个人名
-        :param sender_name: 发送者昵称（如果是非整体群组，需要提供）
-        :param group_type: 群组类型，'whole' 或 'non-whole'
+        :param sender_name: 发送者昵称（point_mode 为 'user' 时需要提供）
         :return: 是否有足够的积分
         """
+        point_mode = policy.point_mode
         logging.debug(
-            f"开始积分检查 - 消息类型: {message_type}, 上下文名称: {context_name}, 发送者: {sender_name}, 群组类型: {group_type}")
-        if message_type == 'group':
-            if group_type == 'whole':
-                # 整体群组积分检查
-                has_points = self.point_manager.has_group_points(context_name)
-                logging.debug(f"群组 '{context_name}' 是否有足够的积分: {has_points}")
-                if not has_points:
-                    logging.info(f"群组 '{context_name}' 的积分不足")
-                    return False
-            elif group_type == 'non-whole':
-                if sender_name is None:
-                    logging.warning("非整体群组需要提供发送者昵称")
-                    return False
-                # 确保用户存在于数据库中
-                self.point_manager.ensure_user(context_name, sender_name)
-                # 用户积分检查
-                has_points = self.point_manager.has_user_points(context_name, sender_name)
-                logging.debug(f"用户 '{sender_name}' 在群组 '{context_name}' 中是否有足够的积分: {has_points}")
-                if not has_points:
-                    logging.info(f"用户 '{sender_name}' 在群组 '{context_name}' 中的积分不足")
-                    return False
-            else:
-                logging.warning(f"未知的群组类型: {group_type}")
+            f"开始积分检查 - 积分检查方式: {point_mode}, 上下文名称: {context_name}, 发送者: {sender_name}")
+        if point_mode == 'group':
+            # 整体群组积分检查
+            has_points = self.point_manager.has_group_points(context_name)
+            logging.debug(f"群组 '{context_name}' 是否有足够的积分: {has_points}")
+            if not has_points:
+                logging.info(f"群组 '{context_name}' 的积分不足")
+                return False
+        elif point_mode == 'user':
+            if sender_name is None:
+                logging.warning("非整体群组需要提供发送者昵称")
+                return False
+            # 确保用户存在于数据库中
+            self.point_manager.ensure_user(context_name, sender_name)
+            # 用户积分检查
+            has_points = self.point_manager.has_user_points(context_name, sender_name)
+            logging.debug(f"用户 '{sender_name}' 在群组 '{context_name}' 中是否有足够的积分: {has_points}")
+            if not has_points:
+                logging.info(f"用户 '{sender_name}' 在群组 '{context_name}' 中的积分不足")
                 return False
-        elif message_type == 'individual':
+        elif point_mode == 'recipient':
             # 个人积分检查
             has_points = self.point_manager.has_recipient_points(context_name)
             logging.debug(f"个人 '{context_name}' 是否有足够的积分: {has_points}")
@@ -260,7 +408,7 @@ class MessageHandler:
                 logging.info(f"个人 '{context_name}' 的积分不足")
                 return False
         else:
-            logging.warning(f"未知的消息类型: {message_type}")
+            logging.warning(f"未知的积分检查方式: {point_mode}")
             return False
         logging.debug("积分检查通过")
         return True
@@ -268,78 +416,82 @@ class MessageHandler:
     def handle_group_message(self, msg):
         """处理来自群组的消息，提取并处理URL"""
         logging.debug(f"处理群组消息: {msg}")
+        routing = self.routing
 
-        # 获取群组名称
+        # 获取群组名称，查找群组的处理策略
         group_name = msg.get('User', {}).get('NickName', '')
-        if group_name not in self.monitor_groups:
+        policy = routing.route_group(group_name)
+        if policy is None:
             logging.debug(f"忽略来自非监控群组的消息: {group_name}")
             return
-
-        # 确定群组类型
-        if group_name in self.group_types.get('whole_groups', []):
-            group_type = 'whole'
-        elif group_name in self.group_types.get('non_whole_groups', []):
-            group_type = 'non-whole'
-        else:
-            group_type = 'whole'  # 默认类型
+        group_type = policy.group_type
 
         # 获取发送者昵称
         sender_nickname = msg.get('ActualNickName', '')
         # 提取消息中的URL
-        urls = self.extract_urls(msg)
+        urls = self.extract_urls(msg, routing)
         if not urls:
             return
 
         # 处理URL，得到有效的URL列表
-        valid_urls = self.process_urls(urls)
+        valid_urls = routing.process_urls(urls)
         if not valid_urls:
             return
 
         # 进行积分检查
         point_check = self.check_points(
-            message_type='group',
+            policy,
             context_name=group_name,
-            sender_name=sender_nickname,
-            group_type=group_type
+            sender_name=sender_nickname
         )
         if not point_check:
             return
 
+        # 管理员在群组中发送的链接进入管理员通道，其余按群组公平分派
+        if sender_nickname in routing.admins:
+            priority, flow = PRIORITY_ADMIN, sender_nickname
+        else:
+            priority, flow = policy.priority, group_name
+
         # 通过积分检查后，调用上传和添加任务函数
         for url, soft_id in valid_urls:
             if self.uploader and soft_id:
                 # 上传群组ID和 soft_id
-                self.uploader.upload_group_id(
+                needs_download = self.uploader.upload_group_id(
                     recipient_name=group_name,
                     soft_id=soft_id,
                     sender_nickname=sender_nickname if group_type == 'non-whole' else None,
                     recipient_type='group',
                     group_type=group_type
                 )
+                if needs_download is False:
+                    # 同一份资料已在下载中，下载完成后会一并发送给该接收者
+                    logging.info(f"soft_id {soft_id} 已在下载中，不再重复添加下载任务")
+                    continue
             else:
                 logging.warning("Uploader 未设置，或无法上传接收者和 soft_id 信息。")
 
             # 使用回调将任务添加到队列
             if self.add_download_task_callback:
-                self.add_download_task_callback(url)
+                self.add_download_task_callback(url, priority, flow)
             else:
                 logging.warning("下载任务回调未设置，无法添加下载任务。")
 
     def handle_individual_message(self, msg):
         """处理来自个人的消息，提取URL或执行管理员命令"""
         logging.debug(f"处理个人消息: {msg}")
+        routing = self.routing
 
-        # 获取发送者昵称
+        # 获取发送者昵称，查找发送者的处理策略
         sender = msg['User'].get('NickName', '')
-        logging.debug(f"发送者昵称: {sender}")
-        logging.debug(f"监控的个人列表: {self.target_individuals}")
-        logging.debug(f"管理员列表: {self.admins}")
+        policy = routing.route_individual(sender)
+        logging.debug(f"发送者昵称: {sender}，处理策略: {policy}")
 
-        if sender not in self.target_individuals and sender not in self.admins:
+        if policy is None:
             # 非目标个人或管理员，忽略消息
             return
 
-        if sender in self.admins:
+        if policy.kind == 'admin':
             # 如果是管理员，处理命令
             content = self.get_message_content(msg)  # 获取完整消息内容
             response = self.handle_admin_command(content)
@@ -349,18 +501,18 @@ class MessageHandler:
             return
 
         # 提取URL
-        urls = self.extract_urls(msg)
+        urls = self.extract_urls(msg, routing)
         if not urls:
             return
 
         # 处理URL，得到有效的URL列表
-        valid_urls = self.process_urls(urls)
+        valid_urls = routing.process_urls(urls)
         if not valid_urls:
             return
 
         # 检查积分
         if not self.check_points(
-                message_type='individual',
+                policy,
                 context_name=sender
         ):
             return
@@ -369,17 +521,21 @@ class MessageHandler:
         for url, soft_id in valid_urls:
             if self.uploader and soft_id:
                 # 上传个人ID和 soft_id
-                self.uploader.upload_group_id(
+                needs_download = self.uploader.upload_group_id(
                     recipient_name=sender,
                     soft_id=soft_id,
                     recipient_type='individual'
                 )
+                if needs_download is False:
+                    # 同一份资料已在下载中，下载完成后会一并发送给该接收者
+                    logging.info(f"soft_id {soft_id} 已在下载中，不再重复添加下载任务")
+                    continue
             else:
                 logging.warning("Uploader 未设置，或无法上传接收者和 soft_id 信息。")
 
             # 使用回调将任务添加到队列
             if self.add_download_task_callback:
-                self.add_download_task_callback(url)
+                self.add_download_task_callback(url, policy.priority, sender)
             else:
                 logging.warning("下载任务回调未设置，无法添加下载任务。")
 
@@ -388,52 +544,17 @@ class MessageHandler:
         response = self.admin_commands_handler.handle_command(message)
         return response
 
-    def extract_urls(self, msg) -> List[str]:
-        """从消息中提取URL列表"""
-        msg_type = msg.get('Type', getattr(msg, 'type', ''))
-
-        if msg_type not in ['Text', 'Sharing']:
+    def extract_urls(self, msg, routing: Optional[RoutingTable] = None) -> List[str]:
+        """从消息中提取URL列表，routing 为 None 时使用当前的路由表"""
+        content = self.get_message_content(msg)
+        if not content:
             return []
+        # 使用路由表中预编译的正则表达式提取URL
+        return (routing or self.routing).url_regex.findall(content)
 
-        # 根据消息类型获取内容
-        if msg_type == 'Text':
-            content = msg.get('Text', msg.get('text', ''))
-        elif msg_type == 'Sharing':
-            content = msg.get('Url', msg.get('url', ''))
-        else:
-            content = ''
-
-        # 使用正则表达式提取URL
-        urls = self.regex.findall(content)
-        return urls
-
-    def process_urls(self, urls: List[str]) -> list[tuple[bytes, str | None | Any]]:
+    def process_urls(self, urls: List[str]) -> List[Tuple[str, Optional[str]]]:
         """清理、验证并处理URL，返回有效的 (url, soft_id) 列表"""
-        valid_urls = []
-        for url in urls:
-            # 清理URL并验证
-            # 使用 urlparse 解析URL
-            parsed = urlparse(url)
-            # 移除 fragment（#后面的部分）
-            clean = parsed._replace(fragment='')
-            # 重新构建 URL，并移除结尾的特殊字符
-            cleaned_url = urlunparse(clean).rstrip('」””"\'')
-            # 验证URL（检查是否以 http:// 或 https:// 开头）
-            if self.validation and not cleaned_url.startswith(('http://', 'https://')):
-                logging.warning(f"URL 验证失败: {cleaned_url}")
-                continue
-
-            # 从URL中提取 soft_id
-            soft_id_match = re.search(r'/soft/(\d+)\.html', cleaned_url)
-            if soft_id_match:
-                soft_id = soft_id_match.group(1)
-            else:
-                logging.warning(f"无法从 URL 中提取 soft_id: {cleaned_url}")
-                soft_id = None
-
-            valid_urls.append((cleaned_url, soft_id))
-
-        return valid_urls
+        return self.routing.process_urls(urls)
 
     def get_last_n_logs(self, n: int) -> Optional[str]:
         """获取日志目录下最新日志文件的最后 n 行内容"""
@@ -459,9 +580,12 @@ def send_long_message(notifier, message: str, max_length: int = 2000):
 
 class DownloadTaskQueue:
     def __init__(self, browser_controller, batch_size=10, initial_interval=30,
-                 min_interval=5, max_interval=60, high_threshold=20, low_threshold=10):
+                 min_interval=5, max_interval=60, high_threshold=20, low_threshold=10,
+                 weights=None, default_weight=1, cancel_reason=None, on_failed=None):
         """
         初始化下载任务队列，并设置动态调整间隔时间的参数。
+        任务按优先级通道（管理员 > 个人 > 群组）和通道内各来源的权重公平分派，见 FairScheduler。
+        分派前用 cancel_reason 检查任务是否仍需下载，已取消或过期的任务直接放弃，不占用本批的名额。
 
         :param browser_controller: 用于处理下载任务的浏览器控制器实例
         :param batch_size: 每批处理的链接数量
@@ -470,6 +594,10 @@ class DownloadTaskQueue:
         :param max_interval: 最大处理间隔时间（秒）
         :param high_threshold: 队列长度高阈值，超过此值将增加间隔
         :param low_threshold: 队列长度低阈值，低于此值将减少间隔
+        :param weights: 来源（群组名或发送者）-> 公平调度的权重
+        :param default_weight: 未配置来源的权重
+        :param cancel_reason: 以 URL 调用，返回不再需要下载的原因，仍需下载时返回 None
+        :param on_failed: 任务交给浏览器控制器失败时以 (URL, 出错信息) 调用
         """
         self.browser_controller = browser_controller
         self.batch_size = batch_size
@@ -478,15 +606,18 @@ class DownloadTaskQueue:
         self.max_interval = max_interval
         self.high_threshold = high_threshold
         self.low_threshold = low_threshold
-        self.queue = queue.Queue()
+        self.queue = FairScheduler(weights=weights, default_weight=default_weight)
+        self.cancel_reason = cancel_reason
+        self.on_failed = on_failed
+        self.dropped = 0  # 分派前放弃的已取消或过期任务数
         self.lock = threading.Lock()  # 用于保护 current_interval
         self.thread = threading.Thread(target=self.worker, daemon=True)
         self.thread.start()
         logging.debug("下载任务队列已启动，初始间隔时间为 %s 秒", self.current_interval)
 
-    def add_task(self, url: str):
-        """将下载任务添加到队列中"""
-        self.queue.put(url)
+    def add_task(self, url: str, priority: int = PRIORITY_GROUP, flow: Optional[str] = None):
+        """将下载任务添加到 priority 对应的通道，flow 为公平调度的来源"""
+        self.queue.put(url, priority, flow)
         logging.debug(f"任务已添加到队列: {url}")
 
     def adjust_interval(self):
@@ -506,17 +637,41 @@ class DownloadTaskQueue:
             else:
                 logging.debug(f"队列长度为 {queue_size}，保持处理间隔为 {self.current_interval:.2f} 秒")
 
+    def check_cancelled(self, url: str) -> Optional[str]:
+        """返回任务不再需要下载的原因，检查出错时按仍需下载处理"""
+        if self.cancel_reason is None:
+            return None
+        try:
+            return self.cancel_reason(url)
+        except Exception as e:
+            logging.error(f"检查下载任务是否已取消时出错: {url}, {e}", exc_info=True)
+            return None
+
+    def report_failed(self, url: str, detail: str):
+        """任务没有交给浏览器控制器，通知 on_failed 关闭请求"""
+        if self.on_failed is None:
+            return
+        try:
+            self.on_failed(url, detail)
+        except Exception as e:
+            logging.error(f"关闭分派失败的下载请求时出错: {url}, {e}", exc_info=True)
+
     def worker(self):
         """后台线程，定期处理下载任务，并动态调整间隔时间"""
         while True:
             batch = []
-            for _ in range(self.batch_size):
+            while len(batch) < self.batch_size:
                 try:
                     # 使用较短的超时时间，例如 1 秒
-                    url = self.queue.get(timeout=1)
-                    batch.append(url)
+                    task = self.queue.get(timeout=1)
                 except queue.Empty:
                     break
+                reason = self.check_cancelled(task.url)
+                if reason is not None:
+                    self.dropped += 1
+                    logging.info(f"{reason}，放弃排队中的下载任务: {task.url}")
+                    continue
+                batch.append(task.url)
 
             if batch:
                 logging.info(f"开始处理 {len(batch)} 个下载任务")
@@ -526,6 +681,7 @@ class DownloadTaskQueue:
                         logging.info(f"已添加任务到下载队列: {url}")
                     except Exception as e:
                         logging.error(f"处理任务 {url} 时出错: {e}")
+                        self.report_failed(url, f"分派下载任务时出错: {e}")
                 # 动态调整间隔时间
                 self.adjust_interval()
             else:
@@ -0,0 +1,131 @@
+# src/itchat_module/routing.py
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+DEFAULT_URL_REGEX = r'https?://[^\s"」]+'
+SOFT_ID_PATTERN = re.compile(r'/soft/(\d+)\.html')
+URL_TRAILING_CHARS = '」””"\''
+
+# 下载请求的优先级，数值越小越优先
+PRIORITY_ADMIN = 0
+PRIORITY_INDIVIDUAL = 1
+PRIORITY_GROUP = 2
+
+
+def extract_soft_id(url: str) -> Optional[str]:
+    """从资料链接中提取 soft_id，不是资料链接时返回 None。"""
+    match = SOFT_ID_PATTERN.search(url or '')
+    return match.group(1) if match else None
+
+
+class ChatPolicy:
+    """
+    一个监控会话的处理策略，由配置编译得到，创建后不再修改。
+
+    - kind: 'group'、'individual' 或 'admin'。
+    - group_type: 群组类型 'whole' 或 'non-whole'，个人和管理员为 None。
+    - point_mode: 积分检查方式，'group' 扣群组积分，'user' 扣群成员积分，'recipient' 扣个人积分，
+      管理员为 None（执行命令，不检查积分）。
+    - priority: 下载请求的优先级，管理员 > 个人 > 群组。
+    """
+
+    __slots__ = ('name', 'kind', 'group_type', 'point_mode', 'priority')
+
+    def __init__(self, name: str, kind: str, group_type: Optional[str], point_mode: Optional[str], priority: int):
+        self.name = name
+        self.kind = kind
+        self.group_type = group_type
+        self.point_mode = point_mode
+        self.priority = priority
+
+    def __repr__(self):
+        return (f"ChatPolicy({self.name!r}, kind={self.kind!r}, group_type={self.group_type!r}, "
+                f"point_mode={self.point_mode!r}, priority={self.priority})")
+
+
+class RoutingTable:
+    """
+    MessageHandler 的路由表：监控会话名称到 ChatPolicy 的映射和预编译的 URL 提取规则。
+
+    路由表在创建时从配置一次编译完成，之后只读，因此处理线程无需加锁即可读取。
+    配置变化时创建新的路由表，再用一次属性赋值替换旧表：正在处理的消息继续使用旧表，
+    之后的消息使用新表，不会读到修改了一半的配置。新配置有误（例如 URL 正则无效）时创建失败，旧表保持不变。
+
+    参数:
+    - monitor_groups: 监控的群组名称。
+    - target_individuals: 监控的个人名称。
+    - admins: 管理员名称，同时出现在监控个人中时按管理员处理。
+    - group_types: 配置中的 wechat.group_types，未列出的监控群组按整体群组处理。
+    - url_config: 配置中的 url 部分（regex、validation）。
+    """
+
+    def __init__(self, monitor_groups: Iterable[str] = (), target_individuals: Iterable[str] = (),
+                 admins: Iterable[str] = (), group_types: Optional[Dict] = None, url_config: Optional[Dict] = None):
+        group_types = group_types or {}
+        url_config = url_config or {}
+        self.monitor_groups = frozenset(monitor_groups)
+        self.target_individuals = frozenset(target_individuals)
+        self.admins = frozenset(admins)
+        non_whole_groups = frozenset(group_types.get('non_whole_groups', [])) - \
+            frozenset(group_types.get('whole_groups', []))
+
+        self.groups: Dict[str, ChatPolicy] = {}
+        for name in self.monitor_groups:
+            if name in non_whole_groups:
+                self.groups[name] = ChatPolicy(name, 'group', 'non-whole', 'user', PRIORITY_GROUP)
+            else:
+                self.groups[name] = ChatPolicy(name, 'group', 'whole', 'group', PRIORITY_GROUP)
+        self.individuals: Dict[str, ChatPolicy] = {
+            name: ChatPolicy(name, 'individual', None, 'recipient', PRIORITY_INDIVIDUAL)
+            for name in self.target_individuals}
+        for name in self.admins:
+            self.individuals[name] = ChatPolicy(name, 'admin', None, None, PRIORITY_ADMIN)
+
+        self.url_regex = re.compile(url_config.get('regex', DEFAULT_URL_REGEX))
+        self.validation = url_config.get('validation', True)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'RoutingTable':
+        """从完整配置编译路由表。"""
+        wechat_config = config.get('wechat', {})
+        return cls(
+            monitor_groups=wechat_config.get('monitor_groups', []),
+            target_individuals=wechat_config.get('target_individuals', []),
+            admins=wechat_config.get('admins', []),
+            group_types=wechat_config.get('group_types', {}),
+            url_config=config.get('url', {}),
+        )
+
+    def route_group(self, group_name: str) -> Optional[ChatPolicy]:
+        """返回监控群组的策略，非监控群组返回 None。"""
+        return self.groups.get(group_name)
+
+    def route_individual(self, name: str) -> Optional[ChatPolicy]:
+        """返回监控个人或管理员的策略，其他个人返回 None。"""
+        return self.individuals.get(name)
+
+    def clean_url(self, url: str) -> str:
+        """
+        移除 URL 的 fragment 和结尾的特殊字符，结果与 urlparse/urlunparse 清理一致。
+        常见的 URL 没有 fragment，也不以空查询 '?' 结尾，这时 urlunparse 原样重建，不必解析。
+        """
+        if '#' in url or url.endswith('?') or not url.startswith(('http://', 'https://')):
+            url = urlunparse(urlparse(url)._replace(fragment=''))
+        return url.rstrip(URL_TRAILING_CHARS)
+
+    def process_urls(self, urls: Iterable[str]) -> List[Tuple[str, Optional[str]]]:
+        """清理、验证 URL 并提取 soft_id，返回有效的 (url, soft_id) 列表，无法提取 soft_id 时为 None。"""
+        valid_urls = []
+        for url in urls:
+            cleaned_url = self.clean_url(url)
+            if self.validation and not cleaned_url.startswith(('http://', 'https://')):
+                logging.warning(f"URL 验证失败: {cleaned_url}")
+                continue
+            match = SOFT_ID_PATTERN.search(cleaned_url)
+            if match is None:
+                logging.warning(f"无法从 URL 中提取 soft_id: {cleaned_url}")
+            valid_urls.append((cleaned_url, match.group(1) if match else None))
+        return valid_urls
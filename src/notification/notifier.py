@@ -3,6 +3,10 @@
 import logging
 from typing import Optional, List
 from lib import itchat
+from src.notification.outbox import get_notification_outbox
+from src.notification.recipient_directory import get_recipient_directory
+
+SEND_TIMEOUT = 60  # 异步 itchat 下等待一次发送完成的最长秒数
 
 class WeChatNotifier:
     def __init__(self, recipient: str):
@@ -20,53 +24,15 @@ class WeChatNotifier:
 
     def _find_recipient(self):
         """
-        查找接收者的 UserName
+        通过共享的接收者索引查找 UserName，不遍历联系人列表，也不刷新联系人。
+        每次发送前都查找一次，重新登录后 UserName 变化时会自动使用新值。
         """
         try:
-            # 尝试通过微信ID查找
-            user = itchat.search_friends(userName=self.recipient)
-            if user:
-                self.user_name = user['UserName']
-                logging.debug(f"通过微信ID找到接收者: {self.recipient}")
-                return
-
-            # 尝试通过昵称查找
-            users = itchat.search_friends(name=self.recipient)
-            if users:
-                self.user_name = users[0]['UserName']
-                logging.debug(f"通过昵称找到接收者: {self.recipient}")
-                return
-
-            # 尝试在群聊中查找
-            groups = itchat.search_chatrooms(name=self.recipient)
-            if groups:
-                self.user_name = groups[0]['UserName']
-                logging.debug(f"通过群聊昵称找到接收者: {self.recipient}")
-                return
-
-            # 如果未找到接收者，记录错误并列出所有好友和群聊
-            logging.error(f"未找到接收者: {self.recipient}")
-            self._log_available_contacts()
+            self.user_name = get_recipient_directory().resolve(self.recipient)
         except Exception as e:
+            self.user_name = None
             logging.error(f"查找接收者时发生错误: {e}", exc_info=True)
 
-    def _log_available_contacts(self):
-        """
-        记录所有好友和群聊的名称，帮助调试
-        """
-        try:
-            friends = itchat.get_friends(update=True)
-            logging.debug("好友列表:")
-            for friend in friends:
-                logging.debug(f"好友: {friend['NickName']} (ID: {friend['UserName']})")
-
-            chatrooms = itchat.get_chatrooms(update=True)
-            logging.debug("群聊列表:")
-            for chatroom in chatrooms:
-                logging.debug(f"群聊: {chatroom['NickName']} (ID: {chatroom['UserName']})")
-        except Exception as e:
-            logging.error(f"记录可用联系人时发生错误: {e}", exc_info=True)
-
     def send_message(self, message: str) -> bool:
         """
         发送消息给接收者
@@ -74,14 +40,14 @@ class WeChatNotifier:
         :param message: 要发送的消息内容
         :return: 发送是否成功
         """
+        self._find_recipient()
         if not self.user_name:
-            self._find_recipient()
-            if not self.user_name:
-                logging.error(f"无法发送消息，因为未找到接收者: {self.recipient}")
-                return False
+            logging.error(f"无法发送消息，因为未找到接收者: {self.recipient}")
+            return False
 
         try:
-            itchat.send_msg(msg=message, toUserName=self.user_name)
+            # 异步 itchat 下 send_msg 返回协程，在 itchat 的事件循环中执行并等待结果
+            itchat.instance.run_sync(itchat.send_msg(msg=message, toUserName=self.user_name), timeout=SEND_TIMEOUT)
             logging.info(f"已发送通知消息给 {self.recipient}")
             return True
         except Exception as e:
@@ -95,14 +61,13 @@ class WeChatNotifier:
         :param image_path: 图片文件的路径
         :return: 发送是否成功
         """
+        self._find_recipient()
         if not self.user_name:
-            self._find_recipient()
-            if not self.user_name:
-                logging.error(f"无法发送图片，因为未找到接收者: {self.recipient}")
-                return False
+            logging.error(f"无法发送图片，因为未找到接收者: {self.recipient}")
+            return False
 
         try:
-            itchat.send_image(image_path, toUserName=self.user_name)
+            itchat.instance.run_sync(itchat.send_image(image_path, toUserName=self.user_name), timeout=SEND_TIMEOUT)
             logging.info(f"已发送图片给 {self.recipient}: {image_path}")
             return True
         except Exception as e:
@@ -128,13 +93,23 @@ class Notifier:
         """
         初始化 Notifier
 
-        :param config: 配置字典，包含 'method' 和 'recipient'
+        :param config: 配置字典，包含 'method' 和 'recipient'，以及可选的发件箱参数 rate_per_minute、burst、
+            dedup_window_seconds、digest_interval_seconds、max_individual
         """
         self.method = config.get('method', 'wechat').lower()
         self.recipient = config.get('recipient', '')
         self.error_recipient = config.get('error_recipient', '')  # 新增 error_recipient
         self.wechat_notifier: Optional[WeChatNotifier] = None
         self.wechat_error_notifier: Optional[WeChatNotifier] = None  # 用于错误通知
+        # 消息由共享的发件箱在后台线程中发送，调用方不会阻塞在网络请求上
+        self.outbox = get_notification_outbox()
+        self.outbox.update_settings(
+            rate_per_minute=config.get('rate_per_minute'),
+            burst=config.get('burst'),
+            dedup_window=config.get('dedup_window_seconds'),
+            digest_interval=config.get('digest_interval_seconds'),
+            max_individual=config.get('max_individual')
+        )
 
         if self.method == 'wechat':
             if not self.recipient:
@@ -146,13 +121,16 @@ class Notifier:
         else:
             logging.warning(f"未知的通知方法: {self.method}")
 
-    def notify(self, message: str, is_error: bool = False) -> bool:
+    def notify(self, message: str, is_error: bool = False, coalesce: Optional[bool] = None) -> bool:
         """
-        发送通知
+        将通知放入发件箱，由后台线程发送，不等待发送完成。
+        错误通知会按来源去重，短时间内大量同类错误合并为汇总消息。
 
         :param message: 要发送的消息内容
         :param is_error: 是否为错误通知
-        :return: 发送是否成功
+        :param coalesce: 是否允许去重和并入汇总，默认只对错误通知开启；
+                         分段发送的长消息应传 False，否则各段会按首行被合并掉
+        :return: 通知是否已被接受
         """
         if self.method == 'wechat':
             notifier = self.wechat_error_notifier if is_error else self.wechat_notifier
@@ -161,7 +139,9 @@ class Notifier:
                 notifier = self.wechat_notifier
                 logging.warning("未配置错误通知接收者，使用默认接收者发送错误通知")
             if notifier:
-                return notifier.send_message(message)
+                if coalesce is None:
+                    coalesce = is_error
+                return self.outbox.submit(notifier, message, coalesce=coalesce)
             else:
                 logging.warning("未配置对应的 WeChatNotifier 实例")
                 return False
@@ -191,19 +171,27 @@ class Notifier:
 
     def notify_images(self, image_paths: List[str], is_error: bool = False) -> bool:
         """
-        发送图片通知
+        将图片通知放入发件箱，由后台线程发送
 
         :param image_paths: 图片文件的路径列表
         :param is_error: 是否为错误通知
-        :return: 发送是否成功
+        :return: 通知是否已被接受
         """
         if self.method == 'wechat':
             notifier = self.wechat_error_notifier if is_error else self.wechat_notifier
             if notifier:
-                return notifier.send_images(image_paths)
+                return self.outbox.submit_images(notifier, image_paths)
             else:
                 logging.warning("未配置对应的 WeChatNotifier 实例")
                 return False
         else:
             logging.warning(f"无法发送通知，未知的通知方法: {self.method}")
             return False
+
+    def stop(self, timeout: float = 10):
+        """
+        发出发件箱中剩余的通知和汇总后停止发送线程
+
+        :param timeout: 最多等待的秒数
+        """
+        self.outbox.stop(timeout)
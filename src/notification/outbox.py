@@ -0,0 +1,253 @@
+# src/notification/outbox.py
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+LEADING_TAGS_PATTERN = re.compile(r'^\s*((?:\[[^\]]*\]\s*)+)')
+DETAIL_SEPARATOR_PATTERN = re.compile(r'\s*[:：]')
+
+
+def summarize_message(message: str) -> Tuple[str, str]:
+    """
+    返回消息的 (来源, 摘要)，用于把同类消息合并到汇总中。
+
+    来源取开头第一个方括号标签（如 [xkw7][tab1][soft_id:123] 中的 xkw7）；摘要取去掉标签后第一行中冒号之前的部分，
+    冒号之后的链接、标题和异常内容在同类消息中各不相同，不参与合并。
+    """
+    first_line = message.strip().split('\n', 1)[0]
+    source = ''
+    match = LEADING_TAGS_PATTERN.match(first_line)
+    if match:
+        source = match.group(1).strip()[1:].split(']', 1)[0]
+        first_line = first_line[match.end():]
+    summary = DETAIL_SEPARATOR_PATTERN.split(first_line, 1)[0].strip() or first_line.strip()
+    return source, summary[:60]
+
+
+class _RecipientState:
+    """单个接收者的发送状态：令牌桶、待发送队列、去重记录和待汇总的消息。"""
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.refilled_at = now
+        self.pending = deque()  # (target, 方法名, 内容)
+        self.recent: 'OrderedDict[str, float]' = OrderedDict()  # 消息内容 -> 最近一次入队时间
+        self.window_started = now
+        self.window_counts: Dict[Tuple[str, str], int] = {}  # 本汇总周期内每类消息的条数
+        self.folded: 'OrderedDict[Tuple[str, str], int]' = OrderedDict()  # 待汇总的消息类别 -> 条数
+        self.digest_due = now  # 待汇总的消息应当发出的时间
+        self.digest_target = None
+
+
+class NotificationOutbox:
+    """
+    通知发件箱：调用方只把消息放入队列，由后台线程发送，调用方不会阻塞在微信网络请求上。
+
+    每个接收者一个令牌桶，限制发送频率；同一接收者在 dedup_window 秒内重复的相同消息不再单独发送。
+    可合并的消息（错误通知）按来源和摘要归类，同一类在一个汇总周期内最多单独发送 max_individual 条，
+    其余的和重复消息一起计数，每 digest_interval 秒合并为一条汇总，例如 "xkw7: 23 × 在60秒内未能找到匹配的下载文件"。
+    不可合并的消息（命令回复等）只受频率限制，按顺序全部发送。
+
+    参数:
+    - rate_per_minute: 每个接收者每分钟最多发送的消息数。
+    - burst: 令牌桶容量，允许短时间内连续发送的消息数。
+    - dedup_window: 相同消息的去重时间窗口（秒）。
+    - digest_interval: 汇总周期（秒）。
+    - max_individual: 每类可合并消息在一个汇总周期内单独发送的条数。
+    - max_pending: 每个接收者最多排队的消息数，超出的可合并消息并入汇总，不可合并的消息丢弃。
+    """
+
+    def __init__(self, rate_per_minute: float = 20, burst: int = 5, dedup_window: float = 300,
+                 digest_interval: float = 60, max_individual: int = 3, max_pending: int = 200,
+                 name: str = 'NotificationOutbox'):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self.digest_interval = digest_interval
+        self.max_individual = max_individual
+        self.max_pending = max_pending
+        self._states: Dict[str, _RecipientState] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._sending = 0
+        self.stats = {'submitted': 0, 'sent': 0, 'failed': 0, 'folded': 0, 'digests': 0, 'dropped': 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        logging.info(f"{name} 通知发送线程已启动")
+
+    def update_settings(self, **settings):
+        """更新发送参数，只接受构造函数中的参数名，值为 None 的参数保持不变。"""
+        with self._cond:
+            for key, value in settings.items():
+                if value is not None and key in ('rate_per_minute', 'burst', 'dedup_window', 'digest_interval',
+                                                 'max_individual', 'max_pending'):
+                    setattr(self, key, value)
+            self._cond.notify()
+
+    def submit(self, target, message: str, coalesce: bool = True) -> bool:
+        """
+        把一条文本消息放入发件箱，立即返回。
+
+        参数:
+        - target: 具有 recipient 属性和 send_message 方法的发送对象（如 WeChatNotifier）。
+        - message: 消息内容。
+        - coalesce: 是否允许去重和并入汇总。
+
+        返回:
+        - 是否已接受（放入队列或计入汇总）。发件箱已停止或队列已满时返回 False。
+        """
+        return self._submit(target, 'send_message', message, coalesce)
+
+    def submit_images(self, target, image_paths) -> bool:
+        """把一组图片放入发件箱，由后台线程调用 target.send_images 发送。"""
+        return self._submit(target, 'send_images', list(image_paths), False)
+
+    def _submit(self, target, method: str, payload, coalesce: bool) -> bool:
+        now = time.monotonic()
+        with self._cond:
+            if self._stopped:
+                return False
+            state = self._state_for(target, now)
+            self.stats['submitted'] += 1
+            if coalesce:
+                category = summarize_message(payload)
+                if now - state.window_started >= self.digest_interval:
+                    state.window_started = now
+                    state.window_counts.clear()
+                state.window_counts[category] = state.window_counts.get(category, 0) + 1
+                sent_at = state.recent.get(payload)
+                duplicate = sent_at is not None and now - sent_at < self.dedup_window
+                if (duplicate or state.window_counts[category] > self.max_individual
+                        or len(state.pending) >= self.max_pending):
+                    if not state.folded:
+                        state.digest_due = state.window_started + self.digest_interval
+                    state.folded[category] = state.folded.get(category, 0) + 1
+                    state.digest_target = target
+                    self.stats['folded'] += 1
+                    self._cond.notify()
+                    return True
+                state.recent[payload] = now
+                state.recent.move_to_end(payload)
+                while state.recent and now - next(iter(state.recent.values())) >= self.dedup_window:
+                    state.recent.popitem(last=False)
+            elif len(state.pending) >= self.max_pending:
+                self.stats['dropped'] += 1
+                logging.warning(f"发送给 {target.recipient} 的通知队列已满，丢弃消息")
+                return False
+            state.pending.append((target, method, payload))
+            self._cond.notify()
+            return True
+
+    def _state_for(self, target, now: float) -> _RecipientState:
+        state = self._states.get(target.recipient)
+        if state is None:
+            state = self._states[target.recipient] = _RecipientState(self.burst, now)
+        return state
+
+    def _refill(self, state: _RecipientState, now: float):
+        state.tokens = min(self.burst, state.tokens + (now - state.refilled_at) * self._rate_per_second())
+        state.refilled_at = now
+
+    def _next_item(self, now: float):
+        """
+        返回下一条可以发送的 (target, 方法名, 内容)，没有时返回 (None, 需要等待的秒数)。调用方需持有锁。
+        """
+        wait = None
+        for recipient, state in self._states.items():
+            digest_due = state.folded and (now >= state.digest_due or self._stopped)
+            if not state.pending and not digest_due:
+                if state.folded:
+                    wait = self._min_wait(wait, state.digest_due - now)
+                continue
+            self._refill(state, now)
+            if state.tokens < 1 and not self._stopped:
+                wait = self._min_wait(wait, (1 - state.tokens) / self._rate_per_second())
+                continue
+            state.tokens -= 1
+            if state.pending:
+                return state.pending.popleft(), None
+            return (state.digest_target, 'send_message', self._build_digest(state, now)), None
+        return None, wait
+
+    def _rate_per_second(self) -> float:
+        return max(self.rate_per_minute, 0.001) / 60
+
+    @staticmethod
+    def _min_wait(current: Optional[float], candidate: float) -> float:
+        candidate = max(0.01, candidate)
+        return candidate if current is None else min(current, candidate)
+
+    def _build_digest(self, state: _RecipientState, now: float) -> str:
+        lines = [f"{source}: {count} × {summary}" if source else f"{count} × {summary}"
+                 for (source, summary), count in state.folded.items()]
+        state.folded.clear()
+        state.window_started = now
+        state.window_counts.clear()
+        self.stats['digests'] += 1
+        return f"通知汇总（最近 {self.digest_interval:.0f} 秒内合并的消息）：\n" + "\n".join(lines)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                item, wait = self._next_item(time.monotonic())
+                if item is None:
+                    if self._stopped:
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(wait)
+                    continue
+                self._sending += 1
+            target, method, payload = item
+            try:
+                success = getattr(target, method)(payload)
+            except Exception as e:
+                logging.error(f"后台发送通知给 {target.recipient} 时出错: {e}", exc_info=True)
+                success = False
+            with self._cond:
+                self._sending -= 1
+                self.stats['sent' if success else 'failed'] += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中的消息发送完成（不包括尚未到期的汇总），返回是否在超时前完成。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._sending or any(state.pending for state in self._states.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout: float = 10):
+        """停止接收新消息，立即发出待发送的消息和汇总（不再受频率限制），最多等待 timeout 秒。"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        logging.info(f"通知发件箱已停止，统计: {self.get_stats()}")
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['pending'] = sum(len(state.pending) for state in self._states.values())
+            stats['folded_pending'] = sum(sum(state.folded.values()) for state in self._states.values())
+            return stats
+
+
+_default_outbox = None
+_default_outbox_lock = threading.Lock()
+
+
+def get_notification_outbox() -> NotificationOutbox:
+    """获取进程内共享的 NotificationOutbox，首次调用时创建。同一接收者的频率限制在所有 Notifier 之间共享。"""
+    global _default_outbox
+    if _default_outbox is None:
+        with _default_outbox_lock:
+            if _default_outbox is None:
+                _default_outbox = NotificationOutbox()
+    return _default_outbox
@@ -0,0 +1,135 @@
+# src/notification/recipient_directory.py
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+FRIEND_NAME_KEYS = ('RemarkName', 'NickName', 'Alias')
+
+
+class RecipientDirectory:
+    """
+    接收者名称到 UserName 的索引。
+
+    登录后从 itchat 的本地联系人列表构建一次（只读取字典，不做深拷贝，不发起网络请求），
+    之后由 itchat 的 contactHooks 在联系人更新（包括 start_receiving 收到的 ModContactList）时增量更新。
+    查找时先按 UserName、好友备注/昵称/微信号、群聊名称精确匹配，再按群聊名称包含匹配。
+    找不到的名称记入负缓存，在退避时间内直接返回 None，退避时间每次翻倍，直到 max_negative_ttl。
+
+    参数:
+    - core: itchat Core 实例，默认使用 lib.itchat 的全局实例。
+    - negative_ttl: 找不到的名称首次退避的秒数。
+    - max_negative_ttl: 最长退避秒数。
+    """
+
+    def __init__(self, core=None, negative_ttl: float = 60, max_negative_ttl: float = 3600):
+        if core is None:
+            from lib import itchat
+            core = itchat.instance
+        self.core = core
+        self.negative_ttl = negative_ttl
+        self.max_negative_ttl = max_negative_ttl
+        self.friend_names: Dict[str, str] = {}  # 好友备注、昵称或微信号 -> UserName
+        self.chatroom_names: Dict[str, str] = {}  # 群聊名称 -> UserName
+        self.entries: Dict[str, Tuple[str, Tuple[str, ...]]] = {}  # UserName -> (类型, 名称)
+        self.negatives: Dict[str, Tuple[float, float]] = {}  # 名称 -> (下次重试时间, 退避秒数)
+        self.built = False
+        self.lock = threading.Lock()
+        core.contactHooks.append(self.apply)
+
+    def rebuild(self):
+        """从 itchat 本地联系人列表重建索引。"""
+        with self.core.storageClass.updateLock:
+            contacts = list(self.core.memberList) + list(self.core.chatroomList)
+            with self.lock:
+                self.friend_names.clear()
+                self.chatroom_names.clear()
+                self.entries.clear()
+                self.negatives.clear()
+                self._apply(contacts)
+                self.built = True
+        logging.info(f"接收者索引已重建，好友名称 {len(self.friend_names)} 个，群聊 {len(self.chatroom_names)} 个")
+
+    def apply(self, contacts: Iterable[Dict]):
+        """
+        联系人更新时由 itchat 调用，更新这些联系人的索引项。
+        调用时 itchat 持有联系人更新锁，这里只修改本地字典。
+        """
+        with self.lock:
+            self._apply(contacts)
+
+    def _apply(self, contacts: Iterable[Dict]):
+        for contact in contacts:
+            user_name = contact.get('UserName')
+            if not user_name:
+                continue
+            self._remove(user_name)
+            if user_name.startswith('@@'):
+                names = (contact['NickName'],) if contact.get('NickName') else ()
+                index, kind = self.chatroom_names, 'chatroom'
+            else:
+                names = tuple(contact[key] for key in FRIEND_NAME_KEYS if contact.get(key))
+                index, kind = self.friend_names, 'friend'
+            for name in names:
+                index[name] = user_name
+                self.negatives.pop(name, None)
+            self.entries[user_name] = (kind, names)
+
+    def _remove(self, user_name: str):
+        entry = self.entries.pop(user_name, None)
+        if not entry:
+            return
+        kind, names = entry
+        index = self.chatroom_names if kind == 'chatroom' else self.friend_names
+        for name in names:
+            if index.get(name) == user_name:
+                del index[name]
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        返回名称对应的 UserName，找不到时返回 None。
+
+        参数:
+        - name: 微信 UserName、好友的备注/昵称/微信号或群聊名称。
+        """
+        if not self.built:
+            self.rebuild()
+        now = time.monotonic()
+        with self.lock:
+            if name in self.entries:
+                return name
+            user_name = self.friend_names.get(name) or self.chatroom_names.get(name)
+            if user_name:
+                return user_name
+            negative = self.negatives.get(name)
+            if negative and now < negative[0]:
+                return None
+            user_name = next((user for chatroom_name, user in self.chatroom_names.items() if name in chatroom_name),
+                             None)
+            if user_name:
+                return user_name
+            delay = min(negative[1] * 2, self.max_negative_ttl) if negative else self.negative_ttl
+            self.negatives[name] = (now + delay, delay)
+        logging.error(f"未找到接收者: {name}，{delay:.0f} 秒内不再查找（好友名称 {len(self.friend_names)} 个，"
+                      f"群聊 {len(self.chatroom_names)} 个）")
+        return None
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {'friend_names': len(self.friend_names), 'chatrooms': len(self.chatroom_names),
+                    'negatives': len(self.negatives)}
+
+
+_default_directory = None
+_default_directory_lock = threading.Lock()
+
+
+def get_recipient_directory() -> RecipientDirectory:
+    """获取进程内共享的 RecipientDirectory，首次调用时创建并注册到 itchat 全局实例。"""
+    global _default_directory
+    if _default_directory is None:
+        with _default_directory_lock:
+            if _default_directory is None:
+                _default_directory = RecipientDirectory()
+    return _default_directory
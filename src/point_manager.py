@@ -17,7 +17,7 @@ class PointManager:
 
     def initialize_database(self):
         """
-        创建 groups、users、recipients、download_logs、daily_download_summary 和 download_links 表
+        创建 groups、users、recipients、download_logs、daily_download_summary、download_links 和 recorded_uploads 表
         """
         try:
             # 现有的表创建逻辑
@@ -77,6 +77,15 @@ class PointManager:
                 )
             ''')
 
+            # 已记账的上传，与扣分在同一个事务中写入，恢复时不会重复扣分
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS recorded_uploads (
+                    upload_key TEXT PRIMARY KEY,
+                    charged BOOLEAN DEFAULT 0,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
             self.conn.commit()
             logging.info("PointManager 数据库表已创建或已存在")
         except Exception as e:
@@ -224,102 +233,142 @@ class PointManager:
     # 扣除整体性群组的积分
     def deduct_whole_group_points(self, group_name: str, points: int = 1) -> bool:
         with self.lock:
-            # 检查群组是否是整体性群组
-            self.cursor.execute('''
-                SELECT is_whole, remaining_points FROM groups WHERE name = ?
-            ''', (group_name,))
-            result = self.cursor.fetchone()
-            if not result:
-                logging.error(f"群组 '{group_name}' 不存在")
-                return False
-
-            is_whole = bool(result[0])
-            if not is_whole:
-                logging.error(f"群组 '{group_name}' 不是整体性群组")
-                return False
-
-            # 扣除群组的积分
-            self.cursor.execute('''
-                UPDATE groups
-                SET remaining_points = remaining_points - ?
-                WHERE name = ? AND remaining_points >= ?
-            ''', (points, group_name, points))
-            if self.cursor.rowcount == 0:
-                logging.warning(f"群组 '{group_name}' 的积分不足，无法扣除 {points} 积分")
-                return False  # 群组积分不足
-
-            self.conn.commit()
-            logging.debug(f"成功从整体群组 '{group_name}' 扣除 {points} 积分")
-            return True
+            return self._commit_if(self._deduct_whole_group_points(group_name, points))
 
     # 扣除非整体性群组成员的积分
     def deduct_non_whole_group_members_points(self, group_name: str, points: int = 1) -> bool:
         with self.lock:
-            # 检查群组是否存在且为非整体性群组
-            self.cursor.execute('''
-                SELECT is_whole FROM groups WHERE name = ?
-            ''', (group_name,))
-            result = self.cursor.fetchone()
-            if not result:
-                logging.error(f"群组 '{group_name}' 不存在")
-                return False
-
-            is_whole = bool(result[0])
-            if is_whole:
-                logging.error(f"群组 '{group_name}' 是整体性群组，不适用于非整体性群组成员扣分")
-                return False
-
-            # 检查所有成员是否有足够的积分
-            self.cursor.execute('''
-                SELECT nickname, remaining_points FROM users WHERE group_name = ?
-            ''', (group_name,))
-            members = self.cursor.fetchall()
-            for member in members:
-                if member[1] < points:
-                    logging.warning(f"用户 '{member[0]}' 在群组 '{group_name}' 中积分不足，无法扣除 {points} 积分")
-                    return False
-
-            # 扣除每个成员的积分
-            self.cursor.execute('''
-                UPDATE users
-                SET remaining_points = remaining_points - ?
-                WHERE group_name = ? AND remaining_points >= ?
-            ''', (points, group_name, points))
-
-            self.conn.commit()
-            logging.debug(f"成功从群组 '{group_name}' 的所有成员扣除 {points} 积分")
-            return True
+            return self._commit_if(self._deduct_non_whole_group_members_points(group_name, points))
 
     # 扣除个人接收者的积分
     def deduct_recipient_points(self, recipient_name: str, points: int = 1) -> bool:
         with self.lock:
-            self.cursor.execute('''
-                UPDATE recipients
-                SET remaining_points = remaining_points - ?
-                WHERE name = ? AND remaining_points >= ?
-            ''', (points, recipient_name, points))
-            if self.cursor.rowcount == 0:
-                logging.warning(f"接收者 '{recipient_name}' 的积分不足，无法扣除 {points} 积分")
-                return False
-            self.conn.commit()
-            logging.debug(f"成功从接收者 '{recipient_name}' 扣除 {points} 积分")
-            return True
+            return self._commit_if(self._deduct_recipient_points(recipient_name, points))
 
     # 扣除个人用户的积分
     def deduct_user_points(self, group_name: str, nickname: str, points: int = 1) -> bool:
         logging.debug(f"尝试从用户 '{nickname}' 在群组 '{group_name}' 中扣除 {points} 个积分")
         with self.lock:
-            self.cursor.execute('''
-                UPDATE users
-                SET remaining_points = remaining_points - ?
-                WHERE group_name = ? AND nickname = ? AND remaining_points >= ?
-            ''', (points, group_name, nickname, points))
-            if self.cursor.rowcount == 0:
-                logging.warning(f"用户 '{nickname}' 的积分不足，无法扣除 {points} 积分")
-                return False  # 用户积分不足
+            return self._commit_if(self._deduct_user_points(group_name, nickname, points))
+
+    def _commit_if(self, success: bool) -> bool:
+        if success:
             self.conn.commit()
-            logging.debug(f"成功从用户 '{nickname}' 扣除 {points} 积分")
-            return True
+        return success
+
+    # 以下 _deduct_* 方法只执行语句、不提交事务，调用方需持有锁
+    def _deduct_whole_group_points(self, group_name: str, points: int) -> bool:
+        # 检查群组是否是整体性群组
+        self.cursor.execute('''
+            SELECT is_whole, remaining_points FROM groups WHERE name = ?
+        ''', (group_name,))
+        result = self.cursor.fetchone()
+        if not result:
+            logging.error(f"群组 '{group_name}' 不存在")
+            return False
+
+        is_whole = bool(result[0])
+        if not is_whole:
+            logging.error(f"群组 '{group_name}' 不是整体性群组")
+            return False
+
+        # 扣除群组的积分
+        self.cursor.execute('''
+            UPDATE groups
+            SET remaining_points = remaining_points - ?
+            WHERE name = ? AND remaining_points >= ?
+        ''', (points, group_name, points))
+        if self.cursor.rowcount == 0:
+            logging.warning(f"群组 '{group_name}' 的积分不足，无法扣除 {points} 积分")
+            return False  # 群组积分不足
+
+        logging.debug(f"成功从整体群组 '{group_name}' 扣除 {points} 积分")
+        return True
+
+    def _deduct_non_whole_group_members_points(self, group_name: str, points: int) -> bool:
+        # 检查群组是否存在且为非整体性群组
+        self.cursor.execute('''
+            SELECT is_whole FROM groups WHERE name = ?
+        ''', (group_name,))
+        result = self.cursor.fetchone()
+        if not result:
+            logging.error(f"群组 '{group_name}' 不存在")
+            return False
+
+        is_whole = bool(result[0])
+        if is_whole:
+            logging.error(f"群组 '{group_name}' 是整体性群组，不适用于非整体性群组成员扣分")
+            return False
+
+        # 检查所有成员是否有足够的积分
+        self.cursor.execute('''
+            SELECT nickname, remaining_points FROM users WHERE group_name = ?
+        ''', (group_name,))
+        members = self.cursor.fetchall()
+        for member in members:
+            if member[1] < points:
+                logging.warning(f"用户 '{member[0]}' 在群组 '{group_name}' 中积分不足，无法扣除 {points} 积分")
+                return False
+
+        # 扣除每个成员的积分
+        self.cursor.execute('''
+            UPDATE users
+            SET remaining_points = remaining_points - ?
+            WHERE group_name = ? AND remaining_points >= ?
+        ''', (points, group_name, points))
+
+        logging.debug(f"成功从群组 '{group_name}' 的所有成员扣除 {points} 积分")
+        return True
+
+    def _deduct_recipient_points(self, recipient_name: str, points: int) -> bool:
+        self.cursor.execute('''
+            UPDATE recipients
+            SET remaining_points = remaining_points - ?
+            WHERE name = ? AND remaining_points >= ?
+        ''', (points, recipient_name, points))
+        if self.cursor.rowcount == 0:
+            logging.warning(f"接收者 '{recipient_name}' 的积分不足，无法扣除 {points} 积分")
+            return False
+        logging.debug(f"成功从接收者 '{recipient_name}' 扣除 {points} 积分")
+        return True
+
+    def _deduct_user_points(self, group_name: str, nickname: str, points: int) -> bool:
+        self.cursor.execute('''
+            UPDATE users
+            SET remaining_points = remaining_points - ?
+            WHERE group_name = ? AND nickname = ? AND remaining_points >= ?
+        ''', (points, group_name, nickname, points))
+        if self.cursor.rowcount == 0:
+            logging.warning(f"用户 '{nickname}' 的积分不足，无法扣除 {points} 积分")
+            return False  # 用户积分不足
+        logging.debug(f"成功从用户 '{nickname}' 扣除 {points} 积分")
+        return True
+
+    def _deduct_for_upload(self, recipient_name: str, recipient_type: str, group_type: Optional[str],
+                           sender_nickname: Optional[str], points: int) -> bool:
+        """按接收者类型扣除一次上传的积分：整体性群组扣群组积分，非整体性群组扣发送者积分，个人扣接收者积分。"""
+        if recipient_type == 'individual':
+            return self._deduct_recipient_points(recipient_name, points)
+        if recipient_type != 'group':
+            logging.error(f"未知的接收者类型 '{recipient_type}'，无法扣除积分。")
+            return False
+        if not group_type:
+            # 未提供 group_type 时从数据库获取
+            self.cursor.execute('SELECT is_whole FROM groups WHERE name = ?', (recipient_name,))
+            result = self.cursor.fetchone()
+            if not result:
+                logging.error(f"群组 '{recipient_name}' 信息未找到，无法扣除积分。")
+                return False
+            group_type = 'whole' if result[0] else 'non-whole'
+        if group_type == 'whole':
+            return self._deduct_whole_group_points(recipient_name, points)
+        if group_type == 'non-whole':
+            if not sender_nickname:
+                logging.error("缺少发送者昵称，无法从非整体性群组成员中扣除积分。")
+                return False
+            return self._deduct_user_points(recipient_name, sender_nickname, points)
+        logging.error(f"未知的群组类型 '{group_type}'，无法扣除积分。")
+        return False
 
     # 获取接收者信息
     def get_recipient_info(self, recipient_name: str) -> Optional[Dict]:
@@ -578,35 +627,118 @@ class PointManager:
         """
         with self.lock:
             try:
-                # 插入 download_logs 表
-                self.cursor.execute('''
-                    INSERT INTO download_logs (recipient_type, recipient_name, link)
-                    VALUES (?, ?, ?)
-                ''', (recipient_type, recipient_name, link))
-                download_log_id = self.cursor.lastrowid
-
-                # 插入 download_links 表
-                self.cursor.execute('''
-                    INSERT INTO download_links (download_log_id, link)
-                    VALUES (?, ?)
-                ''', (download_log_id, link))
-
-                # 获取当前日期
-                current_date = datetime.now().date()
-
-                # 更新 daily_download_summary 表
-                self.cursor.execute('''
-                    INSERT INTO daily_download_summary (date, recipient_type, recipient_name, download_count)
-                    VALUES (?, ?, ?, 1)
-                    ON CONFLICT(date, recipient_type, recipient_name)
-                    DO UPDATE SET download_count = download_count + 1
-                ''', (current_date, recipient_type, recipient_name))
-
+                self._log_download(recipient_type, recipient_name, link)
                 self.conn.commit()
                 logging.debug(f"已记录下载事件：{recipient_type}, {recipient_name}, {link}")
             except Exception as e:
+                self.conn.rollback()
                 logging.error(f"记录下载事件时出错：{e}", exc_info=True)
 
+    def _log_download(self, recipient_type: str, recipient_name: str, link: str):
+        """写入下载事件和每日汇总，不提交事务，调用方需持有锁。"""
+        # 插入 download_logs 表
+        self.cursor.execute('''
+            INSERT INTO download_logs (recipient_type, recipient_name, link)
+            VALUES (?, ?, ?)
+        ''', (recipient_type, recipient_name, link))
+        download_log_id = self.cursor.lastrowid
+
+        # 插入 download_links 表
+        self.cursor.execute('''
+            INSERT INTO download_links (download_log_id, link)
+            VALUES (?, ?)
+        ''', (download_log_id, link))
+
+        # 获取当前日期
+        current_date = datetime.now().date()
+
+        # 更新 daily_download_summary 表
+        self.cursor.execute('''
+            INSERT INTO daily_download_summary (date, recipient_type, recipient_name, download_count)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT(date, recipient_type, recipient_name)
+            DO UPDATE SET download_count = download_count + 1
+        ''', (current_date, recipient_type, recipient_name))
+
+    def record_uploads(self, items: List[Dict], points: int = 1) -> List[Dict]:
+        """
+        在一个事务中记录一批已发送文件的扣分和下载事件，整批只提交一次。
+        每个文件使用独立的保存点，某个文件的语句出错时只回滚该文件，不影响同批的其它文件。
+
+        参数:
+        - items: 每项包含 recipient_name、recipient_type（'group' 或 'individual'）、group_type、sender_nickname、
+          link（下载记录的链接），以及可选的 charge 和 log（默认都为 True，为 False 时跳过扣分或下载记录）
+          和 key（上传的唯一标识，与扣分一起提交；已记录过的 key 直接跳过，同一个上传只扣一次积分）。
+        - points: 每个文件扣除的积分。
+
+        返回:
+        - 与 items 一一对应的结果 {'charged': 是否扣分成功, 'logged': 是否已记录下载, 'error': 出错信息或 None,
+          'duplicate': key 是否已记录过}。积分不足时 charged 为 False，但下载仍会记录；
+          key 已记录过时 charged 为当时的扣分结果。
+        """
+        results = []
+        with self.lock:
+            try:
+                if not self.conn.in_transaction:
+                    self.cursor.execute('BEGIN')
+                for item in items:
+                    result = {'charged': False, 'logged': False, 'error': None, 'duplicate': False}
+                    key = item.get('key')
+                    if key is not None:
+                        self.cursor.execute('SELECT charged FROM recorded_uploads WHERE upload_key = ?', (key,))
+                        row = self.cursor.fetchone()
+                        if row:
+                            results.append({'charged': bool(row[0]), 'logged': True, 'error': None, 'duplicate': True})
+                            continue
+                    self.cursor.execute('SAVEPOINT upload_item')
+                    try:
+                        if item.get('charge', True):
+                            result['charged'] = self._deduct_for_upload(
+                                item['recipient_name'], item.get('recipient_type', 'group'), item.get('group_type'),
+                                item.get('sender_nickname'), points)
+                        if item.get('log', True):
+                            self._log_download(self.download_log_type(item.get('recipient_type', 'group'),
+                                                                      item.get('group_type')),
+                                               item['recipient_name'], item['link'])
+                            result['logged'] = True
+                        if key is not None:
+                            self.cursor.execute('INSERT INTO recorded_uploads (upload_key, charged) VALUES (?, ?)',
+                                                (key, result['charged']))
+                        self.cursor.execute('RELEASE SAVEPOINT upload_item')
+                    except sqlite3.Error as e:
+                        self.cursor.execute('ROLLBACK TO SAVEPOINT upload_item')
+                        self.cursor.execute('RELEASE SAVEPOINT upload_item')
+                        result = {'charged': False, 'logged': False, 'error': str(e), 'duplicate': False}
+                        logging.error(f"记录 '{item['recipient_name']}' 的上传时出错：{e}", exc_info=True)
+                    results.append(result)
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+        logging.debug(f"已在一个事务中记录 {len(items)} 个上传")
+        return results
+
+    def purge_recorded_uploads(self, days: int = 30) -> int:
+        """删除 days 天前的上传记账标识，返回删除的条数。"""
+        with self.lock:
+            try:
+                self.cursor.execute('''
+                    DELETE FROM recorded_uploads WHERE timestamp < datetime('now', ?)
+                ''', (f'-{days} days',))
+                self.conn.commit()
+                return self.cursor.rowcount
+            except Exception as e:
+                self.conn.rollback()
+                logging.error(f"清理上传记账标识时出错：{e}", exc_info=True)
+                return 0
+
+    @staticmethod
+    def download_log_type(recipient_type: str, group_type: Optional[str]) -> str:
+        """下载记录中的接收者类型：whole_group、non_whole_group 或 individual。"""
+        if recipient_type == 'individual':
+            return 'individual'
+        return 'whole_group' if group_type == 'whole' else 'non_whole_group' if group_type == 'non-whole' else 'individual'
+
     def get_daily_download_summary(self, date: datetime.date) -> List[Dict]:
         """
         获取指定日期的下载汇总信息。
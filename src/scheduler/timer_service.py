@@ -0,0 +1,196 @@
+# src/scheduler/timer_service.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class TimerHandle:
+    """
+    定时任务句柄，由 TimerService 返回，可用于取消尚未执行的任务。
+    """
+
+    __slots__ = ('when', 'seq', 'callback', 'args', 'kwargs', 'interval', 'name', 'cancelled', 'queued', '_service')
+
+    def __init__(self, service, when, seq, callback, args, kwargs, interval=None, name=None):
+        self._service = service
+        self.when = when  # 到期时间（time.monotonic）
+        self.seq = seq  # 相同到期时间下保持插入顺序
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.interval = interval  # 周期任务的间隔，None 表示一次性任务
+        self.name = name or getattr(callback, '__name__', 'timer')
+        self.cancelled = False
+        self.queued = False  # 是否仍在调度堆中
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def cancel(self):
+        """取消任务；对已执行的一次性任务调用无副作用。"""
+        if not self.cancelled:
+            self.cancelled = True
+            self._service._on_cancel(self)
+
+    def __repr__(self):
+        return f"<TimerHandle {self.name} when={self.when:.1f} cancelled={self.cancelled}>"
+
+
+class TimerService:
+    """
+    基于最小堆的共享定时调度器。
+
+    所有延迟任务和周期任务都由同一个调度线程按到期时间管理，到期回调交给一个
+    小型线程池执行，耗时回调不会拖慢其它定时任务，也不需要为每个定时任务单独创建线程。
+    """
+
+    def __init__(self, max_workers: int = 4, name: str = 'TimerService'):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._cancelled_count = 0
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        logging.info(f"{name} 定时调度线程已启动，工作线程数: {max_workers}")
+
+    def call_later(self, delay: float, callback: Callable, *args, name: Optional[str] = None, **kwargs) -> TimerHandle:
+        """
+        在 delay 秒后执行一次 callback。
+
+        参数:
+        - delay: 延迟秒数。
+        - callback: 到期后执行的回调。
+        - name: 任务名称，用于日志。
+
+        返回:
+        - TimerHandle: 可取消的任务句柄。
+        """
+        return self._schedule(max(0.0, delay), callback, args, kwargs, None, name)
+
+    def call_every(self, interval: float, callback: Callable, *args, initial_delay: float = 0.0,
+                   name: Optional[str] = None, **kwargs) -> TimerHandle:
+        """
+        周期执行 callback。下一次执行时间从本次回调结束后开始计算，回调不会重叠执行。
+
+        参数:
+        - interval: 执行间隔（秒）。
+        - callback: 周期回调。
+        - initial_delay: 首次执行前的延迟（秒）。
+        - name: 任务名称，用于日志。
+
+        返回:
+        - TimerHandle: 取消后不再继续调度。
+        """
+        return self._schedule(max(0.0, initial_delay), callback, args, kwargs, interval, name)
+
+    def pending_count(self) -> int:
+        """返回尚未到期且未取消的任务数。"""
+        with self._cond:
+            return len(self._heap) - self._cancelled_count
+
+    def stop(self, wait: bool = False):
+        """停止调度线程，未到期的任务全部丢弃。"""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cancelled_count = 0
+            self._cond.notify_all()
+        self._executor.shutdown(wait=wait)
+        logging.info("定时调度线程已停止。")
+
+    def _schedule(self, delay, callback, args, kwargs, interval, name) -> TimerHandle:
+        with self._cond:
+            handle = TimerHandle(self, time.monotonic() + delay, next(self._counter), callback, args, kwargs,
+                                 interval, name)
+            if self._stopped:
+                logging.warning(f"定时调度线程已停止，忽略任务: {handle.name}")
+                handle.cancelled = True
+                return handle
+            handle.queued = True
+            heapq.heappush(self._heap, handle)
+            # 新任务成为堆顶时唤醒调度线程重新计算等待时间
+            if self._heap[0] is handle:
+                self._cond.notify()
+            return handle
+
+    def _on_cancel(self, handle: TimerHandle):
+        with self._cond:
+            if not handle.queued:
+                return
+            self._cancelled_count += 1
+            # 已取消的任务大量堆积时压缩堆，避免下载成功后取消的刷新任务占用内存
+            if self._cancelled_count > 256 and self._cancelled_count * 2 > len(self._heap):
+                for h in self._heap:
+                    if h.cancelled:
+                        h.queued = False
+                self._heap = [h for h in self._heap if not h.cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled_count = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    handle = self._heap[0]
+                    if handle.cancelled:
+                        heapq.heappop(self._heap)
+                        handle.queued = False
+                        self._cancelled_count = max(0, self._cancelled_count - 1)
+                        continue
+                    delay = handle.when - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    handle.queued = False
+                    break
+                else:
+                    return
+            try:
+                self._executor.submit(self._execute, handle)
+            except RuntimeError:
+                # 线程池已关闭
+                return
+
+    def _execute(self, handle: TimerHandle):
+        if handle.cancelled:
+            return
+        try:
+            handle.callback(*handle.args, **handle.kwargs)
+        except Exception as e:
+            logging.error(f"定时任务 {handle.name} 执行出错: {e}", exc_info=True)
+        finally:
+            if handle.interval is not None and not handle.cancelled:
+                with self._cond:
+                    if self._stopped:
+                        return
+                    handle.when = time.monotonic() + handle.interval
+                    handle.seq = next(self._counter)
+                    handle.queued = True
+                    heapq.heappush(self._heap, handle)
+                    if self._heap[0] is handle:
+                        self._cond.notify()
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def get_timer_service() -> TimerService:
+    """获取进程内共享的 TimerService，首次调用时创建。"""
+    global _default_service
+    if _default_service is None:
+        with _default_service_lock:
+            if _default_service is None:
+                _default_service = TimerService()
+    return _default_service